@@ -13,7 +13,7 @@ from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files import File
 from tom_observations.facilities.lco import (
     LCOFacility as BaseLCOFacility,
     LCOSettings,
@@ -25,17 +25,20 @@ from tom_observations.facilities.lco import (
 )
 from tom_observations.facilities.ocs import make_request
 from tom_observations.models import ObservationRecord
-from tom_dataproducts.models import DataProduct, ReducedDatum
+from tom_dataproducts.models import DataProduct
 from tom_targets.models import Target
 
 from custom_code.bhtom2_uploads import (
-    forward_dataproduct_to_bhtom2,
+    enqueue_bhtom2_forward,
     has_successful_bhtom2_upload,
     load_extra_data_dict,
     normalize_fits_upload,
     save_extra_data_dict,
 )
+from custom_code.data_services.archive_downloads import download_product
+from custom_code.exposure_time import ExposureLimits, ImagerModel
 from custom_code.facility_proposals import get_proposal_by_pk, get_proposal_choices_for_user
+from custom_code.last_photometry import latest_magnitudes_by_filter
 
 
 logger = logging.getLogger(__name__)
@@ -136,86 +139,67 @@ def _lco_etc_match_filter_code(filter_name):
     return None
 
 
-def _lco_etc_extract_mag_and_filter(datum):
-    value = datum.value
-    if isinstance(value, dict):
-        magnitude = value.get('magnitude', value.get('mag'))
-        datum_filter = value.get('filter') or ''
-    else:
-        magnitude = value
-        datum_filter = ''
-    try:
-        magnitude = float(magnitude)
-    except (TypeError, ValueError):
-        return None, ''
-    if not math.isfinite(magnitude):
-        return None, ''
-    return magnitude, str(datum_filter or '')
-
-
 def _lco_etc_latest_magnitudes_by_filter(target_id):
     magnitudes = {}
-    datums = ReducedDatum.objects.filter(target_id=target_id, data_type='photometry').order_by('-timestamp', '-id')
-    for datum in datums:
-        magnitude, datum_filter = _lco_etc_extract_mag_and_filter(datum)
-        if magnitude is None:
-            continue
+    for datum_filter, magnitude in latest_magnitudes_by_filter(target_id):
         filter_code = _lco_etc_match_filter_code(datum_filter)
         if filter_code and filter_code not in magnitudes:
             magnitudes[filter_code] = round(magnitude, 2)
     return magnitudes
 
 
-def calculate_lco_etc_exposure_time(telescope_class, filter_code, magnitude, signal_to_noise=100.0, moon_phase=1, airmass=1.3):
-    try:
-        magnitude = float(magnitude)
-        signal_to_noise = float(signal_to_noise)
-        airmass = float(airmass)
-    except (TypeError, ValueError):
-        return None
-    if not math.isfinite(magnitude) or not math.isfinite(signal_to_noise) or not math.isfinite(airmass):
-        return None
-    if signal_to_noise <= 0:
-        return None
+def _lco_etc_model(telescope_class):
+    telescope_index = LCO_ETC_TELESCOPE_INDEX[telescope_class]
+    return ImagerModel(
+        name=f'LCO {telescope_class}',
+        pixel_scale=LCO_ETC_PIXEL_SCALE[telescope_index],
+        read_noise=LCO_ETC_RON[telescope_index],
+        dark_current=LCO_ETC_DARK[telescope_index],
+        zeropoints=dict(zip(LCO_ETC_FILTER_ORDER, LCO_ETC_ZEROPOINT[telescope_index])),
+        sky_brightness={
+            filter_code: tuple(phase_row[filter_index] for phase_row in LCO_ETC_SKY_BRIGHTNESS)
+            for filter_code, filter_index in LCO_ETC_FILTER_INDEX.items()
+        },
+        extinction=dict(zip(LCO_ETC_FILTER_ORDER, LCO_ETC_EXTINCTION)),
+        aperture_diameter=3.0,
+        limits=ExposureLimits(minimum=1.0, maximum=200000.0, whole_seconds=True),
+    )
 
-    telescope_index = LCO_ETC_TELESCOPE_INDEX.get(str(telescope_class or '').strip())
-    filter_index = LCO_ETC_FILTER_INDEX.get(filter_code)
-    if telescope_index is None or filter_index is None:
-        return None
 
-    zeropoint = LCO_ETC_ZEROPOINT[telescope_index][filter_index]
-    if zeropoint <= 0:
-        return None
+# Same model as the JavaScript calculator of the form widgets.
+LCO_ETC_MODELS = {telescope_class: _lco_etc_model(telescope_class) for telescope_class in LCO_ETC_TELESCOPE_INDEX}
 
-    moon_phase_index = max(0, min(2, int(moon_phase)))
-    aperture_diameter_arcsec = 3.0
-    pixel_scale = LCO_ETC_PIXEL_SCALE[telescope_index]
-    readout_noise = LCO_ETC_RON[telescope_index]
-    dark_current = LCO_ETC_DARK[telescope_index]
-    sky_mag = LCO_ETC_SKY_BRIGHTNESS[moon_phase_index][filter_index]
-    extinction = LCO_ETC_EXTINCTION[filter_index]
-    aperture_area_arcsec2 = math.pi * aperture_diameter_arcsec * aperture_diameter_arcsec / 4.0
-    pixel_count = aperture_area_arcsec2 / (pixel_scale * pixel_scale)
-    airmass_correction = (airmass - 1.0) * extinction
-
-    exposure_time = 1.0
-    for _step in range(200000):
-        mag_at_airmass = magnitude + airmass_correction
-        object_electrons_per_sec = 10.0 ** (-0.4 * (mag_at_airmass - zeropoint))
-        background_electrons_per_sec_arcsec2 = 10.0 ** (-0.4 * (sky_mag - zeropoint))
-        background_electrons_per_sec = background_electrons_per_sec_arcsec2 * aperture_area_arcsec2
-        dark_electrons_per_sec = pixel_count * dark_current
-        read_noise_electrons = pixel_count * readout_noise * readout_noise
-
-        object_electrons = object_electrons_per_sec * exposure_time
-        background_electrons = background_electrons_per_sec * exposure_time
-        dark_electrons = dark_electrons_per_sec * exposure_time
-        signal_noise = object_electrons / math.sqrt(object_electrons + background_electrons + dark_electrons + read_noise_electrons)
-        if signal_noise >= signal_to_noise:
-            return int(round(exposure_time))
-        exposure_time += 1.0
 
-    return None
+def calculate_lco_etc_exposure_times(telescope_class, filter_codes, magnitudes, signal_to_noise=100.0, moon_phase=1,
+                                     airmass=1.3):
+    """Whole-second exposure times per filter (None where unsupported) for one LCO telescope class."""
+    model = LCO_ETC_MODELS.get(str(telescope_class or '').strip())
+    if model is None:
+        return {filter_code: None for filter_code in filter_codes}
+    times = model.exposure_times_by_filter(
+        filter_codes,
+        magnitudes,
+        airmass=airmass,
+        moon_phase=moon_phase,
+        signal_to_noise=signal_to_noise,
+    )
+    return {filter_code: None if time is None else int(time) for filter_code, time in times.items()}
+
+
+def calculate_lco_etc_exposure_time(telescope_class, filter_code, magnitude, signal_to_noise=100.0, moon_phase=1, airmass=1.3):
+    try:
+        moon_phase = int(moon_phase)
+    except (TypeError, ValueError):
+        return None
+    times = calculate_lco_etc_exposure_times(
+        telescope_class,
+        [filter_code],
+        magnitude,
+        signal_to_noise=signal_to_noise,
+        moon_phase=moon_phase,
+        airmass=airmass,
+    )
+    return times[filter_code]
 
 
 def _bhtom2_api_base_url():
@@ -483,9 +467,11 @@ class BhtomLCOImagingObservationForm(BhtomLCOFormMixin, LCOImagingObservationFor
         rows_by_class = {}
         for telescope_class, _label in LCO_ETC_TELESCOPE_CLASS_CHOICES:
             rows = []
-            for filter_code in filters_by_class.get(telescope_class, []):
-                magnitude = latest_magnitudes.get(filter_code, round(fallback_mag, 2))
-                exposure_time = calculate_lco_etc_exposure_time(telescope_class, filter_code, magnitude, signal_to_noise=100.0)
+            filter_codes = filters_by_class.get(telescope_class, [])
+            magnitudes = [latest_magnitudes.get(filter_code, round(fallback_mag, 2)) for filter_code in filter_codes]
+            exposure_times = calculate_lco_etc_exposure_times(telescope_class, filter_codes, magnitudes, signal_to_noise=100.0)
+            for filter_code, magnitude in zip(filter_codes, magnitudes):
+                exposure_time = exposure_times[filter_code]
                 rows.append({
                     'filter_code': filter_code,
                     'filter_label': LCO_ETC_FILTER_LABELS.get(filter_code, filter_code),
@@ -1385,6 +1371,51 @@ class LCOFacility(BaseLCOFacility):
         _, facility = self._record_account_facility(record)
         return facility.cancel_observation(observation_id)
 
+    def _fetch_remote_status(self, observation_id, facility):
+        try:
+            return facility.get_observation_status(observation_id)
+        except requests.HTTPError as exc:
+            response = getattr(exc, 'response', None)
+            if getattr(response, 'status_code', None) == 404:
+                logger.warning(
+                    'LCO observation %s was not found in the remote portal; marking local record as canceled.',
+                    observation_id,
+                )
+                return self._missing_remote_status_payload()
+            raise
+
+    def _log_status_update(self, record, previous_status):
+        logger.info(
+            'Updated LCO observation status observation_id=%s record_id=%s target_id=%s previous_status=%s new_status=%s scheduled_start=%s scheduled_end=%s',
+            record.observation_id,
+            record.pk,
+            record.target_id,
+            previous_status,
+            record.status,
+            record.scheduled_start,
+            record.scheduled_end,
+        )
+
+    def _process_completed_status(self, record, facility):
+        # Frames are downloaded by the frame-sync job; status polling only queues it.
+        from custom_code.lco_frame_sync import enqueue_lco_frame_sync
+
+        if record.status != 'COMPLETED':
+            return
+        try:
+            queued = enqueue_lco_frame_sync(record)
+            logger.info(
+                'Automatic LCO archive sync for observation %s: %s',
+                record.observation_id,
+                'queued' if queued else 'already queued',
+            )
+        except Exception as exc:
+            logger.warning(
+                'Could not queue automatic LCO archive sync for observation %s: %s',
+                record.observation_id,
+                exc,
+            )
+
     def update_observation_status(self, observation_id):
         records = ObservationRecord.objects.filter(observation_id=observation_id, facility=self.name)
         if not records:
@@ -1392,47 +1423,59 @@ class LCOFacility(BaseLCOFacility):
 
         for record in records:
             _, facility = self._record_account_facility(record)
-            try:
-                status = facility.get_observation_status(observation_id)
-            except requests.HTTPError as exc:
-                response = getattr(exc, 'response', None)
-                if getattr(response, 'status_code', None) == 404:
-                    logger.warning(
-                        'LCO observation %s was not found in the remote portal; marking local record as canceled.',
-                        observation_id,
-                    )
-                    status = self._missing_remote_status_payload()
-                else:
-                    raise
+            status = self._fetch_remote_status(observation_id, facility)
             previous_status = record.status
             record.status = status['state']
             record.scheduled_start = status['scheduled_start']
             record.scheduled_end = status['scheduled_end']
             record.save()
-            logger.info(
-                'Updated LCO observation status observation_id=%s record_id=%s target_id=%s previous_status=%s new_status=%s scheduled_start=%s scheduled_end=%s',
-                record.observation_id,
-                record.pk,
-                record.target_id,
-                previous_status,
-                record.status,
-                record.scheduled_start,
-                record.scheduled_end,
-            )
-            if record.status == 'COMPLETED':
-                try:
-                    result = self._sync_completed_lco_dataproducts(record, facility.facility_settings)
-                    logger.info(
-                        'Automatic LCO processing finished for observation %s: %s',
-                        record.observation_id,
-                        result,
-                    )
-                except Exception as exc:
-                    logger.warning(
-                        'Automatic LCO data sync failed for observation %s: %s',
-                        record.observation_id,
-                        exc,
-                    )
+            self._log_status_update(record, previous_status)
+            self._process_completed_status(record, facility)
+
+    def update_all_observation_statuses(self, target=None):
+        """Refresh all open LCO requests with one portal lookup per request and account.
+
+        Lookups run concurrently and the results are written with a single bulk
+        update; completed requests get a background archive frame sync queued.
+        """
+        from custom_code.observation_status import apply_observation_statuses, fetch_statuses_concurrently
+
+        records = ObservationRecord.objects.filter(facility=self.name)
+        if target:
+            records = records.filter(target=target)
+        records = list(records.exclude(status__in=self.get_terminal_observing_states()))
+
+        groups = {}
+        facilities = {}
+        for record in records:
+            proposal, facility = self._record_account_facility(record)
+            key = (record.observation_id, proposal.pk if proposal else None)
+            facilities.setdefault(key, facility)
+            groups.setdefault(key, []).append(record)
+
+        statuses, errors = fetch_statuses_concurrently(
+            lambda key: self._fetch_remote_status(key[0], facilities[key]),
+            groups,
+        )
+        failed_records = [
+            (record.observation_id, str(exc))
+            for key, exc in errors.items()
+            for record in groups[key]
+        ]
+
+        previous_statuses = {record.pk: record.status for record in records}
+        changed = apply_observation_statuses(
+            (record, statuses[key])
+            for key in statuses
+            for record in groups[key]
+        )
+        changed_pks = {record.pk for record in changed}
+        for key in statuses:
+            for record in groups[key]:
+                if record.pk in changed_pks:
+                    self._log_status_update(record, previous_statuses[record.pk])
+                self._process_completed_status(record, facilities[key])
+        return failed_records
 
     def process_completed_observation(self, record):
         if record.facility != self.name:
@@ -1440,10 +1483,11 @@ class LCOFacility(BaseLCOFacility):
         if str(record.status or '').strip() != 'COMPLETED':
             raise ValueError(f'Observation {record.observation_id} is not completed yet.')
 
-        _, facility = self._record_account_facility(record)
-        result = self._sync_completed_lco_dataproducts(record, facility.facility_settings, force=True)
-        logger.info('Manual LCO processing finished for observation %s: %s', record.observation_id, result)
-        return result
+        from custom_code.lco_frame_sync import enqueue_lco_frame_sync
+
+        queued = enqueue_lco_frame_sync(record, force=True)
+        logger.info('Manual LCO processing queued for observation %s.', record.observation_id)
+        return {'queued': queued}
 
     def _archive_api_url(self, path):
         root_url = str(getattr(settings, 'LCO_ARCHIVE_API_URL', LCO_ARCHIVE_API_URL) or LCO_ARCHIVE_API_URL).rstrip('/')
@@ -1458,28 +1502,24 @@ class LCOFacility(BaseLCOFacility):
     def _archive_headers(self, api_key):
         return {'Authorization': f'Token {api_key}'}
 
-    def _iter_completed_archive_frames(self, observation_id, api_key):
-        next_url = self._archive_api_url('/frames/')
-        params = {
-            'request_id': observation_id,
-            'reduction_level': 91,
-            'configuration_type': 'EXPOSE',
-            'public': 'false',
-            'limit': 100,
-        }
-        while next_url:
-            response = requests.get(
-                next_url,
-                params=params,
-                headers=self._archive_headers(api_key),
-                timeout=self._archive_timeout(),
-            )
-            response.raise_for_status()
-            payload = response.json()
-            for frame in payload.get('results') or []:
-                yield frame
-            next_url = payload.get('next')
-            params = None
+    def _archive_frames_page(self, observation_id, api_key, offset=0, limit=100):
+        """One page of the reduced archive frames of a request, and whether more pages follow."""
+        response = requests.get(
+            self._archive_api_url('/frames/'),
+            params={
+                'request_id': observation_id,
+                'reduction_level': 91,
+                'configuration_type': 'EXPOSE',
+                'public': 'false',
+                'limit': limit,
+                'offset': offset,
+            },
+            headers=self._archive_headers(api_key),
+            timeout=self._archive_timeout(),
+        )
+        response.raise_for_status()
+        payload = response.json()
+        return list(payload.get('results') or []), bool(payload.get('next'))
 
     def _frame_filename(self, frame):
         basename = str(frame.get('basename') or '').strip()
@@ -1501,60 +1541,85 @@ class LCOFacility(BaseLCOFacility):
             return filename
         return f'{filename}.fits'
 
-    def _create_lco_dataproduct(self, record, frame, api_key, *, force=False):
+    def _frame_checksum(self, frame):
+        """The archive MD5 of a frame file, when the frame listing carries one."""
+        for version in frame.get('version_set') or []:
+            if version.get('md5'):
+                return str(version['md5'])
+        return str(frame.get('md5') or '')
+
+    def _existing_frame_dataproduct(self, record, frame):
         frame_id = str(frame.get('id') or '').strip()
         if not frame_id:
             raise ValueError(f'Missing LCO archive frame id for observation {record.observation_id}.')
-
-        existing = DataProduct.objects.filter(observation_record=record, product_id=frame_id).order_by('-created').first()
-        created_new = existing is None
-        if existing is not None and not force:
-            return existing, False
-
+        return DataProduct.objects.filter(observation_record=record, product_id=frame_id).order_by('-created').first()
+
+    def _frame_needs_download(self, frame, existing, *, force=False):
+        """Whether a frame has to be fetched: new frames always, stored ones only when forced and changed."""
+        if existing is None:
+            return True
+        if not force:
+            return False
+        stored = load_extra_data_dict(existing).get('lco_archive_frame') or {}
+        checksum = self._frame_checksum(frame)
+        return not checksum or checksum != stored.get('md5')
+
+    def _download_lco_frame(self, record, frame):
+        """Stream one frame file to the local archive cache; runs in the frame-sync worker threads."""
+        frame_id = str(frame.get('id') or '').strip()
         download_url = str(frame.get('url') or '').strip()
         if not download_url:
             raise ValueError(f'Missing download url for LCO archive frame {frame_id}.')
-
-        download_response = requests.get(
+        # Frame URLs are signed and expire, so partial downloads are keyed by frame id and checksum.
+        product = download_product(
             download_url,
+            key=f'lco-frame-{frame_id}-{self._frame_checksum(frame)}',
             timeout=self._archive_timeout(),
         )
-        download_response.raise_for_status()
         logger.info(
             'Downloaded LCO frame frame_id=%s observation_id=%s source_name=%s bytes=%s',
             frame_id,
             record.observation_id,
             self._frame_filename(frame),
-            len(download_response.content),
+            product.size,
         )
+        return product
 
-        uploaded_file = SimpleUploadedFile(
-            self._frame_filename(frame),
-            download_response.content,
-            content_type='application/fits',
-        )
-        normalized_file, normalization_metadata = normalize_fits_upload(uploaded_file)
-        normalized_file.name = self._normalized_frame_filename(frame)
-        normalized_file.seek(0)
-        logger.info(
-            'Normalized LCO frame frame_id=%s observation_id=%s normalized_name=%s metadata=%s',
-            frame_id,
-            record.observation_id,
-            normalized_file.name,
-            normalization_metadata,
-        )
+    def _save_lco_frame(self, record, frame, product, existing=None):
+        """Normalise a downloaded frame from disk into the record's DataProduct."""
+        frame_id = str(frame.get('id') or '').strip()
+        if existing is not None:
+            stored = load_extra_data_dict(existing).get('lco_archive_frame') or {}
+            if stored.get('sha256') == product.sha256:
+                logger.info('LCO frame frame_id=%s is unchanged; keeping dataproduct %s.', frame_id, existing.pk)
+                return existing
+
+        with open(product.path, 'rb') as handle:
+            normalized_file, normalization_metadata = normalize_fits_upload(File(handle, name=self._frame_filename(frame)))
+            normalized_file.name = self._normalized_frame_filename(frame)
+            normalized_file.seek(0)
+            logger.info(
+                'Normalized LCO frame frame_id=%s observation_id=%s normalized_name=%s metadata=%s',
+                frame_id,
+                record.observation_id,
+                normalized_file.name,
+                normalization_metadata,
+            )
 
-        dataproduct = existing or DataProduct(
-            target=record.target,
-            observation_record=record,
-            product_id=frame_id,
-            data_product_type='fits_file',
-        )
-        dataproduct.target = record.target
-        dataproduct.observation_record = record
-        dataproduct.product_id = frame_id
-        dataproduct.data_product_type = 'fits_file'
-        dataproduct.data.save(normalized_file.name, normalized_file, save=False)
+            dataproduct = existing or DataProduct(
+                target=record.target,
+                observation_record=record,
+                product_id=frame_id,
+                data_product_type='fits_file',
+            )
+            dataproduct.target = record.target
+            dataproduct.observation_record = record
+            dataproduct.product_id = frame_id
+            dataproduct.data_product_type = 'fits_file'
+            try:
+                dataproduct.data.save(normalized_file.name, normalized_file, save=False)
+            finally:
+                normalized_file.close()
         dataproduct.save()
         logger.info(
             'Saved LCO dataproduct frame_id=%s observation_id=%s dataproduct_id=%s stored_name=%s',
@@ -1572,71 +1637,47 @@ class LCOFacility(BaseLCOFacility):
             'basename': str(frame.get('basename') or ''),
             'filename': normalized_file.name,
             'reduction_level': frame.get('reduction_level'),
+            'md5': self._frame_checksum(frame),
+            'sha256': product.sha256,
             'normalization': normalization_metadata,
         }
         save_extra_data_dict(dataproduct, metadata)
-
-        return dataproduct, created_new
-
-    def _sync_completed_lco_dataproducts(self, record, facility_settings, *, force=False):
-        archive_api_key = str(facility_settings.get_setting('api_key') or '').strip()
-        if not archive_api_key:
-            logger.warning('Skipping LCO archive sync for observation %s because no LCO API key is configured.', record.observation_id)
-            return {'frames_seen': 0, 'created': 0, 'forwarded': 0, 'already_forwarded': 0}
-
-        bhtom2_token = str(getattr(settings, 'BHTOM2_API_TOKEN', '') or '').strip()
-        if not bhtom2_token:
-            logger.warning('Skipping automatic BHTOM2 forwarding for observation %s because BHTOM2_API_TOKEN is empty.', record.observation_id)
-            return {'frames_seen': 0, 'created': 0, 'forwarded': 0, 'already_forwarded': 0}
-
-        logger.info('Starting LCO archive sync for observation %s.', record.observation_id)
-        result = {
-            'frames_seen': 0,
-            'created': 0,
-            'forwarded': 0,
-            'already_forwarded': 0,
-            'refreshed': 0,
-        }
-        for frame in self._iter_completed_archive_frames(record.observation_id, archive_api_key):
-            result['frames_seen'] += 1
-            logger.info(
-                'Processing LCO frame frame_id=%s observation_id=%s filename=%s reduction_level=%s',
-                frame.get('id'),
-                record.observation_id,
-                self._frame_filename(frame),
-                frame.get('reduction_level'),
-            )
-            dataproduct, created_new = self._create_lco_dataproduct(record, frame, archive_api_key, force=force)
-            if created_new:
-                result['created'] += 1
-            elif force:
-                result['refreshed'] += 1
-            if not force and not created_new and has_successful_bhtom2_upload(dataproduct):
-                result['already_forwarded'] += 1
-                logger.info(
-                    'Skipping already-forwarded LCO dataproduct frame_id=%s observation_id=%s dataproduct_id=%s',
-                    frame.get('id'),
-                    record.observation_id,
-                    dataproduct.pk,
-                )
-                continue
-            observatory_oname = resolve_lco_bhtom2_observatory_oname(frame, bhtom2_token)
-            forward_dataproduct_to_bhtom2(
-                dataproduct,
-                token=bhtom2_token,
-                observatory=observatory_oname,
-                calibration_filter=LCO_BHTOM2_AUTOMATED_FILTER,
-                comment=f'Uploaded automatically from BHTOM3 LCO observation {record.observation_id}',
-                user_id=record.user_id,
-            )
-            result['forwarded'] += 1
+        return dataproduct
+
+    def _forward_synced_frame(self, record, frame, dataproduct, bhtom2_token, result, *, created_new, force=False):
+        """Queue a synced frame for BHTOM2 unless it was forwarded before, and count the outcome in ``result``."""
+        if created_new:
+            result['created'] += 1
+        elif force:
+            result['refreshed'] += 1
+        if not force and not created_new and has_successful_bhtom2_upload(dataproduct):
+            result['already_forwarded'] += 1
             logger.info(
-                'Forwarded LCO dataproduct frame_id=%s observation_id=%s dataproduct_id=%s upload_name=%s observatory=%s',
+                'Skipping already-forwarded LCO dataproduct frame_id=%s observation_id=%s dataproduct_id=%s',
                 frame.get('id'),
                 record.observation_id,
                 dataproduct.pk,
-                dataproduct.get_file_name(),
-                observatory_oname,
             )
-        logger.info('Finished LCO archive sync for observation %s: %s', record.observation_id, result)
-        return result
+            return
+        observatory_oname = resolve_lco_bhtom2_observatory_oname(frame, bhtom2_token)
+        queued = enqueue_bhtom2_forward(
+            dataproduct,
+            observatory=observatory_oname,
+            calibration_filter=LCO_BHTOM2_AUTOMATED_FILTER,
+            comment=f'Uploaded automatically from BHTOM3 LCO observation {record.observation_id}',
+            user_id=record.user_id,
+            site_token=True,
+            force=force,
+        )
+        if not queued:
+            result['already_forwarded'] += 1
+            return
+        result['forwarded'] += 1
+        logger.info(
+            'Queued LCO dataproduct for BHTOM2 frame_id=%s observation_id=%s dataproduct_id=%s upload_name=%s observatory=%s',
+            frame.get('id'),
+            record.observation_id,
+            dataproduct.pk,
+            dataproduct.get_file_name(),
+            observatory_oname,
+        )
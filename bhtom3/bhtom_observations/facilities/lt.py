@@ -17,9 +17,9 @@ from crispy_forms.bootstrap import PrependedAppendedText, PrependedText
 from tom_observations.facility import BaseRoboticObservationForm, BaseRoboticObservationFacility
 from tom_targets.models import Target
 
-#from tom_lt import __version__
+from custom_code.exposure_time import MOON_PHASES, ExposureLimits, ImagerModel, SpectrographModel
 
-import math
+#from tom_lt import __version__
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -397,11 +397,12 @@ class LT_SPRAT_ObservationForm(LTObservationForm):
 
         self.exposure_times = {}
 
-        instrument = "sprat"
-        for grating_option in valid_gratings:
-            self.exposure_times[grating_option] = calculate_exposure_time(None, None, None, None, None, None, instrument, "spratslit", grating_option, 10, self.mag_init, 1.2)
-            #calculate_exposure_time(None, None, None, None, None, None, spmag=self.mag_init, sparm=grating_option, spinstrum=instrument, spslit="spratslit",
-            #    spsnr = 50, spseeing = 1.2)
+        # All gratings in one call, for S/N=10 in 1.2 arcsec seeing; -1 when out of limits.
+        exposure_times = lt_spectrograph_model("sprat", "spratslit").exposure_times_by_filter(
+            valid_gratings, self.mag_init, signal_to_noise=10, seeing=1.2
+        )
+        for grating_option, exposure_time in exposure_times.items():
+            self.exposure_times[grating_option] = -1 if exposure_time is None else exposure_time
         
         # Set initial exposure time based on the first filter choice
         first_filter = valid_gratings[0][0]
@@ -644,131 +645,102 @@ class LTFacility(BaseRoboticObservationFacility):
     
 
 
-def calculate_exposure_time(instrum, binn, filt, snr, mag, seeing, spinstrum=None, spslit=None, sparm=None, spsnr=None, spmag=None, spseeing=None):
-    # Define instrument characteristics for imaging
-    instrum_data = {
-        "ioo": {"pixscale": 0.15, "darkcurrent": 0, "readnoise": 10},
-        "ioi": {"pixscale": 0.18, "darkcurrent": 0, "readnoise": 17},
-        "rise": {"pixscale": 0.54, "darkcurrent": 0, "readnoise": 10},
-        "ringo": {"pixscale": 0.48, "darkcurrent": 0, "readnoise": 17}
-    }
+# Imaging instruments, filters and spectrographs of the Liverpool Telescope exposure-time calculator.
+LT_ETC_IMAGERS = {
+    "ioo": {"pixscale": 0.15, "darkcurrent": 0, "readnoise": 10},
+    "ioi": {"pixscale": 0.18, "darkcurrent": 0, "readnoise": 17},
+    "rise": {"pixscale": 0.54, "darkcurrent": 0, "readnoise": 10},
+    "ringo": {"pixscale": 0.48, "darkcurrent": 0, "readnoise": 17}
+}
+LT_ETC_FILTERS = {
+    "fsu": {"zp": 22.17, "skybr": 21.0, "skyoff": 1.5},
+    "fbb": {"zp": 24.90, "skybr": 22.3, "skyoff": 1.5},
+    "fbv": {"zp": 24.96, "skybr": 21.4, "skyoff": 1.5},
+    "fsg": {"zp": 25.14, "skybr": 21.7, "skyoff": 1.0},
+    "fsr": {"zp": 25.39, "skybr": 20.4, "skyoff": 1.0},
+    "fsi": {"zp": 25.06, "skybr": 19.3, "skyoff": 1.0},
+    "fsz": {"zp": 24.52, "skybr": 18.3, "skyoff": 0.5},
+    "fjj": {"zp": 24.50, "skybr": 16.6, "skyoff": 0.0},
+    "fhh": {"zp": 24.00, "skybr": 12.5, "skyoff": 0.0},
+    "frise": {"zp": 25.20, "skybr": 20.4, "skyoff": 1.0},
+    "frise720": {"zp": 23.40, "skybr": 19.3, "skyoff": 1.0},
+    "fringr": {"zp": 21, "skybr": 19.3, "skyoff": 1.0},
+    "fringg": {"zp": 21.8, "skybr": 20.4, "skyoff": 1.0},
+    "fringb": {"zp": 23, "skybr": 22.3, "skyoff": 1.5}
+}
+LT_ETC_BINNING = {"two": 2, "one": 1}
+LT_ETC_SPECTROGRAPHS = {
+    "frodo": {"sppixscale": 0.82, "spdarkcurrent": 0, "spreadnoise": 10},
+    "sprat": {"sppixscale": 0.48, "spdarkcurrent": 0, "spreadnoise": 9}
+}
+LT_ETC_SLITS = {
+    "spratslit": 2,
+    "ifu": 10
+}
+LT_ETC_ARMS = {
+    "frredarmv": {"spzp": 16.0, "spskybr": 20.8, "spskyoff": 1.0, "spres": 5300, "wvpixscale": 0.8, "refwav": 7000},
+    "frbluarmv": {"spzp": 14.5, "spskybr": 22.8, "spskyoff": 1.5, "spres": 5500, "wvpixscale": 0.35, "refwav": 4500},
+    "frredarm": {"spzp": 15.60, "spskybr": 20.8, "spskyoff": 1.0, "spres": 2200, "wvpixscale": 1.9, "refwav": 7000},
+    "frbluarm": {"spzp": 14.70, "spskybr": 22.8, "spskyoff": 1.5, "spres": 2600, "wvpixscale": 0.60, "refwav": 4500},
+    "spredarm": {"spzp": 17.7, "spskybr": 20.8, "spskyoff": 1.0, "spres": 350, "wvpixscale": 9.0, "refwav": 7000},
+    "spbluarm": {"spzp": 17.2, "spskybr": 22.8, "spskyoff": 1.5, "spres": 350, "wvpixscale": 3.0, "refwav": 4500}
+}
+# Exposures must stay under 3 hours and 10000 e-/pixel from the target.
+LT_ETC_LIMITS = {"minimum": 1.0, "maximum": 10800.0, "saturation_level": 10000.0}
+
+
+def _lt_sky_by_moon_phase(skybr, skyoff):
+    # Dark, grey and bright sky; the calculator used to assume grey time only.
+    return tuple(skybr - skyoff * phase for phase in range(len(MOON_PHASES)))
+
+
+def lt_imager_model(instrum, binn):
+    instrument = LT_ETC_IMAGERS[instrum]
+    return ImagerModel(
+        name=f"LT {instrum}",
+        pixel_scale=instrument["pixscale"] * LT_ETC_BINNING[binn],
+        read_noise=instrument["readnoise"],
+        dark_current=instrument["darkcurrent"],
+        zeropoints={code: data["zp"] for code, data in LT_ETC_FILTERS.items()},
+        sky_brightness={code: _lt_sky_by_moon_phase(data["skybr"], data["skyoff"]) for code, data in LT_ETC_FILTERS.items()},
+        aperture_diameter=0,
+        limits=ExposureLimits(overhead_factor=1.1, **LT_ETC_LIMITS),  # Zielinski factor
+    )
+
+
+def lt_spectrograph_model(spinstrum, spslit):
+    spectrograph = LT_ETC_SPECTROGRAPHS[spinstrum]
+    return SpectrographModel(
+        name=f"LT {spinstrum}",
+        pixel_scale=spectrograph["sppixscale"],
+        read_noise=spectrograph["spreadnoise"],
+        dark_current=spectrograph["spdarkcurrent"],
+        slit_width=LT_ETC_SLITS[spslit],
+        arms={
+            arm: {
+                "zeropoint": data["spzp"],
+                "sky_brightness": _lt_sky_by_moon_phase(data["spskybr"], data["spskyoff"]),
+                "resolution": data["spres"],
+                "dispersion": data["wvpixscale"],
+                "reference_wavelength": data["refwav"],
+            }
+            for arm, data in LT_ETC_ARMS.items()
+        },
+        limits=ExposureLimits(**LT_ETC_LIMITS),
+    )
 
-    # Define filter characteristics
-    filter_data = {
-        "fsu": {"zp": 22.17, "skybr": 21.0, "skyoff": 1.5},
-        "fbb": {"zp": 24.90, "skybr": 22.3, "skyoff": 1.5},
-        "fbv": {"zp": 24.96, "skybr": 21.4, "skyoff": 1.5},
-        "fsg": {"zp": 25.14, "skybr": 21.7, "skyoff": 1.0},
-        "fsr": {"zp": 25.39, "skybr": 20.4, "skyoff": 1.0},
-        "fsi": {"zp": 25.06, "skybr": 19.3, "skyoff": 1.0},
-        "fsz": {"zp": 24.52, "skybr": 18.3, "skyoff": 0.5},
-        "fjj": {"zp": 24.50, "skybr": 16.6, "skyoff": 0.0},
-        "fhh": {"zp": 24.00, "skybr": 12.5, "skyoff": 0.0},
-        "frise": {"zp": 25.20, "skybr": 20.4, "skyoff": 1.0},
-        "frise720": {"zp": 23.40, "skybr": 19.3, "skyoff": 1.0},
-        "fringr": {"zp": 21, "skybr": 19.3, "skyoff": 1.0},
-        "fringg": {"zp": 21.8, "skybr": 20.4, "skyoff": 1.0},
-        "fringb": {"zp": 23, "skybr": 22.3, "skyoff": 1.5}
-    }
 
-    # Define binning values
-    bin_values = {"two": 2, "one": 1}
-
-    # Imaging calculation
-    if instrum in instrum_data and binn in bin_values and filt in filter_data:
-        pixscale = instrum_data[instrum]["pixscale"]
-        darkcurrent = instrum_data[instrum]["darkcurrent"]
-        readnoise = instrum_data[instrum]["readnoise"]
-        bin_factor = bin_values[binn]
-        zp = filter_data[filt]["zp"]
-        skybr = filter_data[filt]["skybr"]
-        skyoff = filter_data[filt]["skyoff"]
-
-        # Calculate exposure time for photometry
-        exposure_time = 0.1
-#        seeing = 0.5 + (i / 2)
-#        skymag = skybr - (skyoff * j)
-        j=1.0
-        skymag = skybr - skyoff*j
-        ###
-        areaofdisk = (seeing * 2) ** 2
-        numberofpixels = areaofdisk / (pixscale * pixscale * bin_factor * bin_factor)
-        starphotons = 10 ** ((zp - mag) / 2.5)
-        skyphotons = 10 ** ((zp - skymag) / 2.5) * areaofdisk
-        a = starphotons ** 2
-        b = -snr ** 2 * (starphotons + skyphotons + darkcurrent)
-        c = -snr ** 2 * numberofpixels * readnoise ** 2
-        texpaa = (-b + math.sqrt(b * b - 4 * a * c)) / (2 * a)
-        texpbb = (-b - math.sqrt(b * b - 4 * a * c)) / (2 * a)
-        exposure_time = max(texpaa, texpbb)
-
-        # Check for exposure time limits
-        if exposure_time < 1.0:
-            exposure_time = 1
-        if exposure_time > 10800 or (starphotons * exposure_time / numberofpixels) > 10000:
-            exposure_time = -1
-
-        return exposure_time*1.1 #Zielinski factor
-
-    # Spectroscopy calculation
+def calculate_exposure_time(instrum, binn, filt, snr, mag, seeing, spinstrum=None, spslit=None, sparm=None, spsnr=None, spmag=None, spseeing=None):
+    """Suggested exposure time in seconds for imaging or, without an imager, spectroscopy; -1 when out of limits."""
+    if instrum in LT_ETC_IMAGERS and binn in LT_ETC_BINNING and filt in LT_ETC_FILTERS:
+        model = lt_imager_model(instrum, binn)
+        exposure_time = model.exposure_times_by_filter([filt], mag, signal_to_noise=snr, seeing=seeing)[filt]
     elif spinstrum and spslit and sparm and spmag and spsnr:
-        spectrometer_data = {
-            "frodo": {"sppixscale": 0.82, "spdarkcurrent": 0, "spreadnoise": 10},
-            "sprat": {"sppixscale": 0.48, "spdarkcurrent": 0, "spreadnoise": 9}
-        }
-
-        slit_data = {
-            "spratslit": 2,
-            "ifu": 10
-        }
-
-        arm_data = {
-            "frredarmv": {"spzp": 16.0, "spskybr": 20.8, "spskyoff": 1.0, "spres": 5300, "wvpixscale": 0.8, "refwav": 7000},
-            "frbluarmv": {"spzp": 14.5, "spskybr": 22.8, "spskyoff": 1.5, "spres": 5500, "wvpixscale": 0.35, "refwav": 4500},
-            "frredarm": {"spzp": 15.60, "spskybr": 20.8, "spskyoff": 1.0, "spres": 2200, "wvpixscale": 1.9, "refwav": 7000},
-            "frbluarm": {"spzp": 14.70, "spskybr": 22.8, "spskyoff": 1.5, "spres": 2600, "wvpixscale": 0.60, "refwav": 4500},
-            "spredarm": {"spzp": 17.7, "spskybr": 20.8, "spskyoff": 1.0, "spres": 350, "wvpixscale": 9.0, "refwav": 7000},
-            "spbluarm": {"spzp": 17.2, "spskybr": 22.8, "spskyoff": 1.5, "spres": 350, "wvpixscale": 3.0, "refwav": 4500}
-        }
-
-        sppixscale = spectrometer_data[spinstrum]["sppixscale"]
-        spdarkcurrent = spectrometer_data[spinstrum]["spdarkcurrent"]
-        spreadnoise = spectrometer_data[spinstrum]["spreadnoise"]
-        slitwd = slit_data[spslit]
-        spzp = arm_data[sparm]["spzp"]
-        spskybr = arm_data[sparm]["spskybr"]
-        spskyoff = arm_data[sparm]["spskyoff"]
-        spres = arm_data[sparm]["spres"]
-        wvpixscale = arm_data[sparm]["wvpixscale"]
-        refwav = arm_data[sparm]["refwav"]
-
-        # Calculate exposure times for spectroscopy
-        exposure_time = 0.1
-        sj = 1.0
-#        spseeing = 0.5 + (si / 2)
-        spskymag = spskybr - (spskyoff * sj)
-        spatialarcs = (slitwd * spseeing * 2)
-        spatialarea = spatialarcs / (sppixscale * sppixscale)
-        specpixsc = refwav / (spres * wvpixscale)
-        spnumberofpixels = spatialarea * specpixsc
-        spstarphotons = 10 ** ((spzp - spmag) / 2.5) * (refwav / spres)
-        spskyphotons = 10 ** ((spzp - spskymag) / 2.5) * (refwav / spres) * spatialarcs
-        spa = spstarphotons ** 2
-        spb = -spsnr ** 2 * (spstarphotons + spskyphotons + spdarkcurrent)
-        spc = -spsnr ** 2 * spnumberofpixels * spreadnoise ** 2
-        sptexpaa = (-spb + math.sqrt(spb * spb - 4 * spa * spc)) / (2 * spa)
-        sptexpbb = (-spb - math.sqrt(spb * spb - 4 * spa * spc)) / (2 * spa)
-        exposure_time = max(sptexpaa, sptexpbb)
-
-        # Check for exposure time limits
-        if exposure_time < 1.0:
-            exposure_time = 1
-        if exposure_time > 10800 or (spstarphotons * exposure_time / spnumberofpixels) > 10000:
-            print(f"SPEC limit hit: {(spstarphotons * exposure_time / spnumberofpixels)}")
-            print(f"{exposure_time}")
-            exposure_time = -1
-
-        return exposure_time
+        model = lt_spectrograph_model(spinstrum, spslit)
+        exposure_time = model.exposure_times_by_filter([sparm], spmag, signal_to_noise=spsnr, seeing=spseeing)[sparm]
+    else:
+        return None
+    return -1 if exposure_time is None else exposure_time
 
 # # Example usage:
 # # For imaging
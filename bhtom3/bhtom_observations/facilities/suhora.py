@@ -8,6 +8,7 @@ from tom_observations.cadence import CadenceForm
 from tom_targets.models import Target
 
 from custom_code.models import BhtomTarget
+from custom_code.exposure_time import ScaledExposureModel
 from custom_code.facility_proposals import get_proposal_by_pk, get_proposal_choices_for_user
 from django.core.mail import send_mail
 from django.conf import settings
@@ -20,6 +21,12 @@ TERMINAL_OBSERVING_STATES = SUCCESSFUL_OBSERVING_STATES + FAILED_OBSERVING_STATE
 
 valid_instruments = ['Suhora']
 valid_filters = [['U','U'],['B','B'],['V','V'],['I','I']] 
+# http://www.rem.inaf.it/?p=etc: 60s for V=15mag gives S/N=100 in optical.
+SUHORA_ETC_MODEL = ScaledExposureModel(
+    name='SUHORA',
+    filters=tuple(code for code, _ in valid_filters),
+    filter_exposures={'U': 60, 'B': 60, 'V': 60, 'I': 60},
+)
 
 proposal_choices = []
 
@@ -67,11 +74,10 @@ class SUHORAPhotometricSequenceForm(BaseRoboticObservationForm):
 
         self.exposure_times = {}
 
-        instrument = "SUHORA60_APOGEE"
-        for filter_option, _ in valid_filters:
-            self.exposure_times[filter_option] = int(self.exposure_time_calculator(
-                mag=self.mag_init, filter_name=filter_option, instrument=instrument
-            )) #it has to be int - SUHORA's requirement
+        # All filters in one call; -1 marks filters without a suggestion (it has to be int - SUHORA's requirement).
+        exposure_times = SUHORA_ETC_MODEL.exposure_times_by_filter([code for code, _ in valid_filters], self.mag_init)
+        for filter_option, exposure_time in exposure_times.items():
+            self.exposure_times[filter_option] = -1 if exposure_time is None else int(exposure_time)
         
         # Set initial exposure time based on the first filter choice
         first_filter = self.fields['filter'].initial or valid_filters[0][0]
@@ -114,23 +120,8 @@ class SUHORAPhotometricSequenceForm(BaseRoboticObservationForm):
     def exposure_time_calculator(self, mag, filter_name, instrument):
         if instrument not in valid_instruments:
             return -1
-        if filter_name in [item for sublist in valid_filters for item in sublist]:
-            pass
-        else:
-            return -1
-
-        # Define a base exposure time for each filter
-        filter_base_exposure_times = {
-            'U': 60,   
-            'B': 60,   
-            'V': 60,   
-            'I': 60,
-        }
-
-        # Get the base exposure time for the selected filter
-        base_exposure_time = filter_base_exposure_times.get(filter_name, 60)  # Default to 60s
-        adjusted_exposure_time = base_exposure_time * (10**((mag-15)/2.5))
-        return adjusted_exposure_time
+        exposure_time = SUHORA_ETC_MODEL.exposure_times_by_filter([filter_name], mag)[filter_name]
+        return -1 if exposure_time is None else exposure_time
 
 
 class SUHORA(BaseRoboticObservationFacility):
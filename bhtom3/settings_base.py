@@ -19,6 +19,15 @@ BHTOM2_UPLOAD_SERVICE_URL = secret.get('BHTOM2_UPLOAD_SERVICE_URL', secret.get('
 BHTOM2_API_BASE_URL = secret.get('BHTOM2_API_BASE_URL', '')
 BHTOM2_API_TOKEN = secret.get('BHTOM2_API_TOKEN', '')
 BHTOM2_API_TIMEOUT = int(secret.get('BHTOM2_API_TIMEOUT', '30'))
+# FITS forwarding to BHTOM2 runs as db_worker jobs; failed uploads are retried with exponential
+# backoff and at most BHTOM2_FORWARD_MAX_CONCURRENCY uploads run at once per worker process.
+BHTOM2_FORWARD_MAX_ATTEMPTS = int(secret.get('BHTOM2_FORWARD_MAX_ATTEMPTS', os.environ.get('BHTOM2_FORWARD_MAX_ATTEMPTS', '5')))
+BHTOM2_FORWARD_BACKOFF_SECONDS = int(secret.get('BHTOM2_FORWARD_BACKOFF_SECONDS', os.environ.get('BHTOM2_FORWARD_BACKOFF_SECONDS', '60')))
+BHTOM2_FORWARD_MAX_BACKOFF_SECONDS = int(secret.get('BHTOM2_FORWARD_MAX_BACKOFF_SECONDS', os.environ.get('BHTOM2_FORWARD_MAX_BACKOFF_SECONDS', '3600')))
+BHTOM2_FORWARD_MAX_CONCURRENCY = int(secret.get('BHTOM2_FORWARD_MAX_CONCURRENCY', os.environ.get('BHTOM2_FORWARD_MAX_CONCURRENCY', '2')))
+BHTOM2_UPLOAD_CHUNK_SIZE = int(secret.get('BHTOM2_UPLOAD_CHUNK_SIZE', os.environ.get('BHTOM2_UPLOAD_CHUNK_SIZE', '65536')))
+# FITS normalisation works disk to disk; at most FITS_FUNPACK_MAX_CONCURRENCY funpack processes run at once per process.
+FITS_FUNPACK_MAX_CONCURRENCY = int(secret.get('FITS_FUNPACK_MAX_CONCURRENCY', os.environ.get('FITS_FUNPACK_MAX_CONCURRENCY', '2')))
 PUBLIC_UPLOAD_PASSWORD = secret.get('PUBLIC_UPLOAD_PASSWORD', '')
 
 DATA_SERVICE_CONNECT_TIMEOUT = int(secret.get('DATA_SERVICE_CONNECT_TIMEOUT', os.environ.get('DATA_SERVICE_CONNECT_TIMEOUT', '10')))
@@ -26,7 +35,11 @@ DATA_SERVICE_READ_TIMEOUT = int(secret.get('DATA_SERVICE_READ_TIMEOUT', os.envir
 DATA_SERVICE_JOB_TIMEOUT = int(secret.get('DATA_SERVICE_JOB_TIMEOUT', os.environ.get('DATA_SERVICE_JOB_TIMEOUT', '300')))
 DB_WORKER_HEARTBEAT_INTERVAL = int(secret.get('DB_WORKER_HEARTBEAT_INTERVAL', os.environ.get('DB_WORKER_HEARTBEAT_INTERVAL', '300')))
 DB_WORKER_STALE_RUNNING_AFTER = int(secret.get('DB_WORKER_STALE_RUNNING_AFTER', os.environ.get('DB_WORKER_STALE_RUNNING_AFTER', '7200')))
-OBSERVATION_STATUS_FACILITY_TIMEOUT = int(secret.get('OBSERVATION_STATUS_FACILITY_TIMEOUT', os.environ.get('OBSERVATION_STATUS_FACILITY_TIMEOUT', '300')))
+# Facilities are updated concurrently, each in its own child with this timeout, so a full
+# sweep fits into one OBSERVATION_STATUS_UPDATE_INTERVAL_SECONDS tick.
+OBSERVATION_STATUS_FACILITY_TIMEOUT = int(secret.get('OBSERVATION_STATUS_FACILITY_TIMEOUT', os.environ.get('OBSERVATION_STATUS_FACILITY_TIMEOUT', '150')))
+OBSERVATION_STATUS_MAX_PARALLEL_FACILITIES = int(secret.get('OBSERVATION_STATUS_MAX_PARALLEL_FACILITIES', os.environ.get('OBSERVATION_STATUS_MAX_PARALLEL_FACILITIES', '10')))
+OBSERVATION_STATUS_LOOKUP_WORKERS = int(secret.get('OBSERVATION_STATUS_LOOKUP_WORKERS', os.environ.get('OBSERVATION_STATUS_LOOKUP_WORKERS', '8')))
 
 
 def env_bool(name, default=False):
@@ -213,6 +226,68 @@ STATIC_ROOT = os.path.join(BASE_DIR, '_static')
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_ROOT = os.path.join(BASE_DIR, 'data')
 MEDIA_URL = '/data/'
+# Data-product uploads are staged here in chunks and processed by db_worker.
+DATA_PRODUCT_UPLOAD_STAGING_DIR = os.path.join(MEDIA_ROOT, 'upload_staging')
+DATA_PRODUCT_UPLOAD_CHUNK_SIZE = int(secret.get('DATA_PRODUCT_UPLOAD_CHUNK_SIZE', os.environ.get('DATA_PRODUCT_UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024))))
+DATA_PRODUCT_UPLOAD_STAGING_MAX_AGE_SECONDS = int(secret.get('DATA_PRODUCT_UPLOAD_STAGING_MAX_AGE_SECONDS', os.environ.get('DATA_PRODUCT_UPLOAD_STAGING_MAX_AGE_SECONDS', '86400')))
+# Spectrum arrays are kept in float32 NPY files under SPECTRUM_STORAGE_DIR; 'inline' keeps them as JSON lists.
+SPECTRUM_STORAGE_BACKEND = secret.get('SPECTRUM_STORAGE_BACKEND', os.environ.get('SPECTRUM_STORAGE_BACKEND', 'npy'))
+SPECTRUM_STORAGE_DIR = os.path.join(MEDIA_ROOT, 'spectra')
+# Spectrum archive downloads (Gemini, ESO, LCO) are streamed into a content-addressed cache and resumed with HTTP ranges.
+ARCHIVE_DOWNLOAD_CACHE_DIR = os.path.join(MEDIA_ROOT, 'archive_cache')
+ARCHIVE_DOWNLOAD_MAX_CONCURRENCY = int(secret.get('ARCHIVE_DOWNLOAD_MAX_CONCURRENCY', os.environ.get('ARCHIVE_DOWNLOAD_MAX_CONCURRENCY', '4')))
+ARCHIVE_DOWNLOAD_MAX_ATTEMPTS = int(secret.get('ARCHIVE_DOWNLOAD_MAX_ATTEMPTS', os.environ.get('ARCHIVE_DOWNLOAD_MAX_ATTEMPTS', '3')))
+ARCHIVE_DOWNLOAD_CACHE_MAX_AGE_SECONDS = int(secret.get('ARCHIVE_DOWNLOAD_CACHE_MAX_AGE_SECONDS', os.environ.get('ARCHIVE_DOWNLOAD_CACHE_MAX_AGE_SECONDS', '604800')))
+# Completed LCO requests are synced from the archive by a background job, one page of frames per job.
+LCO_FRAME_SYNC_PAGE_SIZE = int(secret.get('LCO_FRAME_SYNC_PAGE_SIZE', os.environ.get('LCO_FRAME_SYNC_PAGE_SIZE', '100')))
+LCO_FRAME_SYNC_MAX_CONCURRENCY = int(secret.get('LCO_FRAME_SYNC_MAX_CONCURRENCY', os.environ.get('LCO_FRAME_SYNC_MAX_CONCURRENCY', '4')))
+LCO_FRAME_SYNC_MAX_ATTEMPTS = int(secret.get('LCO_FRAME_SYNC_MAX_ATTEMPTS', os.environ.get('LCO_FRAME_SYNC_MAX_ATTEMPTS', '5')))
+LCO_FRAME_SYNC_BACKOFF_SECONDS = int(secret.get('LCO_FRAME_SYNC_BACKOFF_SECONDS', os.environ.get('LCO_FRAME_SYNC_BACKOFF_SECONDS', '60')))
+LCO_FRAME_SYNC_STALE_SECONDS = int(secret.get('LCO_FRAME_SYNC_STALE_SECONDS', os.environ.get('LCO_FRAME_SYNC_STALE_SECONDS', '3600')))
+# Batch photometric classification cross-matches this many targets per catalogue upload query.
+PHOT_CLASSIFICATION_BATCH_SIZE = int(secret.get('PHOT_CLASSIFICATION_BATCH_SIZE', os.environ.get('PHOT_CLASSIFICATION_BATCH_SIZE', '500')))
+# Periodicity searches: largest frequency grid, and the work (points x frequencies, weighted per method)
+# above which a search runs in db_worker instead of the request; about 3e8 per second of CPU.
+PERIODICITY_MAX_FREQUENCIES = int(secret.get('PERIODICITY_MAX_FREQUENCIES', os.environ.get('PERIODICITY_MAX_FREQUENCIES', '500000')))
+PERIODICITY_SYNC_MAX_WORK = int(secret.get('PERIODICITY_SYNC_MAX_WORK', os.environ.get('PERIODICITY_SYNC_MAX_WORK', '1000000000')))
+# Stored Pallas queries (MPC observations, JPL Horizons, SsODNet) are refreshed after these TTLs; db_worker
+# refreshes recently read ones ahead of expiry every SOLAR_SYSTEM_CACHE_REFRESH_INTERVAL_SECONDS (0 disables).
+SOLAR_SYSTEM_CACHE_MPC_TTL_SECONDS = int(secret.get('SOLAR_SYSTEM_CACHE_MPC_TTL_SECONDS', os.environ.get('SOLAR_SYSTEM_CACHE_MPC_TTL_SECONDS', '21600')))
+SOLAR_SYSTEM_CACHE_HORIZONS_TTL_SECONDS = int(secret.get('SOLAR_SYSTEM_CACHE_HORIZONS_TTL_SECONDS', os.environ.get('SOLAR_SYSTEM_CACHE_HORIZONS_TTL_SECONDS', '86400')))
+SOLAR_SYSTEM_CACHE_SSODNET_TTL_SECONDS = int(secret.get('SOLAR_SYSTEM_CACHE_SSODNET_TTL_SECONDS', os.environ.get('SOLAR_SYSTEM_CACHE_SSODNET_TTL_SECONDS', '604800')))
+SOLAR_SYSTEM_CACHE_KEEP_SECONDS = int(secret.get('SOLAR_SYSTEM_CACHE_KEEP_SECONDS', os.environ.get('SOLAR_SYSTEM_CACHE_KEEP_SECONDS', str(30 * 86400))))
+SOLAR_SYSTEM_CACHE_REFRESH_INTERVAL_SECONDS = int(secret.get('SOLAR_SYSTEM_CACHE_REFRESH_INTERVAL_SECONDS', os.environ.get('SOLAR_SYSTEM_CACHE_REFRESH_INTERVAL_SECONDS', '900')))
+# Non-sidereal targets get precomputed positions every NON_SIDEREAL_EPHEMERIS_STEP_MINUTES from PAST_DAYS
+# before to FUTURE_DAYS after now; db_worker extends the grids every REFRESH_INTERVAL_SECONDS (0 disables).
+NON_SIDEREAL_EPHEMERIS_STEP_MINUTES = int(secret.get('NON_SIDEREAL_EPHEMERIS_STEP_MINUTES', os.environ.get('NON_SIDEREAL_EPHEMERIS_STEP_MINUTES', '60')))
+NON_SIDEREAL_EPHEMERIS_PAST_DAYS = int(secret.get('NON_SIDEREAL_EPHEMERIS_PAST_DAYS', os.environ.get('NON_SIDEREAL_EPHEMERIS_PAST_DAYS', '30')))
+NON_SIDEREAL_EPHEMERIS_FUTURE_DAYS = int(secret.get('NON_SIDEREAL_EPHEMERIS_FUTURE_DAYS', os.environ.get('NON_SIDEREAL_EPHEMERIS_FUTURE_DAYS', '30')))
+NON_SIDEREAL_EPHEMERIS_REFRESH_INTERVAL_SECONDS = int(secret.get('NON_SIDEREAL_EPHEMERIS_REFRESH_INTERVAL_SECONDS', os.environ.get('NON_SIDEREAL_EPHEMERIS_REFRESH_INTERVAL_SECONDS', '3600')))
+# Transits of TransitEphemeris planets are listed HORIZON_DAYS ahead, observable from a site when the target is
+# above MIN_ALTITUDE_DEG and the Sun below MAX_SUN_ALTITUDE_DEG; db_worker rolls the calendar every
+# REFRESH_INTERVAL_SECONDS (0 disables).
+TRANSIT_CALENDAR_HORIZON_DAYS = int(secret.get('TRANSIT_CALENDAR_HORIZON_DAYS', os.environ.get('TRANSIT_CALENDAR_HORIZON_DAYS', '14')))
+TRANSIT_CALENDAR_MIN_ALTITUDE_DEG = float(secret.get('TRANSIT_CALENDAR_MIN_ALTITUDE_DEG', os.environ.get('TRANSIT_CALENDAR_MIN_ALTITUDE_DEG', '30')))
+TRANSIT_CALENDAR_MAX_SUN_ALTITUDE_DEG = float(secret.get('TRANSIT_CALENDAR_MAX_SUN_ALTITUDE_DEG', os.environ.get('TRANSIT_CALENDAR_MAX_SUN_ALTITUDE_DEG', '-12')))
+TRANSIT_CALENDAR_REFRESH_INTERVAL_SECONDS = int(secret.get('TRANSIT_CALENDAR_REFRESH_INTERVAL_SECONDS', os.environ.get('TRANSIT_CALENDAR_REFRESH_INTERVAL_SECONDS', '3600')))
+# GeoTOM TLEs are mirrored from whole CelesTrak groups (comma-separated GROUPS), or from the *.tle/*.txt files of
+# DIRECTORY for installs without network access; a group is downloaded at most every MIN_FETCH_SECONDS and db_worker
+# syncs every SYNC_INTERVAL_SECONDS (0 disables). The GeoTOM list flags TLEs with an epoch older than STALE_DAYS.
+TLE_CATALOGUE_GROUPS = secret.get('TLE_CATALOGUE_GROUPS', os.environ.get('TLE_CATALOGUE_GROUPS', 'geo'))
+TLE_CATALOGUE_URL = secret.get('TLE_CATALOGUE_URL', os.environ.get('TLE_CATALOGUE_URL', 'https://celestrak.org/NORAD/elements/gp.php?GROUP={group}&FORMAT=tle'))
+TLE_CATALOGUE_DIRECTORY = secret.get('TLE_CATALOGUE_DIRECTORY', os.environ.get('TLE_CATALOGUE_DIRECTORY', ''))
+TLE_CATALOGUE_MIN_FETCH_SECONDS = int(secret.get('TLE_CATALOGUE_MIN_FETCH_SECONDS', os.environ.get('TLE_CATALOGUE_MIN_FETCH_SECONDS', '7200')))
+TLE_CATALOGUE_SYNC_INTERVAL_SECONDS = int(secret.get('TLE_CATALOGUE_SYNC_INTERVAL_SECONDS', os.environ.get('TLE_CATALOGUE_SYNC_INTERVAL_SECONDS', '21600')))
+TLE_CATALOGUE_STALE_DAYS = float(secret.get('TLE_CATALOGUE_STALE_DAYS', os.environ.get('TLE_CATALOGUE_STALE_DAYS', '3')))
+# The GeoTOM live stream computes positions for every observer site once per TICK_SECONDS, shared by all viewers;
+# each stream ends after STREAM_SECONDS (the browser then reconnects) so that it does not hold a worker forever.
+GEOTOM_LIVE_TICK_SECONDS = float(secret.get('GEOTOM_LIVE_TICK_SECONDS', os.environ.get('GEOTOM_LIVE_TICK_SECONDS', '1')))
+GEOTOM_LIVE_STREAM_SECONDS = int(secret.get('GEOTOM_LIVE_STREAM_SECONDS', os.environ.get('GEOTOM_LIVE_STREAM_SECONDS', '300')))
+# Bulk target imports write BATCH_SIZE targets per transaction; the DataServices of the imported targets run in one
+# queued job handling DATASERVICES_BATCH_SIZE targets at a time, DATASERVICES_INTERVAL_SECONDS apart.
+TARGET_IMPORT_BATCH_SIZE = int(secret.get('TARGET_IMPORT_BATCH_SIZE', os.environ.get('TARGET_IMPORT_BATCH_SIZE', '500')))
+TARGET_IMPORT_DATASERVICES_BATCH_SIZE = int(secret.get('TARGET_IMPORT_DATASERVICES_BATCH_SIZE', os.environ.get('TARGET_IMPORT_DATASERVICES_BATCH_SIZE', '20')))
+TARGET_IMPORT_DATASERVICES_INTERVAL_SECONDS = int(secret.get('TARGET_IMPORT_DATASERVICES_INTERVAL_SECONDS', os.environ.get('TARGET_IMPORT_DATASERVICES_INTERVAL_SECONDS', '60')))
 
 LOGGING = {
     'version': 1,
@@ -236,18 +311,42 @@ LOGGING = {
     }
 }
 
+# The default cache keeps recently used entries in a per-process LRU in front of the 'shared' cache
+# of the web and db_worker processes: a SQLite database, or Redis when CACHE_REDIS_URL is set.
+CACHE_SQLITE_PATH = secret.get('CACHE_SQLITE_PATH', os.environ.get('CACHE_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'bhtom3-cache.sqlite3')))
+CACHE_REDIS_URL = secret.get('CACHE_REDIS_URL', os.environ.get('CACHE_REDIS_URL', ''))
+CACHE_LOCAL_TIMEOUT = float(secret.get('CACHE_LOCAL_TIMEOUT', os.environ.get('CACHE_LOCAL_TIMEOUT', '5')))
+CACHE_LOCAL_MAX_BYTES = int(secret.get('CACHE_LOCAL_MAX_BYTES', os.environ.get('CACHE_LOCAL_MAX_BYTES', str(64 * 1024 * 1024))))
+# cached_value() waits this long for another process computing the same entry before computing it itself.
+CACHE_LOCK_TIMEOUT = int(secret.get('CACHE_LOCK_TIMEOUT', os.environ.get('CACHE_LOCK_TIMEOUT', '120')))
+CACHE_REVALIDATION_WORKERS = int(secret.get('CACHE_REVALIDATION_WORKERS', os.environ.get('CACHE_REVALIDATION_WORKERS', '2')))
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
-        'LOCATION': tempfile.gettempdir()
-    }
+        'BACKEND': 'custom_code.caching.TieredCache',
+        'OPTIONS': {
+            'SHARED_CACHE': 'shared',
+            'LOCAL_TIMEOUT': CACHE_LOCAL_TIMEOUT,
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_MAX_BYTES': CACHE_LOCAL_MAX_BYTES,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'custom_code.caching.SQLiteCache',
+        'LOCATION': CACHE_SQLITE_PATH,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
 }
 
 TARGET_TYPE = 'SIDEREAL'
 
 TARGET_MODEL_CLASS = 'custom_code.models.BhtomTarget'
 
-MATCH_MANAGERS = {}
+# Duplicate name checks of targets and aliases go through the indexed TargetNameIndex keys.
+MATCH_MANAGERS = {'Target': 'custom_code.target_names.BhtomTargetMatchManager'}
 
 FACILITIES = {
     'LCO': {
@@ -371,6 +470,8 @@ ATLAS_SERVICE_CONFIGURATION = {
 ATLAS_POLL_INTERVAL_SECONDS = int(secret.get('ATLAS_POLL_INTERVAL_SECONDS', os.environ.get('ATLAS_POLL_INTERVAL_SECONDS', '300')))
 ATLAS_JOB_MAX_AGE_SECONDS = int(secret.get('ATLAS_JOB_MAX_AGE_SECONDS', os.environ.get('ATLAS_JOB_MAX_AGE_SECONDS', '86400')))
 ATLAS_POLL_BATCH = int(secret.get('ATLAS_POLL_BATCH', os.environ.get('ATLAS_POLL_BATCH', '50')))
+ATLAS_POLL_WORKERS = int(secret.get('ATLAS_POLL_WORKERS', os.environ.get('ATLAS_POLL_WORKERS', '4')))
+ATLAS_THROTTLE_BACKOFF_SECONDS = int(secret.get('ATLAS_THROTTLE_BACKOFF_SECONDS', os.environ.get('ATLAS_THROTTLE_BACKOFF_SECONDS', '60')))
 
 
 def _discover_custom_harvesters():
@@ -467,6 +568,22 @@ HOOKS = {
 AUTO_QUERY_DATA_SERVICES_ON_TARGET_CREATE = True
 DATA_SERVICES_UPDATE_INTERVAL_SECONDS = 86400
 DATA_SERVICES_UPDATE_IMPORTANCE_GT = 0.0
+# Refresh scheduler (custom_code/refresh_scheduler.py): db_worker enqueues the most urgent
+# due (target, service) pairs every pass instead of every service for every target daily.
+DATA_SERVICES_SCHEDULER_INTERVAL_SECONDS = int(secret.get('DATA_SERVICES_SCHEDULER_INTERVAL_SECONDS', os.environ.get('DATA_SERVICES_SCHEDULER_INTERVAL_SECONDS', '300')))
+DATA_SERVICES_SCHEDULER_WINDOW = int(secret.get('DATA_SERVICES_SCHEDULER_WINDOW', os.environ.get('DATA_SERVICES_SCHEDULER_WINDOW', '200')))
+DATA_SERVICES_MIN_REFRESH_INTERVAL_SECONDS = int(secret.get('DATA_SERVICES_MIN_REFRESH_INTERVAL_SECONDS', os.environ.get('DATA_SERVICES_MIN_REFRESH_INTERVAL_SECONDS', '3600')))
+DATA_SERVICES_MAX_REFRESH_INTERVAL_SECONDS = int(secret.get('DATA_SERVICES_MAX_REFRESH_INTERVAL_SECONDS', os.environ.get('DATA_SERVICES_MAX_REFRESH_INTERVAL_SECONDS', str(30 * 86400))))
+DATA_SERVICES_MIN_SUN_SEPARATION_DEG = float(secret.get('DATA_SERVICES_MIN_SUN_SEPARATION_DEG', os.environ.get('DATA_SERVICES_MIN_SUN_SEPARATION_DEG', '15')))
+DATA_SERVICES_SUN_CONJUNCTION_DEFER_SECONDS = int(secret.get('DATA_SERVICES_SUN_CONJUNCTION_DEFER_SECONDS', os.environ.get('DATA_SERVICES_SUN_CONJUNCTION_DEFER_SECONDS', str(7 * 86400))))
+# Per-service publication cadence overrides, e.g. {'ZTF': 43200}; see refresh_cadence_seconds.
+DATA_SERVICES_REFRESH_CADENCE_SECONDS = {}
+# Learned per (target, service) interval multiplier: x2 after a refresh with nothing new,
+# x0.75 after one that brought new datums, aliases or target fields, within these caps.
+DATA_SERVICES_REFRESH_BACKOFF_MULTIPLIER = float(secret.get('DATA_SERVICES_REFRESH_BACKOFF_MULTIPLIER', os.environ.get('DATA_SERVICES_REFRESH_BACKOFF_MULTIPLIER', '2.0')))
+DATA_SERVICES_REFRESH_TIGHTEN_MULTIPLIER = float(secret.get('DATA_SERVICES_REFRESH_TIGHTEN_MULTIPLIER', os.environ.get('DATA_SERVICES_REFRESH_TIGHTEN_MULTIPLIER', '0.75')))
+DATA_SERVICES_REFRESH_MAX_BACKOFF_FACTOR = float(secret.get('DATA_SERVICES_REFRESH_MAX_BACKOFF_FACTOR', os.environ.get('DATA_SERVICES_REFRESH_MAX_BACKOFF_FACTOR', '32')))
+DATA_SERVICES_REFRESH_MIN_TIGHTEN_FACTOR = float(secret.get('DATA_SERVICES_REFRESH_MIN_TIGHTEN_FACTOR', os.environ.get('DATA_SERVICES_REFRESH_MIN_TIGHTEN_FACTOR', '0.25')))
 
 AUTO_THUMBNAILS = False
 
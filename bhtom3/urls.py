@@ -26,6 +26,9 @@ from custom_code.views import (
     Bhtom2TargetListView,
     BhtomTargetCreateView,
     BhtomDataProductSaveView,
+    BhtomDataProductUploadBatchStatusView,
+    BhtomDataProductUploadChunkView,
+    BhtomDataProductUploadStartView,
     BhtomDataProductUploadView,
     BhtomTargetDetailView,
     TargetDownloadPhotometryDataApiView,
@@ -38,8 +41,10 @@ from custom_code.views import (
     BhtomPallasView,
     GeoTomDeleteSatView,
     GeoTomLiveDataView,
+    GeoTomLiveStreamView,
     GeoTomRefreshTleView,
     GeoTomRefreshSingleTleView,
+    GeoTomSunExclusionView,
     GeoTomTargetListView,
     LegacyLogoutView,
     OrcidCallbackView,
@@ -59,6 +64,9 @@ from custom_code.views import (
     UpdateReducedDataAndDataServicesView,
     TargetPeriodicityView,
     TargetPeriodicityComputeView,
+    TargetPeriodicitySearchView,
+    TransitCalendarApiView,
+    TransitCalendarView,
 )
 
 urlpatterns = [
@@ -70,6 +78,8 @@ urlpatterns = [
     path('targets/search/', GenericTargetSearchRedirectView.as_view(), name='targets-generic-search'),
     path('targets/', Bhtom2TargetListView.as_view(), name='targets-list-override'),
     path('targets/download-photometry/', TargetDownloadPhotometryDataApiView.as_view(), name='targets-download-photometry-api'),
+    path('targets/transits/', TransitCalendarView.as_view(), name='transit-calendar'),
+    path('targets/transits/api/', TransitCalendarApiView.as_view(), name='transit-calendar-api'),
     path('proposals/', ProposalListView.as_view(), name='proposal-list'),
     path('proposals/lco/import/', LCOProposalImportView.as_view(), name='proposal-import-lco'),
     path('proposals/<str:facility_code>/add/', FacilityProposalCreateView.as_view(), name='proposal-create'),
@@ -87,12 +97,26 @@ urlpatterns = [
     path('targets/<int:pk>/', BhtomTargetDetailView.as_view(), name='targets-detail-override'),
     path('targets/<int:pk>/models/periodicity/', TargetPeriodicityView.as_view(), name='target-periodicity'),
     path('targets/<int:pk>/models/periodicity/compute/', TargetPeriodicityComputeView.as_view(), name='target-periodicity-compute'),
+    path('targets/<int:pk>/models/periodicity/searches/<int:search_id>/', TargetPeriodicitySearchView.as_view(), name='target-periodicity-search'),
     path('dataproducts/data/upload/', BhtomDataProductUploadView.as_view(), name='dataproduct-upload'),
+    path('dataproducts/data/upload/start/', BhtomDataProductUploadStartView.as_view(), name='dataproduct-upload-start'),
+    path(
+        'dataproducts/data/upload/<str:upload_id>/chunk/',
+        BhtomDataProductUploadChunkView.as_view(),
+        name='dataproduct-upload-chunk',
+    ),
+    path(
+        'dataproducts/data/upload/batch/<str:batch_id>/',
+        BhtomDataProductUploadBatchStatusView.as_view(),
+        name='dataproduct-upload-batch-status',
+    ),
     path('dataproducts/<int:pk>/save/', BhtomDataProductSaveView.as_view(), name='observation-dataproduct-save'),
     path('observations/<int:pk>/', BhtomObservationRecordDetailView.as_view(), name='observation-detail-override'),
     path('observations/<int:pk>/process/', BhtomObservationProcessView.as_view(), name='observation-process-lco'),
     path('geotom/', GeoTomTargetListView.as_view(), name='geotom-list'),
     path('geotom/live-data/', GeoTomLiveDataView.as_view(), name='geotom-live-data'),
+    path('geotom/live-stream/', GeoTomLiveStreamView.as_view(), name='geotom-live-stream'),
+    path('geotom/sun-exclusion/', GeoTomSunExclusionView.as_view(), name='geotom-sun-exclusion'),
     path('bhtom-pallas/', BhtomPallasView.as_view(), name='bhtom-pallas'),
     path('bhtom-pallas/visible/', BhtomPallasVisibleView.as_view(), name='bhtom-pallas-visible'),
     path('bhtom-pallas/photometry/', BhtomPallasPhotometryView.as_view(), name='bhtom-pallas-photometry'),
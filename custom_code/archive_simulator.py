@@ -0,0 +1,364 @@
+"""Offline archive simulator for replaying recorded DataService HTTP traffic.
+
+DataServices talk to live archives (IRSA, ESA TAP, ATLAS, ASAS-SN, OGLE, KMT, MOA,
+Horizons, Celestrak, ...) through ``requests`` (directly or via astroquery/pyvo) and,
+for a few helpers, ``urllib``. The simulator patches both transports in-process so every
+outgoing call is answered from recorded fixtures instead of the network:
+
+* fixtures live in one JSON file per service (``<service>.json``) under a directory,
+  each holding a list of recorded responses keyed by method, host, path and query;
+* every service gets a :class:`ArchiveProfile` with latency, jitter, failure rate and a
+  payload scale (data lines of text responses are repeated to simulate bigger payloads);
+* :func:`record_archives` wraps the real transport and writes the fixtures, so a live
+  refresh can be captured once and replayed offline afterwards.
+
+The patches are plain module attribute swaps that only live in the current process:
+recordings and stats kept by a forked DataService query subprocess (``custom_code.tasks``
+with ``DATA_SERVICE_JOB_TIMEOUT`` > 0) are lost, so run the queries in-process while a
+simulator or recorder is installed (``benchmark_dataservices`` sets the timeout to 0).
+"""
+
+import base64
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import urllib.response
+from dataclasses import dataclass
+from email.message import Message
+from io import BytesIO
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+logger = logging.getLogger(__name__)
+
+# Host -> fixture/service label. Unknown hosts fall back to the host name itself.
+ARCHIVE_SIMULATOR_HOSTS = {
+    'irsa.ipac.caltech.edu': 'IRSA',
+    'gea.esac.esa.int': 'ESA-TAP',
+    'hst.esac.esa.int': 'ESA-TAP',
+    'fallingstar-data.com': 'ATLAS',
+    'asas-sn.osu.edu': 'ASASSN',
+    'asas-sn.ifa.hawaii.edu': 'ASASSN',
+    'www.astrouw.edu.pl': 'OGLE',
+    'kmtnet.kasi.re.kr': 'KMT',
+    'moaprime.massey.ac.nz': 'MOA',
+    'ssd.jpl.nasa.gov': 'Horizons',
+    'celestrak.org': 'Celestrak',
+    'gsaweb.ast.cam.ac.uk': 'GaiaAlerts',
+    'www.exoclock.space': 'ExoClock',
+    'simbad.cds.unistra.fr': 'Simbad',
+    'archive.eso.org': 'ESO',
+    'archive-api.lco.global': 'LCO',
+    'ws.cadc-ccda.hia-iha.nrc-cnrc.gc.ca': 'Gemini',
+    'api.alerce.online': 'Alerce',
+    'www.lamost.org': 'LAMOST',
+    'skyserver.sdss.org': 'SDSS',
+    'catalogs.mast.stsci.edu': 'MAST',
+    'galex.stsci.edu': 'MAST',
+}
+
+
+@dataclass
+class ArchiveProfile:
+    """Behaviour of one simulated archive."""
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    failure_rate: float = 0.0
+    payload_scale: float = 1.0
+
+
+def archive_service_for_url(url):
+    host = (urlsplit(str(url)).hostname or '').lower()
+    return ARCHIVE_SIMULATOR_HOSTS.get(host, host or 'unknown')
+
+
+def _canonical_query(query):
+    return urlencode(sorted(parse_qsl(query or '', keep_blank_values=True)))
+
+
+def _encode_body(content):
+    try:
+        return content.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        return base64.b64encode(content).decode('ascii'), 'base64'
+
+
+def _decode_body(entry):
+    body = entry.get('body') or ''
+    if entry.get('body_encoding') == 'base64':
+        return base64.b64decode(body)
+    return body.encode('utf-8')
+
+
+def scale_payload(content, scale):
+    """Repeat the data lines of a text payload ``scale`` times; binary payloads are untouched."""
+    if not content or scale is None or abs(float(scale) - 1.0) < 1e-9:
+        return content
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content
+
+    lines = text.splitlines(keepends=True)
+    header = [line for line in lines if line.lstrip().startswith(('#', '|', '\\'))]
+    data = [line for line in lines if line not in header and line.strip()]
+    if not data:
+        return content
+    target_count = max(1, int(round(len(data) * float(scale))))
+    repeated = [data[index % len(data)] for index in range(target_count)]
+    return ''.join(header + repeated).encode('utf-8')
+
+
+def load_archive_fixtures(fixtures_dir):
+    """Return ``{service: [entry, ...]}`` from the ``*.json`` files in ``fixtures_dir``."""
+    fixtures = {}
+    if not fixtures_dir or not os.path.isdir(fixtures_dir):
+        return fixtures
+    for file_name in sorted(os.listdir(fixtures_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        path = os.path.join(fixtures_dir, file_name)
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                payload = json.load(handle)
+        except (OSError, ValueError) as exc:
+            logger.warning('Skipping unreadable archive fixture %s: %s', path, exc)
+            continue
+        service = payload.get('service') or file_name[:-5]
+        fixtures.setdefault(service, []).extend(payload.get('responses') or [])
+    return fixtures
+
+
+class _PatchedTransport:
+    """Swap ``HTTPAdapter.send`` and ``urllib.request.urlopen`` for the lifetime of the context."""
+
+    def __init__(self):
+        self._original_send = None
+        self._original_urlopen = None
+
+    def _send(self, adapter, request, **kwargs):
+        raise NotImplementedError
+
+    def _urlopen(self, url, data=None, timeout=None, **kwargs):
+        raise NotImplementedError
+
+    def install(self):
+        if self._original_send is not None:
+            return self
+        self._original_send = HTTPAdapter.send
+        self._original_urlopen = urllib.request.urlopen
+        transport = self
+
+        def send(adapter, request, **kwargs):
+            return transport._send(adapter, request, **kwargs)
+
+        def urlopen(url, data=None, timeout=None, **kwargs):
+            return transport._urlopen(url, data=data, timeout=timeout, **kwargs)
+
+        HTTPAdapter.send = send
+        urllib.request.urlopen = urlopen
+        return self
+
+    def uninstall(self):
+        if self._original_send is None:
+            return
+        HTTPAdapter.send = self._original_send
+        urllib.request.urlopen = self._original_urlopen
+        self._original_send = None
+        self._original_urlopen = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+        return False
+
+
+class ArchiveSimulator(_PatchedTransport):
+    """Serve recorded archive responses with configurable latency, failures and payload size."""
+
+    def __init__(self, fixtures=None, *, fixtures_dir=None, default_profile=None, profiles=None, seed=None,
+                 unmatched_status=404):
+        super().__init__()
+        self.fixtures = dict(fixtures or {})
+        if fixtures_dir:
+            for service, entries in load_archive_fixtures(fixtures_dir).items():
+                self.fixtures.setdefault(service, []).extend(entries)
+        self.default_profile = default_profile or ArchiveProfile()
+        self.profiles = dict(profiles or {})
+        self.unmatched_status = unmatched_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def profile_for(self, service):
+        return self.profiles.get(service, self.default_profile)
+
+    def _count(self, service, key):
+        with self._lock:
+            service_stats = self.stats.setdefault(
+                service, {'requests': 0, 'matched': 0, 'unmatched': 0, 'failed': 0, 'bytes': 0}
+            )
+            service_stats[key] += 1
+            return service_stats
+
+    def match(self, method, url):
+        service = archive_service_for_url(url)
+        parts = urlsplit(str(url))
+        host = (parts.hostname or '').lower()
+        query = _canonical_query(parts.query)
+        best = None
+        for entry in self.fixtures.get(service, ()):
+            if str(entry.get('method') or 'GET').upper() != str(method or 'GET').upper():
+                continue
+            if entry.get('host') and str(entry['host']).lower() != host:
+                continue
+            entry_path = entry.get('path') or '*'
+            if entry_path not in ('*', parts.path):
+                continue
+            if entry_path == parts.path and _canonical_query(entry.get('query')) == query:
+                return service, entry
+            if best is None or (best.get('path') or '*') == '*':
+                best = entry
+        return service, best
+
+    def respond(self, method, url):
+        """Return ``(status, headers, body)`` for one simulated request."""
+        service, entry = self.match(method, url)
+        profile = self.profile_for(service)
+        self._count(service, 'requests')
+
+        delay_ms = max(0.0, profile.latency_ms + self._random.uniform(-profile.jitter_ms, profile.jitter_ms))
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+
+        if profile.failure_rate and self._random.random() < profile.failure_rate:
+            self._count(service, 'failed')
+            return 503, {'Content-Type': 'text/plain'}, b'Simulated archive failure.'
+
+        if entry is None:
+            self._count(service, 'unmatched')
+            return self.unmatched_status, {'Content-Type': 'text/plain'}, b''
+
+        body = scale_payload(_decode_body(entry), profile.payload_scale)
+        stats = self._count(service, 'matched')
+        with self._lock:
+            stats['bytes'] += len(body)
+        return int(entry.get('status') or 200), dict(entry.get('headers') or {}), body
+
+    def _send(self, adapter, request, **kwargs):
+        status, headers, body = self.respond(request.method, request.url)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.raw = BytesIO(body)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK' if status < 400 else 'Simulated'
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or 'utf-8'
+        response.connection = adapter
+        return response
+
+    def _urlopen(self, url, data=None, timeout=None, **kwargs):
+        full_url = url.full_url if isinstance(url, urllib.request.Request) else str(url)
+        method = 'POST' if data is not None else 'GET'
+        if isinstance(url, urllib.request.Request):
+            method = url.get_method()
+        status, headers, body = self.respond(method, full_url)
+        message = Message()
+        for key, value in headers.items():
+            message[key] = value
+        if status >= 400:
+            raise urllib.error.HTTPError(full_url, status, 'Simulated', message, BytesIO(body))
+        return urllib.response.addinfourl(BytesIO(body), message, full_url, status)
+
+
+class ArchiveRecorder(_PatchedTransport):
+    """Pass requests through to the real archives and record the responses as fixtures."""
+
+    def __init__(self, fixtures_dir):
+        super().__init__()
+        self.fixtures_dir = fixtures_dir
+        self._lock = threading.Lock()
+        self.recorded = {}
+
+    def _record(self, method, url, status, headers, content):
+        parts = urlsplit(str(url))
+        body, encoding = _encode_body(content or b'')
+        entry = {
+            'method': str(method or 'GET').upper(),
+            'host': (parts.hostname or '').lower(),
+            'path': parts.path,
+            'query': _canonical_query(parts.query),
+            'status': status,
+            'headers': {key: value for key, value in headers.items() if key.lower() == 'content-type'},
+            'body': body,
+            'body_encoding': encoding,
+        }
+        with self._lock:
+            self.recorded.setdefault(archive_service_for_url(url), []).append(entry)
+
+    def _send(self, adapter, request, **kwargs):
+        response = self._original_send(adapter, request, **kwargs)
+        self._record(request.method, request.url, response.status_code, response.headers, response.content)
+        return response
+
+    def _urlopen(self, url, data=None, timeout=None, **kwargs):
+        if timeout is None:
+            response = self._original_urlopen(url, data=data, **kwargs)
+        else:
+            response = self._original_urlopen(url, data=data, timeout=timeout, **kwargs)
+        content = response.read()
+        full_url = url.full_url if isinstance(url, urllib.request.Request) else str(url)
+        method = url.get_method() if isinstance(url, urllib.request.Request) else ('POST' if data else 'GET')
+        self._record(method, full_url, response.status, dict(response.headers.items()), content)
+        return urllib.response.addinfourl(BytesIO(content), response.headers, full_url, response.status)
+
+    def save(self):
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        written = []
+        with self._lock:
+            recorded = {service: list(entries) for service, entries in self.recorded.items()}
+        for service, entries in recorded.items():
+            safe_name = ''.join(char if char.isalnum() or char in '-_.' else '_' for char in service)
+            path = os.path.join(self.fixtures_dir, f'{safe_name}.json')
+            existing = load_archive_fixtures_file(path)
+            with open(path, 'w', encoding='utf-8') as handle:
+                json.dump({'service': service, 'responses': existing + entries}, handle, indent=1)
+            written.append(path)
+        return written
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        self.save()
+        return False
+
+
+def load_archive_fixtures_file(path):
+    if not os.path.isfile(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as handle:
+            return list(json.load(handle).get('responses') or [])
+    except (OSError, ValueError):
+        return []
+
+
+def simulate_archives(**kwargs):
+    return ArchiveSimulator(**kwargs)
+
+
+def record_archives(fixtures_dir):
+    return ArchiveRecorder(fixtures_dir)
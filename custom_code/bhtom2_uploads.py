@@ -6,13 +6,18 @@ import os
 import shutil
 import subprocess
 import tempfile
-from datetime import datetime, timezone
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 
 import requests
 from astropy.io import fits
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from tom_dataproducts.models import DataProduct
 
 
 logger = logging.getLogger(__name__)
@@ -49,12 +54,87 @@ COMPRESSED_FITS_SUFFIXES = (
     '.fits.fz', '.fts.fz', '.ftt.fz', '.ftsc.fz', '.fit.fz',
 )
 BHTOM2_UPLOAD_STATE_KEY = 'bhtom2_fits_upload'
+BHTOM2_PENDING_UPLOAD_STATUSES = ('queued', 'retrying', 'uploading')
+BHTOM2_UPLOAD_ATTEMPT_HISTORY = 20
+BHTOM2_RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+FITS_BLOCK_SIZE = 2880
+FITS_COPY_BLOCK_SIZE = 1024 * 1024
+
+_forward_slots = None
+_forward_slots_lock = threading.Lock()
+_funpack_slots = None
+_funpack_slots_lock = threading.Lock()
 
 
 class Bhtom2UploadError(Exception):
     pass
 
 
+class Bhtom2RetryableUploadError(Bhtom2UploadError):
+    def __init__(self, message, retry_at):
+        super().__init__(message)
+        self.retry_at = retry_at
+
+
+class StreamingMultipartBody:
+    """multipart/form-data request body that reads its file part in chunks.
+
+    requests builds ``files=`` uploads in memory; passing this object as ``data=``
+    sends the file straight from its handle with a known Content-Length.
+    """
+
+    def __init__(self, fields, file_field, file_name, file_handle, content_type='application/fits', chunk_size=65536):
+        self.fields = dict(fields)
+        self.file_name = file_name
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.chunk_size = max(1024, int(chunk_size))
+
+        head = io.BytesIO()
+        for name, value in self.fields.items():
+            head.write(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            )
+        head.write(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+            f'filename="{_quote_multipart_filename(file_name)}"\r\nContent-Type: {content_type}\r\n\r\n'.encode()
+        )
+        tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        file_handle.seek(0, os.SEEK_END)
+        file_size = file_handle.tell()
+        file_handle.seek(0)
+        self._length = head.tell() + file_size + len(tail)
+        head.seek(0)
+        self._parts = [head, file_handle, io.BytesIO(tail)]
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._parts:
+            data = self._parts[0].read(size)
+            if not data:
+                self._parts.pop(0)
+                continue
+            chunks.append(data)
+            size -= len(data)
+        return b''.join(chunks)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _quote_multipart_filename(file_name):
+    return str(file_name).replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
 def is_supported_fits_filename(filename):
     lower_name = str(filename or '').lower()
     return lower_name.endswith(SIMPLE_FITS_SUFFIXES + COMPRESSED_FITS_SUFFIXES)
@@ -82,8 +162,9 @@ def _coerce_simple_fits_name(file_name):
 
 
 def _get_first_image_hdu(hdulist):
+    # Decide from the headers: touching ``data`` would read (and scale) the whole image.
     for hdu in hdulist:
-        if getattr(hdu, 'data', None) is not None:
+        if hdu.size > 0:
             return hdu
     raise ValueError('FITS file does not contain an image HDU.')
 
@@ -136,14 +217,46 @@ def _build_primary_header_from_hdu_headers(*headers):
     return clean_header
 
 
-def _build_simple_fits_content(file_content):
-    with fits.open(io.BytesIO(file_content)) as hdulist:
+def _copy_file_into(source_path, output):
+    with open(source_path, 'rb') as source:
+        shutil.copyfileobj(source, output, FITS_COPY_BLOCK_SIZE)
+
+
+def _write_primary_image(output, header, image_hdu, source_path):
+    primary_header = fits.Header()
+    primary_header['SIMPLE'] = True
+    primary_header['BITPIX'] = image_hdu.header['BITPIX']
+    primary_header['NAXIS'] = image_hdu.header['NAXIS']
+    for axis in range(1, image_hdu.header['NAXIS'] + 1):
+        primary_header[f'NAXIS{axis}'] = image_hdu.header[f'NAXIS{axis}']
+    primary_header['EXTEND'] = True
+    primary_header.extend(header.cards, strip=False)
+    output.write(primary_header.tostring().encode('ascii'))
+
+    # The image bytes, BZERO/BSCALE included, are copied unchanged block by block.
+    data_size = image_hdu.size
+    with open(source_path, 'rb') as source:
+        source.seek(image_hdu.fileinfo()['datLoc'])
+        remaining = data_size
+        while remaining > 0:
+            block = source.read(min(FITS_COPY_BLOCK_SIZE, remaining))
+            if not block:
+                raise ValueError('FITS file is truncated.')
+            output.write(block)
+            remaining -= len(block)
+    output.write(b'\0' * (-data_size % FITS_BLOCK_SIZE))
+
+
+def _write_simple_fits_file(source_path, output):
+    with fits.open(source_path, memmap=True) as hdulist:
         primary_header = hdulist[0].header if hdulist else None
         image_hdu = _get_first_image_hdu(hdulist)
-        output = io.BytesIO()
         header = _build_primary_header_from_hdu_headers(primary_header, image_hdu.header)
-        fits.PrimaryHDU(data=image_hdu.data, header=header).writeto(output, overwrite=True)
-        return output.getvalue()
+        if isinstance(image_hdu, fits.CompImageHDU) or not isinstance(image_hdu, (fits.PrimaryHDU, fits.ImageHDU)):
+            # Tile-compressed images have no raw image bytes to copy; astropy decompresses them.
+            fits.PrimaryHDU(data=image_hdu.data, header=header).writeto(output)
+            return
+        _write_primary_image(output, header, image_hdu, source_path)
 
 
 def _sanitize_extension_header(header, *, keep_extname=True):
@@ -181,8 +294,8 @@ def _sanitize_extension_header(header, *, keep_extname=True):
     return clean_header
 
 
-def _build_funpack_like_fits_content(file_content):
-    with fits.open(io.BytesIO(file_content)) as hdulist:
+def _write_funpack_like_fits_file(source_path, output):
+    with fits.open(source_path, memmap=True) as hdulist:
         output_hdus = []
         for hdu in hdulist:
             data = getattr(hdu, 'data', None)
@@ -191,6 +304,11 @@ def _build_funpack_like_fits_content(file_content):
                 continue
             if not output_hdus:
                 primary_header = _sanitize_extension_header(hdu.header, keep_extname=True)
+                if hdu is not hdulist[0]:
+                    # Keep the observation keywords funpack leaves in the dropped empty primary HDU.
+                    for card in _build_primary_header_from_hdu_headers(hdulist[0].header).cards:
+                        if card.keyword not in ('', 'COMMENT', 'HISTORY') and card.keyword not in primary_header:
+                            primary_header[card.keyword] = (card.value, card.comment)
                 output_hdus.append(fits.PrimaryHDU(data=data, header=primary_header))
                 continue
             if isinstance(hdu, (fits.BinTableHDU, fits.TableHDU)):
@@ -203,103 +321,158 @@ def _build_funpack_like_fits_content(file_content):
         if not output_hdus:
             raise ValueError('FITS file does not contain any HDUs with data.')
 
-        output = io.BytesIO()
-        fits.HDUList(output_hdus).writeto(output, overwrite=True, checksum=True)
-        return output.getvalue()
+        fits.HDUList(output_hdus).writeto(output, checksum=True)
+
 
+def _funpack_slot():
+    global _funpack_slots
+    with _funpack_slots_lock:
+        if _funpack_slots is None:
+            _funpack_slots = threading.BoundedSemaphore(max(1, _forward_setting('FITS_FUNPACK_MAX_CONCURRENCY', 2)))
+    return _funpack_slots
 
-def _decompress_fpack_content(file_content, file_name):
+
+def _decompress_fpack_file(source_path, file_name, work_dir):
     funpack_path = shutil.which('funpack')
     if not funpack_path:
         return None
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_input_name = os.path.join(temp_dir, 'input.fits.fz')
-        temp_output_name = os.path.join(temp_dir, 'output.fits')
-
-        with open(temp_input_name, 'wb') as temp_input:
-            temp_input.write(file_content)
+    input_name = source_path
+    if not str(source_path).lower().endswith('.fz'):
+        input_name = os.path.join(work_dir, 'input.fits.fz')
+        try:
+            os.symlink(os.path.abspath(source_path), input_name)
+        except OSError:
+            shutil.copyfile(source_path, input_name)
+    output_name = os.path.join(work_dir, 'output.fits')
 
+    # funpack runs as a child process; the pool bounds how many run at once per process.
+    with _funpack_slot():
         result = subprocess.run(
-            [funpack_path, '-O', temp_output_name, temp_input_name],
+            [funpack_path, '-O', output_name, input_name],
             capture_output=True,
             check=True,
         )
-        if not os.path.exists(temp_output_name):
-            raise OSError(f'funpack did not create output file for {file_name}')
-
-        with open(temp_output_name, 'rb') as decompressed_handle:
-            decompressed_content = decompressed_handle.read()
+    if not os.path.exists(output_name):
+        raise OSError(f'funpack did not create output file for {file_name}')
 
-        logger.info(
-            'Decompressed FPACK file with funpack: %s stdout=%d stderr=%d output_bytes=%d',
-            file_name,
-            len(result.stdout or b''),
-            len(result.stderr or b''),
-            len(decompressed_content),
-        )
-        return decompressed_content
+    logger.info(
+        'Decompressed FPACK file with funpack: %s stdout=%d stderr=%d output_bytes=%d',
+        file_name,
+        len(result.stdout or b''),
+        len(result.stderr or b''),
+        os.path.getsize(output_name),
+    )
+    return output_name
 
 
-def normalize_fits_upload(uploaded_file, *, preserve_extensions=True):
-    lower_name = str(uploaded_file.name or '').lower()
-    metadata = {
-        'recognized_format': _detect_fits_upload_format(uploaded_file.name),
+def _normalization_metadata(file_name, preserve_extensions):
+    return {
+        'recognized_format': _detect_fits_upload_format(file_name),
         'decompression_method': 'none',
         'preserve_extensions': preserve_extensions,
     }
-    if not lower_name.endswith(COMPRESSED_FITS_SUFFIXES):
-        uploaded_file.seek(0)
-        if preserve_extensions:
-            uploaded_file.name = _coerce_simple_fits_name(uploaded_file.name)
-            return uploaded_file, metadata
 
-        file_content = uploaded_file.read()
-        uploaded_file.seek(0)
-        normalized_name = _coerce_simple_fits_name(uploaded_file.name)
-        normalized_content = _build_simple_fits_content(file_content)
-        return SimpleUploadedFile(
-            normalized_name,
-            normalized_content,
-            content_type='application/fits',
-        ), metadata
 
-    uploaded_file.seek(0)
-    file_content = uploaded_file.read()
-    uploaded_file.seek(0)
+def _normalization_temp_dir():
+    return getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None) or None
 
-    if lower_name.endswith('.gz'):
-        file_content = gzip.decompress(file_content)
-        metadata['decompression_method'] = 'gzip'
-    elif lower_name.endswith('.fz'):
-        try:
-            decompressed_content = _decompress_fpack_content(file_content, uploaded_file.name)
-            if decompressed_content is not None:
-                file_content = decompressed_content
+
+def normalize_fits_file(source_path, file_name, output, *, preserve_extensions=True):
+    """Write the normalised form of the FITS file at ``source_path`` into the binary file ``output``.
+
+    Works disk to disk: gzip is decompressed in blocks, fpack files are unpacked
+    by funpack straight from ``source_path`` and images are copied from the
+    memory-mapped file, so memory use does not grow with the image size.
+    ``file_name`` is the name the file was uploaded as. Returns the normalised
+    file name and the normalisation metadata.
+    """
+    lower_name = str(file_name or '').lower()
+    metadata = _normalization_metadata(file_name, preserve_extensions)
+    with tempfile.TemporaryDirectory(dir=_normalization_temp_dir()) as work_dir:
+        if lower_name.endswith('.gz') and lower_name.endswith(COMPRESSED_FITS_SUFFIXES):
+            decompressed_name = os.path.join(work_dir, 'decompressed.fits')
+            with gzip.open(source_path, 'rb') as compressed, open(decompressed_name, 'wb') as decompressed:
+                shutil.copyfileobj(compressed, decompressed, FITS_COPY_BLOCK_SIZE)
+            metadata['decompression_method'] = 'gzip'
+            _write_simple_fits_file(decompressed_name, output)
+        elif lower_name.endswith('.fz') and lower_name.endswith(COMPRESSED_FITS_SUFFIXES):
+            unpacked_name = None
+            try:
+                unpacked_name = _decompress_fpack_file(source_path, file_name, work_dir)
+                if unpacked_name is None:
+                    logger.warning('funpack not available, falling back to astropy for %s', file_name)
+            except (subprocess.CalledProcessError, OSError) as exc:
+                logger.warning('funpack failed for %s, falling back to astropy', file_name)
+                logger.exception(exc)
+            if unpacked_name is not None:
                 metadata['decompression_method'] = 'funpack'
+                if preserve_extensions:
+                    _copy_file_into(unpacked_name, output)
+                else:
+                    _write_simple_fits_file(unpacked_name, output)
             else:
-                logger.warning('funpack not available, falling back to astropy for %s', uploaded_file.name)
                 metadata['decompression_method'] = 'astropy'
-        except (subprocess.CalledProcessError, OSError) as exc:
-            logger.warning('funpack failed for %s, falling back to astropy', uploaded_file.name)
-            logger.exception(exc)
-            metadata['decompression_method'] = 'astropy'
-
-    normalized_name = _coerce_simple_fits_name(uploaded_file.name)
-    if lower_name.endswith('.fz'):
-        if preserve_extensions and metadata['decompression_method'] == 'funpack':
-            normalized_content = file_content
+                if preserve_extensions:
+                    _write_funpack_like_fits_file(source_path, output)
+                else:
+                    _write_simple_fits_file(source_path, output)
         elif preserve_extensions:
-            normalized_content = _build_funpack_like_fits_content(file_content)
+            _copy_file_into(source_path, output)
         else:
-            normalized_content = _build_simple_fits_content(file_content)
-    else:
-        normalized_content = _build_simple_fits_content(file_content)
-    return SimpleUploadedFile(
-        normalized_name,
-        normalized_content,
-        content_type='application/fits',
-    ), metadata
+            _write_simple_fits_file(source_path, output)
+    return _coerce_simple_fits_name(file_name), metadata
+
+
+@contextmanager
+def _local_file_path(django_file):
+    """Path of ``django_file`` on local disk, spooling it to a temporary file if it has none."""
+    if hasattr(django_file, 'temporary_file_path'):
+        yield django_file.temporary_file_path()
+        return
+    try:
+        path = getattr(django_file, 'path', None)
+    except (NotImplementedError, ValueError):
+        path = None
+    if path is None:
+        path = getattr(getattr(django_file, 'file', None), 'name', None)
+    if isinstance(path, str) and os.path.isfile(path):
+        yield path
+        return
+
+    with tempfile.NamedTemporaryFile(dir=_normalization_temp_dir()) as spooled:
+        django_file.seek(0)
+        for chunk in django_file.chunks(FITS_COPY_BLOCK_SIZE):
+            spooled.write(chunk)
+        spooled.flush()
+        yield spooled.name
+
+
+def normalize_fits_upload(uploaded_file, *, preserve_extensions=True):
+    lower_name = str(uploaded_file.name or '').lower()
+    if not lower_name.endswith(COMPRESSED_FITS_SUFFIXES) and preserve_extensions:
+        uploaded_file.seek(0)
+        metadata = _normalization_metadata(uploaded_file.name, preserve_extensions)
+        uploaded_file.name = _coerce_simple_fits_name(uploaded_file.name)
+        return uploaded_file, metadata
+
+    # The normalised file lives in an anonymous temporary file that is removed when closed.
+    output = tempfile.TemporaryFile(dir=_normalization_temp_dir())
+    try:
+        with _local_file_path(uploaded_file) as source_path:
+            normalized_name, metadata = normalize_fits_file(
+                source_path,
+                uploaded_file.name,
+                output,
+                preserve_extensions=preserve_extensions,
+            )
+    except BaseException:
+        output.close()
+        raise
+    uploaded_file.seek(0)
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(output, name=normalized_name, content_type='application/fits', size=size), metadata
 
 
 def build_bhtom2_upload_payload(dataproduct, observatory, calibration_filter, comment=''):
@@ -352,8 +525,27 @@ def has_successful_bhtom2_upload(dataproduct):
 
 
 def record_bhtom2_upload_state(dataproduct, *, status, observatory='', calibration_filter='', response_status=None,
-                               message='', upload_metadata=None, user_id=None):
+                               message='', upload_metadata=None, user_id=None, attempt=None, forward_id=None,
+                               next_retry_at=None):
     payload = load_extra_data_dict(dataproduct)
+    previous_state = payload.get(BHTOM2_UPLOAD_STATE_KEY) or {}
+    updated_at = datetime.now(timezone.utc).isoformat()
+    new_forward = forward_id is not None and forward_id != previous_state.get('forward_id')
+    attempts = list(previous_state.get('attempts') or [])
+    if attempt is not None:
+        attempts.append({
+            'attempt': attempt,
+            'status': status,
+            'response_status': response_status,
+            'message': str(message or '')[:500],
+            'at': updated_at,
+        })
+    if attempt is not None:
+        attempt_count = attempt
+    elif new_forward:
+        attempt_count = 0
+    else:
+        attempt_count = previous_state.get('attempt_count', 0)
     payload[BHTOM2_UPLOAD_STATE_KEY] = {
         'status': status,
         'observatory': observatory,
@@ -362,16 +554,22 @@ def record_bhtom2_upload_state(dataproduct, *, status, observatory='', calibrati
         'message': message,
         'upload_metadata': upload_metadata or {},
         'user_id': user_id,
-        'updated_at': datetime.now(timezone.utc).isoformat(),
+        'updated_at': updated_at,
+        'forward_id': forward_id or previous_state.get('forward_id'),
+        'attempt_count': attempt_count,
+        'attempts': attempts[-BHTOM2_UPLOAD_ATTEMPT_HISTORY:],
+        'next_retry_at': next_retry_at.isoformat() if next_retry_at else None,
     }
     save_extra_data_dict(dataproduct, payload)
     logger.info(
-        'Recorded BHTOM2 upload state dataproduct=%s status=%s observatory=%s calibration_filter=%s response_status=%s message=%s',
+        'Recorded BHTOM2 upload state dataproduct=%s status=%s observatory=%s calibration_filter=%s response_status=%s '
+        'attempt=%s message=%s',
         getattr(dataproduct, 'pk', None),
         status,
         observatory,
         calibration_filter,
         response_status,
+        attempt,
         message,
     )
 
@@ -391,7 +589,14 @@ def ensure_fits_dataproduct_type(dataproduct):
     return True
 
 
-def upload_fits_dataproduct_to_bhtom2(dataproduct, *, token, observatory, calibration_filter, comment=''):
+def _forward_setting(name, default):
+    try:
+        return int(getattr(settings, name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _validate_upload_arguments(token, observatory):
     upload_url = _upload_service_url()
     if not upload_url:
         raise Bhtom2UploadError('BHTOM2 upload service URL is not configured.')
@@ -399,36 +604,61 @@ def upload_fits_dataproduct_to_bhtom2(dataproduct, *, token, observatory, calibr
         raise Bhtom2UploadError('BHTOM2 token is required.')
     if not str(observatory or '').strip():
         raise Bhtom2UploadError('BHTOM2 ONAME is required.')
+    return upload_url
 
-    with dataproduct.data.open('rb') as data_handle:
-        upload_file = SimpleUploadedFile(
-            dataproduct.get_file_name(),
-            data_handle.read(),
-            content_type='application/octet-stream',
-        )
-    logger.info(
-        'Preparing BHTOM2 upload for dataproduct=%s original_name=%s observatory=%s',
-        getattr(dataproduct, 'pk', None),
-        upload_file.name,
-        observatory,
-    )
-    normalized_file, upload_metadata = normalize_fits_upload(upload_file, preserve_extensions=False)
-    normalized_file.seek(0)
-    normalized_file.name = _coerce_simple_fits_name(normalized_file.name)
+
+def _spool_normalized_upload(dataproduct, spooled_file):
+    file_name = dataproduct.get_file_name()
     logger.info(
-        'Normalized BHTOM2 upload for dataproduct=%s normalized_name=%s metadata=%s',
+        'Preparing BHTOM2 upload for dataproduct=%s original_name=%s',
         getattr(dataproduct, 'pk', None),
-        normalized_file.name,
-        upload_metadata,
+        file_name,
     )
+    try:
+        with _local_file_path(dataproduct.data) as source_path:
+            normalized_name, upload_metadata = normalize_fits_file(
+                source_path,
+                file_name,
+                spooled_file,
+                preserve_extensions=False,
+            )
+    finally:
+        dataproduct.data.close()
+    spooled_file.seek(0)
+    return normalized_name, upload_metadata
 
-    response = requests.post(
-        upload_url,
-        data=build_bhtom2_upload_payload(dataproduct, observatory, calibration_filter, comment=comment),
-        files={'file_0': (normalized_file.name, normalized_file, normalized_file.content_type or 'application/fits')},
-        headers={'Authorization': f'Token {str(token).strip()}'},
-        timeout=_upload_timeout(),
-    )
+
+def upload_fits_dataproduct_to_bhtom2(dataproduct, *, token, observatory, calibration_filter, comment=''):
+    upload_url = _validate_upload_arguments(token, observatory)
+    chunk_size = max(1024, _forward_setting('BHTOM2_UPLOAD_CHUNK_SIZE', 65536))
+
+    with tempfile.TemporaryFile() as spooled_file:
+        # Only the normalized file on disk is kept while the upload streams it out.
+        normalized_name, upload_metadata = _spool_normalized_upload(dataproduct, spooled_file)
+        body = StreamingMultipartBody(
+            build_bhtom2_upload_payload(dataproduct, observatory, calibration_filter, comment=comment),
+            'file_0',
+            normalized_name,
+            spooled_file,
+            chunk_size=chunk_size,
+        )
+        logger.info(
+            'Normalized BHTOM2 upload for dataproduct=%s normalized_name=%s bytes=%d observatory=%s metadata=%s',
+            getattr(dataproduct, 'pk', None),
+            normalized_name,
+            len(body),
+            observatory,
+            upload_metadata,
+        )
+        response = requests.post(
+            upload_url,
+            data=body,
+            headers={
+                'Authorization': f'Token {str(token).strip()}',
+                'Content-Type': body.content_type,
+            },
+            timeout=_upload_timeout(),
+        )
     logger.info(
         'BHTOM2 upload response for dataproduct=%s status=%s body=%s',
         getattr(dataproduct, 'pk', None),
@@ -438,8 +668,46 @@ def upload_fits_dataproduct_to_bhtom2(dataproduct, *, token, observatory, calibr
     return response, upload_metadata
 
 
+def bhtom2_forward_retry_delay_seconds(attempt, retry_after=None):
+    base_delay = max(1, _forward_setting('BHTOM2_FORWARD_BACKOFF_SECONDS', 60))
+    max_delay = max(base_delay, _forward_setting('BHTOM2_FORWARD_MAX_BACKOFF_SECONDS', 3600))
+    delay = min(max_delay, base_delay * 2 ** max(0, attempt - 1))
+    if retry_after:
+        delay = max(delay, min(max_delay, retry_after))
+    return delay
+
+
+def _retry_after_seconds(response):
+    value = str(getattr(response, 'headers', {}).get('Retry-After') or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def _record_failed_bhtom2_upload(dataproduct, *, message, retryable, max_attempts, retry_after=None, **state):
+    attempt = state.get('attempt')
+    if retryable and attempt is not None and attempt < max_attempts:
+        retry_at = datetime.now(timezone.utc) + timedelta(
+            seconds=bhtom2_forward_retry_delay_seconds(attempt, retry_after)
+        )
+        record_bhtom2_upload_state(dataproduct, status='retrying', message=message, next_retry_at=retry_at, **state)
+        raise Bhtom2RetryableUploadError(message, retry_at)
+    record_bhtom2_upload_state(dataproduct, status='failed', message=message, **state)
+
+
 def forward_dataproduct_to_bhtom2(dataproduct, *, token, observatory, calibration_filter, comment='',
-                                  user_id=None):
+                                  user_id=None, attempt=None, max_attempts=1, forward_id=None):
+    """Upload a FITS data product to BHTOM2 once and record the outcome in its upload state.
+
+    While ``attempt`` is below ``max_attempts``, network errors, throttling and server
+    errors are recorded as ``retrying`` and raised as Bhtom2RetryableUploadError with
+    the backoff deadline; every other failure is final.
+    """
+    state = {
+        'observatory': observatory,
+        'calibration_filter': calibration_filter,
+        'user_id': user_id,
+        'attempt': attempt,
+        'forward_id': forward_id,
+    }
     try:
         response, upload_metadata = upload_fits_dataproduct_to_bhtom2(
             dataproduct,
@@ -449,23 +717,21 @@ def forward_dataproduct_to_bhtom2(dataproduct, *, token, observatory, calibratio
             comment=comment,
         )
     except requests.RequestException as exc:
-        record_bhtom2_upload_state(
+        _record_failed_bhtom2_upload(
             dataproduct,
-            status='failed',
-            observatory=observatory,
-            calibration_filter=calibration_filter,
             message=str(exc),
-            user_id=user_id,
+            retryable=True,
+            max_attempts=max_attempts,
+            **state,
         )
         raise
     except Exception as exc:
-        record_bhtom2_upload_state(
+        _record_failed_bhtom2_upload(
             dataproduct,
-            status='failed',
-            observatory=observatory,
-            calibration_filter=calibration_filter,
             message=str(exc),
-            user_id=user_id,
+            retryable=False,
+            max_attempts=max_attempts,
+            **state,
         )
         raise
 
@@ -475,26 +741,201 @@ def forward_dataproduct_to_bhtom2(dataproduct, *, token, observatory, calibratio
         except ValueError:
             payload = {}
         message = payload.get('message') or payload.get('detail') or response.text.strip() or f'HTTP {response.status_code}'
-        record_bhtom2_upload_state(
+        _record_failed_bhtom2_upload(
             dataproduct,
-            status='failed',
-            observatory=observatory,
-            calibration_filter=calibration_filter,
-            response_status=response.status_code,
             message=message,
+            retryable=response.status_code in BHTOM2_RETRYABLE_STATUS_CODES,
+            max_attempts=max_attempts,
+            retry_after=_retry_after_seconds(response),
+            response_status=response.status_code,
             upload_metadata=upload_metadata,
-            user_id=user_id,
+            **state,
         )
         raise ValidationError(message)
 
     record_bhtom2_upload_state(
         dataproduct,
         status='uploaded',
-        observatory=observatory,
-        calibration_filter=calibration_filter,
         response_status=response.status_code,
         message='Uploaded to BHTOM2.',
         upload_metadata=upload_metadata,
-        user_id=user_id,
+        **state,
     )
     return response
+
+
+def _parse_state_time(value):
+    try:
+        return datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _pending_forward_is_stale(state):
+    # A pending forward whose worker died is replaced after BHTOM2_FORWARD_STALE_SECONDS.
+    reference = _parse_state_time(state.get('next_retry_at')) or _parse_state_time(state.get('updated_at'))
+    if reference is None:
+        return True
+    stale_after = _forward_setting('BHTOM2_FORWARD_STALE_SECONDS', 3600)
+    return (datetime.now(timezone.utc) - reference).total_seconds() > stale_after
+
+
+def resolve_bhtom2_forward_token(user_id, *, site_token=False):
+    """Return the BHTOM2 API token a forward uploads with.
+
+    Tokens never travel through the task queue: jobs carry the user id (or the
+    ``site_token`` flag for automated forwards using BHTOM2_API_TOKEN) and the token
+    is looked up when the job runs. Returns '' when no token is stored.
+    """
+    if site_token:
+        return str(getattr(settings, 'BHTOM2_API_TOKEN', '') or '').strip()
+    if user_id is None:
+        return ''
+    from custom_code.models import UserBhtom2UploadPreference
+
+    token = UserBhtom2UploadPreference.objects.filter(user_id=user_id).values_list('token', flat=True).first()
+    return str(token or '').strip()
+
+
+def enqueue_bhtom2_forward(dataproduct, *, observatory, calibration_filter, comment='', user_id=None,
+                           site_token=False, force=False):
+    """Queue a background BHTOM2 upload of a FITS data product.
+
+    The upload uses the BHTOM2 token stored in the preferences of ``user_id``, or
+    BHTOM2_API_TOKEN when ``site_token`` is set. Forwarding is idempotent per data
+    product: nothing is queued while the product is already uploaded or a forward
+    of it is pending, unless ``force`` is set. Returns whether a job was queued.
+    """
+    from custom_code.tasks import forward_dataproduct_to_bhtom2_task
+
+    _validate_upload_arguments(resolve_bhtom2_forward_token(user_id, site_token=site_token), observatory)
+    with transaction.atomic():
+        locked = DataProduct.objects.select_for_update().get(pk=dataproduct.pk)
+        state = get_bhtom2_upload_state(locked)
+        status = state.get('status')
+        if not force and (
+            status == 'uploaded'
+            or (status in BHTOM2_PENDING_UPLOAD_STATUSES and not _pending_forward_is_stale(state))
+        ):
+            queued = False
+        else:
+            forward_id = uuid.uuid4().hex
+            record_bhtom2_upload_state(
+                locked,
+                status='queued',
+                observatory=observatory,
+                calibration_filter=calibration_filter,
+                message='Queued for BHTOM2 upload.',
+                user_id=user_id,
+                forward_id=forward_id,
+            )
+            forward_dataproduct_to_bhtom2_task.enqueue(
+                locked.pk,
+                forward_id,
+                observatory,
+                calibration_filter,
+                comment,
+                user_id,
+                site_token,
+            )
+            queued = True
+    dataproduct.extra_data = locked.extra_data
+    return queued
+
+
+def _acquire_forward_slot():
+    global _forward_slots
+    with _forward_slots_lock:
+        if _forward_slots is None:
+            _forward_slots = threading.BoundedSemaphore(max(1, _forward_setting('BHTOM2_FORWARD_MAX_CONCURRENCY', 2)))
+    return _forward_slots.acquire(timeout=max(0, _forward_setting('BHTOM2_FORWARD_SLOT_WAIT_SECONDS', 5)))
+
+
+def _claim_bhtom2_forward(dataproduct_id, forward_id, attempt, *, observatory, calibration_filter, user_id):
+    with transaction.atomic():
+        dataproduct = DataProduct.objects.select_for_update().filter(pk=dataproduct_id).first()
+        if dataproduct is None:
+            return None, 'data product no longer exists'
+        state = get_bhtom2_upload_state(dataproduct)
+        status = state.get('status')
+        if state.get('forward_id') != forward_id:
+            return None, 'superseded by a newer forward'
+        if status in ('uploaded', 'failed'):
+            return None, f'forward already {status}'
+        if int(state.get('attempt_count') or 0) >= attempt:
+            return None, f'attempt {attempt} already made'
+        if status == 'uploading' and not _pending_forward_is_stale(state):
+            return None, 'upload already in progress'
+        record_bhtom2_upload_state(
+            dataproduct,
+            status='uploading',
+            observatory=observatory,
+            calibration_filter=calibration_filter,
+            message=f'Uploading to BHTOM2 (attempt {attempt}).',
+            upload_metadata=state.get('upload_metadata'),
+            user_id=user_id,
+        )
+    return dataproduct, ''
+
+
+def run_bhtom2_forward(dataproduct_id, forward_id, observatory, calibration_filter, comment='', user_id=None,
+                       site_token=False, attempt=1):
+    """Run one attempt of a queued BHTOM2 forward.
+
+    At most BHTOM2_FORWARD_MAX_CONCURRENCY uploads run at once per worker process;
+    a job that finds no free slot, or fails with a retryable error, re-enqueues
+    itself with a delay. Duplicate or superseded jobs exit without uploading, and
+    a forward whose user has no stored BHTOM2 token any more fails.
+    """
+    from custom_code.tasks import forward_dataproduct_to_bhtom2_task
+
+    args = (dataproduct_id, forward_id, observatory, calibration_filter, comment, user_id, site_token)
+    summary = {'dataproduct_id': dataproduct_id, 'attempt': attempt}
+    if not _acquire_forward_slot():
+        run_after = datetime.now(timezone.utc) + timedelta(
+            seconds=max(1, _forward_setting('BHTOM2_FORWARD_BUSY_DELAY_SECONDS', 30))
+        )
+        forward_dataproduct_to_bhtom2_task.using(run_after=run_after).enqueue(*args, attempt)
+        logger.info('All BHTOM2 upload slots busy; deferred dataproduct=%s attempt=%s.', dataproduct_id, attempt)
+        return {**summary, 'status': 'deferred'}
+
+    try:
+        dataproduct, skip_reason = _claim_bhtom2_forward(
+            dataproduct_id,
+            forward_id,
+            attempt,
+            observatory=observatory,
+            calibration_filter=calibration_filter,
+            user_id=user_id,
+        )
+        if dataproduct is None:
+            logger.info('Skipping BHTOM2 forward of dataproduct=%s attempt=%s: %s.', dataproduct_id, attempt, skip_reason)
+            return {**summary, 'status': 'skipped', 'message': skip_reason}
+        try:
+            forward_dataproduct_to_bhtom2(
+                dataproduct,
+                token=resolve_bhtom2_forward_token(user_id, site_token=site_token),
+                observatory=observatory,
+                calibration_filter=calibration_filter,
+                comment=comment,
+                user_id=user_id,
+                attempt=attempt,
+                max_attempts=max(1, _forward_setting('BHTOM2_FORWARD_MAX_ATTEMPTS', 5)),
+                forward_id=forward_id,
+            )
+        except Bhtom2RetryableUploadError as exc:
+            forward_dataproduct_to_bhtom2_task.using(run_after=exc.retry_at).enqueue(*args, attempt + 1)
+            logger.warning(
+                'BHTOM2 forward of dataproduct=%s attempt=%s failed, retrying at %s: %s',
+                dataproduct_id,
+                attempt,
+                exc.retry_at.isoformat(),
+                exc,
+            )
+            return {**summary, 'status': 'retrying', 'message': str(exc), 'next_retry_at': exc.retry_at.isoformat()}
+        except Exception as exc:
+            logger.warning('BHTOM2 forward of dataproduct=%s failed after %s attempt(s): %s', dataproduct_id, attempt, exc)
+            return {**summary, 'status': 'failed', 'message': str(exc)}
+        return {**summary, 'status': 'uploaded'}
+    finally:
+        _forward_slots.release()
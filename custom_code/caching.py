@@ -0,0 +1,367 @@
+"""Two-tier cache backend and single-flight cached computations.
+
+TieredCache (the default cache) answers from a per-process LRU of recently
+used entries and falls back to a cache alias shared by the gunicorn workers
+and db_worker processes of a host: SQLiteCache, or Django's RedisCache when
+CACHE_REDIS_URL is set. Local entries live at most LOCAL_TIMEOUT seconds, so
+a value changed or deleted by another process is seen after that delay, one
+changed by this process immediately.
+
+SQLiteCache keeps pickled values in one SQLite database in WAL mode; unlike
+FileBasedCache it expires and culls entries with indexed deletes instead of
+scanning a directory.
+
+cached_value() computes an expensive value at most once across processes:
+the process that misses takes a lock in the cache (cache.add()) and computes,
+the others wait for its result. Entries with a stale period are served stale
+once they expire while one process recomputes them in a background thread.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class _LocalTier:
+    """LRU of pickled values shared by all threads of a process, bounded by entries and bytes."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            pickled, expires = entry
+            if expires <= time.monotonic():
+                self._pop(key)
+                return _MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, seconds):
+        if seconds <= 0:
+            self.delete(key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self._pop(key)
+            if len(pickled) > self.max_bytes:
+                return
+            self.entries[key] = (pickled, time.monotonic() + seconds)
+            self.size += len(pickled)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+# Cache instances are created per thread; their local tiers are shared per process, as in LocMemCache.
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """A per-process LRU in front of the cache alias OPTIONS['SHARED_CACHE'].
+
+    Keys, versions and timeouts are those of the shared cache; OPTIONS
+    LOCAL_TIMEOUT, LOCAL_MAX_ENTRIES and LOCAL_MAX_BYTES bound the local tier.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED_CACHE', 'shared')
+        self._local_timeout = float(options.get('LOCAL_TIMEOUT', 5))
+        with _local_tiers_lock:
+            self._local = _local_tiers.setdefault(
+                self._shared_alias,
+                _LocalTier(int(options.get('LOCAL_MAX_ENTRIES', 1000)), int(options.get('LOCAL_MAX_BYTES', 64 * 1024 * 1024))),
+            )
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _local_key(self, key, version):
+        return self.shared.make_and_validate_key(key, version=version)
+
+    def _local_seconds(self, timeout):
+        expires = self.shared.get_backend_timeout(timeout)
+        if expires is None:
+            return self._local_timeout
+        return min(self._local_timeout, expires - time.time())
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        value = self._local.get(local_key)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._local.set(local_key, value, self._local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._local.set(self._local_key(key, version), value, self._local_seconds(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        if not self.shared.add(key, value, timeout, version=version):
+            self._local.delete(local_key)
+            return False
+        self._local.set(local_key, value, self._local_seconds(timeout))
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local.delete(self._local_key(key, version))
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local.delete(self._local_key(key, version))
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        if self._local.get(self._local_key(key, version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local.delete(self._local_key(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+
+class SQLiteCache(BaseCache):
+    """Pickled values in the SQLite database at LOCATION, shared by all processes of a host."""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    # Expired and surplus entries are culled every CULL_EVERY writes of a cache instance.
+    CULL_EVERY = 64
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._connection = None
+        self._pid = None
+        self._writes = 0
+
+    def _db(self):
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)')
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _written(self):
+        self._writes += 1
+        if self._writes % self.CULL_EVERY == 0:
+            self._cull()
+
+    def _cull(self):
+        db = self._db()
+        db.execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+        (count,) = db.execute('SELECT COUNT(*) FROM cache_entries').fetchone()
+        if count > self._max_entries:
+            surplus = max(count - self._max_entries, count // self._cull_frequency if self._cull_frequency else count)
+            db.execute(
+                'DELETE FROM cache_entries WHERE key IN '
+                '(SELECT key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                (surplus,),
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._db().execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return default
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._db().execute(
+            'INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, self.pickle_protocol), self.get_backend_timeout(timeout)),
+        )
+        self._written()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        # Inserts, or replaces an expired entry; a live entry is left alone and rowcount stays 0.
+        cursor = self._db().execute(
+            'INSERT INTO cache_entries (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache_entries.expires <= ?',
+            (key, pickle.dumps(value, self.pickle_protocol), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._written()
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._db().execute(
+            'UPDATE cache_entries SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._db().execute('DELETE FROM cache_entries WHERE key = ?', (key,)).rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._db().execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def clear(self):
+        self._db().execute('DELETE FROM cache_entries')
+
+
+CachedEntry = namedtuple('CachedEntry', ['value', 'fresh_until'])
+
+_revalidation_executor = None
+_revalidation_pid = None
+_revalidations = set()
+_revalidations_lock = threading.Lock()
+
+
+def _executor():
+    global _revalidation_executor, _revalidation_pid
+    # Threads do not survive a fork, so every process starts its own pool.
+    if _revalidation_executor is None or _revalidation_pid != os.getpid():
+        _revalidation_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'CACHE_REVALIDATION_WORKERS', 2),
+            thread_name_prefix='cache-revalidate',
+        )
+        _revalidation_pid = os.getpid()
+        _revalidations.clear()
+    return _revalidation_executor
+
+
+def _lock_key(key):
+    return f'{key}:computing'
+
+
+def _release(store, key, token):
+    if store.get(_lock_key(key)) == token:
+        store.delete(_lock_key(key))
+
+
+def _store(store, key, value, timeout, stale_timeout):
+    store.set(key, CachedEntry(value, time.time() + timeout), timeout + stale_timeout)
+    return value
+
+
+def _revalidate(cache_alias, key, compute, timeout, stale_timeout, token):
+    store = caches[cache_alias]
+    try:
+        _store(store, key, compute(), timeout, stale_timeout)
+    except Exception:
+        # The lock is kept until it times out, so a failing source is retried at most once per lock timeout.
+        logger.exception('Could not recompute cache entry %s; serving the stale value.', key)
+        return
+    finally:
+        close_old_connections()
+    _release(store, key, token)
+
+
+def cached_value(key, compute, timeout, stale_timeout=0, cache_alias='default', lock_timeout=None):
+    """The value cached under ``key``, calling ``compute()`` at most once across processes when it is missing.
+
+    Values are fresh for ``timeout`` seconds. For ``stale_timeout`` seconds more
+    the old value is returned while one process recomputes it in the background.
+    A process that misses while another computes the value waits up to
+    ``lock_timeout`` (CACHE_LOCK_TIMEOUT) seconds for it, then computes it itself.
+    """
+    store = caches[cache_alias]
+    lock_timeout = lock_timeout or getattr(settings, 'CACHE_LOCK_TIMEOUT', 120)
+    token = uuid.uuid4().hex
+
+    entry = store.get(key)
+    if isinstance(entry, CachedEntry):
+        if time.time() < entry.fresh_until:
+            return entry.value
+        if stale_timeout > 0:
+            if store.add(_lock_key(key), token, lock_timeout):
+                future = _executor().submit(_revalidate, cache_alias, key, compute, timeout, stale_timeout, token)
+                with _revalidations_lock:
+                    _revalidations.add(future)
+                future.add_done_callback(_revalidation_done)
+            return entry.value
+
+    deadline = time.monotonic() + lock_timeout
+    while not store.add(_lock_key(key), token, lock_timeout):
+        if time.monotonic() >= deadline:
+            logger.warning('Gave up waiting for cache entry %s computed by another process.', key)
+            return _store(store, key, compute(), timeout, stale_timeout)
+        time.sleep(getattr(settings, 'CACHE_LOCK_POLL_SECONDS', 0.1))
+        entry = store.get(key)
+        if isinstance(entry, CachedEntry) and time.time() < entry.fresh_until:
+            return entry.value
+    try:
+        return _store(store, key, compute(), timeout, stale_timeout)
+    finally:
+        _release(store, key, token)
+
+
+def _revalidation_done(future):
+    with _revalidations_lock:
+        _revalidations.discard(future)
+
+
+def wait_for_revalidations(timeout=None):
+    """Block until the background recomputations started by this process have finished."""
+    with _revalidations_lock:
+        pending = list(_revalidations)
+    wait(pending, timeout=timeout)
@@ -0,0 +1,423 @@
+"""Shared download path for the spectrum archive services (Gemini, ESO, LCO).
+
+Products are streamed to disk instead of being held in memory:
+
+* every download goes to ``<cache>/partial/`` first and is resumed with an HTTP
+  ``Range`` request when an earlier attempt was cut off;
+* a finished payload is moved to ``<cache>/objects/<sha[:2]>/<sha256>`` and an
+  index entry maps the product key (normally its URL) to that checksum, so the
+  same product is never fetched twice and identical payloads are kept once;
+  ``<cache>/refs/<sha[:2]>/<sha256>/`` holds one marker per key sharing the
+  payload, which is only deleted once the last key is discarded;
+* a cache hit touches the files it uses, so pruning by modification time
+  evicts the least recently used products;
+* bz2/gzip/tar containers are decoded stream by stream into
+  ``<cache>/decoded/`` and the services open the resulting plain FITS file.
+
+Services resolve DataLink and download products through
+:func:`map_with_bounded_concurrency`, and skip products whose archive ID is
+already stored for the target (:func:`ingested_product_ids`).
+"""
+
+import bz2
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import requests
+from django.conf import settings
+from tom_dataproducts.models import ReducedDatum
+
+from custom_code.data_services.service_utils import DATA_SERVICE_HTTP_TIMEOUT
+
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+ARCHIVE_CACHE_PRUNE_INTERVAL_SECONDS = 3600
+FITS_MAGIC = b'SIMPLE'
+
+# Locks only live while a download holds them, so the map does not grow with every key seen.
+_key_locks = weakref.WeakValueDictionary()
+_key_locks_lock = threading.Lock()
+_last_prune = {'at': 0.0}
+
+
+class ArchiveDownloadError(Exception):
+    pass
+
+
+@dataclass
+class CachedProduct:
+    key: str
+    url: str
+    sha256: str
+    path: str
+    size: int
+
+
+def archive_cache_dir():
+    return getattr(settings, 'ARCHIVE_DOWNLOAD_CACHE_DIR', '') or os.path.join(settings.MEDIA_ROOT, 'archive_cache')
+
+
+def archive_download_concurrency():
+    return max(1, int(getattr(settings, 'ARCHIVE_DOWNLOAD_MAX_CONCURRENCY', 4) or 1))
+
+
+def archive_download_attempts():
+    return max(1, int(getattr(settings, 'ARCHIVE_DOWNLOAD_MAX_ATTEMPTS', 3) or 1))
+
+
+def archive_cache_max_age_seconds():
+    return int(getattr(settings, 'ARCHIVE_DOWNLOAD_CACHE_MAX_AGE_SECONDS', 7 * 86400))
+
+
+def _key_digest(key):
+    return hashlib.sha256(str(key).encode('utf8')).hexdigest()
+
+
+def _index_path(key):
+    digest = _key_digest(key)
+    return os.path.join(archive_cache_dir(), 'index', digest[:2], f'{digest}.json')
+
+
+def _object_path(sha256):
+    return os.path.join(archive_cache_dir(), 'objects', sha256[:2], sha256)
+
+
+def _decoded_path(sha256):
+    return os.path.join(archive_cache_dir(), 'decoded', sha256[:2], f'{sha256}.fits')
+
+
+def _partial_path(key):
+    return os.path.join(archive_cache_dir(), 'partial', f'{_key_digest(key)}.part')
+
+
+def _ref_path(sha256, key):
+    return os.path.join(archive_cache_dir(), 'refs', sha256[:2], sha256, _key_digest(key))
+
+
+def _key_lock(key):
+    digest = _key_digest(key)
+    with _key_locks_lock:
+        lock = _key_locks.get(digest)
+        if lock is None:
+            lock = threading.Lock()
+            _key_locks[digest] = lock
+        return lock
+
+
+def _touch(path, create=False):
+    try:
+        if create:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a'):
+                pass
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(ARCHIVE_DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json_atomically(path, payload):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    with os.fdopen(handle, 'w') as temp_file:
+        json.dump(payload, temp_file)
+    os.replace(temp_path, path)
+
+
+def cached_product(key):
+    """The cached payload for ``key``, or None when it has not been downloaded yet."""
+    try:
+        with open(_index_path(key)) as handle:
+            entry = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    path = _object_path(entry.get('sha256') or '')
+    if not entry.get('sha256') or not os.path.exists(path):
+        return None
+    # Mark the hit so pruning keeps products in use; the ref also covers entries written before refs existed.
+    _touch(_index_path(key))
+    _touch(path)
+    _touch(_ref_path(entry['sha256'], key), create=True)
+    return CachedProduct(
+        key=str(key),
+        url=entry.get('url') or '',
+        sha256=entry['sha256'],
+        path=path,
+        size=os.path.getsize(path),
+    )
+
+
+def _fetch_into(partial_path, url, timeout, request_kwargs, http):
+    """Stream ``url`` into ``partial_path``, resuming after the bytes already on disk.
+
+    Returns False when the partial file did not match the remote payload and
+    was discarded, so the caller should start over.
+    """
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    headers = dict(request_kwargs.pop('headers', None) or {})
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+    with http.get(url, headers=headers, stream=True, timeout=timeout, **request_kwargs) as response:
+        if response.status_code == 416 and offset:
+            # Nothing left to send: the partial file already holds the whole payload.
+            total = str(response.headers.get('Content-Range') or '').rpartition('/')[2]
+            if total.isdigit() and int(total) == offset:
+                return True
+            os.remove(partial_path)
+            return False
+        if not response.ok:
+            raise ArchiveDownloadError(f'HTTP {response.status_code}')
+        # A server that ignores Range answers 200 with the full payload.
+        mode = 'ab' if offset and response.status_code == 206 else 'wb'
+        with open(partial_path, mode) as output:
+            for block in response.iter_content(chunk_size=ARCHIVE_DOWNLOAD_CHUNK_SIZE):
+                if block:
+                    output.write(block)
+    return True
+
+
+def download_product(url, key=None, timeout=DATA_SERVICE_HTTP_TIMEOUT, session=None, **request_kwargs):
+    """Download ``url`` into the content-addressed cache and return its :class:`CachedProduct`.
+
+    ``key`` identifies the product in the cache (default: the URL). Interrupted
+    transfers are retried up to ``ARCHIVE_DOWNLOAD_MAX_ATTEMPTS`` times and
+    resume from the partial file, also across worker runs. Raises
+    :class:`ArchiveDownloadError` on HTTP errors and lets connection errors of
+    the last attempt propagate.
+    """
+    key = str(key or url)
+    cached = cached_product(key)
+    if cached is not None:
+        return cached
+    _maybe_prune_archive_cache()
+
+    http = session or requests
+    with _key_lock(key):
+        cached = cached_product(key)
+        if cached is not None:
+            return cached
+
+        partial_path = _partial_path(key)
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+        attempts = archive_download_attempts()
+        for attempt in range(1, attempts + 1):
+            try:
+                if _fetch_into(partial_path, url, timeout, dict(request_kwargs), http):
+                    break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as exc:
+                if attempt >= attempts:
+                    raise
+                logger.info('Archive download of %s interrupted (%s); resuming, attempt %s.', url, exc, attempt + 1)
+        else:
+            raise ArchiveDownloadError(f'Could not download {url}')
+
+        sha256 = _file_sha256(partial_path)
+        object_path = _object_path(sha256)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        with _key_lock(f'sha256:{sha256}'):
+            if os.path.exists(object_path):
+                os.remove(partial_path)
+                _touch(object_path)
+            else:
+                os.replace(partial_path, object_path)
+            _touch(_ref_path(sha256, key), create=True)
+            _write_json_atomically(_index_path(key), {'url': url, 'sha256': sha256})
+        return CachedProduct(key=key, url=url, sha256=sha256, path=object_path, size=os.path.getsize(object_path))
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard_cached_product(product):
+    """Remove a product from the cache once its content has been stored elsewhere.
+
+    The payload and its decoded file are shared by every key with the same
+    checksum, so they are only deleted when no other key still refers to them.
+    """
+    _remove_file(_index_path(product.key))
+    ref_path = _ref_path(product.sha256, product.key)
+    with _key_lock(f'sha256:{product.sha256}'):
+        _remove_file(ref_path)
+        try:
+            if os.listdir(os.path.dirname(ref_path)):
+                return
+        except FileNotFoundError:
+            pass
+        _remove_file(product.path)
+        _remove_file(_decoded_path(product.sha256))
+        try:
+            os.rmdir(os.path.dirname(ref_path))
+        except OSError:
+            pass
+
+
+def prune_archive_cache(now=None):
+    """Delete cache files unused for ARCHIVE_DOWNLOAD_CACHE_MAX_AGE_SECONDS; return how many.
+
+    Cache hits touch their files, so the modification time is the last use.
+    """
+    cutoff = (now or time.time()) - archive_cache_max_age_seconds()
+    removed = 0
+    for directory, _subdirs, file_names in os.walk(archive_cache_dir()):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
+
+
+def _maybe_prune_archive_cache():
+    now = time.time()
+    with _key_locks_lock:
+        if now - _last_prune['at'] < ARCHIVE_CACHE_PRUNE_INTERVAL_SECONDS:
+            return
+        _last_prune['at'] = now
+    try:
+        prune_archive_cache(now)
+    except Exception:
+        logger.debug('Could not prune the archive download cache.', exc_info=True)
+
+
+def _decompressing_reader(handle):
+    """Wrap a buffered binary stream in a bz2/gzip reader when its magic bytes ask for it."""
+    magic = handle.peek(3)[:3]
+    if magic == b'BZh':
+        return bz2.BZ2File(handle)
+    if magic[:2] == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=handle)
+    return handle
+
+
+def _is_tar(path):
+    with open(path, 'rb') as handle:
+        return handle.read(512)[257:262] == b'ustar'
+
+
+def _starts_with_fits(path):
+    with open(path, 'rb') as handle:
+        return handle.read(len(FITS_MAGIC)) == FITS_MAGIC
+
+
+def _copy_decompressed(source, output_path):
+    with open(output_path, 'wb') as output:
+        shutil.copyfileobj(_decompressing_reader(source), output, ARCHIVE_DOWNLOAD_CHUNK_SIZE)
+
+
+def decode_fits_product(product):
+    """Path of the plain FITS file inside a cached product, or None when there is none.
+
+    bz2/gzip payloads and tar archives (with compressed members) are decoded
+    from disk to disk; the first FITS member of a tar wins. The decoded file is
+    kept next to the payload, so a product is decoded once.
+    """
+    decoded_path = _decoded_path(product.sha256)
+    if os.path.exists(decoded_path):
+        _touch(decoded_path)
+        return decoded_path
+
+    directory = os.path.dirname(decoded_path)
+    os.makedirs(directory, exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=directory)
+    try:
+        stage_path = os.path.join(work_dir, 'payload')
+        with open(product.path, 'rb') as source:
+            _copy_decompressed(source, stage_path)
+
+        if _is_tar(stage_path):
+            member_path = os.path.join(work_dir, 'member')
+            found = False
+            with tarfile.open(stage_path, 'r:') as archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    _copy_decompressed(archive.extractfile(member), member_path)
+                    if _starts_with_fits(member_path):
+                        found = True
+                        break
+            if not found:
+                return None
+            stage_path = member_path
+        elif not _starts_with_fits(stage_path):
+            return None
+
+        os.replace(stage_path, decoded_path)
+        return decoded_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def describe_product(product):
+    """Say what a cached payload starts with, for log lines about undecodable products."""
+    try:
+        with open(product.path, 'rb') as handle:
+            head = _decompressing_reader(handle).read(60)
+    except Exception as exc:
+        return f'unreadable: {type(exc).__name__}'
+    text = head.decode('utf8', 'replace').strip().replace('\n', ' ')
+    return f'not FITS ({product.size}B): {text[:52]!r}'
+
+
+def map_with_bounded_concurrency(func, items, max_workers=None):
+    """``[func(item) for item in items]`` on at most ``ARCHIVE_DOWNLOAD_MAX_CONCURRENCY`` threads.
+
+    Results keep the order of ``items``; ``func`` is expected to handle its own
+    errors and return None for a product it could not use.
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = min(max_workers or archive_download_concurrency(), len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
+
+
+def ingested_product_ids(query_parameters, source_name):
+    """Archive product IDs (``value['source_id']``) already stored as spectra of the queried target.
+
+    A refresh can skip those products; a forced refresh, or a query without a
+    local target, skips nothing.
+    """
+    target_id = query_parameters.get('target_id')
+    if not target_id or query_parameters.get('force'):
+        return set()
+    try:
+        values = ReducedDatum.objects.filter(
+            target_id=target_id,
+            source_name=source_name,
+            data_type='spectroscopy',
+        ).values_list('value__source_id', flat=True)
+        return {str(value) for value in values if value not in (None, '')}
+    except Exception:
+        logger.debug('Could not read ingested %s products for target %s.', source_name, target_id, exc_info=True)
+        return set()
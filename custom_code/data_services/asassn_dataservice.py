@@ -3,7 +3,6 @@ from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from contextlib import redirect_stderr, redirect_stdout
 from io import StringIO
 import re
-from django.core.cache import cache
 from django.db import IntegrityError, transaction
 
 try:
@@ -23,6 +22,7 @@ from tom_dataservices.dataservices import DataService
 from tom_dataproducts.models import ReducedDatum
 from tom_targets.models import Target, TargetName
 
+from custom_code.caching import cached_value
 from custom_code.data_services.forms import ASASSNQueryForm
 from custom_code.data_services.service_utils import DATA_SERVICE_HTTP_TIMEOUT
 
@@ -33,6 +33,7 @@ ASASSN_QUERY_URL = 'http://asas-sn.ifa.hawaii.edu/skypatrol'
 ASASSN_TRANSIENTS_URL = 'https://www.astronomy.ohio-state.edu/asassn/transients.html'
 ASASSN_TRANSIENTS_CACHE_KEY = 'asassn_transient_rows'
 ASASSN_TRANSIENTS_CACHE_TIMEOUT = 3600
+ASASSN_TRANSIENTS_STALE_TIMEOUT = 86400
 ASASSN_TRANSIENT_SEARCH_RADIUS_ARCSEC = 7.0
 ASASSN_SKYPATROL_TIMEOUT_SECONDS = 60
 
@@ -143,20 +144,25 @@ def _parse_transient_rows(html):
     return rows
 
 
-def _fetch_transient_rows():
-    cached_rows = cache.get(ASASSN_TRANSIENTS_CACHE_KEY)
-    if cached_rows is not None:
-        logger.info('ASAS-SN transient table cache hit: rows=%s', len(cached_rows))
-        return cached_rows
+def _download_transient_rows():
     logger.info('ASAS-SN transient table fetch starting: url=%s', ASASSN_TRANSIENTS_URL)
     response = requests.get(ASASSN_TRANSIENTS_URL, timeout=DATA_SERVICE_HTTP_TIMEOUT)
     response.raise_for_status()
     rows = _parse_transient_rows(response.text)
-    cache.set(ASASSN_TRANSIENTS_CACHE_KEY, rows, ASASSN_TRANSIENTS_CACHE_TIMEOUT)
     logger.info('ASAS-SN transient table fetch finished: rows=%s', len(rows))
     return rows
 
 
+def _fetch_transient_rows():
+    # One process downloads the table; after an hour the old table is served while it is downloaded again.
+    return cached_value(
+        ASASSN_TRANSIENTS_CACHE_KEY,
+        _download_transient_rows,
+        ASASSN_TRANSIENTS_CACHE_TIMEOUT,
+        stale_timeout=ASASSN_TRANSIENTS_STALE_TIMEOUT,
+    )
+
+
 def _candidate_target_names(query_parameters):
     names = []
     for value in query_parameters.get('target_names') or []:
@@ -13,8 +13,10 @@ that is force-killed at ``DATA_SERVICE_JOB_TIMEOUT`` = 300s):
   submit so repeat refreshes do not pile up duplicate jobs.
 * **Phase 2 -- poll & ingest** (:func:`poll_pending_atlas_jobs`, called every
   ``ATLAS_POLL_INTERVAL_SECONDS`` -- default 5 min -- from db_worker's scheduled loop):
-  does a *single* non-blocking check per pending job; when a job has finished it downloads
-  the result, cleans the ATLAS AB magnitudes, and bulk-inserts the total photometry.
+  does a *single* non-blocking check per pending job on a small thread pool; when a job has
+  finished it downloads the result, cleans the ATLAS AB magnitudes, and all finished jobs of
+  the cycle are bulk-inserted together. Jobs queued behind one that has not started yet are
+  not checked, and an HTTP 429 pauses polling for the server's Retry-After.
 
 Efficiency notes: incremental fetch (only request epochs newer than the latest stored
 ATLAS point), one authentication per worker (module-cached token, inherited across the
@@ -26,6 +28,9 @@ so incremental-boundary overlap never duplicates rows.
 
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timezone as dt_timezone
 from io import StringIO
 
@@ -35,6 +40,7 @@ import requests
 from astropy.time import Time
 
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone as dj_timezone
 
 from tom_dataservices.dataservices import DataService, NotConfiguredError, QueryServiceError
@@ -46,6 +52,7 @@ from custom_code.data_services.service_utils import (
     DATA_SERVICE_HTTP_TIMEOUT,
     resolve_query_coordinates,
 )
+from custom_code.target_names import upsert_target_aliases
 
 
 logger = logging.getLogger(__name__)
@@ -67,6 +74,8 @@ _OUTLIER_Z_SCORE = 5.0     # drop |z| >= 5 outliers; keeps transients only a few
 
 # Process-lived token cache so a worker authenticates at most once per (base_url, username).
 _TOKEN_CACHE = {}
+# time.monotonic() before which the poller stays quiet after ATLAS answered HTTP 429.
+_POLL_THROTTLED_UNTIL = 0.0
 
 
 def _to_float(value):
@@ -82,6 +91,8 @@ def _atlas_tuning():
         'mjd_floor': float(getattr(settings, 'ATLAS_MJD_FLOOR', _DEFAULT_MJD_FLOOR)),
         'job_max_age': float(getattr(settings, 'ATLAS_JOB_MAX_AGE_SECONDS', 86400.0)),
         'poll_batch': int(getattr(settings, 'ATLAS_POLL_BATCH', 50)),
+        'poll_workers': max(1, int(getattr(settings, 'ATLAS_POLL_WORKERS', 4))),
+        'throttle_backoff': float(getattr(settings, 'ATLAS_THROTTLE_BACKOFF_SECONDS', 60.0)),
     }
 
 
@@ -176,53 +187,168 @@ def _reduced_datum_identity(timestamp, value):
     return (timestamp, json.dumps(value, sort_keys=True, separators=(',', ':'), default=str))
 
 
-def _ingest_photometry(target, rows):
-    """Bulk-insert photometry rows, deduping on (timestamp, value). Returns count added."""
-    if not rows:
-        return 0
-    timestamps = [row['timestamp'] for row in rows]
+def _ingest_photometry_batch(rows_by_target):
+    """Bulk-insert photometry for several targets at once, deduping on (target, timestamp, value).
+
+    ``rows_by_target`` maps target -> rows; returns target_id -> count added. One
+    lookup of existing rows and one bulk insert cover the whole batch.
+    """
+    rows_by_target = {target: rows for target, rows in rows_by_target.items() if rows}
+    if not rows_by_target:
+        return {}
+    timestamps = {row['timestamp'] for rows in rows_by_target.values() for row in rows}
     existing_keys = {
-        _reduced_datum_identity(ts, val)
-        for ts, val in ReducedDatum.objects.filter(
-            target=target,
+        (target_id,) + _reduced_datum_identity(ts, val)
+        for target_id, ts, val in ReducedDatum.objects.filter(
+            target_id__in=[target.pk for target in rows_by_target],
             source_name=ATLASDataService.name,
             data_type='photometry',
             timestamp__in=timestamps,
-        ).values_list('timestamp', 'value')
+        ).values_list('target_id', 'timestamp', 'value')
     }
     seen = set()
     new_rows = []
-    for row in rows:
-        key = _reduced_datum_identity(row['timestamp'], row['value'])
-        if key in existing_keys or key in seen:
-            continue
-        seen.add(key)
-        new_rows.append(ReducedDatum(
-            target=target,
-            data_type='photometry',
-            source_name=ATLASDataService.name,
-            source_location=ATLAS_INFO_URL,
-            timestamp=row['timestamp'],
-            value=row['value'],
-        ))
+    added = {}
+    for target, rows in rows_by_target.items():
+        added[target.pk] = 0
+        for row in rows:
+            key = (target.pk,) + _reduced_datum_identity(row['timestamp'], row['value'])
+            if key in existing_keys or key in seen:
+                continue
+            seen.add(key)
+            added[target.pk] += 1
+            new_rows.append(ReducedDatum(
+                target=target,
+                data_type='photometry',
+                source_name=ATLASDataService.name,
+                source_location=ATLAS_INFO_URL,
+                timestamp=row['timestamp'],
+                value=row['value'],
+            ))
     if new_rows:
         ReducedDatum.objects.bulk_create(new_rows, batch_size=500)
-    return len(new_rows)
+    return added
+
+
+def _ingest_photometry(target, rows):
+    """Bulk-insert photometry rows, deduping on (timestamp, value). Returns count added."""
+    return _ingest_photometry_batch({target: rows}).get(target.pk, 0)
 
 
 # ----------------------------------------------------------- phase 2: poller
+def _retry_after_seconds(resp, default):
+    value = _to_float(resp.headers.get('Retry-After'))
+    return value if value is not None and value > 0 else default
+
+
+class _PollCycle:
+    """State shared by the poller threads of one cycle.
+
+    ATLAS works through a user's jobs in submission order, so once one job is
+    still waiting to start every younger job is too and is not checked. A 429
+    stops the whole cycle until the server's Retry-After has passed.
+    """
+
+    def __init__(self, token, throttle_backoff):
+        self.token = token
+        self.throttle_backoff = throttle_backoff
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.sessions = []
+        self.queued_since = None
+        self.throttled_for = None
+
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = _authed_session(self.token)
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def should_skip(self, job):
+        with self.lock:
+            if self.throttled_for is not None:
+                return True
+            return self.queued_since is not None and job.submitted_at > self.queued_since
+
+    def mark_queued(self, job):
+        with self.lock:
+            if self.queued_since is None or job.submitted_at < self.queued_since:
+                self.queued_since = job.submitted_at
+
+    def mark_throttled(self, resp):
+        with self.lock:
+            self.throttled_for = max(self.throttled_for or 0.0, _retry_after_seconds(resp, self.throttle_backoff))
+
+    def get(self, url):
+        resp = self.session().get(url, timeout=DATA_SERVICE_HTTP_TIMEOUT)
+        if resp.status_code == 429:
+            self.mark_throttled(resp)
+        elif resp.status_code == 401:
+            # Cached tokens can expire; authenticate again on the next cycle.
+            for key, token in list(_TOKEN_CACHE.items()):
+                if token == self.token:
+                    _TOKEN_CACHE.pop(key, None)
+        return resp
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+
+
+def _check_atlas_job(cycle, job):
+    """Check one job over HTTP (no database access) and return what happened to it."""
+    if cycle.should_skip(job):
+        return {'state': 'skipped'}
+    try:
+        resp = cycle.get(job.task_url)
+        if resp.status_code == 429:
+            return {'state': 'skipped'}
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception as exc:
+        return {'state': 'error', 'error': f'Poll failed: {exc}'}
+
+    if not data.get('finishtimestamp'):
+        if not data.get('starttimestamp'):
+            cycle.mark_queued(job)
+        return {'state': 'pending'}
+
+    result_url = data.get('result_url')
+    if not result_url:
+        return {'state': 'done', 'result_url': None, 'rows': []}
+
+    try:
+        result = cycle.get(result_url)
+        if result.status_code == 429:
+            return {'state': 'skipped'}
+        result.raise_for_status()
+        rows = _parse_result_text(result.text)
+    except Exception as exc:
+        return {'state': 'error', 'result_url': result_url, 'error': f'Result download/ingest failed: {exc}'}
+    return {'state': 'done', 'result_url': result_url, 'rows': rows}
+
+
 def poll_pending_atlas_jobs(limit=None):
     """Check pending ATLAS jobs once each; ingest photometry for any that have finished.
 
     Designed to be called on a fixed cadence (every ATLAS_POLL_INTERVAL_SECONDS) from the
-    db_worker scheduled loop. Each job costs at most one HTTP GET (plus one download when it
-    is ready), so a tick never blocks the worker on the ATLAS queue.
+    db_worker scheduled loop. Jobs are checked concurrently on ATLAS_POLL_WORKERS threads
+    sharing one token, each costing at most one HTTP GET (plus one download when ready).
+    All finished jobs are then ingested together in one transaction.
     """
+    global _POLL_THROTTLED_UNTIL
     from custom_code.models import ATLASForcedPhotJob
 
     tuning = _atlas_tuning()
     limit = limit or tuning['poll_batch']
-    summary = {'checked': 0, 'completed': 0, 'ingested': 0, 'failed': 0}
+    summary = {'checked': 0, 'completed': 0, 'ingested': 0, 'failed': 0, 'skipped': 0}
+
+    if time.monotonic() < _POLL_THROTTLED_UNTIL:
+        logger.info('ATLAS poller: backing off after throttling; skipping this cycle.')
+        return summary
 
     jobs = list(
         ATLASForcedPhotJob.objects
@@ -233,79 +359,102 @@ def poll_pending_atlas_jobs(limit=None):
     if not jobs:
         return summary
 
-    try:
-        token = ATLASDataService._resolve_token()
-    except NotConfiguredError:
-        logger.warning('ATLAS poller: no credentials configured; leaving %s job(s) pending.', len(jobs))
-        return summary
-
-    session = _authed_session(token)
-    try:
-        for job in jobs:
-            summary['checked'] += 1
-            now = dj_timezone.now()
-
-            # Give up on jobs that have been queued far too long.
-            if (now - job.submitted_at).total_seconds() > tuning['job_max_age']:
-                job.status = ATLASForcedPhotJob.STATUS_FAILED
-                job.error = 'Timed out waiting for the ATLAS queue.'
-                job.finished_at = now
-                job.last_checked_at = now
-                job.save(update_fields=['status', 'error', 'finished_at', 'last_checked_at'])
-                summary['failed'] += 1
-                continue
-
-            job.attempts += 1
-            job.last_checked_at = now
-            try:
-                resp = session.get(job.task_url, timeout=DATA_SERVICE_HTTP_TIMEOUT)
-                resp.raise_for_status()
-                data = resp.json()
-            except Exception as exc:
-                job.error = f'Poll failed: {exc}'
-                job.save(update_fields=['attempts', 'last_checked_at', 'error'])
-                logger.warning('ATLAS poller: task check failed for job id=%s: %s', job.id, exc)
-                continue
-
-            if not data.get('finishtimestamp'):
-                # Still queued/running; try again next tick.
-                job.save(update_fields=['attempts', 'last_checked_at'])
-                continue
-
-            result_url = data.get('result_url')
-            job.result_url = result_url
-            if not result_url:
-                # Job finished with no data in the requested window.
-                job.status = ATLASForcedPhotJob.STATUS_DONE
-                job.finished_at = now
-                job.datapoints_added = 0
-                job.save()
-                summary['completed'] += 1
-                continue
-
+    # Give up on jobs that have been queued far too long.
+    now = dj_timezone.now()
+    expired = [job for job in jobs if (now - job.submitted_at).total_seconds() > tuning['job_max_age']]
+    for job in expired:
+        job.status = ATLASForcedPhotJob.STATUS_FAILED
+        job.error = 'Timed out waiting for the ATLAS queue.'
+        job.finished_at = now
+        job.last_checked_at = now
+    summary['checked'] += len(expired)
+    summary['failed'] += len(expired)
+    jobs = [job for job in jobs if job not in expired]
+
+    outcomes = {}
+    if jobs:
+        try:
+            token = ATLASDataService._resolve_token()
+        except NotConfiguredError:
+            logger.warning('ATLAS poller: no credentials configured; leaving %s job(s) pending.', len(jobs))
+            jobs = []
+        else:
+            cycle = _PollCycle(token, tuning['throttle_backoff'])
             try:
-                result = session.get(result_url, timeout=DATA_SERVICE_HTTP_TIMEOUT)
-                result.raise_for_status()
-                rows = _parse_result_text(result.text)
-                added = _ingest_photometry(job.target, rows)
-            except Exception as exc:
+                with ThreadPoolExecutor(max_workers=min(tuning['poll_workers'], len(jobs))) as executor:
+                    futures = {job.pk: executor.submit(_check_atlas_job, cycle, job) for job in jobs}
+                    outcomes = {job_pk: future.result() for job_pk, future in futures.items()}
+            finally:
+                cycle.close()
+            if cycle.throttled_for is not None:
+                _POLL_THROTTLED_UNTIL = time.monotonic() + cycle.throttled_for
+                logger.info('ATLAS poller: throttled by ATLAS (HTTP 429); backing off %.0fs.', cycle.throttled_for)
+
+    now = dj_timezone.now()
+    finished = []
+    checked = []
+    for job in jobs:
+        outcome = outcomes.get(job.pk) or {'state': 'skipped'}
+        if outcome['state'] == 'skipped':
+            summary['skipped'] += 1
+            continue
+        summary['checked'] += 1
+        job.attempts += 1
+        job.last_checked_at = now
+        if 'result_url' in outcome:
+            job.result_url = outcome['result_url']
+        if outcome['state'] == 'error':
+            job.error = outcome['error']
+            logger.warning('ATLAS poller: job id=%s: %s', job.id, job.error)
+        elif outcome['state'] == 'done':
+            finished.append((job, outcome['rows']))
+        checked.append(job)
+
+    added_by_target = {}
+    if finished:
+        rows_by_target = {}
+        targets = {}
+        for job, rows in finished:
+            target = targets.setdefault(job.target_id, job.target)
+            rows_by_target.setdefault(target, []).extend(rows)
+        try:
+            with transaction.atomic():
+                added_by_target = _ingest_photometry_batch(rows_by_target)
+        except Exception as exc:
+            logger.exception('ATLAS poller: batched ingest failed for %s job(s).', len(finished))
+            for job, _rows in finished:
                 job.error = f'Result download/ingest failed: {exc}'
-                job.save(update_fields=['attempts', 'last_checked_at', 'result_url', 'error'])
-                logger.exception('ATLAS poller: ingest failed for job id=%s', job.id)
-                continue
+            finished = []
+
+    credited = set()
+    for job, _rows in finished:
+        # Rows of several jobs for one target are ingested together; credit them to its first job.
+        added = added_by_target.get(job.target_id, 0) if job.target_id not in credited else 0
+        credited.add(job.target_id)
+        _ensure_alias(job.target, job.target.ra, job.target.dec)
+        job.status = ATLASForcedPhotJob.STATUS_DONE
+        job.finished_at = now
+        job.datapoints_added = added
+        job.error = None
+        summary['completed'] += 1
+        summary['ingested'] += added
+    for target_id in credited:
+        _record_data_arrival(target_id, added_by_target.get(target_id, 0))
+
+    ATLASForcedPhotJob.objects.bulk_update(
+        expired + checked,
+        ['status', 'attempts', 'last_checked_at', 'result_url', 'error', 'datapoints_added', 'finished_at'],
+        batch_size=200,
+    )
+    return summary
 
-            _ensure_alias(job.target, job.target.ra, job.target.dec)
-            job.status = ATLASForcedPhotJob.STATUS_DONE
-            job.finished_at = now
-            job.datapoints_added = added
-            job.error = None
-            job.save()
-            summary['completed'] += 1
-            summary['ingested'] += added
-    finally:
-        session.close()
 
-    return summary
+def _record_data_arrival(target_id, datapoints_added):
+    try:
+        from custom_code.refresh_scheduler import record_dataservice_data_arrival
+        record_dataservice_data_arrival(target_id, ATLASDataService.name, ATLASDataService, datapoints_added > 0)
+    except Exception:
+        logger.debug('ATLAS poller: could not record data arrival for target %s.', target_id, exc_info=True)
 
 
 def _ensure_alias(target, ra, dec):
@@ -314,20 +463,17 @@ def _ensure_alias(target, ra, dec):
     if ra is None or dec is None:
         return
     name = _atlas_alias(ra, dec)
-    if str(target.name or '').strip().casefold() == name.casefold():
-        return
-    existing = TargetName.objects.filter(name=name).first()
-    if existing is None:
-        try:
-            TargetName.objects.create(target=target, name=name)
-        except Exception:
-            logger.debug('ATLAS poller: could not create alias %s for target %s.', name, target.id, exc_info=True)
+    try:
+        upsert_target_aliases(target, [name])
+    except Exception:
+        logger.debug('ATLAS poller: could not create alias %s for target %s.', name, target.id, exc_info=True)
 
 
 class ATLASDataService(DataService):
     name = 'ATLAS'
     verbose_name = 'ATLAS Forced Photometry'
     update_on_daily_refresh = True
+    delivers_data_asynchronously = True
     info_url = ATLAS_INFO_URL
     base_url = ATLAS_BASE_URL
     service_notes = (
@@ -19,6 +19,7 @@ from tom_targets.models import Target, TargetName
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from custom_code.data_services.forms import DESIQueryForm
 from custom_code.data_services.service_utils import DATA_SERVICE_HTTP_TIMEOUT
+from custom_code.spectrum_storage import store_spectrum_value
 
 
 
@@ -193,7 +194,7 @@ class DESIDataService(DataService):
                 target=target,
                 data_type='spectroscopy',
                 timestamp=datum['timestamp'],
-                value=datum['value'],
+                value=store_spectrum_value(datum['value']),
                 defaults={
                     'source_name': self.name,
                     'source_location': source_location,
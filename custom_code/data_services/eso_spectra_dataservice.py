@@ -6,10 +6,8 @@ from datetime import timezone
 from specutils import Spectrum1D
 
 import pyvo
-import requests
 from astropy.io import fits
 from astropy.table import Table
-from io import BytesIO
 import numpy as np
 
 from tom_dataservices.dataservices import DataService
@@ -17,14 +15,21 @@ from tom_dataproducts.models import ReducedDatum
 from tom_targets.models import Target, TargetName
 
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
+from custom_code.data_services.archive_downloads import (
+    decode_fits_product,
+    download_product,
+    map_with_bounded_concurrency,
+)
 from custom_code.data_services.forms import ESOSpectraQueryForm
 from custom_code.data_services.service_utils import DATA_SERVICE_HTTP_TIMEOUT
+from custom_code.spectrum_storage import store_spectrum_value
 
 
 
 logger = logging.getLogger(__name__)
 
 ESO_SCIENCE_PORTAL_URL = 'https://archive.eso.org/scienceportal/home'
+ESO_DATAPORTAL_FILE_URL = 'https://dataportal.eso.org/dataPortal/file/'
 
 def _build_eso_query(ra,dec,rad_arcsec):
     rad_deg = rad_arcsec/3600.0
@@ -141,7 +146,7 @@ class ESOSpectraDataService(DataService):
                 target=target,
                 data_type='spectroscopy',
                 timestamp=datum['timestamp'],
-                value=datum['value'],
+                value=store_spectrum_value(datum['value']),
                 defaults={
                     'source_name': self.name,
                     'source_location': source_location,
@@ -160,39 +165,40 @@ class ESOSpectraDataService(DataService):
             )
 
     def _build_spectroscopy_datums(self, spec_table):
-        output = []
-        for tab in spec_table:
-            try:
-                serializer = SpectrumSerializer()
-                spec_res = requests.get(
-                    f"https://dataportal.eso.org/dataPortal/file/{tab['dp_id']}",
-                    timeout=DATA_SERVICE_HTTP_TIMEOUT,
-                )
-                spec_hdul = fits.open(BytesIO(spec_res.content))
+        # Products are downloaded in parallel into the shared archive cache, so
+        # a product fetched by an earlier run is read from disk.
+        return [datum for datum in map_with_bounded_concurrency(self._datum_from_product, spec_table) if datum]
+
+    def _datum_from_product(self, tab):
+        try:
+            product = download_product(f"{ESO_DATAPORTAL_FILE_URL}{tab['dp_id']}", timeout=DATA_SERVICE_HTTP_TIMEOUT)
+            fits_path = decode_fits_product(product)
+            if fits_path is None:
+                return None
+            with fits.open(fits_path, memmap=True) as spec_hdul:
                 time_mjd = spec_hdul[0].header['MJD-OBS']
                 target_id = spec_hdul[0].header['HIERARCH ESO OBS ID']
                 tel = spec_hdul[0].header['TELESCOP']
                 instr = spec_hdul[0].header['INSTRUME']
-                spec_data = Table.read(BytesIO(spec_res.content), format="fits")
-                spec_wave = spec_data['WAVE'][0]
-                spec_flux = spec_data['FLUX'][0]
-                mask = (~np.isnan(spec_flux)) & (spec_flux > 0)
-                spec_wave_pos = spec_wave[mask]
-                spec_flux_pos = spec_flux[mask]
-                spectrum = Spectrum1D(
-                            flux=spec_flux_pos * spec_data['FLUX'].unit,
-                            spectral_axis=spec_wave_pos * spec_data['WAVE'].unit,)
-                serialized = serializer.serialize(spectrum)
-                serialized.update({
-                        'filter': f'{tel}-{instr}',
-                        'source_id': str(target_id),
-                        'spectrum_type': 'ESO_spectrum',})
-
-                output.append({
-                    'timestamp': Time(time_mjd, format='mjd', scale='utc').to_datetime(timezone=timezone.utc),
-                    'value': serialized,
-                    })
-            except Exception as e:
-                continue
-
-        return output
+            spec_data = Table.read(fits_path, format="fits")
+            spec_wave = spec_data['WAVE'][0]
+            spec_flux = spec_data['FLUX'][0]
+            mask = (~np.isnan(spec_flux)) & (spec_flux > 0)
+            spec_wave_pos = spec_wave[mask]
+            spec_flux_pos = spec_flux[mask]
+            spectrum = Spectrum1D(
+                        flux=spec_flux_pos * spec_data['FLUX'].unit,
+                        spectral_axis=spec_wave_pos * spec_data['WAVE'].unit,)
+            serialized = SpectrumSerializer().serialize(spectrum)
+            serialized.update({
+                    'filter': f'{tel}-{instr}',
+                    'source_id': str(target_id),
+                    'spectrum_type': 'ESO_spectrum',})
+
+            return {
+                'timestamp': Time(time_mjd, format='mjd', scale='utc').to_datetime(timezone=timezone.utc),
+                'value': serialized,
+                }
+        except Exception as e:
+            logger.debug('ESO spectrum %s could not be read: %s', tab['dp_id'], e)
+            return None
@@ -51,6 +51,7 @@ class ExoClockDataService(DataService):
     name = 'ExoClock'
     verbose_name = 'ExoClock'
     update_on_daily_refresh = True
+    refresh_cadence_seconds = 7 * 86400
     info_url = EXOCLOCK_PLANETS_JSON_URL
     service_notes = 'Query ExoClock by planet name or cone search and ingest transit ephemerides.'
 
@@ -30,6 +30,7 @@ class FAVADataService(DataService):
     name = 'FAVA'
     verbose_name = 'FAVA (Fermi-LAT)'
     update_on_daily_refresh = True
+    refresh_cadence_seconds = 7 * 86400
     info_url = FAVA_PAGE
     service_notes = 'Query FAVA (Fermi All-sky Variability Analysis) by coordinates and ingest high-energy light curves.'
 
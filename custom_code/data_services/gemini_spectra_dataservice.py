@@ -5,6 +5,11 @@ Retrieval chain (the part that is easy to get wrong):
     ivoa.ObsCore.access_url  ->  XML VOTable (a DataLink *listing*, not data)
         -> row with semantics '#this'  ->  the actual FITS (maybe .bz2 / tar)
 
+Rows are resolved and downloaded in parallel through the shared archive
+download cache (``custom_code.data_services.archive_downloads``), which also
+decodes the .bz2 / tar containers on disk. Products already stored for the
+target are not downloaded again.
+
 Gemini products are served through several reduction pipelines and instrument
 formats, so a single decoder cannot assume one layout. ``read_spectrum`` tries
 every plausible encoding (binary table, WCS image axis, GHOST-style AWAV-TAB
@@ -15,16 +20,11 @@ so they are stored with the astropy count unit (``u.ct``), the same convention
 used by the 6dFGS service for its raw-count spectra.
 """
 
-import bz2
-import gzip
-import io
 import logging
 import re
-import tarfile
 from datetime import date, timezone
 
 import numpy as np
-import requests
 
 import astropy.units as u
 from astropy.io import fits
@@ -41,8 +41,16 @@ from tom_dataproducts.models import ReducedDatum
 from tom_targets.models import Target, TargetName
 
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
+from custom_code.data_services.archive_downloads import (
+    decode_fits_product,
+    describe_product,
+    download_product,
+    ingested_product_ids,
+    map_with_bounded_concurrency,
+)
 from custom_code.data_services.forms import GeminiSpectraQueryForm
 from custom_code.data_services.service_utils import DATA_SERVICE_HTTP_TIMEOUT
+from custom_code.spectrum_storage import store_spectrum_value
 
 
 logger = logging.getLogger(__name__)
@@ -54,7 +62,8 @@ CADC_TAP_URL = 'https://ws.cadc-ccda.hia-iha.nrc-cnrc.gc.ca/argus'
 GEMINI_COLLECTIONS = ('GEMINI', 'GEMINICADC')
 
 # Cap the number of ObsCore rows, and the number we will actually download.
-# Every kept row costs one DataLink round trip plus one FITS download.
+# Every kept row costs one DataLink round trip plus one FITS download; rows
+# are worked on ARCHIVE_DOWNLOAD_MAX_CONCURRENCY at a time.
 MAX_OBSCORE_ROWS = 200
 MAX_SPECTRA = 40
 
@@ -89,28 +98,6 @@ ERR_KEYS = ('ERROR', 'ERR', 'SIGMA', 'FLUX_ERROR', 'IVAR', 'VARIANCE', 'VAR', 'F
 _SKIP_EXTNAMES = ('DQ', 'VAR', 'ERR', 'AWAV', 'MASK')
 
 
-def _decompress(blob):
-    if blob[:3] == b'BZh':
-        return bz2.decompress(blob)
-    if blob[:2] == b'\x1f\x8b':
-        return gzip.decompress(blob)
-    return blob
-
-
-def _untar(blob):
-    """Return the first FITS member of a tar blob, or None if it is not a tar."""
-    if blob[257:262] != b'ustar':
-        return None
-    with tarfile.open(fileobj=io.BytesIO(blob)) as archive:
-        for member in archive.getmembers():
-            if not member.isfile():
-                continue
-            extracted = _decompress(archive.extractfile(member).read())
-            if extracted[:6] == b'SIMPLE':
-                return extracted
-    return None
-
-
 def _to_nm(lam, unit):
     """Convert a wavelength array to nm, guessing from magnitude if unit is absent."""
     unit = (unit or '').lower()
@@ -279,38 +266,24 @@ def _read_image_spectra(hdul, best):
     return best
 
 
-def read_spectrum(blob):
-    """Decode a downloaded product into ``(lam_nm, flux, err, note, snr)``, or None."""
-    blob = _decompress(blob)
-    inner = _untar(blob)
-    if inner:
-        blob = inner
-    if blob[:6] != b'SIMPLE':
-        return None
-    with fits.open(io.BytesIO(blob)) as hdul:
+def read_spectrum(fits_path):
+    """Decode a decoded FITS product into ``(lam_nm, flux, err, note, snr)``, or None."""
+    with fits.open(fits_path, memmap=True) as hdul:
         best = _read_bintable_spectra(hdul, None)
         best = _read_image_spectra(hdul, best)
     return best
 
 
-def describe_blob(blob):
-    """Say what a downloaded blob actually is, so failures are never silent."""
+def describe_fits(fits_path):
+    """Say what an undecodable FITS product holds, so failures are never silent."""
     try:
-        raw = blob
-        blob = _decompress(blob)
-        untarred = _untar(blob)
-        prefix = 'tar>' if untarred else ('compressed>' if blob is not raw else '')
-        blob = untarred or blob
-        if blob[:6] != b'SIMPLE':
-            head = blob[:60].decode('utf8', 'replace').strip().replace('\n', ' ')
-            return f'{prefix}not FITS ({len(blob)}B): {head[:52]!r}'
-        with fits.open(io.BytesIO(blob)) as hdul:
+        with fits.open(fits_path, memmap=True) as hdul:
             parts = []
             for hdu in hdul:
                 data = getattr(hdu, 'data', None)
                 shape = '' if data is None else str(getattr(data, 'shape', ''))
                 parts.append(f"{hdu.header.get('EXTNAME') or hdu.__class__.__name__}{shape}")
-        return f'{prefix}FITS but undecodable: ' + ', '.join(parts[:7])
+        return 'FITS but undecodable: ' + ', '.join(parts[:7])
     except Exception as exc:
         return f'unreadable: {type(exc).__name__}'
 
@@ -332,12 +305,10 @@ def mjd_from_row(row):
     return None, None
 
 
-def mjd_from_fits(blob):
+def mjd_from_fits(fits_path):
     """Fall back to the FITS header. GHOST has no MJD-OBS but carries DATE-OBS + UTSTART."""
     try:
-        blob = _decompress(blob)
-        blob = _untar(blob) or blob
-        with fits.open(io.BytesIO(blob)) as hdul:
+        with fits.open(fits_path, memmap=True) as hdul:
             headers = [hdu.header for hdu in hdul]
 
         for header in headers:
@@ -499,6 +470,8 @@ class GeminiSpectraDataService(DataService):
             'dec': dec,
             'radius_arcsec': parameters.get('radius_arcsec') or 10.0,
             'include_spectroscopy': bool(parameters.get('include_spectroscopy', True)),
+            'target_id': parameters.get('target_id'),
+            'force': bool(parameters.get('force')),
         }
         return self.query_parameters
 
@@ -543,7 +516,10 @@ class GeminiSpectraDataService(DataService):
         if ra is None or dec is None or spectroscopy_data is None:
             return []
 
-        datums = self._build_spectroscopy_datums(spectroscopy_data)
+        datums = self._build_spectroscopy_datums(
+            spectroscopy_data,
+            skip_product_ids=ingested_product_ids(query_parameters, self.name),
+        )
         if not datums:
             return []
 
@@ -577,7 +553,7 @@ class GeminiSpectraDataService(DataService):
                 target=target,
                 data_type='spectroscopy',
                 timestamp=datum['timestamp'],
-                value=datum['value'],
+                value=store_spectrum_value(datum['value']),
                 defaults={
                     'source_name': self.name,
                     'source_location': source_location,
@@ -595,15 +571,22 @@ class GeminiSpectraDataService(DataService):
                 source_location=self.query_results.get('source_location') or self.info_url,
             )
 
-    def _build_spectroscopy_datums(self, obs_table):
+    def _build_spectroscopy_datums(self, obs_table, skip_product_ids=()):
+        rows = [row for row in obs_table if str(row['obs_id']).strip() not in skip_product_ids]
+        if len(rows) < len(obs_table):
+            logger.debug('Gemini: %s products are already stored; skipping them.', len(obs_table) - len(rows))
+
+        # Work on only as many rows as are still needed to reach the cap.
         output = []
-        for row in obs_table:
-            if len(output) >= MAX_SPECTRA:
-                logger.info('Gemini: reached the %s spectrum cap; ignoring the rest.', MAX_SPECTRA)
-                break
-            datum = self._datum_from_obscore_row(row)
-            if datum:
-                output.append(datum)
+        start = 0
+        while start < len(rows) and len(output) < MAX_SPECTRA:
+            batch = rows[start:start + MAX_SPECTRA - len(output)]
+            start += len(batch)
+            output.extend(
+                datum for datum in map_with_bounded_concurrency(self._datum_from_obscore_row, batch) if datum
+            )
+        if start < len(rows):
+            logger.info('Gemini: reached the %s spectrum cap; ignoring the rest.', MAX_SPECTRA)
         return output
 
     def _datum_from_obscore_row(self, row):
@@ -629,23 +612,24 @@ class GeminiSpectraDataService(DataService):
                 cert = _gemini_cert()
                 if cert:
                     kwargs['cert'] = cert
-                response = requests.get(url, **kwargs)
-                if not response.ok:
-                    why = f'HTTP {response.status_code}'
+                product = download_product(url, **kwargs)
+                fits_path = decode_fits_product(product)
+                if fits_path is None:
+                    why = describe_product(product)
                     continue
-                spectrum_data = read_spectrum(response.content)
+                spectrum_data = read_spectrum(fits_path)
             except Exception as exc:
                 why = f'{type(exc).__name__}: {str(exc)[:60]}'
                 continue
 
             if spectrum_data is None:
-                why = describe_blob(response.content)
+                why = describe_fits(fits_path)
                 continue
 
             lam_nm, flux, err, note, snr = spectrum_data
             mjd, mjd_source = mjd_from_row(row)
             if mjd is None:
-                mjd, mjd_source = mjd_from_fits(response.content)
+                mjd, mjd_source = mjd_from_fits(fits_path)
             if mjd is None:
                 logger.warning('Gemini: no observation time for obs_id=%s; skipping.', obs_id)
                 return None
@@ -17,6 +17,7 @@ from tom_targets.models import Target, TargetName
 
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from custom_code.data_services.forms import GS6dFQueryForm
+from custom_code.spectrum_storage import store_spectrum_value
 
 
 
@@ -158,7 +159,7 @@ class Gs6dfDataService(DataService):
                 target=target,
                 data_type='spectroscopy',
                 timestamp=datum['timestamp'],
-                value=datum['value'],
+                value=store_spectrum_value(datum['value']),
                 defaults={
                     'source_name': self.name,
                     'source_location': source_location,
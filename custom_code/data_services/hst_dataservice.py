@@ -34,6 +34,7 @@ class HSTDataService(DataService):
     name = 'Hubble'
     verbose_name = 'Hubble'
     update_on_daily_refresh = True
+    refresh_cadence_seconds = 30 * 86400
     info_url = HUBBLE_PAGE
     service_notes = 'Query Hubble Catalog of Variables (HCV) by ra and dec through astroquery.'
 
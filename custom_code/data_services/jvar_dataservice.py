@@ -29,6 +29,7 @@ class JVARDataService(DataService):
     name = 'JVAR'
     verbose_name = 'JVAR'
     update_on_daily_refresh = True
+    refresh_cadence_seconds = 30 * 86400
     info_url = JVAR_PAGE
     service_notes = 'Query JVAR catalog by coordinates (doi:10.1051/0004-6361/202557049).'
 
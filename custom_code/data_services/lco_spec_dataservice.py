@@ -12,8 +12,15 @@ from tom_dataservices.dataservices import DataService
 from tom_dataproducts.models import ReducedDatum
 from tom_targets.models import Target, TargetName
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
+from custom_code.data_services.archive_downloads import (
+    decode_fits_product,
+    download_product,
+    ingested_product_ids,
+    map_with_bounded_concurrency,
+)
 from custom_code.data_services.forms import LCOSpectraQueryForm
 from custom_code.data_services.service_utils import DATA_SERVICE_HTTP_TIMEOUT
+from custom_code.spectrum_storage import store_spectrum_value
 
 
 
@@ -50,6 +57,8 @@ class LCOSpectraDataService(DataService):
             'dec': dec,
             'radius_arcsec': parameters.get('radius_arcsec') or 5.0,
             'include_spectroscopy': bool(parameters.get('include_spectroscopy', True)),
+            'target_id': parameters.get('target_id'),
+            'force': bool(parameters.get('force')),
         }
         return self.query_parameters
 
@@ -105,7 +114,10 @@ class LCOSpectraDataService(DataService):
             'ra': ra,
             'dec': dec,
             'aliases': [None],
-            'reduced_datums': {'spectroscopy': self._build_spectroscopy_datums(spectroscopy_data)},
+            'reduced_datums': {'spectroscopy': self._build_spectroscopy_datums(
+                spectroscopy_data,
+                skip_product_ids=ingested_product_ids(query_parameters, self.name),
+            )},
             'source_location': data.get('source_location'),
         }]
 
@@ -130,7 +142,7 @@ class LCOSpectraDataService(DataService):
                 target=target,
                 data_type='spectroscopy',
                 timestamp=datum['timestamp'],
-                value=datum['value'],
+                value=store_spectrum_value(datum['value']),
                 defaults={
                     'source_name': self.name,
                     'source_location': source_location,
@@ -149,63 +161,53 @@ class LCOSpectraDataService(DataService):
                 source_location=self.query_results.get('source_location') or self.info_url,
             )
 
-    def _build_spectroscopy_datums(self, spec_data):
-        output = []
-        for spec_info in spec_data:
-            try:
-                serializer = SpectrumSerializer()
-                basename = spec_info['basename']
-
-                if "e91-1d" in basename:
-                    spec_hdul = fits.open(spec_info['url'])
-                    spec_time = spec_info['observation_date']
-                    site_id = spec_info['site_id']
-                    spec_id = spec_info['id']
-                    sp_data = spec_hdul[1].data
-                    valid = (~np.isnan(sp_data['flux'])) & (~np.isnan(sp_data['wavelength']))
-                    clean_flux = np.array(sp_data['flux'][valid])
-                    clean_wavelength = np.array(sp_data['wavelength'][valid])
-                    spectrum = Spectrum1D(
-                        flux=clean_flux * u.erg / u.s / u.cm**2 / u.AA,
-                        spectral_axis=clean_wavelength * u.AA,)
-                    serialized = serializer.serialize(spectrum)
-                    serialized.update({
-                    'filter': f'LCO-{site_id}',
-                    'source_id': str(spec_id),
-                    'spectrum_type': 'LCO_spectrum',})
-                    output.append({
-                    'timestamp': Time(spec_time, format='isot', scale='utc').to_datetime(timezone=timezone.utc),
-                    'value': serialized,})
-                else:
-                    spec_id = spec_info['id']
-                    resp_rel_frames = requests.get(
-                        f"https://archive-api.lco.global/frames/{spec_id}/related/",
-                        timeout=DATA_SERVICE_HTTP_TIMEOUT,
-                    ).json()
-                    for rel_frame in resp_rel_frames:
-                        if "e91-1d" in rel_frame['basename']:
-                            spec_hdul = fits.open(rel_frame['url'])
-                            spec_time = rel_frame['observation_date']
-                            site_id = rel_frame['site_id']
-                            spec_id = rel_frame['id']
-                            sp_data = spec_hdul[1].data
-                            valid = (~np.isnan(sp_data['flux'])) & (~np.isnan(sp_data['wavelength']))
-                            clean_flux = np.array(sp_data['flux'][valid])
-                            clean_wavelength = np.array(sp_data['wavelength'][valid])
-                            spectrum = Spectrum1D(
-                                flux=clean_flux * u.erg / u.s / u.cm**2 / u.AA,
-                                spectral_axis=clean_wavelength * u.AA,)
-                            serialized = serializer.serialize(spectrum)
-                            serialized.update({
-                            'filter': f'LCO-{site_id}',
-                            'source_id': str(spec_id),
-                            'spectrum_type': 'LCO_spectrum',})
-                            output.append({
-                            'timestamp': Time(spec_time, format='isot', scale='utc').to_datetime(timezone=timezone.utc),
-                            'value': serialized,})
-
-            except Exception as e:
-                print(e)
-                continue
-
-        return output
+    def _build_spectroscopy_datums(self, spec_data, skip_product_ids=()):
+        # Related-frame lookups and downloads run in parallel; frames already
+        # stored for the target are not downloaded again.
+        frames = {}
+        for related in map_with_bounded_concurrency(self._extracted_frames, spec_data):
+            for frame in related:
+                if str(frame['id']) not in skip_product_ids:
+                    frames.setdefault(frame['id'], frame)
+        return [datum for datum in map_with_bounded_concurrency(self._datum_from_frame, list(frames.values())) if datum]
+
+    def _extracted_frames(self, spec_info):
+        """The 1D extracted (e91-1d) frames for one archive frame."""
+        try:
+            if "e91-1d" in spec_info['basename']:
+                return [spec_info]
+            resp_rel_frames = requests.get(
+                f"https://archive-api.lco.global/frames/{spec_info['id']}/related/",
+                timeout=DATA_SERVICE_HTTP_TIMEOUT,
+            ).json()
+            return [rel_frame for rel_frame in resp_rel_frames if "e91-1d" in rel_frame['basename']]
+        except Exception as e:
+            logger.debug('LCO related frames lookup failed for %s: %s', spec_info.get('id'), e)
+            return []
+
+    def _datum_from_frame(self, frame):
+        try:
+            # Frame URLs are signed and expire, so the cache is keyed by frame id.
+            product = download_product(frame['url'], key=f"lco-frame-{frame['id']}", timeout=DATA_SERVICE_HTTP_TIMEOUT)
+            fits_path = decode_fits_product(product)
+            if fits_path is None:
+                return None
+            with fits.open(fits_path, memmap=True) as spec_hdul:
+                sp_data = spec_hdul[1].data
+                valid = (~np.isnan(sp_data['flux'])) & (~np.isnan(sp_data['wavelength']))
+                clean_flux = np.array(sp_data['flux'][valid])
+                clean_wavelength = np.array(sp_data['wavelength'][valid])
+            spectrum = Spectrum1D(
+                flux=clean_flux * u.erg / u.s / u.cm**2 / u.AA,
+                spectral_axis=clean_wavelength * u.AA,)
+            serialized = SpectrumSerializer().serialize(spectrum)
+            serialized.update({
+            'filter': f"LCO-{frame['site_id']}",
+            'source_id': str(frame['id']),
+            'spectrum_type': 'LCO_spectrum',})
+            return {
+            'timestamp': Time(frame['observation_date'], format='isot', scale='utc').to_datetime(timezone=timezone.utc),
+            'value': serialized,}
+        except Exception as e:
+            logger.debug('LCO spectrum %s could not be read: %s', frame.get('id'), e)
+            return None
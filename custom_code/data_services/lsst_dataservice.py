@@ -59,6 +59,7 @@ class LSSTDataService(DataService):
     name = 'LSST'
     verbose_name = 'LSST'
     update_on_daily_refresh = True
+    refresh_cadence_seconds = 43200
     info_url = 'https://api.fink-portal.org'
     service_notes = 'Query LSST (Fink) by diaObjectId or cone search, with optional photometry.'
 
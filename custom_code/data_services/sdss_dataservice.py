@@ -16,6 +16,7 @@ from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_targets.models import Target, TargetName
 
 from custom_code.data_services.forms import SDSSQueryForm
+from custom_code.spectrum_storage import store_spectrum_value
 
 logger = logging.getLogger(__name__)
 
@@ -165,7 +166,7 @@ class SDSSDataService(DataService):
                 target=target,
                 data_type=data_type,
                 timestamp=datum['timestamp'],
-                value=datum['value'],
+                value=store_spectrum_value(datum['value']) if data_type == 'spectroscopy' else datum['value'],
                 defaults={
                     'source_name': self.name,
                     'source_location': source_location,
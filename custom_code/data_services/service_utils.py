@@ -2,8 +2,8 @@ import logging
 import socket
 
 from django.conf import settings
-from django.db.models import Q
-from tom_targets.models import Target
+
+from custom_code.target_names import find_target_by_name
 
 
 logger = logging.getLogger(__name__)
@@ -49,12 +49,7 @@ def resolve_target_by_name(target_name):
     if not target_name:
         return None
 
-    target = (
-        Target.objects
-        .filter(Q(name__iexact=target_name) | Q(aliases__name__iexact=target_name))
-        .distinct()
-        .first()
-    )
+    target = find_target_by_name(target_name)
     if target is None:
         logger.info('Could not resolve target name "%s" to a local BHTOM target.', target_name)
     return target
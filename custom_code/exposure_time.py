@@ -0,0 +1,253 @@
+"""Exposure-time calculator shared by the observation facility forms.
+
+Each facility describes its instruments with one of the models below. A model
+evaluates the CCD equation for NumPy arrays of magnitudes, airmasses, moon
+phases and target S/N values in one call; exposure_time_grid() returns every
+combination at once. Exposure times that cannot be reached (unsupported
+filter, invalid input, over the time or saturation limit) are NaN.
+"""
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+MOON_PHASES = ('dark', 'grey', 'bright')
+
+
+def solve_ccd_equation(object_rate, background_rate, read_noise_variance, signal_to_noise):
+    """Exposure times in seconds at which ``O t / sqrt((O + B) t + R)`` reaches ``signal_to_noise``.
+
+    ``object_rate`` and ``background_rate`` are in e-/s within the aperture and
+    ``read_noise_variance`` is the read noise in e-^2 summed over its pixels.
+    All arguments broadcast against each other.
+    """
+    object_rate = np.asarray(object_rate, dtype=float)
+    signal_to_noise = np.asarray(signal_to_noise, dtype=float)
+    snr_squared = signal_to_noise * signal_to_noise
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        linear = snr_squared * (object_rate + background_rate)
+        quadratic = object_rate * object_rate
+        times = (linear + np.sqrt(linear * linear + 4.0 * quadratic * snr_squared * read_noise_variance)) / (2.0 * quadratic)
+    return np.where((object_rate > 0) & (signal_to_noise > 0) & np.isfinite(times), times, np.nan)
+
+
+def _as_float_array(values):
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        # Lists with None or strings in them: convert item by item.
+        items = np.asarray(values, dtype=object)
+        converted = np.full(items.shape, np.nan)
+        for index, item in np.ndenumerate(items):
+            try:
+                converted[index] = float(item)
+            except (TypeError, ValueError):
+                pass
+        return converted
+
+
+class ExposureTimeModel:
+    """Common interface of the instrument models.
+
+    Subclasses implement exposure_times(), which broadcasts its arguments
+    element by element like a NumPy ufunc.
+    """
+
+    def supported_filters(self):
+        raise NotImplementedError
+
+    def exposure_times(self, filter_codes, magnitudes, airmasses=1.3, moon_phases=1, signal_to_noise=100.0, seeing=1.0):
+        raise NotImplementedError
+
+    def exposure_time_grid(self, filter_codes, magnitudes, airmasses=(1.3,), moon_phases=(1,), signal_to_noise=(100.0,),
+                           seeing=1.0):
+        """Exposure times for every combination, shaped (filters, magnitudes, airmasses, moon phases, S/N)."""
+        axes = [
+            np.asarray(list(filter_codes), dtype=object),
+            np.atleast_1d(_as_float_array(magnitudes)),
+            np.atleast_1d(_as_float_array(airmasses)),
+            np.atleast_1d(_as_float_array(moon_phases)),
+            np.atleast_1d(_as_float_array(signal_to_noise)),
+        ]
+        shaped = []
+        for position, axis in enumerate(axes):
+            shape = [1] * len(axes)
+            shape[position] = axis.size
+            shaped.append(axis.reshape(shape))
+        return self.exposure_times(*shaped, seeing=seeing)
+
+    def exposure_times_by_filter(self, filter_codes, magnitudes, airmass=1.3, moon_phase=1, signal_to_noise=100.0,
+                                 seeing=1.0):
+        """``{filter code: seconds or None}`` for one magnitude, or one magnitude per filter."""
+        filter_codes = list(filter_codes)
+        times = self.exposure_times(
+            np.asarray(filter_codes, dtype=object),
+            _as_float_array(magnitudes),
+            airmass,
+            moon_phase,
+            signal_to_noise,
+            seeing=seeing,
+        )
+        times = np.broadcast_to(times, (len(filter_codes),))
+        return {code: (float(time) if np.isfinite(time) else None) for code, time in zip(filter_codes, times)}
+
+    def _filter_indices(self, filter_codes, table_filters):
+        lookup = {code: index for index, code in enumerate(table_filters)}
+        codes = np.asarray(filter_codes, dtype=object)
+        indices = np.fromiter((lookup.get(code, -1) for code in codes.ravel()), dtype=int, count=codes.size)
+        indices = indices.reshape(codes.shape)
+        return np.where(indices >= 0, indices, 0), indices >= 0
+
+
+@dataclass(frozen=True)
+class ExposureLimits:
+    """How a facility turns the ideal exposure time into a suggestion."""
+
+    minimum: float = 1.0
+    maximum: float = math.inf
+    saturation_level: float = math.inf  # peak e- per pixel
+    whole_seconds: bool = False
+    overhead_factor: float = 1.0
+
+    def apply(self, times, peak_rate_per_pixel):
+        if self.whole_seconds:
+            # The smallest whole number of seconds that reaches the S/N.
+            times = np.ceil(times - 1e-9)
+        times = np.maximum(times, self.minimum)
+        with np.errstate(invalid='ignore'):
+            out_of_range = (times > self.maximum) | (peak_rate_per_pixel * times > self.saturation_level)
+        return np.where(out_of_range, np.nan, times * self.overhead_factor)
+
+
+@dataclass(frozen=True)
+class ImagerModel(ExposureTimeModel):
+    """A broadband imager.
+
+    ``zeropoints`` is the magnitude giving 1 e-/s per filter (0 for filters the
+    camera does not have), ``sky_brightness`` the sky in mag/arcsec^2 per
+    filter for each of MOON_PHASES, and ``extinction`` mag per airmass.
+    Photometry uses a circular aperture of ``aperture_diameter`` arcsec, or a
+    box twice the seeing wide when it is 0.
+    """
+
+    name: str
+    pixel_scale: float
+    read_noise: float
+    dark_current: float
+    zeropoints: dict
+    sky_brightness: dict
+    extinction: dict = field(default_factory=dict)
+    aperture_diameter: float = 3.0
+    limits: ExposureLimits = field(default_factory=ExposureLimits)
+
+    def supported_filters(self):
+        return [code for code, zeropoint in self.zeropoints.items() if zeropoint > 0]
+
+    def exposure_times(self, filter_codes, magnitudes, airmasses=1.3, moon_phases=1, signal_to_noise=100.0, seeing=1.0):
+        filters = list(self.zeropoints)
+        index, known = self._filter_indices(filter_codes, filters)
+        zeropoint = np.array([self.zeropoints[code] for code in filters], dtype=float)[index]
+        sky_table = np.array([tuple(self.sky_brightness.get(code, (np.nan,) * 3)) for code in filters], dtype=float)
+        extinction = np.array([self.extinction.get(code, 0.0) for code in filters], dtype=float)[index]
+        phase = np.clip(np.nan_to_num(_as_float_array(moon_phases), nan=1.0).astype(int), 0, len(MOON_PHASES) - 1)
+        sky = sky_table[index, phase]
+
+        seeing = _as_float_array(seeing)
+        if self.aperture_diameter:
+            aperture_area = np.full(seeing.shape, math.pi * self.aperture_diameter ** 2 / 4.0)
+        else:
+            aperture_area = (2.0 * seeing) ** 2
+        pixel_count = aperture_area / (self.pixel_scale * self.pixel_scale)
+
+        airmass_correction = (_as_float_array(airmasses) - 1.0) * extinction
+        with np.errstate(over='ignore'):
+            object_rate = 10.0 ** (-0.4 * (_as_float_array(magnitudes) + airmass_correction - zeropoint))
+            background_rate = 10.0 ** (-0.4 * (sky - zeropoint)) * aperture_area + pixel_count * self.dark_current
+        object_rate = np.where(known & (zeropoint > 0), object_rate, np.nan)
+        times = solve_ccd_equation(
+            object_rate,
+            background_rate,
+            pixel_count * self.read_noise * self.read_noise,
+            _as_float_array(signal_to_noise),
+        )
+        return self.limits.apply(times, object_rate / pixel_count)
+
+
+@dataclass(frozen=True)
+class SpectrographModel(ExposureTimeModel):
+    """A slit or IFU spectrograph, with the S/N per resolution element at each arm's reference wavelength.
+
+    ``arms`` maps an arm or grating to its ``zeropoint`` (magnitude giving 1
+    e-/s/Angstrom), ``sky_brightness`` per moon phase, ``resolution``,
+    ``dispersion`` (Angstrom per pixel) and ``reference_wavelength``.
+    """
+
+    name: str
+    pixel_scale: float
+    read_noise: float
+    dark_current: float
+    slit_width: float
+    arms: dict
+    limits: ExposureLimits = field(default_factory=ExposureLimits)
+
+    def supported_filters(self):
+        return list(self.arms)
+
+    def exposure_times(self, filter_codes, magnitudes, airmasses=1.3, moon_phases=1, signal_to_noise=100.0, seeing=1.0):
+        arms = list(self.arms)
+        index, known = self._filter_indices(filter_codes, arms)
+
+        def column(key):
+            return np.array([float(self.arms[arm][key]) for arm in arms], dtype=float)[index]
+
+        zeropoint = column('zeropoint')
+        element_width = column('reference_wavelength') / column('resolution')
+        sky_table = np.array([tuple(self.arms[arm]['sky_brightness']) for arm in arms], dtype=float)
+        phase = np.clip(np.nan_to_num(_as_float_array(moon_phases), nan=1.0).astype(int), 0, len(MOON_PHASES) - 1)
+        sky = sky_table[index, phase]
+
+        slit_area = self.slit_width * 2.0 * _as_float_array(seeing)
+        pixel_count = slit_area / (self.pixel_scale * self.pixel_scale) * element_width / column('dispersion')
+        with np.errstate(over='ignore'):
+            object_rate = 10.0 ** ((zeropoint - _as_float_array(magnitudes)) / 2.5) * element_width
+            background_rate = 10.0 ** ((zeropoint - sky) / 2.5) * element_width * slit_area + self.dark_current
+        object_rate = np.where(known, object_rate, np.nan)
+        times = solve_ccd_equation(
+            object_rate,
+            background_rate,
+            pixel_count * self.read_noise * self.read_noise,
+            _as_float_array(signal_to_noise),
+        )
+        return self.limits.apply(times, object_rate / pixel_count)
+
+
+@dataclass(frozen=True)
+class ScaledExposureModel(ExposureTimeModel):
+    """For sites without an instrument table: scale a reference exposure with the source flux.
+
+    ``reference_exposure`` seconds (per filter in ``filter_exposures``) give
+    ``reference_signal_to_noise`` at ``reference_magnitude``; in the
+    source-limited regime the time grows with the square of the S/N.
+    Airmass and moon phase are not modelled.
+    """
+
+    name: str
+    filters: tuple
+    reference_exposure: float = 60.0
+    reference_magnitude: float = 15.0
+    reference_signal_to_noise: float = 100.0
+    filter_exposures: dict = field(default_factory=dict)
+
+    def supported_filters(self):
+        return list(self.filters)
+
+    def exposure_times(self, filter_codes, magnitudes, airmasses=1.3, moon_phases=1, signal_to_noise=100.0, seeing=1.0):
+        filters = list(self.filters)
+        index, known = self._filter_indices(filter_codes, filters)
+        reference = np.array([self.filter_exposures.get(code, self.reference_exposure) for code in filters], dtype=float)
+        snr_ratio = _as_float_array(signal_to_noise) / self.reference_signal_to_noise
+        with np.errstate(over='ignore', invalid='ignore'):
+            times = reference[index] * 10.0 ** ((_as_float_array(magnitudes) - self.reference_magnitude) / 2.5) * snr_ratio ** 2
+        times = times * np.ones_like(_as_float_array(airmasses)) * np.ones_like(_as_float_array(moon_phases))
+        return np.where(known & (snr_ratio > 0) & np.isfinite(times), times, np.nan)
@@ -1,10 +1,11 @@
-from django.db.models import Q
 from django.contrib import messages
 
 import django_filters
 
 from tom_targets.models import Target, TargetList
-from tom_targets.utils import cone_search_filter
+
+from custom_code.sky_index import box_search, cone_search, polygon_search
+from custom_code.target_names import targets_matching_name, targets_with_name_prefix
 
 
 def get_target_list_queryset(request):
@@ -15,7 +16,7 @@ def get_target_list_queryset(request):
 
 class BhtomTargetFilterSet(django_filters.FilterSet):
     def filter_name(self, queryset, name, value):
-        return queryset.filter(Q(name__icontains=value) | Q(aliases__name__icontains=value)).distinct()
+        return targets_with_name_prefix(value, queryset)
 
     def filter_description(self, queryset, name, value):
         return queryset.filter(description__icontains=value).distinct()
@@ -75,9 +76,7 @@ class BhtomTargetFilterSet(django_filters.FilterSet):
                     messages.error(self.request, "Cone Search (Target) format: Target Name, Radius")
                 return queryset.none()
 
-            targets = Target.objects.filter(
-                Q(name__icontains=target_name) | Q(aliases__name__icontains=target_name)
-            ).distinct()
+            targets = targets_matching_name(target_name)
 
             if len(targets) != 1:
                 return queryset.none()
@@ -87,7 +86,32 @@ class BhtomTargetFilterSet(django_filters.FilterSet):
         else:
             return queryset
 
-        return cone_search_filter(queryset, ra, dec, radius)
+        return cone_search(queryset, ra, dec, radius)
+
+    def filter_box_search(self, queryset, name, value):
+        if not value:
+            return queryset
+        try:
+            ra_min, ra_max, dec_min, dec_max = [float(v.strip()) for v in value.split(",")]
+        except (TypeError, ValueError):
+            if getattr(self, "request", None):
+                messages.error(self.request, "Box Search format: RA min, RA max, Dec min, Dec max")
+            return queryset.none()
+        return box_search(queryset, ra_min, ra_max, dec_min, dec_max)
+
+    def filter_polygon_search(self, queryset, name, value):
+        if not value:
+            return queryset
+        try:
+            vertices = []
+            for vertex in value.split(","):
+                ra, dec = vertex.split()
+                vertices.append((float(ra), float(dec)))
+            return polygon_search(queryset, vertices)
+        except (TypeError, ValueError) as exc:
+            if getattr(self, "request", None):
+                messages.error(self.request, f"Polygon Search format: RA Dec, RA Dec, RA Dec, ... ({exc})")
+            return queryset.none()
 
     name = django_filters.CharFilter(method="filter_name", label="Name")
     description = django_filters.CharFilter(method="filter_description", label="Description")
@@ -102,6 +126,16 @@ class BhtomTargetFilterSet(django_filters.FilterSet):
         label="Cone Search (Target)",
         help_text="Target Name, Search Radius (degrees)",
     )
+    box_search = django_filters.CharFilter(
+        method="filter_box_search",
+        label="Box Search",
+        help_text="RA min, RA max, Dec min, Dec max (degrees; RA min > RA max wraps through 0)",
+    )
+    polygon_search = django_filters.CharFilter(
+        method="filter_polygon_search",
+        label="Polygon Search",
+        help_text="RA Dec, RA Dec, RA Dec, ... (degrees)",
+    )
 
     ra = django_filters.RangeFilter(method="filter_ra", label="RA")
     dec = django_filters.RangeFilter(method="filter_dec", label="Dec")
@@ -132,6 +166,8 @@ class BhtomTargetFilterSet(django_filters.FilterSet):
             "classification",
             "cone_search",
             "target_cone_search",
+            "box_search",
+            "polygon_search",
             "ra",
             "dec",
             "gall",
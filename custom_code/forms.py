@@ -18,6 +18,7 @@ from custom_code.coordinate_fields import dec_field, ra_field
 from custom_code.models import BhtomUserProfile, TargetAliasInfo, TransitEphemeris
 from custom_code.models import UserBhtom2UploadPreference
 from custom_code.orcid import validate_orcid
+from custom_code.target_names import name_is_taken
 
 
 CREATE_FORM_HIDDEN_FIELDS = (
@@ -32,6 +33,7 @@ CREATE_FORM_HIDDEN_FIELDS = (
     'photometry_icon_plot',
     'spectroscopy_plot',
     'plot_created',
+    'healpix_index',
 )
 
 SIDEREAL_CREATE_FORM_HIDDEN_FIELDS = CREATE_FORM_HIDDEN_FIELDS + (
@@ -263,18 +265,32 @@ class BhtomDataProductUploadForm(DataProductUploadForm):
         required=False,
     )
 
-    def __init__(self, *args, user=None, **kwargs):
+    def __init__(self, *args, user=None, staged_file_names=None, **kwargs):
         self.user = user
+        self.staged_file_names = staged_file_names
         super().__init__(*args, **kwargs)
         self.fields['files'].widget.attrs['accept'] = '.fits,.fit,.fts,.ftt,.ftsc,.fz,.gz'
+        if staged_file_names is not None:
+            # Files of a chunked upload are sent after the form has been validated.
+            self.fields['files'].required = False
         preference = getattr(user, 'bhtom2_upload_preference', None) if user is not None else None
         if preference is not None:
             self.fields['bhtom2_upload_token'].initial = preference.token
             self.fields['bhtom2_upload_oname'].initial = preference.oname
             self.fields['bhtom2_upload_filter'].initial = preference.calibration_filter or 'GaiaSP/any'
 
+    def _submitted_file_names(self):
+        if self.staged_file_names is not None:
+            return list(self.staged_file_names)
+        files = self.files.getlist('files') if hasattr(self.files, 'getlist') else []
+        if not files and self.files.get('files'):
+            files = [self.files['files']]
+        return [uploaded_file.name for uploaded_file in files]
+
     def clean(self):
         cleaned_data = super().clean()
+        if self.staged_file_names is not None and not self.staged_file_names:
+            self.add_error('files', _('Select at least one file to upload.'))
         dp_type = cleaned_data.get('data_product_type')
         if dp_type != 'fits_file':
             return cleaned_data
@@ -286,11 +302,8 @@ class BhtomDataProductUploadForm(DataProductUploadForm):
         if not oname:
             self.add_error('bhtom2_upload_oname', _('Enter your BHTOM2 ONAME.'))
 
-        files = self.files.getlist('files') if hasattr(self.files, 'getlist') else []
-        if not files and self.files.get('files'):
-            files = [self.files['files']]
-        for uploaded_file in files:
-            if not is_supported_fits_filename(uploaded_file.name):
+        for file_name in self._submitted_file_names():
+            if not is_supported_fits_filename(file_name):
                 self.add_error('files', _('Upload a FITS file with extension .fits, .fit, .fts, .fz, or .gz.'))
                 break
         return cleaned_data
@@ -355,10 +368,7 @@ class TargetAliasInlineFormSet(BaseInlineFormSet):
                 raise ValidationError(f'Alias "{name}" is duplicated.')
             seen_names.add(normalized_name)
 
-            duplicates = TargetName.objects.filter(name__iexact=name)
-            if self.instance.pk:
-                duplicates = duplicates.exclude(target=self.instance)
-            if duplicates.exists():
+            if name_is_taken(name, exclude_target_id=self.instance.pk):
                 raise ValidationError(f'Alias "{name}" already exists on another target.')
 
 
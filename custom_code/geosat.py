@@ -5,12 +5,16 @@ from typing import Optional
 import urllib.error
 import urllib.request
 
+import numpy as np
 from astropy import units as u
 from astropy.coordinates import AltAz, EarthLocation, get_sun
 from astropy.time import Time
 from django.core.cache import cache
 from skyfield.api import EarthSatellite, load, wgs84
 
+from custom_code.caching import cached_value
+from custom_code.tle_catalogue import mirrored_tle
+
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +23,12 @@ WARSAW_LON_DEG = 21.0122
 WARSAW_ELEVATION_M = 100.0
 
 _TLE_CACHE_TIMEOUT_SECONDS = 6 * 3600
+_TLE_STALE_TIMEOUT_SECONDS = 24 * 3600
 _TS = load.timescale()
+# Satellites closer to the Sun than this are not observable.
+SUN_AVOIDANCE_ELONGATION_DEG = 90.0
+# Sun curves and exclusion grids are cached per site for this long; the Sun moves at most 0.25 degrees meanwhile.
+SUN_POSITION_BUCKET_SECONDS = 60
 
 
 def _coerce_utc_datetime(value: Optional[datetime]) -> datetime:
@@ -42,22 +51,21 @@ def fetch_tle_by_norad_id(norad_id: int):
 
 
 def get_tle(norad_id: int):
-    cache_key = f"geosat_tle_{norad_id}"
-    cached = cache.get(cache_key)
-    if cached and len(cached) == 3:
-        return cached
-
+    tle = mirrored_tle(norad_id)
+    if tle is not None:
+        return tle
+    # Stale TLEs are served for up to a day while one process fetches a new set from CelesTrak.
     try:
-        tle = fetch_tle_by_norad_id(norad_id)
+        return cached_value(
+            f"geosat_tle_{norad_id}",
+            lambda: fetch_tle_by_norad_id(norad_id),
+            _TLE_CACHE_TIMEOUT_SECONDS,
+            stale_timeout=_TLE_STALE_TIMEOUT_SECONDS,
+        )
     except (urllib.error.URLError, TimeoutError, ValueError) as exc:
         logger.warning("Could not fetch TLE for NORAD %s: %s", norad_id, exc)
-        if cached and len(cached) == 3:
-            return cached
         return None
 
-    cache.set(cache_key, tle, timeout=_TLE_CACHE_TIMEOUT_SECONDS)
-    return tle
-
 
 def geosat_alt_az(
     norad_id: int,
@@ -89,7 +97,9 @@ def geosat_alt_az_from_tle(
     observer_lon_deg: float = WARSAW_LON_DEG,
     observer_elevation_m: float = WARSAW_ELEVATION_M,
     when_utc: Optional[datetime] = None,
+    sun_altaz: Optional[tuple] = None,
 ):
+    """Position of a satellite seen from the observer; ``sun_altaz`` is the Sun's (alt, az) there, if known."""
     if not tle_line1 or not tle_line2:
         return None
 
@@ -105,23 +115,10 @@ def geosat_alt_az_from_tle(
     lst_hours = observer.lst_hours_at(skyfield_time)
     hour_angle_hours = (lst_hours - ra.hours) % 24.0
 
-    location = EarthLocation(
-        lat=observer_lat_deg * u.deg,
-        lon=observer_lon_deg * u.deg,
-        height=observer_elevation_m * u.m,
-    )
-    obs_time = Time(instant)
-    sun_altaz = get_sun(obs_time).transform_to(AltAz(obstime=obs_time, location=location))
-    sat_alt_rad = math.radians(float(alt.degrees))
-    sat_az_rad = math.radians(float(az.degrees))
-    sun_alt_rad = math.radians(float(sun_altaz.alt.deg))
-    sun_az_rad = math.radians(float(sun_altaz.az.deg))
-    cos_elong = (
-        math.sin(sat_alt_rad) * math.sin(sun_alt_rad)
-        + math.cos(sat_alt_rad) * math.cos(sun_alt_rad) * math.cos(sat_az_rad - sun_az_rad)
-    )
-    cos_elong = max(-1.0, min(1.0, cos_elong))
-    solar_elongation_deg = math.degrees(math.acos(cos_elong))
+    if sun_altaz is None:
+        sun_alt_deg, sun_az_deg = sun_altaz_at_sites([(observer_lat_deg, observer_lon_deg, observer_elevation_m)], instant)
+        sun_altaz = (sun_alt_deg[0], sun_az_deg[0])
+    solar_elongation_deg = float(solar_elongation(float(alt.degrees), float(az.degrees), sun_altaz[0], sun_altaz[1]))
     phase_angle_deg = max(0.0, min(180.0, 180.0 - solar_elongation_deg))
 
     phase_factor = 0.5 * (1.0 + math.cos(math.radians(phase_angle_deg)))
@@ -147,38 +144,118 @@ def geosat_alt_az_from_tle(
     }
 
 
-def _altaz_to_enu_vector(alt_deg, az_deg):
-    alt_rad = math.radians(alt_deg)
-    az_rad = math.radians(az_deg)
-    x_east = math.cos(alt_rad) * math.sin(az_rad)
-    y_north = math.cos(alt_rad) * math.cos(az_rad)
-    z_up = math.sin(alt_rad)
-    return (x_east, y_north, z_up)
+def _unit_vectors(vectors):
+    vectors = np.asarray(vectors, dtype=float)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0.0)
+
+
+def _altaz_to_enu(alt_deg, az_deg):
+    alt_rad = np.radians(alt_deg)
+    az_rad = np.radians(az_deg)
+    return np.stack((np.cos(alt_rad) * np.sin(az_rad), np.cos(alt_rad) * np.cos(az_rad), np.sin(alt_rad)), axis=-1)
+
+
+def _enu_to_altaz(vectors):
+    x_east, y_north, z_up = np.moveaxis(_unit_vectors(vectors), -1, 0)
+    alt_deg = np.degrees(np.arcsin(np.clip(z_up, -1.0, 1.0)))
+    az_deg = np.degrees(np.arctan2(x_east, y_north)) % 360.0
+    return alt_deg, az_deg
+
+
+def _equatorial_to_ra_dec(vectors):
+    x, y, z = np.moveaxis(_unit_vectors(vectors), -1, 0)
+    ra_deg = np.degrees(np.arctan2(y, x)) % 360.0
+    dec_deg = np.degrees(np.arcsin(np.clip(z, -1.0, 1.0)))
+    return ra_deg, dec_deg
+
+
+def _great_circles(pole_vectors, num_points):
+    """Points of the great circle 90 degrees from each of the (n, 3) ``pole_vectors``, as an (n, num_points, 3) array."""
+    poles = _unit_vectors(pole_vectors)
+    u_vec = np.cross(poles, [0.0, 0.0, 1.0])
+    degenerate = np.linalg.norm(u_vec, axis=-1) < 1e-8
+    u_vec[degenerate] = np.cross(poles[degenerate], [1.0, 0.0, 0.0])
+    u_vec = _unit_vectors(u_vec)
+    w_vec = _unit_vectors(np.cross(poles, u_vec))
+    t = 2.0 * np.pi * (np.arange(num_points) / (num_points - 1))
+    return u_vec[:, None, :] * np.cos(t)[:, None] + w_vec[:, None, :] * np.sin(t)[:, None]
 
 
-def _normalize_vector(vec):
-    x, y, z = vec
-    norm = math.sqrt(x * x + y * y + z * z)
-    if norm == 0.0:
-        return (0.0, 0.0, 0.0)
-    return (x / norm, y / norm, z / norm)
+def _curve_points(x_values, y_values, x_key, y_key, wrap):
+    """Curve points as dicts, with a None point wherever x jumps by more than ``wrap``."""
+    breaks = set((np.flatnonzero(np.abs(np.diff(x_values)) > wrap) + 1).tolist())
+    points = []
+    for index, (x_value, y_value) in enumerate(zip(x_values.tolist(), y_values.tolist())):
+        if index in breaks:
+            points.append({x_key: None, y_key: None})
+        points.append({x_key: x_value, y_key: y_value})
+    return points
+
+
+def _sites_array(sites):
+    return np.array(sites, dtype=float).reshape(-1, 3)
 
 
-def _cross(a, b):
-    return (
-        a[1] * b[2] - a[2] * b[1],
-        a[2] * b[0] - a[0] * b[2],
-        a[0] * b[1] - a[1] * b[0],
+def sun_altaz_at_sites(sites, when_utc: Optional[datetime] = None):
+    """Sun altitudes and azimuths (degrees) at (lat, lon, elevation_m) ``sites``, from one AltAz transform."""
+    lat_deg, lon_deg, elevation_m = _sites_array(sites).T
+    location = EarthLocation(lat=lat_deg * u.deg, lon=lon_deg * u.deg, height=elevation_m * u.m)
+    obs_time = Time(_coerce_utc_datetime(when_utc))
+    sun_altaz = get_sun(obs_time).transform_to(AltAz(obstime=obs_time, location=location))
+    return np.atleast_1d(sun_altaz.alt.deg).astype(float), np.atleast_1d(sun_altaz.az.deg).astype(float)
+
+
+def solar_elongation(alt_deg, az_deg, sun_alt_deg, sun_az_deg):
+    """Angular distances (degrees) between alt/az directions and the Sun; the arguments broadcast."""
+    alt_rad = np.radians(alt_deg)
+    sun_alt_rad = np.radians(sun_alt_deg)
+    cos_elong = (
+        np.sin(alt_rad) * np.sin(sun_alt_rad)
+        + np.cos(alt_rad) * np.cos(sun_alt_rad) * np.cos(np.radians(np.subtract(az_deg, sun_az_deg)))
     )
+    return np.degrees(np.arccos(np.clip(cos_elong, -1.0, 1.0)))
 
 
-def _enu_vector_to_altaz(vec):
-    x_east, y_north, z_up = _normalize_vector(vec)
-    alt_rad = math.asin(z_up)
-    az_rad = math.atan2(x_east, y_north)
-    az_deg = math.degrees(az_rad) % 360.0
-    alt_deg = math.degrees(alt_rad)
-    return alt_deg, az_deg
+def _per_site_sun_bucket(kind, sites, instant, compute):
+    """Values of ``compute(sites, bucket_start)`` per site, cached per site, date and Sun position bucket.
+
+    Only the sites missing from the cache are computed, in one call.
+    """
+    bucket = int(instant.timestamp() // SUN_POSITION_BUCKET_SECONDS)
+    bucket_start = datetime.fromtimestamp(bucket * SUN_POSITION_BUCKET_SECONDS, tz=timezone.utc)
+    sites = [tuple(float(value) for value in site) for site in sites]
+    keys = {
+        site: "geosat_{}_{:.5f}_{:.5f}_{:.0f}_{:%Y%m%d}_{}".format(kind, site[0], site[1], site[2], bucket_start, bucket)
+        for site in sites
+    }
+    values = cache.get_many(list(keys.values()))
+    missing = [site for site in keys if keys[site] not in values]
+    if missing:
+        computed = {keys[site]: value for site, value in zip(missing, compute(missing, bucket_start))}
+        cache.set_many(computed, 2 * SUN_POSITION_BUCKET_SECONDS)
+        values.update(computed)
+    return [values[keys[site]] for site in sites]
+
+
+def sun_visibility_curves(sites, when_utc: Optional[datetime] = None, num_points: int = 361):
+    """sun_visibility_curve() for each (lat, lon, elevation_m) site, computed for all uncached sites at once."""
+    instant = _coerce_utc_datetime(when_utc)
+
+    def compute(missing, bucket_start):
+        sun_alt_deg, sun_az_deg = sun_altaz_at_sites(missing, bucket_start)
+        alt_deg, az_deg = _enu_to_altaz(_great_circles(_altaz_to_enu(sun_alt_deg, sun_az_deg), num_points))
+        return [
+            {
+                "sun_alt_deg": float(sun_alt_deg[index]),
+                "sun_az_deg": float(sun_az_deg[index]),
+                "curve_points": _curve_points(az_deg[index], alt_deg[index], "az_deg", "alt_deg", 180.0),
+            }
+            for index in range(len(missing))
+        ]
+
+    curves = _per_site_sun_bucket(f"sun_curve_{num_points}", sites, instant, compute)
+    return [{**curve, "computed_at_utc": instant} for curve in curves]
 
 
 def sun_visibility_curve(
@@ -188,57 +265,39 @@ def sun_visibility_curve(
     when_utc: Optional[datetime] = None,
     num_points: int = 361,
 ):
-    instant = _coerce_utc_datetime(when_utc)
-
-    location = EarthLocation(
-        lat=observer_lat_deg * u.deg,
-        lon=observer_lon_deg * u.deg,
-        height=observer_elevation_m * u.m,
-    )
-    obs_time = Time(instant)
-    sun_altaz = get_sun(obs_time).transform_to(AltAz(obstime=obs_time, location=location))
-    sun_alt_deg = float(sun_altaz.alt.deg)
-    sun_az_deg = float(sun_altaz.az.deg)
-
-    sun_vec = _normalize_vector(_altaz_to_enu_vector(sun_alt_deg, sun_az_deg))
-    ref = (0.0, 0.0, 1.0)
-    u_vec = _cross(sun_vec, ref)
-    u_norm = math.sqrt(u_vec[0] * u_vec[0] + u_vec[1] * u_vec[1] + u_vec[2] * u_vec[2])
-    if u_norm < 1e-8:
-        ref = (1.0, 0.0, 0.0)
-        u_vec = _cross(sun_vec, ref)
-    u_vec = _normalize_vector(u_vec)
-    w_vec = _normalize_vector(_cross(sun_vec, u_vec))
+    return sun_visibility_curves([(observer_lat_deg, observer_lon_deg, observer_elevation_m)], when_utc, num_points)[0]
 
-    points = []
-    previous_az = None
-    for i in range(num_points):
-        t = 2.0 * math.pi * (i / (num_points - 1))
-        vec = (
-            u_vec[0] * math.cos(t) + w_vec[0] * math.sin(t),
-            u_vec[1] * math.cos(t) + w_vec[1] * math.sin(t),
-            u_vec[2] * math.cos(t) + w_vec[2] * math.sin(t),
-        )
-        alt_deg, az_deg = _enu_vector_to_altaz(vec)
-
-        if previous_az is not None and abs(az_deg - previous_az) > 180.0:
-            points.append({"az_deg": None, "alt_deg": None})
-        points.append({"az_deg": az_deg, "alt_deg": alt_deg})
-        previous_az = az_deg
-
-    return {
-        "sun_alt_deg": sun_alt_deg,
-        "sun_az_deg": sun_az_deg,
-        "computed_at_utc": instant,
-        "curve_points": points,
-    }
 
+def sun_visibility_curves_ha_dec(sites, when_utc: Optional[datetime] = None, num_points: int = 361):
+    """sun_visibility_curve_ha_dec() for each (lat, lon, elevation_m) site, computed for all uncached sites at once."""
+    instant = _coerce_utc_datetime(when_utc)
 
-def _equatorial_vector_to_ra_dec(vec):
-    x, y, z = _normalize_vector(vec)
-    dec_deg = math.degrees(math.asin(z))
-    ra_deg = math.degrees(math.atan2(y, x)) % 360.0
-    return ra_deg, dec_deg
+    def compute(missing, bucket_start):
+        obs_time = Time(bucket_start)
+        lst_hours = np.atleast_1d(obs_time.sidereal_time("apparent", longitude=_sites_array(missing)[:, 1] * u.deg).hour)
+        sun_icrs = get_sun(obs_time).icrs
+        sun_ra_deg = float(sun_icrs.ra.deg)
+        sun_dec_deg = float(sun_icrs.dec.deg)
+        sun_ra_rad = math.radians(sun_ra_deg)
+        sun_dec_rad = math.radians(sun_dec_deg)
+        sun_vec = np.array([
+            math.cos(sun_dec_rad) * math.cos(sun_ra_rad),
+            math.cos(sun_dec_rad) * math.sin(sun_ra_rad),
+            math.sin(sun_dec_rad),
+        ])
+        ra_deg, dec_deg = _equatorial_to_ra_dec(_great_circles(sun_vec[None, :], num_points)[0])
+        ha_hours = (lst_hours[:, None] - ra_deg / 15.0) % 24.0
+        return [
+            {
+                "sun_ha_hours": float((lst_hours[index] - sun_ra_deg / 15.0) % 24.0),
+                "sun_dec_deg": sun_dec_deg,
+                "curve_points": _curve_points(ha_hours[index], dec_deg, "ha_hours", "dec_deg", 12.0),
+            }
+            for index in range(len(missing))
+        ]
+
+    curves = _per_site_sun_bucket(f"sun_curve_hadec_{num_points}", sites, instant, compute)
+    return [{**curve, "computed_at_utc": instant} for curve in curves]
 
 
 def sun_visibility_curve_ha_dec(
@@ -248,102 +307,98 @@ def sun_visibility_curve_ha_dec(
     when_utc: Optional[datetime] = None,
     num_points: int = 361,
 ):
-    instant = _coerce_utc_datetime(when_utc)
+    return sun_visibility_curves_ha_dec([(observer_lat_deg, observer_lon_deg, observer_elevation_m)], when_utc, num_points)[0]
 
-    location = EarthLocation(
-        lat=observer_lat_deg * u.deg,
-        lon=observer_lon_deg * u.deg,
-        height=observer_elevation_m * u.m,
-    )
-    obs_time = Time(instant)
-    lst_hours = float(obs_time.sidereal_time("apparent", longitude=location.lon).hour)
-
-    sun_icrs = get_sun(obs_time).icrs
-    sun_ra_deg = float(sun_icrs.ra.deg)
-    sun_dec_deg = float(sun_icrs.dec.deg)
-    sun_ra_rad = math.radians(sun_ra_deg)
-    sun_dec_rad = math.radians(sun_dec_deg)
-    sun_vec = _normalize_vector((
-        math.cos(sun_dec_rad) * math.cos(sun_ra_rad),
-        math.cos(sun_dec_rad) * math.sin(sun_ra_rad),
-        math.sin(sun_dec_rad),
-    ))
-
-    ref = (0.0, 0.0, 1.0)
-    u_vec = _cross(sun_vec, ref)
-    u_norm = math.sqrt(u_vec[0] * u_vec[0] + u_vec[1] * u_vec[1] + u_vec[2] * u_vec[2])
-    if u_norm < 1e-8:
-        ref = (1.0, 0.0, 0.0)
-        u_vec = _cross(sun_vec, ref)
-    u_vec = _normalize_vector(u_vec)
-    w_vec = _normalize_vector(_cross(sun_vec, u_vec))
 
-    points = []
-    previous_ha = None
-    for i in range(num_points):
-        t = 2.0 * math.pi * (i / (num_points - 1))
-        vec = (
-            u_vec[0] * math.cos(t) + w_vec[0] * math.sin(t),
-            u_vec[1] * math.cos(t) + w_vec[1] * math.sin(t),
-            u_vec[2] * math.cos(t) + w_vec[2] * math.sin(t),
-        )
-        ra_deg, dec_deg = _equatorial_vector_to_ra_dec(vec)
-        ha_hours = (lst_hours - (ra_deg / 15.0)) % 24.0
+def altaz_to_hadec(alt_deg, az_deg, lat_deg):
+    """Hour angles (hours) and declinations (degrees) of alt/az directions; the arguments broadcast."""
+    alt_rad = np.radians(alt_deg)
+    az_rad = np.radians(az_deg)
+    lat_rad = np.radians(lat_deg)
 
-        if previous_ha is not None and abs(ha_hours - previous_ha) > 12.0:
-            points.append({"ha_hours": None, "dec_deg": None})
-        points.append({"ha_hours": ha_hours, "dec_deg": dec_deg})
-        previous_ha = ha_hours
+    sin_dec = np.sin(lat_rad) * np.sin(alt_rad) + np.cos(lat_rad) * np.cos(alt_rad) * np.cos(az_rad)
+    dec_rad = np.arcsin(np.clip(sin_dec, -1.0, 1.0))
 
-    sun_ha_hours = (lst_hours - (sun_ra_deg / 15.0)) % 24.0
-    return {
-        "sun_ha_hours": sun_ha_hours,
-        "sun_dec_deg": sun_dec_deg,
-        "computed_at_utc": instant,
-        "curve_points": points,
-    }
+    cos_dec = np.maximum(np.cos(dec_rad), 1e-12)
+    sin_ha = -np.cos(alt_rad) * np.sin(az_rad) / cos_dec
+    cos_ha = (np.sin(alt_rad) - np.sin(lat_rad) * np.sin(dec_rad)) / np.maximum(np.cos(lat_rad) * cos_dec, 1e-12)
+    ha_rad = np.arctan2(np.clip(sin_ha, -1.0, 1.0), np.clip(cos_ha, -1.0, 1.0))
+    return (np.degrees(ha_rad) / 15.0) % 24.0, np.degrees(dec_rad)
 
 
 def altaz_to_hadec_point(alt_deg, az_deg, lat_deg):
-    alt_rad = math.radians(alt_deg)
-    az_rad = math.radians(az_deg)
-    lat_rad = math.radians(lat_deg)
-
-    sin_dec = (
-        math.sin(lat_rad) * math.sin(alt_rad)
-        + math.cos(lat_rad) * math.cos(alt_rad) * math.cos(az_rad)
-    )
-    sin_dec = max(-1.0, min(1.0, sin_dec))
-    dec_rad = math.asin(sin_dec)
-
-    cos_dec = max(math.cos(dec_rad), 1e-12)
-    sin_ha = -math.cos(alt_rad) * math.sin(az_rad) / cos_dec
-    cos_ha = (
-        math.sin(alt_rad) - math.sin(lat_rad) * math.sin(dec_rad)
-    ) / (max(math.cos(lat_rad) * cos_dec, 1e-12))
-    sin_ha = max(-1.0, min(1.0, sin_ha))
-    cos_ha = max(-1.0, min(1.0, cos_ha))
-
-    ha_rad = math.atan2(sin_ha, cos_ha)
-    ha_hours = (math.degrees(ha_rad) / 15.0) % 24.0
-    dec_deg = math.degrees(dec_rad)
-    return ha_hours, dec_deg
+    ha_hours, dec_deg = altaz_to_hadec(alt_deg, az_deg, lat_deg)
+    return float(ha_hours), float(dec_deg)
 
 
 def convert_altaz_curve_to_hadec(curve_points, observer_lat_deg: float):
+    alt_deg = np.array([np.nan if point.get("alt_deg") is None else point["alt_deg"] for point in curve_points], dtype=float)
+    az_deg = np.array([np.nan if point.get("az_deg") is None else point["az_deg"] for point in curve_points], dtype=float)
+    ha_hours, dec_deg = altaz_to_hadec(alt_deg, az_deg, observer_lat_deg)
+
     converted = []
     previous_ha = None
-    for point in curve_points:
-        az_deg = point.get("az_deg")
-        alt_deg = point.get("alt_deg")
-        if az_deg is None or alt_deg is None:
+    for ha_value, dec_value in zip(ha_hours.tolist(), dec_deg.tolist()):
+        if math.isnan(ha_value) or math.isnan(dec_value):
             converted.append({"ha_hours": None, "dec_deg": None})
             previous_ha = None
             continue
-
-        ha_hours, dec_deg = altaz_to_hadec_point(alt_deg, az_deg, observer_lat_deg)
-        if previous_ha is not None and abs(ha_hours - previous_ha) > 12.0:
+        if previous_ha is not None and abs(ha_value - previous_ha) > 12.0:
             converted.append({"ha_hours": None, "dec_deg": None})
-        converted.append({"ha_hours": ha_hours, "dec_deg": dec_deg})
-        previous_ha = ha_hours
+        converted.append({"ha_hours": ha_value, "dec_deg": dec_value})
+        previous_ha = ha_value
     return converted
+
+
+def sun_exclusion_grid(
+    observer_lat_deg: float = WARSAW_LAT_DEG,
+    observer_lon_deg: float = WARSAW_LON_DEG,
+    observer_elevation_m: float = WARSAW_ELEVATION_M,
+    when_utc: Optional[datetime] = None,
+    frame: str = "altaz",
+    step_deg: float = 1.0,
+    min_elongation_deg: float = SUN_AVOIDANCE_ELONGATION_DEG,
+):
+    """Whole-sky grid of the directions closer to the Sun than ``min_elongation_deg``, for overlay plots.
+
+    The ``altaz`` grid spans azimuth 0-360 and altitude 0-90 degrees, the ``hadec``
+    grid hour angle 0-24 h and declination -90-90 degrees, both in ``step_deg``
+    steps. ``excluded[i][j]`` is 1 for the i-th altitude (declination) and the
+    j-th azimuth (hour angle) when that direction is too close to the Sun.
+    """
+    if frame not in ("altaz", "hadec"):
+        raise ValueError("frame must be altaz or hadec.")
+    step_deg = float(step_deg)
+    if not 0.25 <= step_deg <= 30.0:
+        raise ValueError("step must be between 0.25 and 30 degrees.")
+    instant = _coerce_utc_datetime(when_utc)
+
+    def compute(missing, bucket_start):
+        sun_alt_deg, sun_az_deg = sun_altaz_at_sites(missing, bucket_start)
+        grids = []
+        for index, (lat_deg, _, _) in enumerate(missing):
+            if frame == "altaz":
+                x_values = np.arange(0.0, 360.0 + step_deg / 2.0, step_deg)
+                y_values = np.arange(0.0, 90.0 + step_deg / 2.0, step_deg)
+                sun_x, sun_y = float(sun_az_deg[index]), float(sun_alt_deg[index])
+                elongation = solar_elongation(y_values[:, None], x_values[None, :], sun_y, sun_x)
+                grid = {"az_deg": x_values.tolist(), "alt_deg": y_values.tolist(), "sun_az_deg": sun_x, "sun_alt_deg": sun_y}
+            else:
+                x_values = np.arange(0.0, 360.0 + step_deg / 2.0, step_deg) / 15.0
+                y_values = np.arange(-90.0, 90.0 + step_deg / 2.0, step_deg)
+                sun_x, sun_y = altaz_to_hadec_point(sun_alt_deg[index], sun_az_deg[index], lat_deg)
+                elongation = solar_elongation(y_values[:, None], 15.0 * x_values[None, :], sun_y, 15.0 * sun_x)
+                grid = {"ha_hours": x_values.tolist(), "dec_deg": y_values.tolist(), "sun_ha_hours": sun_x, "sun_dec_deg": sun_y}
+            grid["excluded"] = (elongation < min_elongation_deg).astype(int).tolist()
+            grids.append(grid)
+        return grids
+
+    kind = f"sun_exclusion_{frame}_{step_deg:g}_{min_elongation_deg:g}"
+    grid = _per_site_sun_bucket(kind, [(observer_lat_deg, observer_lon_deg, observer_elevation_m)], instant, compute)[0]
+    return {
+        "frame": frame,
+        "step_deg": step_deg,
+        "min_elongation_deg": min_elongation_deg,
+        "computed_at_utc": instant,
+        **grid,
+    }
@@ -1,9 +1,11 @@
 import math
 from datetime import timezone
-from typing import Tuple
+from typing import List, Tuple
 
 from astropy.time import Time
 
+from django.core.cache import cache
+from django.db.models import Count, Max
 from tom_dataproducts.models import ReducedDatum
 from tom_targets.models import Target
 
@@ -17,6 +19,7 @@ U_FILTER_TOKENS = ("U(", "(U)")
 G_REF_FILTER_TOKENS = ("G(", "(G)", "g(Gaia)")
 IGNORE_FILTERS = {"WISE(W1)", "WISE(W2)", "GALEX(NUV)", "GALEX(FUV)", "LAT(>100MeV)", "LAT(>800MeV)"}
 IGNORE_FILTER_PREFIXES = ("UVOT(UVW", "UVOT(UVM")
+LATEST_FILTER_MAGNITUDES_CACHE_SECONDS = 86400
 
 
 def _is_finite_number(value) -> bool:
@@ -157,7 +160,43 @@ def compute_last_photometry_values(target_id: int) -> Tuple[float, float, str]:
     return round(float(return_mag), 1), round(float(last_mjd), 8), approxsign
 
 
+def _latest_filter_magnitudes_cache_key(target_id: int) -> str:
+    return f"latest_filter_magnitudes_{target_id}"
+
+
+def latest_magnitudes_by_filter(target_id: int) -> List[Tuple[str, float]]:
+    """Newest finite magnitude of each photometry filter of a target, newest first.
+
+    The list (one entry per filter name, e.g. ``("ZTF(g)", 19.4)``) is cached
+    per target and dropped by refresh_target_last_photometry(); the photometry
+    count and newest datum id are stored with it so a missed refresh cannot
+    serve magnitudes of deleted or replaced photometry.
+    """
+    photometry = ReducedDatum.objects.filter(target_id=target_id, data_type="photometry")
+    version = tuple(photometry.aggregate(count=Count("id"), newest=Max("id")).values())
+    cache_key = _latest_filter_magnitudes_cache_key(target_id)
+    cached = cache.get(cache_key)
+    if cached and tuple(cached.get("version") or ()) == version:
+        return [tuple(entry) for entry in cached["magnitudes"]]
+
+    magnitudes = {}
+    for value in photometry.order_by("-timestamp", "-id").values_list("value", flat=True).iterator():
+        if isinstance(value, dict):
+            mag = value.get("magnitude")
+            if mag is None:
+                mag = value.get("mag")
+            datum_filter = str(value.get("filter") or "")
+        else:
+            mag, datum_filter = value, ""
+        if datum_filter not in magnitudes and _is_finite_number(mag):
+            magnitudes[datum_filter] = float(mag)
+    entries = list(magnitudes.items())
+    cache.set(cache_key, {"version": version, "magnitudes": entries}, LATEST_FILTER_MAGNITUDES_CACHE_SECONDS)
+    return entries
+
+
 def refresh_target_last_photometry(target_id: int) -> None:
+    cache.delete(_latest_filter_magnitudes_cache_key(target_id))
     mag_last, mjd_last, filter_last = compute_last_photometry_values(target_id)
     Target.objects.filter(pk=target_id).update(
         mag_last=mag_last,
@@ -0,0 +1,241 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from tom_observations.models import ObservationRecord
+
+from custom_code.data_services.archive_downloads import discard_cached_product, map_with_bounded_concurrency
+from custom_code.models import LCOFrameSync
+
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (LCOFrameSync.STATUS_QUEUED, LCOFrameSync.STATUS_RUNNING)
+
+
+def _sync_setting(name, default):
+    try:
+        return int(getattr(settings, name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _empty_summary():
+    return {'frames_seen': 0, 'created': 0, 'forwarded': 0, 'already_forwarded': 0, 'refreshed': 0, 'failed': 0}
+
+
+def _sync_is_stale(sync):
+    stale_after = timedelta(seconds=max(60, _sync_setting('LCO_FRAME_SYNC_STALE_SECONDS', 3600)))
+    return sync.modified is None or sync.modified < timezone.now() - stale_after
+
+
+def enqueue_lco_frame_sync(record, *, force=False):
+    """Queue a background archive frame sync of a completed LCO observation record.
+
+    A sync that is already queued or running is left alone unless ``force`` is
+    set (or it looks abandoned); otherwise the cursor restarts at the first frame,
+    and frames stored earlier are skipped by the job. Returns whether a job was queued.
+    """
+    from custom_code.tasks import sync_lco_frames_task
+
+    with transaction.atomic():
+        sync, _created = LCOFrameSync.objects.select_for_update().get_or_create(observation_record=record)
+        if not _created and not force and sync.status in ACTIVE_STATUSES and not _sync_is_stale(sync):
+            return False
+        sync.sync_id = uuid.uuid4().hex
+        sync.status = LCOFrameSync.STATUS_QUEUED
+        sync.force = bool(force)
+        sync.next_offset = 0
+        sync.attempts = 0
+        sync.summary = _empty_summary()
+        sync.error = ''
+        sync.started_at = None
+        sync.finished_at = None
+        sync.save()
+        sync_lco_frames_task.enqueue(record.pk, sync.sync_id)
+    return True
+
+
+def _claim_lco_frame_sync(record_id, sync_id):
+    with transaction.atomic():
+        sync = LCOFrameSync.objects.select_for_update().filter(observation_record_id=record_id).first()
+        if sync is None:
+            return None, 'no sync state'
+        if sync.sync_id != sync_id:
+            return None, 'superseded by a newer sync'
+        if sync.status not in ACTIVE_STATUSES:
+            return None, f'sync is {sync.status}'
+        sync.status = LCOFrameSync.STATUS_RUNNING
+        sync.attempts += 1
+        sync.started_at = sync.started_at or timezone.now()
+        sync.save(update_fields=['status', 'attempts', 'started_at', 'modified'])
+        return sync, ''
+
+
+def _finish_sync(sync, status, error=''):
+    sync.status = status
+    sync.error = error
+    sync.finished_at = timezone.now()
+    sync.save(update_fields=['status', 'error', 'finished_at', 'summary', 'next_offset', 'attempts', 'modified'])
+    logger.info(
+        'Finished LCO archive sync for record %s: status=%s summary=%s',
+        sync.observation_record_id,
+        status,
+        sync.summary,
+    )
+    return {'record_id': sync.observation_record_id, 'status': status, **sync.summary}
+
+
+def _retry_or_fail(sync, error):
+    """Re-enqueue the current page with exponential backoff, or give up after LCO_FRAME_SYNC_MAX_ATTEMPTS."""
+    from custom_code.tasks import sync_lco_frames_task
+
+    if sync.attempts >= max(1, _sync_setting('LCO_FRAME_SYNC_MAX_ATTEMPTS', 5)):
+        return _finish_sync(sync, LCOFrameSync.STATUS_FAILED, error)
+    delay = max(1, _sync_setting('LCO_FRAME_SYNC_BACKOFF_SECONDS', 60)) * 2 ** (sync.attempts - 1)
+    sync.status = LCOFrameSync.STATUS_QUEUED
+    sync.error = error
+    sync.save(update_fields=['status', 'error', 'summary', 'modified'])
+    sync_lco_frames_task.using(run_after=timezone.now() + timedelta(seconds=delay)).enqueue(
+        sync.observation_record_id,
+        sync.sync_id,
+    )
+    logger.warning(
+        'LCO archive sync for record %s failed at offset %s (attempt %s), retrying in %ss: %s',
+        sync.observation_record_id,
+        sync.next_offset,
+        sync.attempts,
+        delay,
+        error,
+    )
+    return {'record_id': sync.observation_record_id, 'status': 'retrying', 'error': error}
+
+
+def _download_frames(facility, record, frames):
+    """Download ``frames`` on at most LCO_FRAME_SYNC_MAX_CONCURRENCY threads; failures come back as exceptions."""
+    def download(frame):
+        try:
+            return facility._download_lco_frame(record, frame)
+        except Exception as exc:
+            return exc
+
+    return map_with_bounded_concurrency(
+        download,
+        frames,
+        max_workers=max(1, _sync_setting('LCO_FRAME_SYNC_MAX_CONCURRENCY', 4)),
+    )
+
+
+def run_lco_frame_sync(record_id, sync_id):
+    """Sync one page of archive frames of an LCO observation record.
+
+    Lists LCO_FRAME_SYNC_PAGE_SIZE frames from the stored cursor, skips frames that
+    are already stored (by frame id, or by checksum when forced), downloads the
+    rest in parallel into the resumable archive cache and saves and forwards them
+    in frame order. The cursor only moves once the whole page succeeded; then the
+    next page is queued as a new job. Failed pages are retried with backoff, and
+    their finished frames are skipped on the retry.
+    """
+    from bhtom3.bhtom_observations.facilities.lco import LCOFacility
+    from custom_code.tasks import sync_lco_frames_task
+
+    sync, skip_reason = _claim_lco_frame_sync(record_id, sync_id)
+    if sync is None:
+        logger.info('Skipping LCO archive sync job for record %s: %s.', record_id, skip_reason)
+        return {'record_id': record_id, 'status': 'skipped', 'reason': skip_reason}
+
+    record = ObservationRecord.objects.select_related('target').get(pk=record_id)
+    facility = LCOFacility()
+    _, account_facility = facility._record_account_facility(record)
+    archive_api_key = str(account_facility.facility_settings.get_setting('api_key') or '').strip()
+    if not archive_api_key:
+        logger.warning('Skipping LCO archive sync for observation %s because no LCO API key is configured.', record.observation_id)
+        return _finish_sync(sync, LCOFrameSync.STATUS_FAILED, 'No LCO API key is configured.')
+    bhtom2_token = str(getattr(settings, 'BHTOM2_API_TOKEN', '') or '').strip()
+    if not bhtom2_token:
+        logger.warning('Skipping automatic BHTOM2 forwarding for observation %s because BHTOM2_API_TOKEN is empty.', record.observation_id)
+        return _finish_sync(sync, LCOFrameSync.STATUS_FAILED, 'BHTOM2_API_TOKEN is empty.')
+
+    logger.info('LCO archive sync for observation %s at offset %s.', record.observation_id, sync.next_offset)
+    summary = {**_empty_summary(), **(sync.summary or {})}
+    try:
+        frames, has_more = facility._archive_frames_page(
+            record.observation_id,
+            archive_api_key,
+            offset=sync.next_offset,
+            limit=max(1, _sync_setting('LCO_FRAME_SYNC_PAGE_SIZE', 100)),
+        )
+        existing = {id(frame): facility._existing_frame_dataproduct(record, frame) for frame in frames}
+        to_download = [
+            frame for frame in frames
+            if facility._frame_needs_download(frame, existing[id(frame)], force=sync.force)
+        ]
+        downloads = dict(zip(map(id, to_download), _download_frames(facility, record, to_download)))
+    except Exception as exc:
+        return _retry_or_fail(sync, f'{type(exc).__name__}: {exc}')
+
+    page_result = {key: 0 for key in summary}
+    errors = []
+    for frame in frames:
+        logger.info(
+            'Processing LCO frame frame_id=%s observation_id=%s filename=%s reduction_level=%s',
+            frame.get('id'),
+            record.observation_id,
+            facility._frame_filename(frame),
+            frame.get('reduction_level'),
+        )
+        dataproduct = existing[id(frame)]
+        created_new = dataproduct is None
+        try:
+            product = downloads.get(id(frame))
+            if isinstance(product, Exception):
+                raise product
+            if product is not None:
+                dataproduct = facility._save_lco_frame(record, frame, product, dataproduct)
+            facility._forward_synced_frame(
+                record,
+                frame,
+                dataproduct,
+                bhtom2_token,
+                page_result,
+                created_new=created_new,
+                force=sync.force,
+            )
+        except Exception as exc:
+            page_result['failed'] += 1
+            errors.append(f"frame {frame.get('id')}: {type(exc).__name__}: {exc}")
+            logger.warning('LCO frame %s of observation %s failed: %s', frame.get('id'), record.observation_id, exc)
+
+    # Stored frames no longer need their cached download. Frames with identical content
+    # share one cache object, so it is only removed once the whole page has been saved.
+    for frame in frames:
+        product = downloads.get(id(frame))
+        if product is not None and not isinstance(product, Exception):
+            discard_cached_product(product)
+
+    if errors:
+        # Frames that made it are stored now and are skipped when the page is retried, where they
+        # only count as already forwarded, so their outcome is counted here. The cursor stays put.
+        for key, value in page_result.items():
+            if key != 'failed':
+                summary[key] = summary.get(key, 0) + value
+        summary['failed'] = page_result['failed']
+        sync.summary = summary
+        return _retry_or_fail(sync, '; '.join(errors)[:2000])
+
+    page_result['frames_seen'] = len(frames)
+    for key, value in page_result.items():
+        summary[key] = summary.get(key, 0) + value if key != 'failed' else 0
+    sync.summary = summary
+    sync.next_offset += len(frames)
+    sync.attempts = 0
+    if has_more and frames:
+        sync.status = LCOFrameSync.STATUS_QUEUED
+        sync.error = ''
+        sync.save(update_fields=['status', 'error', 'summary', 'next_offset', 'attempts', 'modified'])
+        sync_lco_frames_task.enqueue(record_id, sync_id)
+        return {'record_id': record_id, 'status': 'continuing', **summary}
+    return _finish_sync(sync, LCOFrameSync.STATUS_DONE)
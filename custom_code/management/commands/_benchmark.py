@@ -0,0 +1,11 @@
+"""Helpers shared by the benchmark_* management commands."""
+
+import os
+import resource
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size in MB of this process, or of its finished children with RUSAGE_CHILDREN."""
+    # ru_maxrss is reported in KiB on Linux and bytes on macOS.
+    scale = 1024.0 * 1024.0 if os.uname().sysname == "Darwin" else 1024.0
+    return resource.getrusage(who).ru_maxrss / scale
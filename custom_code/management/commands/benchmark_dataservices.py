@@ -0,0 +1,221 @@
+import json
+import os
+import random
+import resource
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+from tom_targets.models import Target
+
+from custom_code.archive_simulator import ArchiveProfile, ArchiveRecorder, ArchiveSimulator
+from custom_code.management.commands._benchmark import peak_rss_mb
+from custom_code.management.commands.db_worker import ScheduledStatusWorker
+from custom_code.tasks import _iter_selected_data_service_classes, update_target_dataservice_for_target
+from django_tasks import DEFAULT_TASK_BACKEND_ALIAS
+from django_tasks.backends.database.models import DBTaskResult
+from django_tasks.task import DEFAULT_QUEUE_NAME
+
+
+BENCHMARK_TARGET_PREFIX = "BENCH-"
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a nightly DataServices refresh for N synthetic targets through the db_worker "
+        "loop against the offline archive simulator and report throughput, p95 job latency "
+        "and peak RSS. Run it against a development database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--targets", type=int, default=50, help="Number of synthetic targets (default: 50).")
+        parser.add_argument(
+            "--services",
+            type=str,
+            default="",
+            help="Comma-separated DataService names. Defaults to the daily-refresh services.",
+        )
+        parser.add_argument(
+            "--fixtures",
+            type=str,
+            default=getattr(
+                settings,
+                "ARCHIVE_SIMULATOR_FIXTURES_DIR",
+                os.path.join(settings.BASE_DIR, "benchmarks", "archive_fixtures"),
+            ),
+            help="Directory with recorded archive fixtures (one <service>.json per archive).",
+        )
+        parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per request.")
+        parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform latency jitter per request.")
+        parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with 503.")
+        parser.add_argument("--payload-scale", type=float, default=1.0, help="Multiply recorded text payload rows.")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed for targets and simulator.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "DB_WORKER_THREADS", 4),
+            help="Number of db_worker threads (default: DB_WORKER_THREADS).",
+        )
+        parser.add_argument(
+            "--record",
+            action="store_true",
+            help="Hit the live archives and record fixtures into --fixtures instead of simulating.",
+        )
+        parser.add_argument("--keep-targets", action="store_true", help="Do not delete synthetic targets afterwards.")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def _selected_service_names(self, services):
+        names = [name.strip() for name in str(services or "").split(",") if name.strip()]
+        if names:
+            return names
+        return [name for name, _clazz in _iter_selected_data_service_classes(include_create_only=False)]
+
+    def _create_targets(self, count, seed):
+        rng = random.Random(seed)
+        target_ids = []
+        for index in range(count):
+            target = Target.objects.create(
+                name=f"{BENCHMARK_TARGET_PREFIX}{index + 1:06d}",
+                type="SIDEREAL",
+                ra=rng.uniform(0.0, 360.0),
+                dec=rng.uniform(-89.0, 89.0),
+                epoch=2000.0,
+                importance=1.0,
+            )
+            target_ids.append(target.pk)
+        return target_ids
+
+    def _run_workers(self, worker_count, task_ids):
+        workers = [
+            ScheduledStatusWorker(
+                queue_names=[DEFAULT_QUEUE_NAME],
+                interval=0.1,
+                batch=True,
+                backend_name=DEFAULT_TASK_BACKEND_ALIAS,
+                startup_delay=False,
+                status_interval=0,
+                dataservices_interval=0,
+                dataservices_importance_gt=0.0,
+                atlas_poll_interval=0,
+                configure_signal_handlers=False,
+                worker_name=f"benchmark-{index + 1}",
+                process_tasks=True,
+                task_ids=task_ids,
+            )
+            for index in range(max(1, worker_count))
+        ]
+        threads = [threading.Thread(target=worker.start, name=worker.worker_name) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _build_report(self, task_ids, wall_seconds, transport):
+        rows = list(
+            DBTaskResult.objects
+            .filter(id__in=task_ids)
+            .values("status", "enqueued_at", "started_at", "finished_at")
+        )
+        run_latencies = []
+        total_latencies = []
+        status_counts = {}
+        for row in rows:
+            status_counts[row["status"]] = status_counts.get(row["status"], 0) + 1
+            if row["started_at"] and row["finished_at"]:
+                run_latencies.append((row["finished_at"] - row["started_at"]).total_seconds())
+            if row["enqueued_at"] and row["finished_at"]:
+                total_latencies.append((row["finished_at"] - row["enqueued_at"]).total_seconds())
+
+        finished = len(run_latencies)
+        peak_rss_self, peak_rss_children = peak_rss_mb(), peak_rss_mb(resource.RUSAGE_CHILDREN)
+        return {
+            "jobs": len(task_ids),
+            "finished": finished,
+            "status_counts": status_counts,
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_jobs_per_second": round(finished / wall_seconds, 3) if wall_seconds else None,
+            "job_latency_p50_seconds": _percentile(run_latencies, 0.50),
+            "job_latency_p95_seconds": _percentile(run_latencies, 0.95),
+            "job_latency_max_seconds": max(run_latencies) if run_latencies else None,
+            "queue_latency_p95_seconds": _percentile(total_latencies, 0.95),
+            "peak_rss_mb": round(peak_rss_self, 1),
+            "peak_child_rss_mb": round(peak_rss_children, 1),
+            "archive_stats": getattr(transport, "stats", {}),
+        }
+
+    def handle(self, *args, **options):
+        target_count = max(1, int(options["targets"]))
+        service_names = self._selected_service_names(options["services"])
+        if not service_names:
+            raise CommandError("No DataServices selected for the benchmark.")
+
+        if options["record"]:
+            transport = ArchiveRecorder(options["fixtures"])
+        else:
+            transport = ArchiveSimulator(
+                fixtures_dir=options["fixtures"],
+                default_profile=ArchiveProfile(
+                    latency_ms=float(options["latency_ms"]),
+                    jitter_ms=float(options["jitter_ms"]),
+                    failure_rate=float(options["failure_rate"]),
+                    payload_scale=float(options["payload_scale"]),
+                ),
+                seed=options["seed"],
+            )
+            if not transport.fixtures:
+                self.stdout.write(self.style.WARNING(
+                    f"No archive fixtures found in {options['fixtures']}; every request will be unmatched."
+                ))
+
+        target_ids = []
+        task_ids = []
+        # DataService queries normally run in forked children that would keep the patched transport's
+        # recordings and stats to themselves, so run them in the worker threads of this process. The
+        # benchmark enqueues its own jobs, so target-create hooks must not queue live refreshes either.
+        with override_settings(DATA_SERVICE_JOB_TIMEOUT=0, AUTO_QUERY_DATA_SERVICES_ON_TARGET_CREATE=False):
+            try:
+                with transport:
+                    target_ids = self._create_targets(target_count, options["seed"])
+                    started_at = time.monotonic()
+                    for target_id in target_ids:
+                        for service_name in service_names:
+                            result = update_target_dataservice_for_target.enqueue(target_id, service_name, False, False)
+                            task_ids.append(result.id)
+                    self._run_workers(int(options["workers"]), task_ids)
+                    wall_seconds = time.monotonic() - started_at
+            finally:
+                if not options["keep_targets"]:
+                    Target.objects.filter(pk__in=target_ids).delete()
+
+        report = self._build_report(task_ids, wall_seconds, transport)
+        report.update({
+            "targets": target_count,
+            "services": service_names,
+            "mode": "record" if options["record"] else "simulate",
+            "finished_at": timezone.now().isoformat(),
+        })
+        DBTaskResult.objects.filter(id__in=task_ids).delete()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, default=str))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Benchmark finished: targets={report['targets']} jobs={report['jobs']} finished={report['finished']} "
+            f"wall={report['wall_seconds']}s throughput={report['throughput_jobs_per_second']} jobs/s "
+            f"p95={report['job_latency_p95_seconds']}s peak_rss={report['peak_rss_mb']}MB "
+            f"peak_child_rss={report['peak_child_rss_mb']}MB"
+        ))
+        for service, stats in sorted(report["archive_stats"].items()):
+            self.stdout.write(f"  {service}: {stats}")
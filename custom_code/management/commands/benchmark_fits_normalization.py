@@ -0,0 +1,213 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from astropy.io import fits
+from django.core.management.base import BaseCommand, CommandError
+
+from custom_code.bhtom2_uploads import FITS_BLOCK_SIZE, normalize_fits_file
+from custom_code.management.commands._benchmark import peak_rss_mb
+
+
+FORMAT_SUFFIXES = {"plain": ".fits", "gz": ".fits.gz", "fz": ".fits.fz"}
+
+
+def _write_header(handle, header):
+    handle.write(header.tostring().encode("ascii"))
+
+
+def _write_synthetic_mosaic(path, size_mb, chips, seed):
+    """Write an LCO-like mosaic of ``chips`` uint16 images without holding an image in memory."""
+    rng = np.random.default_rng(seed)
+    side = max(16, int((size_mb * 1024 * 1024 / chips / 2) ** 0.5))
+    rows_per_block = max(1, (4 * 1024 * 1024) // (side * 2))
+    with open(path, "wb") as handle:
+        primary = fits.Header()
+        primary["SIMPLE"] = True
+        primary["BITPIX"] = 8
+        primary["NAXIS"] = 0
+        primary["EXTEND"] = True
+        primary["ORIGIN"] = "BENCHMARK"
+        primary["DATE-OBS"] = "2026-06-03T01:02:03"
+        _write_header(handle, primary)
+        for chip in range(chips):
+            header = fits.Header()
+            header["XTENSION"] = "IMAGE"
+            header["BITPIX"] = 16
+            header["NAXIS"] = 2
+            header["NAXIS1"] = side
+            header["NAXIS2"] = side
+            header["PCOUNT"] = 0
+            header["GCOUNT"] = 1
+            header["BZERO"] = 32768
+            header["BSCALE"] = 1
+            header["EXTNAME"] = "SCI"
+            header["EXTVER"] = chip + 1
+            header["FILTER"] = "rp"
+            _write_header(handle, header)
+            for first_row in range(0, side, rows_per_block):
+                rows = min(rows_per_block, side - first_row)
+                sky = rng.normal(1000.0, 30.0, rows * side)
+                handle.write((sky - 32768).astype(">i2").tobytes())
+            handle.write(b"\0" * (-side * side * 2 % FITS_BLOCK_SIZE))
+    return os.path.getsize(path)
+
+
+def _in_memory_normalization(path, file_name):
+    """The former normalisation: read everything into memory and rebuild it with astropy."""
+    with open(path, "rb") as handle:
+        content = handle.read()
+    if file_name.endswith(".gz"):
+        content = gzip.decompress(content)
+    with fits.open(io.BytesIO(content)) as hdulist:
+        image_hdu = next(hdu for hdu in hdulist if hdu.data is not None)
+        output = io.BytesIO()
+        fits.PrimaryHDU(data=image_hdu.data, header=image_hdu.header.copy()).writeto(output, overwrite=True)
+        return len(output.getvalue())
+
+
+class Command(BaseCommand):
+    help = (
+        "Normalise synthetic 100-500 MB FITS mosaics (plain, gzip and fpack) as done for uploads "
+        "and BHTOM2 forwarding, and report wall time and peak memory per file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes-mb",
+            type=int,
+            nargs="+",
+            default=[100, 250, 500],
+            help="Uncompressed mosaic sizes in MB (default: 100 250 500).",
+        )
+        parser.add_argument(
+            "--formats",
+            type=str,
+            default="plain,gz,fz",
+            help="Comma-separated input formats: plain, gz, fz (fz needs fpack on PATH).",
+        )
+        parser.add_argument("--chips", type=int, default=4, help="Image extensions per mosaic (default: 4).")
+        parser.add_argument(
+            "--preserve-extensions",
+            action="store_true",
+            help="Keep all extensions, as for local uploads, instead of flattening for BHTOM2.",
+        )
+        parser.add_argument(
+            "--compare-in-memory",
+            action="store_true",
+            help="Also run the former in-memory normalisation on each file for comparison.",
+        )
+        parser.add_argument("--work-dir", type=str, default=None, help="Directory for the synthetic files.")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed for the synthetic images.")
+        parser.add_argument("--keep-files", action="store_true", help="Do not delete the synthetic files afterwards.")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def _prepare_input(self, plain_path, input_format, work_dir):
+        if input_format == "plain":
+            return plain_path
+        if input_format == "gz":
+            gz_path = f"{plain_path}.gz"
+            with open(plain_path, "rb") as source, gzip.open(gz_path, "wb", compresslevel=1) as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            return gz_path
+        fpack_path = shutil.which("fpack")
+        if not fpack_path:
+            return None
+        fz_path = f"{plain_path}.fz"
+        subprocess.run([fpack_path, plain_path], cwd=work_dir, capture_output=True, check=True)
+        return fz_path if os.path.exists(fz_path) else None
+
+    def _measure(self, func):
+        tracemalloc.start()
+        started_at = time.monotonic()
+        try:
+            result = func()
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return result, time.monotonic() - started_at, peak / (1024.0 * 1024.0)
+
+    def _run_case(self, input_path, file_name, work_dir, preserve_extensions):
+        output_path = os.path.join(work_dir, "normalized.fits")
+
+        def _normalize():
+            with open(output_path, "wb") as output:
+                normalize_fits_file(input_path, file_name, output, preserve_extensions=preserve_extensions)
+            return os.path.getsize(output_path)
+
+        output_bytes, seconds, peak_mb = self._measure(_normalize)
+        os.remove(output_path)
+        return {
+            "output_mb": round(output_bytes / (1024.0 * 1024.0), 1),
+            "seconds": round(seconds, 3),
+            "peak_heap_mb": round(peak_mb, 1),
+        }
+
+    def handle(self, *args, **options):
+        formats = [name.strip() for name in str(options["formats"]).split(",") if name.strip()]
+        unknown = sorted(set(formats) - set(FORMAT_SUFFIXES))
+        if unknown:
+            raise CommandError(f"Unknown formats: {', '.join(unknown)}")
+        chips = max(1, int(options["chips"]))
+        preserve_extensions = bool(options["preserve_extensions"])
+
+        work_dir = tempfile.mkdtemp(prefix="fits-benchmark-", dir=options["work_dir"])
+        rows = []
+        try:
+            for size_mb in options["sizes_mb"]:
+                plain_path = os.path.join(work_dir, f"mosaic-{size_mb}mb.fits")
+                input_bytes = _write_synthetic_mosaic(plain_path, size_mb, chips, options["seed"])
+                for input_format in formats:
+                    input_path = self._prepare_input(plain_path, input_format, work_dir)
+                    if input_path is None:
+                        self.stdout.write(self.style.WARNING(f"Skipping {input_format}: fpack is not available."))
+                        continue
+                    file_name = f"mosaic-{size_mb}mb{FORMAT_SUFFIXES[input_format]}"
+                    row = {
+                        "size_mb": size_mb,
+                        "format": input_format,
+                        "input_mb": round(os.path.getsize(input_path) / (1024.0 * 1024.0), 1),
+                        "uncompressed_mb": round(input_bytes / (1024.0 * 1024.0), 1),
+                        **self._run_case(input_path, file_name, work_dir, preserve_extensions),
+                    }
+                    if options["compare_in_memory"]:
+                        _output_bytes, seconds, peak_mb = self._measure(
+                            lambda: _in_memory_normalization(input_path, file_name)
+                        )
+                        row["in_memory_seconds"] = round(seconds, 3)
+                        row["in_memory_peak_heap_mb"] = round(peak_mb, 1)
+                    rows.append(row)
+                    if input_path != plain_path:
+                        os.remove(input_path)
+                if not options["keep_files"]:
+                    os.remove(plain_path)
+        finally:
+            if not options["keep_files"]:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        report = {
+            "chips": chips,
+            "preserve_extensions": preserve_extensions,
+            "cases": rows,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for row in rows:
+            line = (
+                f"{row['size_mb']:>5} MB {row['format']:<5} input={row['input_mb']}MB "
+                f"output={row['output_mb']}MB wall={row['seconds']}s peak_heap={row['peak_heap_mb']}MB"
+            )
+            if "in_memory_peak_heap_mb" in row:
+                line += f" | in-memory wall={row['in_memory_seconds']}s peak_heap={row['in_memory_peak_heap_mb']}MB"
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Benchmark finished: peak_rss={report['peak_rss_mb']}MB"))
@@ -0,0 +1,82 @@
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from custom_code.management.commands._benchmark import peak_rss_mb
+from custom_code.photometry_classification.classification_source import (
+    ClassificationSource,
+    MODEL_PATHS,
+    SELECTED_FEATURES,
+)
+from custom_code.photometry_classification.random_forest_classifier import load_rfc, read_training_data
+from custom_code.photometry_classification.tree_model import TreeEnsembleModel
+
+
+def _timed(function, repeat):
+    timings = []
+    result = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, float(np.median(timings))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the pickled RandomForest models of the photometric classifier with their NumPy tree "
+        "export: load time, file size, predict_proba latency and agreement on the training colours."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sources",
+            nargs="+",
+            choices=[source.name for source in ClassificationSource],
+            default=[source.name for source in ClassificationSource],
+            help="Models to benchmark (default: all).",
+        )
+        parser.add_argument("--samples", type=int, default=1000, help="Rows of the batch prediction (default: 1000).")
+        parser.add_argument("--repeat", type=int, default=5, help="Repetitions per timing; the median is reported (default: 5).")
+
+    def handle(self, *args, **options):
+        samples = max(1, int(options["samples"]))
+        repeat = int(options["repeat"])
+        for name in options["sources"]:
+            source = ClassificationSource[name]
+            forest = load_rfc(source)
+            features = read_training_data(source)[SELECTED_FEATURES[source]]
+            batch = features.sample(n=samples, replace=len(features) < samples, random_state=42)
+
+            with tempfile.TemporaryDirectory() as directory:
+                npz_path = os.path.join(directory, f"{name.lower()}.npz")
+                TreeEnsembleModel.from_forest(forest).save(npz_path)
+
+                def load_pickle():
+                    with open(MODEL_PATHS[source], "rb") as handle:
+                        return pickle.load(handle)
+
+                _, pickle_load = _timed(load_pickle, repeat)
+                model, npz_load = _timed(lambda: TreeEnsembleModel.load(npz_path), repeat)
+                pickle_size = os.path.getsize(MODEL_PATHS[source]) / 1024.0 / 1024.0
+                npz_size = os.path.getsize(npz_path) / 1024.0 / 1024.0
+
+            expected, forest_single = _timed(lambda: forest.predict_proba(batch.iloc[:1]), repeat)
+            _, tree_single = _timed(lambda: model.predict_proba(batch.iloc[:1]), repeat)
+            expected, forest_batch = _timed(lambda: forest.predict_proba(batch), repeat)
+            actual, tree_batch = _timed(lambda: model.predict_proba(batch), repeat)
+
+            self.stdout.write(
+                f"{name}: trees={model.n_estimators} nodes={len(model.left)} "
+                f"size pickle={pickle_size:.1f}MB npz={npz_size:.1f}MB "
+                f"load pickle={pickle_load * 1000:.0f}ms npz={npz_load * 1000:.0f}ms "
+                f"predict 1 row forest={forest_single * 1000:.1f}ms tree={tree_single * 1000:.1f}ms "
+                f"predict {samples} rows forest={forest_batch * 1000:.1f}ms tree={tree_batch * 1000:.1f}ms "
+                f"max |dp|={np.abs(actual - expected).max():.2e} "
+                f"same class={np.mean(actual.argmax(axis=1) == expected.argmax(axis=1)):.2%}"
+            )
+        self.stdout.write(f"Peak RSS: {peak_rss_mb():.1f} MB")
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from custom_code.photometry_classification.batch import run_batch_classification
+from custom_code.tasks import classify_targets_batch_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Photometrically classify all unclassified or stale targets in batches: one Gaia, 2MASS and "
+        "WISE cross-match per batch, cached catalogue magnitudes are reused."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target-id", type=int, action="append", help="Classify only this target id (repeatable).")
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            help="Only use cached catalogue magnitudes, e.g. to reclassify after a model update.",
+        )
+        parser.add_argument(
+            "--refresh-catalogs",
+            action="store_true",
+            help="Cross-match every selected target against the catalogues again.",
+        )
+        parser.add_argument("--batch-size", type=int, help="Targets per catalogue query (default: PHOT_CLASSIFICATION_BATCH_SIZE).")
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Enqueue a background job instead of running synchronously in this command.",
+        )
+
+    def handle(self, *args, **options):
+        target_ids = options.get("target_id")
+        if options["enqueue"]:
+            classify_targets_batch_task.enqueue(
+                target_ids,
+                refresh_catalogs=options["refresh_catalogs"],
+                offline=options["offline"],
+                batch_size=options.get("batch_size"),
+            )
+            self.stdout.write(self.style.SUCCESS("Enqueued batch photometric classification."))
+            return
+
+        summary = run_batch_classification(
+            target_ids,
+            refresh_catalogs=options["refresh_catalogs"],
+            offline=options["offline"],
+            batch_size=options.get("batch_size"),
+        )
+        for failure in summary["failed_queries"]:
+            self.stdout.write(self.style.WARNING(f"Cross-match failed: {failure}"))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Classified {summary['classified']} of {summary['targets']} targets "
+                f"({summary['unclassifiable']} without usable photometry, {summary['pending']} pending)."
+            )
+        )
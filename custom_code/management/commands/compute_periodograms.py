@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from tom_targets.models import Target, TargetList
+
+from custom_code.periodicity import METHODS, run_group_periodicity, search_parameters
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the same periodicity search over every target of a group (or the given targets). "
+        "Searches already stored for the current photometry are not repeated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--group", help="Name of the target group (TargetList) to search.")
+        parser.add_argument("--target-id", type=int, action="append", help="Search this target id (repeatable).")
+        parser.add_argument("--method", choices=METHODS, default=METHODS[0], help="Periodogram method (default: lomb_scargle).")
+        parser.add_argument("--filter", action="append", dest="filters", help="Only use this filter (repeatable).")
+        parser.add_argument("--min-period", type=float, default=0.1, help="Shortest period in days (default: 0.1).")
+        parser.add_argument("--max-period", type=float, default=1000.0, help="Longest period in days (default: 1000).")
+        parser.add_argument("--samples-per-peak", type=int, default=5, help="Frequency grid oversampling (default: 5).")
+        parser.add_argument("--pdm-bins", type=int, default=10, help="Phase bins of the PDM method (default: 10).")
+        parser.add_argument(
+            "--bls-duration",
+            type=float,
+            action="append",
+            dest="bls_durations",
+            help="Transit duration in days tried by BLS (repeatable; default: 0.02 0.05 0.1 0.2).",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Queue one db_worker job per target instead of computing in this command.",
+        )
+
+    def handle(self, *args, **options):
+        if not options.get("group") and not options.get("target_id"):
+            raise CommandError("Pass --group or at least one --target-id.")
+        targets = Target.objects.order_by("pk")
+        if options.get("group"):
+            group = TargetList.objects.filter(name=options["group"]).first()
+            if group is None:
+                raise CommandError(f"No target group named {options['group']!r}.")
+            targets = targets.filter(targetlist=group)
+        if options.get("target_id"):
+            targets = targets.filter(pk__in=options["target_id"])
+
+        try:
+            parameters = search_parameters({
+                "method": options["method"],
+                "filters": options.get("filters"),
+                "min_period": options["min_period"],
+                "max_period": options["max_period"],
+                "samples_per_peak": options["samples_per_peak"],
+                "pdm_bins": options["pdm_bins"],
+                "bls_durations": options.get("bls_durations"),
+            })
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        summary = run_group_periodicity(targets, parameters, background=options["enqueue"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Periodicity searches for {summary.pop('targets')} targets: "
+                + ", ".join(f"{status}={count}" for status, count in sorted(summary.items()))
+            )
+        )
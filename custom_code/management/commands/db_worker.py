@@ -14,9 +14,13 @@ from django.core.management.base import BaseCommand
 from django.db import connections, transaction
 from django.db.utils import OperationalError
 from django.utils import timezone
-from tom_targets.models import Target
 
-from custom_code.tasks import enqueue_target_dataservices_update, run_observation_status_update
+from custom_code.nonsidereal_ephemeris import enqueue_due_nonsidereal_ephemerides
+from custom_code.photometry_classification.service import preload_classifier
+from custom_code.refresh_scheduler import enqueue_due_dataservice_refreshes
+from custom_code.solar_system_cache import enqueue_due_solar_system_refreshes
+from custom_code.tasks import run_observation_status_update, sync_tle_catalogue_task
+from custom_code.transit_calendar import enqueue_due_transit_calendars
 from django_tasks import DEFAULT_TASK_BACKEND_ALIAS
 from django_tasks.backends.database.management.commands.db_worker import (
     package_logger,
@@ -78,9 +82,14 @@ class ScheduledStatusWorker:
         dataservices_interval,
         dataservices_importance_gt,
         atlas_poll_interval=0,
+        solar_system_cache_interval=0,
+        ephemeris_interval=0,
+        transit_calendar_interval=0,
+        tle_sync_interval=0,
         configure_signal_handlers=True,
         worker_name=None,
         process_tasks=True,
+        task_ids=None,
     ):
         self.queue_names = queue_names
         self.process_all_queues = "*" in queue_names
@@ -92,9 +101,17 @@ class ScheduledStatusWorker:
         self.dataservices_interval = dataservices_interval
         self.dataservices_importance_gt = dataservices_importance_gt
         self.atlas_poll_interval = atlas_poll_interval
+        self.solar_system_cache_interval = solar_system_cache_interval
+        self.ephemeris_interval = ephemeris_interval
+        self.transit_calendar_interval = transit_calendar_interval
+        self.tle_sync_interval = tle_sync_interval
         self.next_status_enqueue_at = 0.0 if status_interval else None
         self.next_dataservices_enqueue_at = 0.0 if dataservices_interval else None
         self.next_atlas_poll_at = 0.0 if atlas_poll_interval else None
+        self.next_solar_system_refresh_at = 0.0 if solar_system_cache_interval else None
+        self.next_ephemeris_refresh_at = 0.0 if ephemeris_interval else None
+        self.next_transit_calendar_refresh_at = 0.0 if transit_calendar_interval else None
+        self.next_tle_sync_at = 0.0 if tle_sync_interval else None
         self.heartbeat_interval = getattr(settings, "DB_WORKER_HEARTBEAT_INTERVAL", 300)
         self.stale_running_after = getattr(settings, "DB_WORKER_STALE_RUNNING_AFTER", 7200)
         self.next_heartbeat_at = 0.0
@@ -102,6 +119,8 @@ class ScheduledStatusWorker:
         self.configure_signal_handlers = configure_signal_handlers
         self.worker_name = worker_name or "worker"
         self.process_tasks = process_tasks
+        # Only claim these task ids when given (benchmarks must not drain unrelated queued work).
+        self.task_ids = list(task_ids) if task_ids is not None else None
 
         self.running = True
         self.running_task = False
@@ -159,28 +178,22 @@ class ScheduledStatusWorker:
         self.next_dataservices_enqueue_at = now + self.dataservices_interval
 
         try:
-            target_ids = list(
-                Target.objects
-                .filter(importance__gt=self.dataservices_importance_gt)
-                .order_by("pk")
-                .values_list("pk", flat=True)
-            )
-            for target_id in target_ids:
-                enqueue_target_dataservices_update(
-                    target_id,
-                    include_create_only=False,
-                    force_all_services=False,
-                )
+            summary = enqueue_due_dataservice_refreshes(importance_gt=self.dataservices_importance_gt)
         except Exception:
             logger.exception("Scheduled DataServices refresh enqueue failed.")
             return
 
-        logger.info(
-            "Scheduled DataServices refresh enqueued targets=%s importance_gt=%s next_update_in=%s seconds.",
-            len(target_ids),
-            self.dataservices_importance_gt,
-            self.dataservices_interval,
-        )
+        if summary.get("enqueued") or summary.get("deferred_near_sun"):
+            logger.info(
+                "Scheduled DataServices refresh enqueued=%s due=%s outstanding=%s seeded=%s deferred_near_sun=%s importance_gt=%s next_pass_in=%s seconds.",
+                summary.get("enqueued"),
+                summary.get("due"),
+                summary.get("outstanding"),
+                summary.get("seeded"),
+                summary.get("deferred_near_sun"),
+                self.dataservices_importance_gt,
+                self.dataservices_interval,
+            )
 
     def run_due_atlas_poll(self) -> None:
         if self.next_atlas_poll_at is None:
@@ -199,14 +212,100 @@ class ScheduledStatusWorker:
 
         if summary and summary.get("checked"):
             logger.info(
-                "ATLAS forced-photometry poll: checked=%s completed=%s ingested=%s failed=%s next_poll_in=%s seconds.",
+                "ATLAS forced-photometry poll: checked=%s completed=%s ingested=%s failed=%s skipped=%s next_poll_in=%s seconds.",
                 summary.get("checked"),
                 summary.get("completed"),
                 summary.get("ingested"),
                 summary.get("failed"),
+                summary.get("skipped"),
                 self.atlas_poll_interval,
             )
 
+    def run_due_solar_system_refresh(self) -> None:
+        if self.next_solar_system_refresh_at is None:
+            return
+        now = time.monotonic()
+        if now < self.next_solar_system_refresh_at:
+            return
+        self.next_solar_system_refresh_at = now + self.solar_system_cache_interval
+
+        try:
+            summary = enqueue_due_solar_system_refreshes()
+        except Exception:
+            logger.exception("Scheduled solar system cache refresh enqueue failed.")
+            return
+
+        if summary.get("enqueued") or summary.get("removed"):
+            logger.info(
+                "Scheduled solar system cache refresh enqueued=%s due=%s removed=%s next_pass_in=%s seconds.",
+                summary.get("enqueued"),
+                summary.get("due"),
+                summary.get("removed"),
+                self.solar_system_cache_interval,
+            )
+
+    def run_due_ephemeris_refresh(self) -> None:
+        if self.next_ephemeris_refresh_at is None:
+            return
+        now = time.monotonic()
+        if now < self.next_ephemeris_refresh_at:
+            return
+        self.next_ephemeris_refresh_at = now + self.ephemeris_interval
+
+        try:
+            summary = enqueue_due_nonsidereal_ephemerides()
+        except Exception:
+            logger.exception("Scheduled non-sidereal ephemeris refresh enqueue failed.")
+            return
+
+        if summary.get("enqueued"):
+            logger.info(
+                "Scheduled non-sidereal ephemeris refresh enqueued=%s due=%s pending=%s next_pass_in=%s seconds.",
+                summary.get("enqueued"),
+                summary.get("due"),
+                summary.get("pending"),
+                self.ephemeris_interval,
+            )
+
+    def run_due_transit_calendar_refresh(self) -> None:
+        if self.next_transit_calendar_refresh_at is None:
+            return
+        now = time.monotonic()
+        if now < self.next_transit_calendar_refresh_at:
+            return
+        self.next_transit_calendar_refresh_at = now + self.transit_calendar_interval
+
+        try:
+            summary = enqueue_due_transit_calendars()
+        except Exception:
+            logger.exception("Scheduled transit calendar refresh enqueue failed.")
+            return
+
+        if summary.get("enqueued") or summary.get("removed"):
+            logger.info(
+                "Scheduled transit calendar refresh enqueued=%s due=%s removed=%s next_pass_in=%s seconds.",
+                summary.get("enqueued"),
+                summary.get("due"),
+                summary.get("removed"),
+                self.transit_calendar_interval,
+            )
+
+    def run_due_tle_sync(self) -> None:
+        if self.next_tle_sync_at is None:
+            return
+        now = time.monotonic()
+        if now < self.next_tle_sync_at:
+            return
+        self.next_tle_sync_at = now + self.tle_sync_interval
+
+        try:
+            sync_tle_catalogue_task.enqueue()
+        except Exception:
+            logger.exception("Scheduled TLE catalogue sync enqueue failed.")
+            return
+
+        logger.info("Scheduled TLE catalogue sync enqueued next_sync_in=%s seconds.", self.tle_sync_interval)
+
     def log_heartbeat(self) -> None:
         if not self.heartbeat_interval:
             return
@@ -300,6 +399,10 @@ class ScheduledStatusWorker:
             self.run_due_status_update()
             self.run_due_dataservices_update()
             self.run_due_atlas_poll()
+            self.run_due_solar_system_refresh()
+            self.run_due_ephemeris_refresh()
+            self.run_due_transit_calendar_refresh()
+            self.run_due_tle_sync()
 
             if not self.process_tasks:
                 if self.running:
@@ -309,6 +412,8 @@ class ScheduledStatusWorker:
             tasks = DBTaskResult.objects.ready().filter(backend_name=self.backend_name)
             if not self.process_all_queues:
                 tasks = tasks.filter(queue_name__in=self.queue_names)
+            if self.task_ids is not None:
+                tasks = tasks.filter(id__in=self.task_ids)
 
             task_result = None
             try:
@@ -439,8 +544,8 @@ class Command(BaseCommand):
         parser.add_argument(
             "--dataservices-interval",
             type=int,
-            default=getattr(settings, "DATA_SERVICES_UPDATE_INTERVAL_SECONDS", 86400),
-            help="Seconds between scheduled DataServices refresh enqueues. Use 0 to disable (default: 86400).",
+            default=getattr(settings, "DATA_SERVICES_SCHEDULER_INTERVAL_SECONDS", 300),
+            help="Seconds between DataServices refresh scheduler passes. Use 0 to disable (default: 300).",
         )
         parser.add_argument(
             "--dataservices-importance-gt",
@@ -454,6 +559,30 @@ class Command(BaseCommand):
             default=getattr(settings, "ATLAS_POLL_INTERVAL_SECONDS", 300),
             help="Seconds between ATLAS forced-photometry job polls. Use 0 to disable (default: 300).",
         )
+        parser.add_argument(
+            "--solar-system-cache-interval",
+            type=int,
+            default=getattr(settings, "SOLAR_SYSTEM_CACHE_REFRESH_INTERVAL_SECONDS", 900),
+            help="Seconds between refresh passes over the stored Pallas queries. Use 0 to disable (default: 900).",
+        )
+        parser.add_argument(
+            "--ephemeris-interval",
+            type=int,
+            default=getattr(settings, "NON_SIDEREAL_EPHEMERIS_REFRESH_INTERVAL_SECONDS", 3600),
+            help="Seconds between passes extending the non-sidereal ephemeris grids. Use 0 to disable (default: 3600).",
+        )
+        parser.add_argument(
+            "--transit-calendar-interval",
+            type=int,
+            default=getattr(settings, "TRANSIT_CALENDAR_REFRESH_INTERVAL_SECONDS", 3600),
+            help="Seconds between passes rolling the transit calendar forward. Use 0 to disable (default: 3600).",
+        )
+        parser.add_argument(
+            "--tle-sync-interval",
+            type=int,
+            default=getattr(settings, "TLE_CATALOGUE_SYNC_INTERVAL_SECONDS", 21600),
+            help="Seconds between GeoTOM TLE catalogue syncs. Use 0 to disable (default: 21600).",
+        )
         parser.add_argument(
             "--workers",
             type=int,
@@ -511,6 +640,10 @@ class Command(BaseCommand):
         dataservices_interval: int,
         dataservices_importance_gt: float,
         atlas_poll_interval: int,
+        solar_system_cache_interval: int,
+        ephemeris_interval: int,
+        transit_calendar_interval: int,
+        tle_sync_interval: int,
         workers: int,
         **options,
     ) -> None:
@@ -520,6 +653,10 @@ class Command(BaseCommand):
         dataservices_interval = max(0, int(dataservices_interval))
         dataservices_importance_gt = float(dataservices_importance_gt)
         atlas_poll_interval = max(0, int(atlas_poll_interval))
+        solar_system_cache_interval = max(0, int(solar_system_cache_interval))
+        ephemeris_interval = max(0, int(ephemeris_interval))
+        transit_calendar_interval = max(0, int(transit_calendar_interval))
+        tle_sync_interval = max(0, int(tle_sync_interval))
         queue_names = queue_name.split(",")
         logger.info(
             "Configured BHTOM db_worker workers=%s queues=%s status_interval=%s dataservices_interval=%s dataservices_importance_gt=%s bhtom2_token_configured=%s bhtom2_upload_url_configured=%s",
@@ -532,6 +669,12 @@ class Command(BaseCommand):
             bool(str(getattr(settings, "BHTOM2_UPLOAD_SERVICE_URL", "") or "").strip()),
         )
 
+        # Loaded once here, the classifier models are shared with every forked DataService child.
+        try:
+            preload_classifier()
+        except Exception:
+            logger.exception("Could not preload the photometric classifier models.")
+
         if worker_count == 1:
             worker = ScheduledStatusWorker(
                 queue_names=queue_names,
@@ -543,6 +686,10 @@ class Command(BaseCommand):
                 dataservices_interval=dataservices_interval,
                 dataservices_importance_gt=dataservices_importance_gt,
                 atlas_poll_interval=atlas_poll_interval,
+                solar_system_cache_interval=solar_system_cache_interval,
+                ephemeris_interval=ephemeris_interval,
+                transit_calendar_interval=transit_calendar_interval,
+                tle_sync_interval=tle_sync_interval,
                 process_tasks=True,
             )
             worker.start()
@@ -561,6 +708,10 @@ class Command(BaseCommand):
             dataservices_interval=dataservices_interval,
             dataservices_importance_gt=dataservices_importance_gt,
             atlas_poll_interval=atlas_poll_interval,
+            solar_system_cache_interval=solar_system_cache_interval,
+            ephemeris_interval=ephemeris_interval,
+            transit_calendar_interval=transit_calendar_interval,
+            tle_sync_interval=tle_sync_interval,
             configure_signal_handlers=False,
             worker_name="scheduler",
             process_tasks=False,
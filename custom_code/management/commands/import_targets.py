@@ -0,0 +1,61 @@
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from tom_targets.models import Target
+
+from custom_code.target_import import TABLE_FORMATS, import_targets
+
+
+class Command(BaseCommand):
+    help = (
+        "Import sidereal targets from a CSV, VOTable or ECSV table: rows are validated and matched against "
+        "existing names and aliases, new targets are created in bulk and their DataServices run in one queued job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Target table (.csv, .ecsv, .xml, .vot or .votable).")
+        parser.add_argument(
+            "--format",
+            choices=sorted(set(TABLE_FORMATS.values())),
+            help="Table format, when it cannot be told from the file extension.",
+        )
+        parser.add_argument(
+            "--permissions",
+            choices=[choice for choice, _label in Target.Permissions.choices],
+            help="Access level of the new targets (default: the TOM default).",
+        )
+        parser.add_argument(
+            "--group",
+            action="append",
+            default=[],
+            help="Group given view/change/delete permissions on the new targets (repeatable).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only validate the table and report what would be created.")
+        parser.add_argument("--no-dataservices", action="store_true", help="Do not queue DataService updates for the new targets.")
+
+    def handle(self, *args, **options):
+        groups = list(Group.objects.filter(name__in=options["group"]))
+        unknown = set(options["group"]) - {group.name for group in groups}
+        if unknown:
+            raise CommandError(f"Unknown group(s): {', '.join(sorted(unknown))}")
+
+        try:
+            summary = import_targets(
+                options["path"],
+                table_format=options.get("format"),
+                permissions=options.get("permissions"),
+                groups=groups,
+                dry_run=options["dry_run"],
+                run_dataservices=not options["no_dataservices"],
+            )
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Could not import {options['path']}: {exc}")
+
+        for line, name, message in summary["errors"]:
+            self.stdout.write(f"line {line}{f' ({name})' if name else ''}: {message}")
+        verb = "Would create" if options["dry_run"] else "Created"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {summary['created']} of {summary['rows']} targets: existing={summary['existing']}, "
+                f"duplicates={summary['duplicates']}, invalid={summary['invalid']}, conflicts={summary['conflicts']}"
+            )
+        )
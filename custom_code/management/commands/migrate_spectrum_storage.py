@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand
+from tom_dataproducts.models import ReducedDatum
+
+from custom_code.spectrum_storage import (
+    SPECTRUM_FILE_KEY,
+    inline_spectrum_value,
+    is_inline_spectrum,
+    is_stored_spectrum,
+    remove_orphaned_spectrum_files,
+    spectrum_storage_backend,
+    store_spectrum_value,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the wavelength/flux/error lists of stored spectra out of ReducedDatum.value into "
+        "NPY sidecar files (or back with --inline)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200, help="Spectra updated per query (default: 200).")
+        parser.add_argument("--target-id", type=int, help="Convert only the spectra of one target id.")
+        parser.add_argument("--inline", action="store_true", help="Write the arrays back into ReducedDatum.value.")
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Afterwards delete sidecar files no spectrum points at any more.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be converted.")
+
+    def _flush(self, changed, duplicates):
+        if changed:
+            ReducedDatum.objects.bulk_update(changed, ["value"], batch_size=len(changed))
+        if duplicates:
+            ReducedDatum.objects.filter(pk__in=duplicates).delete()
+
+    def handle(self, *args, **options):
+        inline = options["inline"]
+        dry_run = options["dry_run"]
+        batch_size = max(1, int(options["batch_size"]))
+        if not inline and spectrum_storage_backend() != "npy":
+            self.stdout.write(self.style.WARNING("SPECTRUM_STORAGE_BACKEND is not 'npy'; nothing to convert."))
+            return
+
+        datums = ReducedDatum.objects.filter(data_type="spectroscopy").order_by("pk")
+        if options.get("target_id"):
+            datums = datums.filter(target_id=options["target_id"])
+
+        summary = {"checked": 0, "converted": 0, "duplicates_removed": 0, "skipped": 0}
+        pks = list(datums.values_list("pk", flat=True))
+        for start in range(0, len(pks), batch_size):
+            changed = []
+            duplicates = []
+            batch = datums.filter(pk__in=pks[start:start + batch_size]).only("pk", "target_id", "timestamp", "value")
+            for datum in batch:
+                summary["checked"] += 1
+                if inline:
+                    convertible = is_stored_spectrum(datum.value)
+                else:
+                    convertible = is_inline_spectrum(datum.value)
+                if not convertible:
+                    summary["skipped"] += 1
+                    continue
+                if dry_run:
+                    summary["converted"] += 1
+                    continue
+                new_value = inline_spectrum_value(datum.value) if inline else store_spectrum_value(datum.value)
+                if new_value is datum.value:
+                    summary["skipped"] += 1
+                    continue
+
+                # A refresh may already have stored the converted form of the same spectrum.
+                if ReducedDatum.objects.filter(
+                    target_id=datum.target_id,
+                    data_type="spectroscopy",
+                    timestamp=datum.timestamp,
+                    value=new_value,
+                ).exclude(pk=datum.pk).exists():
+                    duplicates.append(datum.pk)
+                    summary["duplicates_removed"] += 1
+                else:
+                    datum.value = new_value
+                    changed.append(datum)
+                    summary["converted"] += 1
+            self._flush(changed, duplicates)
+
+        if options["prune"] and not dry_run:
+            referenced = [
+                value[SPECTRUM_FILE_KEY]
+                for value in ReducedDatum.objects.filter(data_type="spectroscopy").values_list("value", flat=True)
+                if is_stored_spectrum(value)
+            ]
+            summary["files_removed"] = remove_orphaned_spectrum_files(referenced)
+
+        prefix = "Dry run: " if dry_run else ""
+        self.stdout.write(self.style.SUCCESS(
+            prefix + " ".join(f"{key}={value}" for key, value in summary.items())
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from custom_code.target_names import rebuild_target_name_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the folded target name/alias keys used by name lookups and duplicate checks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target-id", type=int, action="append", help="Rebuild only this target id (repeatable).")
+
+    def handle(self, *args, **options):
+        written = rebuild_target_name_index(options.get("target_id"))
+        self.stdout.write(self.style.SUCCESS(f"Indexed {written} target names and aliases"))
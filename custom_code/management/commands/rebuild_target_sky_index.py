@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from custom_code.sky_index import rebuild_target_sky_index
+
+
+class Command(BaseCommand):
+    help = "Recompute the HEALPix pixel of target coordinates used by cone, box and polygon searches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target-id", type=int, action="append", help="Rebuild only this target id (repeatable).")
+
+    def handle(self, *args, **options):
+        changed = rebuild_target_sky_index(options.get("target_id"))
+        self.stdout.write(self.style.SUCCESS(f"Updated the HEALPix index of {changed} targets"))
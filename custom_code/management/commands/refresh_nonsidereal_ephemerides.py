@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from tom_targets.models import Target
+
+from custom_code.nonsidereal_ephemeris import due_nonsidereal_ephemeris_targets, refresh_nonsidereal_ephemeris
+from custom_code.tasks import refresh_nonsidereal_ephemeris_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the precomputed ephemeris grids of non-sidereal targets that are missing, "
+        "computed from older orbital elements or about to run out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target-id", type=int, action="append", help="Only this target id (repeatable).")
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute every selected non-sidereal target, not only the due ones.",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Queue one db_worker job per target instead of computing in this command.",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            target_ids = list(Target.objects.filter(type=Target.NON_SIDEREAL).order_by("pk").values_list("pk", flat=True))
+        else:
+            target_ids = due_nonsidereal_ephemeris_targets()
+        if options.get("target_id"):
+            target_ids = [target_id for target_id in target_ids if target_id in set(options["target_id"])]
+
+        summary = {}
+        for target_id in target_ids:
+            if options["enqueue"]:
+                refresh_nonsidereal_ephemeris_task.enqueue(target_id)
+                status = "enqueued"
+            else:
+                status = refresh_nonsidereal_ephemeris(target_id)["status"]
+            summary[status] = summary.get(status, 0) + 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Non-sidereal ephemerides for {len(target_ids)} targets: "
+                + (", ".join(f"{status}={count}" for status, count in sorted(summary.items())) or "nothing to do")
+            )
+        )
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from custom_code.models import SolarSystemQuery
+from custom_code.solar_system_cache import prefetch_designation, refresh_solar_system_queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the stored Pallas queries (MPC observations, JPL Horizons, SsODNet), "
+        "or prefetch the MPC observations and Horizons name of new designations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--designation",
+            action="append",
+            help="Prefetch this designation if it is not stored yet, and refresh its stored queries (repeatable).",
+        )
+        parser.add_argument(
+            "--kind",
+            choices=[kind for kind, _label in SolarSystemQuery.KIND_CHOICES],
+            action="append",
+            dest="kinds",
+            help="Only refresh queries of this kind (repeatable).",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Refresh every selected query, not only the expired ones.",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Queue the refreshes in db_worker instead of running them in this command.",
+        )
+
+    def handle(self, *args, **options):
+        designations = [value.strip() for value in options.get("designation") or [] if value.strip()]
+        for designation in designations:
+            try:
+                prefetch_designation(designation)
+            except ValueError as exc:
+                raise CommandError(f"Could not prefetch {designation!r}: {exc}")
+
+        queries = SolarSystemQuery.objects.all()
+        if designations:
+            queries = queries.filter(designation__in=designations)
+        if options.get("kinds"):
+            queries = queries.filter(kind__in=options["kinds"])
+        if not options["all"]:
+            queries = queries.filter(expires_at__lte=timezone.now())
+
+        summary = refresh_solar_system_queries(queries, background=options["enqueue"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Solar system queries ({len(designations)} designations prefetched): "
+                + (", ".join(f"{status}={count}" for status, count in sorted(summary.items())) or "nothing to refresh")
+            )
+        )
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from custom_code.models import TransitEphemeris
+from custom_code.tasks import refresh_transit_calendar_task
+from custom_code.transit_calendar import REFRESH_BATCH_SIZE, due_transit_ephemerides, refresh_transit_calendars
+
+
+class Command(BaseCommand):
+    help = (
+        "Expand transit ephemerides into the precomputed transit calendar: drop past transits, "
+        "add those entering the horizon and recompute the ones whose ephemeris or sites changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ephemeris-id", type=int, action="append", help="Only this transit ephemeris id (repeatable).")
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Refresh every selected ephemeris, not only the due ones.",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help=f"Queue one db_worker job per {REFRESH_BATCH_SIZE} ephemerides instead of computing in this command.",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            ephemeris_ids = list(TransitEphemeris.objects.order_by("pk").values_list("pk", flat=True))
+        else:
+            ephemeris_ids = due_transit_ephemerides()
+        if options.get("ephemeris_id"):
+            ephemeris_ids = [ephemeris_id for ephemeris_id in ephemeris_ids if ephemeris_id in set(options["ephemeris_id"])]
+
+        summary = {}
+        for start in range(0, len(ephemeris_ids), REFRESH_BATCH_SIZE):
+            batch = ephemeris_ids[start:start + REFRESH_BATCH_SIZE]
+            if options["enqueue"]:
+                refresh_transit_calendar_task.enqueue(batch)
+                summary["enqueued"] = summary.get("enqueued", 0) + len(batch)
+                continue
+            for key, count in refresh_transit_calendars(batch).items():
+                summary[key] = summary.get(key, 0) + count
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Transit calendar for {len(ephemeris_ids)} ephemerides: "
+                + (", ".join(f"{key}={count}" for key, count in sorted(summary.items()) if count) or "nothing to do")
+            )
+        )
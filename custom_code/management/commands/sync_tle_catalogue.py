@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from custom_code.tasks import sync_tle_catalogue_task
+from custom_code.tle_catalogue import apply_tle_catalogue, sync_tle_catalogue
+
+
+class Command(BaseCommand):
+    help = (
+        "Read whole TLE groups from CelesTrak (or a local directory of TLE files) into the TLE "
+        "catalogue mirror and update the TLEs of all GeoTOM satellites from it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--group",
+            action="append",
+            dest="groups",
+            help="Read this CelesTrak group, or this file of the TLE directory (repeatable; default: TLE_CATALOGUE_GROUPS).",
+        )
+        parser.add_argument(
+            "--directory",
+            help="Read the *.tle, *.txt and *.3le files of this directory instead of CelesTrak.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Download groups even if they were downloaded within TLE_CATALOGUE_MIN_FETCH_SECONDS.",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Queue the configured sync in db_worker instead of running it in this command.",
+        )
+
+    def handle(self, *args, **options):
+        if options["enqueue"]:
+            if options.get("groups") or options.get("directory"):
+                raise CommandError("--enqueue syncs the configured groups; it cannot be combined with --group or --directory.")
+            sync_tle_catalogue_task.enqueue(force=options["force"])
+            self.stdout.write(self.style.SUCCESS("TLE catalogue sync enqueued."))
+            return
+
+        summary = sync_tle_catalogue(options.get("groups"), directory=options.get("directory"), force=options["force"])
+        applied = apply_tle_catalogue()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"TLE catalogue: groups={summary['groups']} skipped={summary['skipped']} failed={summary['failed']} "
+                f"records={summary['records']} added={summary['added']} updated={summary['updated']}; "
+                f"GeoTOM satellites updated={applied['updated']} of {applied['checked']}, "
+                f"not in catalogue={len(applied['missing'])}"
+            )
+        )
@@ -113,6 +113,10 @@ class BhtomTarget(BaseTarget):
         blank=True,
         help_text='Gaia DR3 variability class from vari_classifier_result.best_class_name.',
     )
+    healpix_index = models.BigIntegerField(
+        verbose_name='HEALPix index', null=True, blank=True, db_index=True,
+        help_text='Nested HEALPix pixel (order 16) of RA/Dec, used by positional searches.'
+    )
 
     def get_classification_type_display(self):
         for key, display in settings.CLASSIFICATION_TYPES:
@@ -149,6 +153,48 @@ class GeoTarget(models.Model):
         return f"{self.name} ({self.norad_id})"
 
 
+class TleCatalogueEntry(models.Model):
+    """Latest mirrored TLE of one NORAD object, from a CelesTrak group or a local TLE file.
+
+    ``group`` is the group (or file) that last supplied it and ``fetched_at``
+    when that group was read. See tle_catalogue.py.
+    """
+    norad_id = models.PositiveIntegerField(unique=True)
+    name = models.CharField(max_length=128, blank=True, default="")
+    line1 = models.CharField(max_length=128)
+    line2 = models.CharField(max_length=128)
+    epoch_jd = models.FloatField(db_index=True)
+    group = models.CharField(max_length=64, db_index=True)
+    fetched_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "TLE catalogue entry"
+        verbose_name_plural = "TLE catalogue entries"
+
+    def __str__(self):
+        return f"TLE {self.norad_id} group={self.group} epoch_jd={self.epoch_jd:.5f}"
+
+
+class TleCatalogueGroup(models.Model):
+    """Last read of one TLE group (a CelesTrak group or a file of the local TLE directory)."""
+    name = models.CharField(max_length=64, unique=True)
+    source = models.CharField(max_length=500, blank=True, default="")
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    records = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "TLE catalogue group"
+        verbose_name_plural = "TLE catalogue groups"
+
+    def __str__(self):
+        return f"TLE group {self.name} records={self.records} fetched={self.fetched_at}"
+
+
 class TargetAliasInfo(models.Model):
     target_name = models.OneToOneField('tom_targets.TargetName', on_delete=models.CASCADE, related_name='alias_info')
     source_name = models.CharField(max_length=100, blank=True, default='')
@@ -164,6 +210,34 @@ class TargetAliasInfo(models.Model):
         return f'{self.target_name.name}'
 
 
+class TargetNameIndex(models.Model):
+    """Folded lookup key of a target's primary name (target_name is null) or of one of its aliases.
+
+    Name lookups, alias upserts and duplicate checks compare alias_key() of the
+    requested name with ``key``, which is indexed, instead of scanning names with
+    iexact/icontains. Signals keep the rows in sync; see target_names.py.
+    """
+    target = models.ForeignKey('custom_code.BhtomTarget', on_delete=models.CASCADE, related_name='name_index')
+    target_name = models.OneToOneField(
+        'tom_targets.TargetName', on_delete=models.CASCADE, null=True, blank=True, related_name='name_index'
+    )
+    key = models.CharField(max_length=100, db_index=True)
+
+    class Meta:
+        verbose_name = 'target name index'
+        verbose_name_plural = 'target name index'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['target'],
+                condition=Q(target_name__isnull=True),
+                name='unique_primary_target_name_index',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.key} -> target={self.target_id}'
+
+
 class TransitEphemeris(models.Model):
     target = models.OneToOneField('custom_code.BhtomTarget', on_delete=models.CASCADE, related_name='transit_ephemeris')
     source_name = models.CharField(max_length=100, blank=True, default='')
@@ -260,6 +334,66 @@ class TransitEphemeris(models.Model):
         }
 
 
+
+class TransitEvent(models.Model):
+    """One predicted transit of a TransitEphemeris planet inside the rolling calendar horizon.
+
+    ``ingress``, ``mid`` and ``egress`` are UTC; without a duration all three
+    are the mid-transit time. ``calendar_hash`` identifies the ephemeris,
+    target coordinates and observing sites the event and its visibilities were
+    computed from. See transit_calendar.py.
+    """
+    ephemeris = models.ForeignKey(TransitEphemeris, on_delete=models.CASCADE, related_name='events')
+    target = models.ForeignKey('custom_code.BhtomTarget', on_delete=models.CASCADE, related_name='transit_events')
+    epoch = models.IntegerField()
+    ingress = models.DateTimeField()
+    mid = models.DateTimeField(db_index=True)
+    egress = models.DateTimeField(db_index=True)
+    calendar_hash = models.CharField(max_length=40)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'transit event'
+        verbose_name_plural = 'transit events'
+        unique_together = (('ephemeris', 'epoch'),)
+
+    def __str__(self):
+        return f'Transit target={self.target_id} epoch={self.epoch} mid={self.mid:%Y-%m-%d %H:%M}'
+
+
+class TransitEventVisibility(models.Model):
+    """Target and Sun altitudes of one TransitEvent at one observing site.
+
+    ``observable`` holds when the target is high enough and the Sun low enough
+    at ingress, mid-transit and egress; ``partial`` when that holds at any of
+    them. ``mid`` and ``facility`` are copied from the event and the site so
+    the observable-transit listing is answered from this table's indexes.
+    """
+    event = models.ForeignKey(TransitEvent, on_delete=models.CASCADE, related_name='visibilities')
+    facility = models.CharField(max_length=64)
+    site = models.CharField(max_length=100)
+    mid = models.DateTimeField()
+    ingress_altitude = models.FloatField()
+    mid_altitude = models.FloatField()
+    egress_altitude = models.FloatField()
+    sun_altitude = models.FloatField(help_text='Highest Sun altitude of ingress, mid-transit and egress.')
+    observable = models.BooleanField(default=False)
+    partial = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = 'transit event visibility'
+        verbose_name_plural = 'transit event visibilities'
+        unique_together = (('event', 'facility', 'site'),)
+        indexes = [
+            models.Index(fields=['observable', 'mid']),
+            models.Index(fields=['partial', 'mid']),
+            models.Index(fields=['facility', 'site', 'mid']),
+        ]
+
+    def __str__(self):
+        return f'Transit event={self.event_id} ({self.facility}) {self.site} observable={self.observable}'
+
+
 class Facility(models.Model):
     """
     Declarative description of a facility and the shapes of its account/proposal fields.
@@ -531,3 +665,279 @@ class ATLASForcedPhotJob(models.Model):
 
     def __str__(self):
         return f'ATLAS job target={self.target_id} status={self.status}'
+
+
+class DataServiceRefreshState(models.Model):
+    """When a (target, DataService) pair was last refreshed and when it is next due.
+
+    Maintained by the refresh scheduler in db_worker, which enqueues the most urgent
+    due pairs instead of every service for every target once a day. interval_factor
+    is learned from whether refreshes bring new data. See refresh_scheduler.py.
+    """
+    target = models.ForeignKey(
+        'custom_code.BhtomTarget', on_delete=models.CASCADE, related_name='dataservice_refresh_states'
+    )
+    service_name = models.CharField(max_length=64, db_index=True)
+    next_due_at = models.DateTimeField()
+    interval_seconds = models.FloatField(default=0)
+    last_enqueued_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_new_data_at = models.DateTimeField(null=True, blank=True)
+    empty_refreshes = models.PositiveIntegerField(default=0)
+    interval_factor = models.FloatField(default=1.0)
+
+    class Meta:
+        verbose_name = 'DataService refresh state'
+        unique_together = (('target', 'service_name'),)
+        indexes = [
+            models.Index(fields=['next_due_at', 'service_name']),
+        ]
+
+    def __str__(self):
+        return f'{self.service_name} refresh target={self.target_id} next_due={self.next_due_at}'
+
+
+class StagedDataProductUpload(models.Model):
+    """A data-product file staged on local disk and processed by a background job.
+
+    Files arrive in resumable chunks (or as one classic form upload) and are appended
+    to a staging file; once complete, db_worker normalises, saves and processes the
+    file as a DataProduct. The upload form polls these rows for per-file progress.
+    See staged_uploads.py.
+    """
+    STATUS_UPLOADING = 'uploading'
+    STATUS_QUEUED = 'queued'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_UPLOADING, 'Uploading'),
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    upload_id = models.CharField(max_length=32, unique=True)
+    batch_id = models.CharField(max_length=32, db_index=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='staged_dataproduct_uploads'
+    )
+    target = models.ForeignKey('custom_code.BhtomTarget', on_delete=models.CASCADE, null=True, blank=True)
+    observation_record = models.ForeignKey(
+        'tom_observations.ObservationRecord', on_delete=models.CASCADE, null=True, blank=True
+    )
+    data_product_type = models.CharField(max_length=50, blank=True, default='')
+    group_ids = models.JSONField(blank=True, default=list)
+    bhtom2_options = models.JSONField(blank=True, default=dict)
+    file_name = models.CharField(max_length=255)
+    total_bytes = models.BigIntegerField(default=0)
+    received_bytes = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_UPLOADING, db_index=True)
+    stage = models.CharField(max_length=32, blank=True, default='')
+    message = models.TextField(blank=True, default='')
+    dataproduct = models.ForeignKey(
+        'tom_dataproducts.DataProduct', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'staged data product upload'
+        indexes = [
+            models.Index(fields=['status', 'modified']),
+        ]
+
+    def __str__(self):
+        return f'Staged upload {self.file_name} status={self.status}'
+
+
+class LCOFrameSync(models.Model):
+    """Archive frame synchronisation of one completed LCO observation record.
+
+    Status polling only queues a sync; a db_worker job then lists the record's
+    archive frames one page at a time from next_offset, downloads the missing
+    frames in parallel and queues them for BHTOM2. The cursor is kept here, so a
+    record with hundreds of frames is synced over several short jobs and a failed
+    page is retried where it stopped. See lco_frame_sync.py.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    observation_record = models.OneToOneField(
+        'tom_observations.ObservationRecord', on_delete=models.CASCADE, related_name='lco_frame_sync'
+    )
+    sync_id = models.CharField(max_length=32, blank=True, default='')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    force = models.BooleanField(default=False)
+    next_offset = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    summary = models.JSONField(blank=True, default=dict)
+    error = models.TextField(blank=True, default='')
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'LCO frame sync'
+
+    def __str__(self):
+        return f'LCO frame sync record={self.observation_record_id} status={self.status} offset={self.next_offset}'
+
+
+class TargetCatalogPhotometry(models.Model):
+    """Archival Gaia/2MASS/WISE magnitudes of a target, kept for photometric classification.
+
+    ``photometry`` maps each catalogue that was cross-matched to the matched
+    magnitudes (an empty dict when nothing matched). The batch classifier only
+    queries catalogues missing here, so reclassifying after a model update
+    needs no network. ``ra``/``dec`` are the coordinates that were matched.
+    See photometry_classification/batch.py.
+    """
+    target = models.OneToOneField(
+        'custom_code.BhtomTarget', on_delete=models.CASCADE, related_name='catalog_photometry'
+    )
+    ra = models.FloatField()
+    dec = models.FloatField()
+    photometry = models.JSONField(blank=True, default=dict)
+    model_version = models.CharField(max_length=64, blank=True, default='')
+    phot_class = models.CharField(max_length=50, blank=True, default='')
+    classified_at = models.DateTimeField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'target catalogue photometry'
+        verbose_name_plural = 'target catalogue photometry'
+
+    def __str__(self):
+        return f'Catalogue photometry target={self.target_id} catalogues={",".join(sorted(self.photometry))}'
+
+
+class PeriodicitySearch(models.Model):
+    """A periodogram of a target's photometry for one set of search parameters.
+
+    Rows are unique per target, photometry version (count and newest datum id)
+    and parameter hash, so repeating a search returns ``result`` without
+    recomputing it, and new photometry starts a new row. Searches over large
+    grids run in db_worker and update ``progress`` as they go. See periodicity.py.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    target = models.ForeignKey(
+        'custom_code.BhtomTarget', on_delete=models.CASCADE, related_name='periodicity_searches'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    data_version = models.CharField(max_length=64)
+    parameters_hash = models.CharField(max_length=40)
+    parameters = models.JSONField(blank=True, default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    progress = models.FloatField(default=0.0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'periodicity search'
+        verbose_name_plural = 'periodicity searches'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['target', 'data_version', 'parameters_hash'],
+                name='unique_periodicity_search',
+            ),
+        ]
+
+    def __str__(self):
+        return f'Periodicity search target={self.target_id} method={self.parameters.get("method")} status={self.status}'
+
+
+class SolarSystemQuery(models.Model):
+    """The stored answer of one external solar-system query made by the Pallas pages.
+
+    ``kind`` names the service (MPC observations, JPL Horizons ephemerides or
+    target names, SsODNet lookups) and ``key`` hashes the kind with the query
+    parameters (designation, location, epoch span, quantities). Pages are served
+    from ``payload``; expired rows are refreshed by db_worker, and rows unused
+    for a long time are removed. See solar_system_cache.py.
+    """
+    KIND_MPC_OBSERVATIONS = 'mpc_observations'
+    KIND_HORIZONS_EPHEMERIDES = 'horizons_ephemerides'
+    KIND_HORIZONS_TARGET_NAME = 'horizons_target_name'
+    KIND_SSODNET_CANDIDATES = 'ssodnet_candidates'
+    KIND_SSODNET_OBJECT = 'ssodnet_object'
+    KIND_CHOICES = (
+        (KIND_MPC_OBSERVATIONS, 'MPC observations'),
+        (KIND_HORIZONS_EPHEMERIDES, 'JPL Horizons ephemerides'),
+        (KIND_HORIZONS_TARGET_NAME, 'JPL Horizons target name'),
+        (KIND_SSODNET_CANDIDATES, 'SsODNet candidates'),
+        (KIND_SSODNET_OBJECT, 'SsODNet object'),
+    )
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    key = models.CharField(max_length=64, unique=True)
+    designation = models.CharField(max_length=200, blank=True, default='', db_index=True)
+    parameters = models.JSONField(blank=True, default=dict)
+    payload = models.JSONField(null=True, blank=True)
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    last_used = models.DateTimeField(db_index=True)
+    refresh_queued_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'solar system query'
+        verbose_name_plural = 'solar system queries'
+
+    def __str__(self):
+        return f'Solar system query kind={self.kind} designation={self.designation} expires={self.expires_at}'
+
+
+class NonSiderealEphemeris(models.Model):
+    """Precomputed positions of a non-sidereal target on a fixed time grid.
+
+    ``data`` holds ``samples`` rows of float64 columns (see
+    nonsidereal_ephemeris.COLUMNS) every ``step_days`` from ``start_mjd``:
+    the geocentric equatorial position in AU, heliocentric distance, solar
+    elongation and phase angle. ``elements_hash`` identifies the orbital
+    elements the grid was computed from; readers ignore a grid whose hash no
+    longer matches the target. See nonsidereal_ephemeris.py.
+    """
+    target = models.OneToOneField(
+        'custom_code.BhtomTarget', on_delete=models.CASCADE, related_name='nonsidereal_ephemeris'
+    )
+    elements_hash = models.CharField(max_length=40)
+    start_mjd = models.FloatField()
+    end_mjd = models.FloatField(db_index=True)
+    step_days = models.FloatField()
+    samples = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'non-sidereal ephemeris'
+        verbose_name_plural = 'non-sidereal ephemerides'
+
+    def __str__(self):
+        return f'Non-sidereal ephemeris target={self.target_id} mjd={self.start_mjd:.2f}-{self.end_mjd:.2f}'
@@ -1,5 +1,6 @@
 import math
 
+import numpy as np
 from astroplan import Observer, time_grid_from_range
 from astropy import units
 from astropy.coordinates import SkyCoord, get_sun
@@ -8,7 +9,34 @@ from astropy.time import Time
 from tom_observations import facility
 from tom_targets.models import Target
 
-from custom_code.sun_separation import _resolve_target_coordinates_now
+from custom_code.nonsidereal_ephemeris import load_ephemeris
+from custom_code.sun_separation import _observer_location, _resolve_target_coordinates_now
+
+
+def _airmass_or_none(secz, sun_alt_deg, airmass_limit):
+    if (
+        not math.isfinite(secz) or
+        secz >= airmass_limit or
+        secz <= 1.0 or
+        sun_alt_deg > -18.0
+    ):
+        return None
+    return secz
+
+
+def _grid_airmasses(grid, observer, time_range, latitude, longitude, elevation, airmass_limit):
+    """Airmasses of every time sample from the ephemeris grid, or None if the grid does not cover them all."""
+    location = _observer_location(latitude, longitude, elevation)
+    ra, dec = grid.ra_dec(time_range, observer_location=location)
+    if not (np.all(np.isfinite(ra)) and np.all(np.isfinite(dec))):
+        return None
+    body = SkyCoord(ra=ra * units.deg, dec=dec * units.deg, frame='icrs')
+    secz = np.atleast_1d(np.asarray(observer.altaz(time_range, body).secz, dtype=float))
+    sun_alt = np.atleast_1d(observer.altaz(time_range, get_sun(time_range)).alt.deg)
+    return [
+        _airmass_or_none(float(value), float(sun_alt_deg), airmass_limit)
+        for value, sun_alt_deg in zip(secz, sun_alt)
+    ]
 
 
 def get_non_sidereal_visibility(target, start_time, end_time, interval, airmass_limit, observation_facility=None):
@@ -16,7 +44,9 @@ def get_non_sidereal_visibility(target, start_time, end_time, interval, airmass_
     Calculate site-by-site airmass curves for a non-sidereal target.
 
     This mirrors TOM Toolkit's sidereal visibility planner, but resolves
-    topocentric RA/Dec for each time sample and observing site.
+    topocentric RA/Dec for each time sample and observing site. With a
+    precomputed ephemeris grid covering the time range, every sample of a site
+    is computed at once.
     """
     if target.type != Target.NON_SIDEREAL:
         return {}
@@ -35,6 +65,7 @@ def get_non_sidereal_visibility(target, start_time, end_time, interval, airmass_
     start = Time(start_time)
     end = Time(end_time)
     time_range = time_grid_from_range(time_range=[start, end], time_resolution=interval * units.minute)
+    grid = load_ephemeris(target)
 
     visibility = {}
     for observing_facility in facilities:
@@ -53,6 +84,12 @@ def get_non_sidereal_visibility(target, start_time, end_time, interval, airmass_
                 elevation=float(elevation) * units.m,
             )
 
+            if grid is not None:
+                airmasses = _grid_airmasses(grid, observer, time_range, latitude, longitude, elevation, airmass_limit)
+                if airmasses is not None:
+                    visibility[f'({observing_facility}) {site}'] = (list(time_range.to_datetime()), airmasses)
+                    continue
+
             times = []
             airmasses = []
             for tt in time_range:
@@ -73,17 +110,8 @@ def get_non_sidereal_visibility(target, start_time, end_time, interval, airmass_
                 obj_altaz = observer.altaz(tt, body)
                 sun_alt = observer.altaz(tt, get_sun(tt)).alt
 
-                secz = float(obj_altaz.secz)
-                if (
-                    not math.isfinite(secz) or
-                    secz >= airmass_limit or
-                    secz <= 1.0 or
-                    float(sun_alt.deg) > -18.0
-                ):
-                    secz = None
-
                 times.append(tt.to_datetime())
-                airmasses.append(secz)
+                airmasses.append(_airmass_or_none(float(obj_altaz.secz), float(sun_alt.deg), airmass_limit))
 
             visibility[f'({observing_facility}) {site}'] = (times, airmasses)
 
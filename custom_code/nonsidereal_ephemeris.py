@@ -0,0 +1,309 @@
+"""Precomputed ephemerides of non-sidereal targets.
+
+Propagating orbital elements needs a Kepler solve plus astropy Earth/Sun
+positions for every requested time, which the target list, sky map, sun
+separation refresh and visibility planner used to repeat per target and per
+request. Instead, each non-sidereal target gets a NonSiderealEphemeris row with
+its geocentric position, heliocentric distance, elongation and phase angle on a
+grid of ``NON_SIDEREAL_EPHEMERIS_STEP_MINUTES`` covering
+``NON_SIDEREAL_EPHEMERIS_PAST_DAYS`` before and
+``NON_SIDEREAL_EPHEMERIS_FUTURE_DAYS`` after the time it was computed, and
+readers interpolate linearly between grid points. Observer positions are
+applied to the interpolated geocentric vector, as the direct propagation does.
+
+A target save that changes its orbital elements queues a recomputation, and
+db_worker's periodic pass (``NON_SIDEREAL_EPHEMERIS_REFRESH_INTERVAL_SECONDS``)
+computes missing or outdated grids and extends those running out, reusing the
+samples that are still inside the new window. Readers fall back to the direct
+propagation outside the grid or when the elements changed since it was computed.
+"""
+import hashlib
+import logging
+import math
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import get_body
+from astropy.time import Time
+from django.conf import settings
+from tom_targets.models import Target
+
+from custom_code.models import NonSiderealEphemeris
+from custom_code.sun_separation import (
+    _build_elements_from_target,
+    _ecliptic_to_equatorial_j2000,
+    _heliocentric_ecliptic_xyz,
+    _utc_time_now,
+)
+
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('x_au', 'y_au', 'z_au', 'heliocentric_distance_au', 'elongation_deg', 'phase_angle_deg')
+ORBIT_FIELDS = (
+    'scheme',
+    'eccentricity',
+    'inclination',
+    'arg_of_perihelion',
+    'lng_asc_node',
+    'mean_anomaly',
+    'epoch_of_elements',
+    'semimajor_axis',
+    'mean_daily_motion',
+    'perihdist',
+    'epoch_of_perihelion',
+)
+REFRESH_BATCH_SIZE = 500
+# Grids are extended once fewer than FUTURE_DAYS minus this many days remain ahead.
+EXTEND_MARGIN_DAYS = 1.0
+
+_GRID_CACHE_ATTRIBUTE = '_nonsidereal_ephemeris_grid'
+
+
+def _setting_float(name, default):
+    try:
+        return float(getattr(settings, name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def grid_step_days():
+    return max(1.0, _setting_float('NON_SIDEREAL_EPHEMERIS_STEP_MINUTES', 60)) / 1440.0
+
+
+def grid_window(now_mjd):
+    """The (start MJD, number of samples) of the grid computed at ``now_mjd``, aligned to whole steps."""
+    step = grid_step_days()
+    start_index = math.floor((now_mjd - _setting_float('NON_SIDEREAL_EPHEMERIS_PAST_DAYS', 30)) / step)
+    end_index = math.ceil((now_mjd + _setting_float('NON_SIDEREAL_EPHEMERIS_FUTURE_DAYS', 30)) / step)
+    return start_index * step, end_index - start_index + 1
+
+
+def elements_hash(target):
+    """A digest of the orbital elements of ``target``, or None when they cannot be propagated."""
+    if target.type != Target.NON_SIDEREAL or _build_elements_from_target(target) is None:
+        return None
+    values = [repr(getattr(target, field, None)) for field in ORBIT_FIELDS]
+    return hashlib.sha1('|'.join(values).encode('utf-8')).hexdigest()
+
+
+def _angle_deg(a, b):
+    cosine = np.einsum('ij,ij->i', a, b) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+def compute_samples(target, mjds):
+    """Propagate ``target`` to every MJD in ``mjds``; returns an array of COLUMNS rows (NaN where it fails)."""
+    mjds = np.asarray(mjds, dtype=float)
+    data = np.full((len(mjds), len(COLUMNS)), np.nan)
+    elements = _build_elements_from_target(target)
+    if elements is None or not len(mjds):
+        return data
+
+    times = Time(mjds, format='mjd', scale='utc')
+    helio = np.full((len(mjds), 3), np.nan)
+    for index in range(len(mjds)):
+        xyz = _heliocentric_ecliptic_xyz(elements, times[index])
+        if xyz is not None:
+            helio[index] = _ecliptic_to_equatorial_j2000(*xyz)
+
+    earth_helio = (get_body('earth', times).cartesian - get_body('sun', times).cartesian).xyz.to(u.au).value.T
+    geo = helio - earth_helio
+    data[:, 0:3] = geo
+    data[:, 3] = np.linalg.norm(helio, axis=1)
+    data[:, 4] = _angle_deg(geo, -earth_helio)
+    data[:, 5] = _angle_deg(helio, geo)
+    return data
+
+
+class EphemerisGrid:
+    """Linear interpolation over the samples of one NonSiderealEphemeris row."""
+
+    def __init__(self, start_mjd, step_days, data):
+        self.start_mjd = start_mjd
+        self.step_days = step_days
+        self.data = data
+        self.mjds = start_mjd + step_days * np.arange(len(data))
+
+    @classmethod
+    def from_entry(cls, entry):
+        data = np.frombuffer(bytes(entry.data), dtype='<f8').reshape(entry.samples, len(COLUMNS))
+        return cls(entry.start_mjd, entry.step_days, data)
+
+    def sample(self, mjds):
+        """COLUMNS rows at ``mjds`` (an array), NaN outside the grid."""
+        mjds = np.atleast_1d(np.asarray(mjds, dtype=float))
+        return np.column_stack([
+            np.interp(mjds, self.mjds, self.data[:, column], left=np.nan, right=np.nan)
+            for column in range(len(COLUMNS))
+        ])
+
+    def ra_dec(self, times, observer_location=None):
+        """RA/Dec arrays in degrees at ``times`` (topocentric when ``observer_location`` is set)."""
+        times = times if isinstance(times, Time) else Time(times, scale='utc')
+        rows = self.sample(np.atleast_1d(times.utc.mjd))
+        x, y, z = rows[:, 0], rows[:, 1], rows[:, 2]
+        if observer_location is not None:
+            observer_gcrs, _ = observer_location.get_gcrs_posvel(times)
+            x = x - np.atleast_1d(observer_gcrs.x.to(u.au).value)
+            y = y - np.atleast_1d(observer_gcrs.y.to(u.au).value)
+            z = z - np.atleast_1d(observer_gcrs.z.to(u.au).value)
+        ra = np.degrees(np.arctan2(y, x)) % 360.0
+        dec = np.degrees(np.arctan2(z, np.hypot(x, y)))
+        return ra, dec
+
+
+def load_ephemeris(target):
+    """The EphemerisGrid of ``target``, or None when it has none for its current elements.
+
+    The grid is kept on the target instance, so repeated reads of one target
+    query the database once.
+    """
+    if getattr(target, 'pk', None) is None:
+        return None
+    digest = elements_hash(target)
+    if digest is None:
+        return None
+    cached = target.__dict__.get(_GRID_CACHE_ATTRIBUTE)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+
+    grid = None
+    entry = NonSiderealEphemeris.objects.filter(target_id=target.pk, elements_hash=digest).first()
+    if entry is not None:
+        grid = EphemerisGrid.from_entry(entry)
+    target.__dict__[_GRID_CACHE_ATTRIBUTE] = (digest, grid)
+    return grid
+
+
+def interpolated_ra_dec(target, tt, observer_location=None):
+    """(RA, Dec) of ``target`` at one time from its grid, or None outside the grid."""
+    grid = load_ephemeris(target)
+    if grid is None:
+        return None
+    ra, dec = grid.ra_dec(tt, observer_location=observer_location)
+    if not (np.isfinite(ra[0]) and np.isfinite(dec[0])):
+        return None
+    return float(ra[0]), float(dec[0])
+
+
+def interpolated_elongation(target, tt):
+    """Geocentric solar elongation of ``target`` in degrees from its grid, or None outside the grid."""
+    grid = load_ephemeris(target)
+    if grid is None:
+        return None
+    value = grid.sample(tt.utc.mjd)[0, COLUMNS.index('elongation_deg')]
+    return float(value) if np.isfinite(value) else None
+
+
+def refresh_nonsidereal_ephemeris(target_id, now=None):
+    """Compute (or extend) the grid of one target around ``now``.
+
+    Samples of the stored grid that fall inside the new window are kept when
+    the orbital elements did not change; only the others are propagated.
+    """
+    target = Target.objects.filter(pk=target_id).first()
+    digest = None if target is None else elements_hash(target)
+    if digest is None:
+        NonSiderealEphemeris.objects.filter(target_id=target_id).delete()
+        return {'status': 'skipped'}
+
+    now = now or _utc_time_now()
+    step = grid_step_days()
+    start_mjd, samples = grid_window(now.utc.mjd)
+    data = np.full((samples, len(COLUMNS)), np.nan)
+    missing = np.ones(samples, dtype=bool)
+
+    entry = NonSiderealEphemeris.objects.filter(target_id=target_id).first()
+    if entry is not None and entry.elements_hash == digest and math.isclose(entry.step_days, step):
+        stored = EphemerisGrid.from_entry(entry).data
+        offset = int(round((entry.start_mjd - start_mjd) / step))
+        low, high = max(0, offset), min(samples, offset + len(stored))
+        if high > low:
+            data[low:high] = stored[low - offset:high - offset]
+            missing[low:high] = False
+
+    mjds = start_mjd + step * np.arange(samples)
+    data[missing] = compute_samples(target, mjds[missing])
+    NonSiderealEphemeris.objects.update_or_create(
+        target_id=target_id,
+        defaults={
+            'elements_hash': digest,
+            'start_mjd': float(start_mjd),
+            'end_mjd': float(mjds[-1]),
+            'step_days': step,
+            'samples': samples,
+            'data': data.astype('<f8').tobytes(),
+        },
+    )
+    return {'status': 'computed', 'samples': samples, 'computed': int(missing.sum()), 'reused': int(samples - missing.sum())}
+
+
+def ephemeris_is_current(target):
+    """Whether ``target`` has a grid for its current orbital elements (False when it cannot have one)."""
+    digest = elements_hash(target)
+    return digest is not None and NonSiderealEphemeris.objects.filter(target_id=target.pk, elements_hash=digest).exists()
+
+
+def _pending_refresh_target_ids(target_ids=None):
+    """Ids of the targets with a grid computation that is queued or running."""
+    from django_tasks import ResultStatus
+    from django_tasks.backends.database.models import DBTaskResult
+    from custom_code.tasks import refresh_nonsidereal_ephemeris_task
+
+    pending = DBTaskResult.objects.filter(
+        task_path=refresh_nonsidereal_ephemeris_task.module_path,
+        status__in=[ResultStatus.NEW, ResultStatus.RUNNING],
+    ).values_list('args_kwargs', flat=True)
+    queued = {(args_kwargs.get('args') or [None])[0] for args_kwargs in pending}
+    return queued if target_ids is None else queued & set(target_ids)
+
+
+def enqueue_nonsidereal_ephemeris_refresh(target):
+    """Queue a grid computation for ``target`` if it lacks one for its current elements; returns whether one was queued."""
+    from custom_code.tasks import refresh_nonsidereal_ephemeris_task
+
+    if target.type != Target.NON_SIDEREAL or ephemeris_is_current(target):
+        return False
+    if elements_hash(target) is None and not NonSiderealEphemeris.objects.filter(target_id=target.pk).exists():
+        return False
+    if _pending_refresh_target_ids([target.pk]):
+        return False
+    refresh_nonsidereal_ephemeris_task.enqueue(target.pk)
+    return True
+
+
+def due_nonsidereal_ephemeris_targets(now=None):
+    """Ids of non-sidereal targets whose grid is missing, outdated or about to run out."""
+    now = now or _utc_time_now()
+    extend_before = now.utc.mjd + _setting_float('NON_SIDEREAL_EPHEMERIS_FUTURE_DAYS', 30) - EXTEND_MARGIN_DAYS
+    stored = {
+        target_id: (digest, end_mjd)
+        for target_id, digest, end_mjd in NonSiderealEphemeris.objects.values_list('target_id', 'elements_hash', 'end_mjd')
+    }
+    due = []
+    targets = Target.objects.filter(type=Target.NON_SIDEREAL).only('pk', 'type', *ORBIT_FIELDS).order_by('pk')
+    for target in targets.iterator():
+        digest = elements_hash(target)
+        if digest is None:
+            continue
+        stored_digest, end_mjd = stored.get(target.pk, (None, None))
+        if stored_digest != digest or end_mjd < extend_before:
+            due.append(target.pk)
+    return due
+
+
+def enqueue_due_nonsidereal_ephemerides(now=None, limit=REFRESH_BATCH_SIZE):
+    """Queue grid computations for the targets returned by due_nonsidereal_ephemeris_targets().
+
+    Targets whose computation is still queued or running are skipped, so a slow
+    worker does not collect duplicate refreshes.
+    """
+    from custom_code.tasks import refresh_nonsidereal_ephemeris_task
+
+    due = due_nonsidereal_ephemeris_targets(now=now)
+    pending = _pending_refresh_target_ids(due)
+    queue = [target_id for target_id in due if target_id not in pending][:limit]
+    for target_id in queue:
+        refresh_nonsidereal_ephemeris_task.enqueue(target_id)
+    return {'due': len(due), 'pending': len(pending), 'enqueued': len(queue)}
@@ -0,0 +1,143 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from tom_common.hooks import run_hook
+from tom_observations.facility import BaseRoboticObservationFacility
+from tom_observations.models import ObservationRecord
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_FIELDS = ('status', 'scheduled_start', 'scheduled_end')
+
+
+def _lookup_workers():
+    return max(1, int(getattr(settings, 'OBSERVATION_STATUS_LOOKUP_WORKERS', 8)))
+
+
+def _to_status_values(status):
+    scheduled_start = ObservationRecord._meta.get_field('scheduled_start').to_python(status.get('scheduled_start'))
+    scheduled_end = ObservationRecord._meta.get_field('scheduled_end').to_python(status.get('scheduled_end'))
+    return status['state'], scheduled_start, scheduled_end
+
+
+def _call_closing_connection(func, *args):
+    try:
+        return func(*args)
+    finally:
+        # Lookups may touch the ORM from a pool thread; do not leak its connection.
+        connection.close()
+
+
+def fetch_statuses_concurrently(lookup, keys):
+    """Run ``lookup(key)`` for every key on a small thread pool.
+
+    Returns ``(results, errors)`` dicts keyed like ``keys``; one failing lookup
+    does not affect the others.
+    """
+    results = {}
+    errors = {}
+    keys = list(keys)
+    if not keys:
+        return results, errors
+    with ThreadPoolExecutor(max_workers=min(_lookup_workers(), len(keys))) as executor:
+        futures = {key: executor.submit(_call_closing_connection, lookup, key) for key in keys}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as exc:
+                errors[key] = exc
+    return results, errors
+
+
+def apply_observation_statuses(records_with_status):
+    """Write ``(record, status)`` pairs with one bulk update.
+
+    Only records whose status or schedule changed are written. The
+    observation_change_state hook that ObservationRecord.save() would run is
+    called for every record whose state changed. Returns the changed records.
+    """
+    changed = []
+    state_changes = []
+    now = timezone.now()
+    for record, status in records_with_status:
+        state, scheduled_start, scheduled_end = _to_status_values(status)
+        if (record.status, record.scheduled_start, record.scheduled_end) == (state, scheduled_start, scheduled_end):
+            continue
+        if record.status != state:
+            state_changes.append((record, record.status))
+        record.status = state
+        record.scheduled_start = scheduled_start
+        record.scheduled_end = scheduled_end
+        record.modified = now
+        changed.append(record)
+
+    if changed:
+        ObservationRecord.objects.bulk_update(changed, list(STATUS_FIELDS) + ['modified'], batch_size=500)
+    for record, previous_status in state_changes:
+        run_hook('observation_change_state', record, previous_status)
+    return changed
+
+
+def _uses_stock_status_update(instance):
+    return (
+        getattr(type(instance), 'update_observation_status', None)
+        is BaseRoboticObservationFacility.update_observation_status
+    )
+
+
+def update_facility_observation_statuses(instance, target=None):
+    """Refresh every open observation of a facility and return its failed records.
+
+    Facilities that keep the stock per-observation update get one lookup per
+    distinct observation id, run concurrently, or a single call to
+    ``get_observation_statuses(observation_ids)`` when the facility API supports
+    multi-id queries. Facilities with their own update logic keep using
+    ``update_all_observation_statuses``.
+    """
+    if not _uses_stock_status_update(instance):
+        return instance.update_all_observation_statuses(target=target)
+
+    records = ObservationRecord.objects.filter(facility=instance.name)
+    if target:
+        records = records.filter(target=target)
+    records = list(records.exclude(status__in=instance.get_terminal_observing_states()))
+    records_by_observation = {}
+    for record in records:
+        records_by_observation.setdefault(record.observation_id, []).append(record)
+
+    failed_records = []
+    batch_lookup = getattr(instance, 'get_observation_statuses', None)
+    if callable(batch_lookup):
+        try:
+            statuses = batch_lookup(list(records_by_observation)) or {}
+            errors = {}
+        except Exception as exc:
+            statuses = {}
+            errors = {observation_id: exc for observation_id in records_by_observation}
+        for observation_id in records_by_observation:
+            if observation_id not in statuses and observation_id not in errors:
+                errors[observation_id] = Exception('No status returned for that observation id')
+    else:
+        statuses, errors = fetch_statuses_concurrently(instance.get_observation_status, records_by_observation)
+
+    for observation_id, exc in errors.items():
+        failed_records.extend((record.observation_id, str(exc)) for record in records_by_observation[observation_id])
+
+    changed = apply_observation_statuses(
+        (record, statuses[observation_id])
+        for observation_id in statuses
+        for record in records_by_observation.get(observation_id, [])
+    )
+    logger.info(
+        'Observation statuses for facility "%s": open_records=%s lookups=%s changed=%s failed=%s.',
+        instance.name,
+        len(records),
+        len(records_by_observation),
+        len(changed),
+        len(failed_records),
+    )
+    return failed_records
@@ -0,0 +1,527 @@
+"""Periodicity searches on target photometry.
+
+Light curves are read from ReducedDatum as NumPy arrays in one query, with
+the timestamps converted to MJD in one step, and searched with (multi-band)
+Lomb-Scargle, phase dispersion minimisation or box least squares over a
+configurable frequency grid. Every search is a PeriodicitySearch row keyed by
+target, photometry version and parameters, so repeating a search returns the
+stored periodogram. Searches whose grid times points exceed
+PERIODICITY_SYNC_MAX_WORK run in db_worker and report their progress on the row.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from astropy.timeseries import BoxLeastSquares, LombScargle, LombScargleMultiband
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from tom_dataproducts.models import ReducedDatum
+
+from custom_code.models import PeriodicitySearch
+
+
+logger = logging.getLogger(__name__)
+
+METHOD_LOMB_SCARGLE = 'lomb_scargle'
+METHOD_PDM = 'pdm'
+METHOD_BLS = 'bls'
+METHODS = (METHOD_LOMB_SCARGLE, METHOD_PDM, METHOD_BLS)
+METHOD_CHOICES = (
+    (METHOD_LOMB_SCARGLE, 'Lomb-Scargle'),
+    (METHOD_PDM, 'Phase dispersion minimisation'),
+    (METHOD_BLS, 'Box least squares'),
+)
+POWER_LABELS = {
+    METHOD_LOMB_SCARGLE: 'LSP Power',
+    METHOD_PDM: '1 - PDM theta',
+    METHOD_BLS: 'BLS log-likelihood',
+}
+# Relative cost per point and frequency, used to decide whether a search runs in db_worker.
+METHOD_WORK = {METHOD_LOMB_SCARGLE: 1, METHOD_PDM: 20, METHOD_BLS: 2}
+
+DEFAULT_BLS_DURATIONS = (0.02, 0.05, 0.1, 0.2)
+MIN_POINTS = 5
+# Periodograms are returned with at most this many periods.
+MAX_RESULT_POINTS = 15000
+# Grid chunks bound the memory of the PDM phase matrix and set the progress granularity.
+CHUNK_ELEMENTS = 2000000
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+MJD_UNIX_EPOCH = 40587.0
+
+ACTIVE_STATUSES = (PeriodicitySearch.STATUS_QUEUED, PeriodicitySearch.STATUS_RUNNING)
+
+LightCurve = namedtuple('LightCurve', ['mjd', 'mag', 'err', 'band', 'telescope'])
+
+
+def _setting(name, default):
+    try:
+        return type(default)(getattr(settings, name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def photometry_queryset(target, user=None):
+    """The photometry of ``target`` that ``user`` may see."""
+    try:
+        photometry_type = settings.DATA_PRODUCT_TYPES['photometry'][0]
+    except (AttributeError, KeyError):
+        photometry_type = 'photometry'
+    datums = ReducedDatum.objects.filter(target=target, data_type=photometry_type)
+    if settings.TARGET_PERMISSIONS_ONLY or user is None:
+        return datums
+    from guardian.shortcuts import get_objects_for_user
+    return get_objects_for_user(user, 'tom_dataproducts.view_reduceddatum', klass=datums)
+
+
+def photometry_version(datums):
+    """Count and newest id of ``datums``; changes whenever photometry is added or removed."""
+    summary = datums.aggregate(count=Count('id'), newest=Max('id'))
+    return f'{summary["count"]}:{summary["newest"] or 0}'
+
+
+def load_light_curve(datums):
+    """Magnitudes of ``datums`` as time-ordered arrays; upper limits and unparsable values are skipped."""
+    timestamps, mags, errs, bands, telescopes = [], [], [], [], []
+    rows = datums.order_by('timestamp').values_list('timestamp', 'value', 'source_name')
+    for timestamp, value, source_name in rows.iterator():
+        if not isinstance(value, dict) or value.get('magnitude') is None:
+            continue
+        err = value.get('error') or value.get('magnitude_error')
+        try:
+            mag = float(value['magnitude'])
+            err = float(err) if err is not None else np.nan
+        except (TypeError, ValueError):
+            continue
+        timestamps.append(timestamp.timestamp())
+        mags.append(mag)
+        errs.append(err)
+        bands.append(str(value.get('filter') or 'Unknown').strip() or 'Unknown')
+        telescopes.append(
+            str(value.get('telescope') or value.get('facility') or source_name or 'Unknown').strip() or 'Unknown'
+        )
+    return LightCurve(
+        np.asarray(timestamps, dtype=float) / 86400.0 + MJD_UNIX_EPOCH,
+        np.asarray(mags, dtype=float),
+        np.asarray(errs, dtype=float),
+        np.asarray(bands, dtype=str),
+        np.asarray(telescopes, dtype=str),
+    )
+
+
+def light_curve_series(light_curve):
+    """``{filter: {telescope: {'mjd': [...], 'mag': [...], 'err': [...]}}}`` for the periodicity page."""
+    series = {}
+    for band in np.unique(light_curve.band):
+        in_band = light_curve.band == band
+        for telescope in np.unique(light_curve.telescope[in_band]):
+            selected = in_band & (light_curve.telescope == telescope)
+            errs = np.round(light_curve.err[selected], 4)
+            series.setdefault(str(band), {})[str(telescope)] = {
+                'mjd': np.round(light_curve.mjd[selected], 6).tolist(),
+                'mag': np.round(light_curve.mag[selected], 4).tolist(),
+                'err': [None if np.isnan(err) else float(err) for err in errs],
+            }
+    return series
+
+
+def _float_or_none(value):
+    if value in (None, ''):
+        return None
+    value = float(value)
+    if not np.isfinite(value):
+        raise ValueError(f'{value} is not a finite number')
+    return value
+
+
+def search_parameters(data):
+    """Validated, canonical search parameters from a request body; raises ValueError."""
+    method = str(data.get('method') or METHOD_LOMB_SCARGLE)
+    if method not in METHODS:
+        raise ValueError(f'Unknown method {method!r}; expected one of {", ".join(METHODS)}')
+    min_period = max(_float_or_none(data.get('min_period')) or 0.1, 1e-4)
+    max_period = _float_or_none(data.get('max_period')) or 1000.0
+    if min_period >= max_period:
+        raise ValueError('min_period must be less than max_period')
+    samples_per_peak = int(data.get('samples_per_peak') or 5)
+    if not 1 <= samples_per_peak <= 100:
+        raise ValueError('samples_per_peak must be between 1 and 100')
+
+    parameters = {
+        'method': method,
+        'filters': sorted({str(name) for name in data.get('filters') or []}),
+        'telescopes': sorted({str(name) for name in data.get('telescopes') or []}),
+        'mjd_min': _float_or_none(data.get('mjd_min')),
+        'mjd_max': _float_or_none(data.get('mjd_max')),
+        'min_period': min_period,
+        'max_period': max_period,
+        'samples_per_peak': samples_per_peak,
+    }
+    if method == METHOD_PDM:
+        parameters['pdm_bins'] = int(data.get('pdm_bins') or 10)
+        if not 2 <= parameters['pdm_bins'] <= 100:
+            raise ValueError('pdm_bins must be between 2 and 100')
+    if method == METHOD_BLS:
+        durations = sorted({float(duration) for duration in data.get('bls_durations') or DEFAULT_BLS_DURATIONS})
+        durations = [duration for duration in durations if 0 < duration < min_period]
+        if not durations:
+            raise ValueError('BLS needs at least one transit duration shorter than min_period')
+        parameters['bls_durations'] = durations
+    return parameters
+
+
+def parameters_hash(parameters):
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def select_points(light_curve, parameters):
+    """The points of ``light_curve`` in the filters, telescopes and MJD range of ``parameters`` (empty = all)."""
+    selected = np.ones(len(light_curve.mjd), dtype=bool)
+    if parameters.get('filters'):
+        selected &= np.isin(light_curve.band, parameters['filters'])
+    if parameters.get('telescopes'):
+        selected &= np.isin(light_curve.telescope, parameters['telescopes'])
+    if parameters.get('mjd_min') is not None:
+        selected &= light_curve.mjd >= parameters['mjd_min']
+    if parameters.get('mjd_max') is not None:
+        selected &= light_curve.mjd <= parameters['mjd_max']
+    return LightCurve(*(array[selected] for array in light_curve))
+
+
+def frequency_grid(light_curve, parameters):
+    """Evenly spaced frequencies (1/d) between 1/max_period and 1/min_period.
+
+    The spacing is 1 / (samples_per_peak * baseline); periods longer than twice
+    the baseline are not searched. Raises ValueError when the grid would exceed
+    PERIODICITY_MAX_FREQUENCIES.
+    """
+    baseline = float(light_curve.mjd.max() - light_curve.mjd.min()) if len(light_curve.mjd) else 0.0
+    min_period = parameters['min_period']
+    max_period = parameters['max_period']
+    if baseline > 0:
+        max_period = min(max_period, 2.0 * baseline)
+    max_period = max(max_period, min_period * 2)
+    minimum_frequency, maximum_frequency = 1.0 / max_period, 1.0 / min_period
+    step = 1.0 / (parameters['samples_per_peak'] * (baseline or max_period))
+    count = int(np.ceil((maximum_frequency - minimum_frequency) / step)) + 1
+    limit = _setting('PERIODICITY_MAX_FREQUENCIES', 500000)
+    if count > limit:
+        raise ValueError(
+            f'The search needs {count} frequencies (limit {limit}); raise min_period, lower max_period or samples_per_peak'
+        )
+    return minimum_frequency + step * np.arange(count)
+
+
+def estimated_work(light_curve, frequencies, parameters):
+    work = len(light_curve.mjd) * len(frequencies) * METHOD_WORK[parameters['method']]
+    return work * len(parameters.get('bls_durations') or [1])
+
+
+def _band_normalised(light_curve):
+    """Magnitudes with the median of each band subtracted, so several bands can be searched together."""
+    mag = light_curve.mag.copy()
+    for band in np.unique(light_curve.band):
+        in_band = light_curve.band == band
+        mag[in_band] -= np.median(mag[in_band])
+    return mag
+
+
+def _errors_or_none(light_curve):
+    err = light_curve.err
+    return err if len(err) and np.all(np.isfinite(err)) and np.all(err > 0) else None
+
+
+def _chunks(frequencies, points):
+    size = max(1, CHUNK_ELEMENTS // max(1, points))
+    for start in range(0, len(frequencies), size):
+        yield start, frequencies[start:start + size]
+
+
+def _lomb_scargle_power(light_curve, frequencies, progress):
+    err = _errors_or_none(light_curve)
+    if len(np.unique(light_curve.band)) > 1:
+        model = LombScargleMultiband(light_curve.mjd, light_curve.mag, light_curve.band, err)
+        power_of = lambda chunk: model.power(chunk, method='fast')  # noqa: E731
+    else:
+        model = LombScargle(light_curve.mjd, light_curve.mag, err)
+        power_of = lambda chunk: model.power(chunk, method='fast', assume_regular_frequency=True)  # noqa: E731
+    power = np.empty(len(frequencies))
+    for start, chunk in _chunks(frequencies, len(light_curve.mjd)):
+        power[start:start + len(chunk)] = power_of(chunk)
+        progress((start + len(chunk)) / len(frequencies))
+    return model, power
+
+
+def _pdm_power(light_curve, frequencies, bins, progress):
+    """1 - theta of Stellingwerf's phase dispersion minimisation, so that the best period is the maximum."""
+    times = light_curve.mjd - light_curve.mjd.min()
+    mag = _band_normalised(light_curve)
+    points = len(mag)
+    variance = mag.var(ddof=1)
+    if variance <= 0:
+        return np.zeros(len(frequencies))
+    power = np.empty(len(frequencies))
+    for start, chunk in _chunks(frequencies, points):
+        phase = np.outer(chunk, times) % 1.0
+        index = np.minimum((phase * bins).astype(np.int64), bins - 1)
+        index += (np.arange(len(chunk)) * bins)[:, None]
+        index = index.ravel()
+        size = len(chunk) * bins
+        counts = np.bincount(index, minlength=size).reshape(len(chunk), bins)
+        sums = np.bincount(index, weights=np.tile(mag, len(chunk)), minlength=size).reshape(len(chunk), bins)
+        squares = np.bincount(index, weights=np.tile(mag * mag, len(chunk)), minlength=size).reshape(len(chunk), bins)
+        within = (squares - sums * sums / np.maximum(counts, 1)).sum(axis=1)
+        degrees = points - (counts > 0).sum(axis=1)
+        power[start:start + len(chunk)] = 1.0 - within / np.maximum(degrees, 1) / variance
+        progress((start + len(chunk)) / len(frequencies))
+    return power
+
+
+def _bls_power(light_curve, frequencies, durations, progress):
+    # BLS looks for dips in flux, i.e. rises in magnitude.
+    model = BoxLeastSquares(light_curve.mjd, -_band_normalised(light_curve), _errors_or_none(light_curve))
+    power = np.empty(len(frequencies))
+    best = None
+    for start, chunk in _chunks(frequencies, len(light_curve.mjd) * len(durations)):
+        result = model.power(1.0 / chunk, durations, objective='likelihood')
+        power[start:start + len(chunk)] = result.power
+        index = int(np.argmax(result.power))
+        if best is None or result.power[index] > best[0]:
+            best = (
+                float(result.power[index]),
+                {
+                    'duration': float(result.duration[index]),
+                    'depth': float(result.depth[index]),
+                    'transit_time': float(result.transit_time[index]),
+                },
+            )
+        progress((start + len(chunk)) / len(frequencies))
+    return power, best[1] if best else None
+
+
+def fit_sinusoid(light_curve, period):
+    """Least-squares sinusoid with one offset per band at a fixed period.
+
+    Returns the amplitude, phase and offset (of the best-sampled band) of
+    ``offset + amplitude * sin(2 pi t / period + phase)`` with ``t`` in MJD.
+    """
+    times = light_curve.mjd - light_curve.mjd.min()
+    angular = 2.0 * np.pi / period
+    bands, band_index = np.unique(light_curve.band, return_inverse=True)
+    design = np.column_stack([np.sin(angular * times), np.cos(angular * times), np.eye(len(bands))[band_index]])
+    err = _errors_or_none(light_curve)
+    weights = 1.0 / err if err is not None else np.ones(len(times))
+    coefficients, *_ = np.linalg.lstsq(design * weights[:, None], light_curve.mag * weights, rcond=None)
+    sine, cosine, offsets = coefficients[0], coefficients[1], coefficients[2:]
+    main_band = int(np.argmax(np.bincount(band_index)))
+    # Shift the phase from t - t_min to absolute MJD.
+    phase = float((np.arctan2(cosine, sine) - angular * light_curve.mjd.min()) % (2.0 * np.pi))
+    amplitude = float(np.hypot(sine, cosine))
+    offset = float(offsets[main_band])
+    times_fine = np.linspace(light_curve.mjd[0], light_curve.mjd[-1], 600)
+    return {
+        'times_fine': times_fine.tolist(),
+        'mags_fine': (offset + amplitude * np.sin(angular * times_fine + phase)).tolist(),
+        'amplitude': amplitude,
+        'phase': phase,
+        'offset': offset,
+        'band_offsets': {str(band): float(value) for band, value in zip(bands, offsets)},
+    }
+
+
+def compute_periodogram(light_curve, parameters, progress=None, frequencies=None):
+    """Periodogram, best period, false alarm levels and sinusoid fit of the selected points."""
+    if len(light_curve.mjd) < MIN_POINTS:
+        raise ValueError(f'Need at least {MIN_POINTS} data points (got {len(light_curve.mjd)})')
+    if frequencies is None:
+        frequencies = frequency_grid(light_curve, parameters)
+    progress = progress or (lambda fraction: None)
+    method = parameters['method']
+
+    fap_levels = [None, None, None]
+    extra = {}
+    if method == METHOD_LOMB_SCARGLE:
+        model, power = _lomb_scargle_power(light_curve, frequencies, progress)
+        if not isinstance(model, LombScargleMultiband):
+            try:
+                fap_levels = [float(level) for level in model.false_alarm_level([0.1, 0.01, 0.001])]
+            except Exception as exc:
+                logger.info('False alarm levels not available: %s', exc)
+    elif method == METHOD_PDM:
+        power = _pdm_power(light_curve, frequencies, parameters['pdm_bins'], progress)
+    else:
+        power, extra['bls'] = _bls_power(light_curve, frequencies, parameters['bls_durations'], progress)
+
+    best_period = float(1.0 / frequencies[int(np.argmax(power))])
+    periods = 1.0 / frequencies
+    if len(periods) > MAX_RESULT_POINTS:
+        step = len(periods) // MAX_RESULT_POINTS
+        periods, power = periods[::step], power[::step]
+
+    fit = None
+    try:
+        fit = fit_sinusoid(light_curve, best_period)
+    except (ValueError, np.linalg.LinAlgError) as exc:
+        logger.warning('Sinusoidal fit failed for period %s: %s', best_period, exc)
+
+    return {
+        'method': method,
+        'power_label': POWER_LABELS[method],
+        'n_points': int(len(light_curve.mjd)),
+        'n_frequencies': int(len(frequencies)),
+        'bands': sorted(str(band) for band in np.unique(light_curve.band)),
+        'periods': periods.tolist(),
+        'powers': np.nan_to_num(power).tolist(),
+        'best_period': best_period,
+        'fap_10': fap_levels[0],
+        'fap_1': fap_levels[1],
+        'fap_01': fap_levels[2],
+        'fit': fit,
+        **extra,
+    }
+
+
+def search_payload(search):
+    payload = {
+        'search_id': search.pk,
+        'status': search.status,
+        'progress': round(search.progress, 3),
+        'error': search.error,
+    }
+    if search.status == PeriodicitySearch.STATUS_DONE:
+        payload.update(search.result or {})
+    return payload
+
+
+def _search_is_stale(search):
+    stale_after = timedelta(seconds=max(60, _setting('PERIODICITY_STALE_SECONDS', 3600)))
+    return search.modified is None or search.modified < timezone.now() - stale_after
+
+
+def start_periodicity_search(target, parameters, *, user=None, background=None):
+    """The PeriodicitySearch for ``parameters`` over the current photometry of ``target``.
+
+    A finished, queued or running search is returned as it is. Otherwise the
+    search is computed right away, or queued for db_worker when ``background``
+    is set or, by default, when its work exceeds PERIODICITY_SYNC_MAX_WORK.
+    Invalid parameters or too few points raise ValueError.
+    """
+    from custom_code.tasks import periodicity_search_task
+
+    datums = photometry_queryset(target, user)
+    lookup = {'target': target, 'data_version': photometry_version(datums), 'parameters_hash': parameters_hash(parameters)}
+    search = PeriodicitySearch.objects.filter(**lookup).first()
+    if search is not None and (
+        search.status == PeriodicitySearch.STATUS_DONE
+        or (search.status in ACTIVE_STATUSES and not _search_is_stale(search))
+    ):
+        return search
+
+    light_curve = select_points(load_light_curve(datums), parameters)
+    if len(light_curve.mjd) < MIN_POINTS:
+        raise ValueError(f'Need at least {MIN_POINTS} data points (got {len(light_curve.mjd)})')
+    frequencies = frequency_grid(light_curve, parameters)
+    if background is None:
+        background = estimated_work(light_curve, frequencies, parameters) > _setting('PERIODICITY_SYNC_MAX_WORK', 1000000000)
+
+    try:
+        with transaction.atomic():
+            search, _created = PeriodicitySearch.objects.update_or_create(
+                **lookup,
+                defaults={
+                    'user': user if getattr(user, 'pk', None) else None,
+                    'parameters': parameters,
+                    'status': PeriodicitySearch.STATUS_QUEUED,
+                    'progress': 0.0,
+                    'result': None,
+                    'error': '',
+                },
+            )
+            if background:
+                periodicity_search_task.enqueue(search.pk)
+    except IntegrityError:
+        # Another request created the same search; return that one.
+        return PeriodicitySearch.objects.get(**lookup)
+    if background:
+        return search
+    return _run_search(search, light_curve, frequencies)
+
+
+def _progress_reporter(search_id):
+    last_update = [0.0]
+
+    def report(fraction):
+        now = time.monotonic()
+        if now - last_update[0] >= PROGRESS_INTERVAL_SECONDS:
+            last_update[0] = now
+            PeriodicitySearch.objects.filter(pk=search_id).update(progress=min(fraction, 1.0), modified=timezone.now())
+
+    return report
+
+
+def _run_search(search, light_curve, frequencies=None):
+    started = time.monotonic()
+    PeriodicitySearch.objects.filter(pk=search.pk).update(status=PeriodicitySearch.STATUS_RUNNING, modified=timezone.now())
+    try:
+        result = compute_periodogram(light_curve, search.parameters, _progress_reporter(search.pk), frequencies)
+    except Exception as exc:
+        if not isinstance(exc, ValueError):
+            logger.exception('Periodicity search %s for target %s failed', search.pk, search.target_id)
+        search.status = PeriodicitySearch.STATUS_FAILED
+        search.error = str(exc)
+        search.save(update_fields=['status', 'error', 'modified'])
+        return search
+    search.status = PeriodicitySearch.STATUS_DONE
+    search.progress = 1.0
+    search.result = result
+    search.save(update_fields=['status', 'progress', 'result', 'modified'])
+    logger.info(
+        'Periodicity search %s for target %s finished: method=%s points=%s frequencies=%s best_period=%.6f in %.1fs',
+        search.pk,
+        search.target_id,
+        result['method'],
+        result['n_points'],
+        result['n_frequencies'],
+        result['best_period'],
+        time.monotonic() - started,
+    )
+    return search
+
+
+def run_periodicity_search(search_id):
+    """Compute a queued PeriodicitySearch (db_worker entry point)."""
+    with transaction.atomic():
+        search = (
+            PeriodicitySearch.objects.select_for_update()
+            .select_related('target', 'user')
+            .filter(pk=search_id, status__in=ACTIVE_STATUSES)
+            .first()
+        )
+        if search is None:
+            return {'search_id': search_id, 'status': 'skipped'}
+        search.status = PeriodicitySearch.STATUS_RUNNING
+        search.save(update_fields=['status', 'modified'])
+    light_curve = select_points(load_light_curve(photometry_queryset(search.target, search.user)), search.parameters)
+    search = _run_search(search, light_curve)
+    return {'search_id': search.pk, 'status': search.status}
+
+
+def run_group_periodicity(targets, parameters, *, background=False):
+    """Start the same search for every target in ``targets``; returns counts per search status."""
+    summary = {'targets': 0, 'skipped': 0}
+    for target in targets:
+        summary['targets'] += 1
+        try:
+            search = start_periodicity_search(target, parameters, background=background)
+        except ValueError as exc:
+            logger.info('Skipping periodicity search of target %s: %s', target.pk, exc)
+            summary['skipped'] += 1
+            continue
+        summary[search.status] = summary.get(search.status, 0) + 1
+    return summary
@@ -0,0 +1,302 @@
+"""Photometric classification of many targets at once.
+
+The per-target path (service.classify_target_coordinates) runs three cone
+searches per target. Here the targets are cross-matched against each
+catalogue in one upload query per chunk of targets, the colours of all
+targets are built as one DataFrame and each RandomForest predicts once per
+chunk. The matched magnitudes are kept in TargetCatalogPhotometry, so a
+model update only needs the cached photometry.
+"""
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import astropy.units as u
+import numpy as np
+import pandas as pd
+from astropy.table import Table
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from tom_targets.models import Target
+
+from custom_code.models import TargetCatalogPhotometry
+from .calculate_colors import colors_df, ALLWISE_COLORS, GAIA_COLORS, TWOMASS_COLORS
+from .catalog_query import (
+    ALLWISE_photometry_columns,
+    ALLWISE_photometry_columns_mapping,
+    GAIA_photometry_columns,
+    GAIA_photometry_columns_mapping,
+    TWOMASS_photometry_columns,
+    TWOMASS_photometry_columns_mapping,
+)
+from .classification_source import ClassificationSource
+from .classifier import CLASSIFIER_LABELS, Classifier
+from .service import get_classifier
+from .tree_model import tree_model_version
+
+
+logger = logging.getLogger(__name__)
+
+GAIA_CATALOG: str = 'gaia'
+TWOMASS_CATALOG: str = '2mass'
+ALLWISE_CATALOG: str = 'wise'
+CATALOGS: List[str] = [GAIA_CATALOG, TWOMASS_CATALOG, ALLWISE_CATALOG]
+
+# Same match radius as the per-target cone searches.
+MATCH_RADIUS: u.Quantity = u.Quantity(0.001, u.deg)
+
+# A target that moved by more than this is matched again.
+COORDINATE_TOLERANCE_DEG: float = 1e-6
+
+XMATCH_CATALOGS: Dict[str, str] = {
+    TWOMASS_CATALOG: 'vizier:II/246/out',
+    ALLWISE_CATALOG: 'vizier:II/328/allwise',
+}
+
+CATALOG_COLUMNS: Dict[str, Dict[str, str]] = {
+    GAIA_CATALOG: {column: GAIA_photometry_columns_mapping[column] for column in GAIA_photometry_columns},
+    TWOMASS_CATALOG: {column: TWOMASS_photometry_columns_mapping[column] for column in TWOMASS_photometry_columns},
+    ALLWISE_CATALOG: {column: ALLWISE_photometry_columns_mapping[column] for column in ALLWISE_photometry_columns},
+}
+
+GAIA_UPLOAD_QUERY: str = (
+    "SELECT t.target_id, g.phot_g_mean_mag, g.phot_rp_mean_mag, g.phot_bp_mean_mag, "
+    "DISTANCE(POINT('ICRS', t.ra, t.dec), POINT('ICRS', g.ra, g.dec)) AS dist "
+    "FROM tap_upload.targets AS t JOIN gaiaedr3.gaia_source AS g "
+    "ON 1 = CONTAINS(POINT('ICRS', g.ra, g.dec), CIRCLE('ICRS', t.ra, t.dec, {radius}))"
+)
+
+# Which model classifies a target, from the richest set of magnitudes it has.
+FEATURE_SOURCES: List[tuple] = [
+    (ClassificationSource.WISE, GAIA_COLORS + TWOMASS_COLORS + ALLWISE_COLORS),
+    (ClassificationSource.TWO_MASS, GAIA_COLORS + TWOMASS_COLORS),
+    (ClassificationSource.GAIA, GAIA_COLORS),
+]
+
+
+def _positions_table(positions: pd.DataFrame) -> Table:
+    return Table({
+        'target_id': positions['target_id'].astype(np.int64).to_numpy(),
+        'ra': positions['ra'].astype(float).to_numpy(),
+        'dec': positions['dec'].astype(float).to_numpy(),
+    })
+
+
+def _nearest_matches(matches: pd.DataFrame, distance_column: str, catalog: str) -> Dict[int, Dict[str, float]]:
+    """``{target id: magnitudes}`` from the nearest match with complete photometry of each target."""
+    columns = CATALOG_COLUMNS[catalog]
+    if matches.empty:
+        return {}
+    matches = matches.dropna(subset=list(columns)).sort_values(distance_column, kind='stable')
+    nearest = matches.drop_duplicates('target_id', keep='first')
+    return {
+        int(row['target_id']): {name: float(row[column]) for column, name in columns.items()}
+        for _, row in nearest.iterrows()
+    }
+
+
+def query_gaia_batch(positions: pd.DataFrame) -> Dict[int, Dict[str, float]]:
+    from astroquery.gaia import Gaia
+
+    job = Gaia.launch_job_async(
+        GAIA_UPLOAD_QUERY.format(radius=MATCH_RADIUS.to_value(u.deg)),
+        upload_resource=_positions_table(positions),
+        upload_table_name='targets',
+    )
+    return _nearest_matches(job.get_results().to_pandas(), 'dist', GAIA_CATALOG)
+
+
+def query_xmatch_batch(positions: pd.DataFrame, catalog: str) -> Dict[int, Dict[str, float]]:
+    from astroquery.xmatch import XMatch
+
+    result = XMatch.query(
+        cat1=_positions_table(positions),
+        cat2=XMATCH_CATALOGS[catalog],
+        max_distance=MATCH_RADIUS.to(u.arcsec),
+        colRA1='ra',
+        colDec1='dec',
+    )
+    return _nearest_matches(result.to_pandas(), 'angDist', catalog)
+
+
+def query_catalog_batch(catalog: str, positions: pd.DataFrame) -> Dict[int, Dict[str, float]]:
+    """Cross-match ``positions`` (target_id, ra, dec) against one catalogue in a single upload query.
+
+    Targets without a match are left out of the result. Network errors propagate.
+    """
+    if catalog == GAIA_CATALOG:
+        return query_gaia_batch(positions)
+    return query_xmatch_batch(positions, catalog)
+
+
+def load_classifier():
+    """The classifier and the version of the model files it was loaded from."""
+    classifier = get_classifier()
+    # Read after loading, which exports models that have no .npz file yet.
+    version = tree_model_version() or 'missing'
+    return classifier, hashlib.sha1(version.encode()).hexdigest()
+
+
+def _source_models(classifier: Classifier) -> dict:
+    return {
+        ClassificationSource.GAIA: classifier.gaia_rfc,
+        ClassificationSource.TWO_MASS: classifier.twomass_rfc,
+        ClassificationSource.WISE: classifier.wise_rfc,
+    }
+
+
+def magnitudes_frame(photometry_by_target: Dict[int, dict]) -> pd.DataFrame:
+    """One row of Gaia/2MASS/WISE magnitudes per target id; NaN where a catalogue did not match."""
+    columns = [name for catalog in CATALOGS for name in CATALOG_COLUMNS[catalog].values()]
+    rows = []
+    for photometry in photometry_by_target.values():
+        row = {}
+        for catalog in CATALOGS:
+            row.update(photometry.get(catalog) or {})
+        rows.append([row.get(column, np.nan) for column in columns])
+    return pd.DataFrame(rows, index=list(photometry_by_target), columns=columns, dtype=float)
+
+
+def classify_magnitudes(magnitudes: pd.DataFrame, classifier: Classifier) -> Dict[int, str]:
+    """``{target id: phot_class}`` with one predict_proba call per model.
+
+    Each row is classified by the model for the richest set of magnitudes it
+    has, like the per-target path; rows without Gaia photometry get ``--``.
+    """
+    results = {target_id: '--' for target_id in magnitudes.index}
+    remaining = magnitudes
+    models = _source_models(classifier)
+    for source, required in FEATURE_SOURCES:
+        complete = remaining[required].notna().all(axis=1)
+        group = remaining[complete]
+        remaining = remaining[~complete]
+        if group.empty:
+            continue
+        features = colors_df(group[required])
+        rfc = models[source]
+        probabilities = np.asarray(rfc.predict_proba(features))
+        best = probabilities.argmax(axis=1)
+        labels = CLASSIFIER_LABELS[source]
+        for target_id, index, row in zip(group.index, best, probabilities):
+            results[target_id] = f'{labels[rfc.classes_[index]]} {row[index]:.1%}'
+    return results
+
+
+def _coordinates_moved(cached: TargetCatalogPhotometry, ra: float, dec: float) -> bool:
+    return abs(cached.ra - ra) > COORDINATE_TOLERANCE_DEG or abs(cached.dec - dec) > COORDINATE_TOLERANCE_DEG
+
+
+def _batch_size(batch_size: Optional[int]) -> int:
+    if batch_size is None:
+        batch_size = getattr(settings, 'PHOT_CLASSIFICATION_BATCH_SIZE', 500)
+    try:
+        return max(1, int(batch_size))
+    except (TypeError, ValueError):
+        return 500
+
+
+def _chunks(items: list, size: int) -> Iterable[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run_batch_classification(target_ids=None, *, refresh_catalogs=False, offline=False, batch_size=None) -> dict:
+    """Classify every unclassified or stale sidereal target.
+
+    A target is stale when it was not classified with the current model files
+    or its coordinates changed since it was matched. Catalogue magnitudes come
+    from TargetCatalogPhotometry where present; the rest are fetched with one
+    upload query per catalogue and chunk of ``batch_size`` targets (unless
+    ``offline``), and ``refresh_catalogs`` matches everything again. Targets
+    whose catalogues could not be queried are left for the next run.
+    """
+    classifier, model_version = load_classifier()
+    queryset = Target.objects.filter(type=Target.SIDEREAL, ra__isnull=False, dec__isnull=False).order_by('pk')
+    if target_ids is not None:
+        queryset = queryset.filter(pk__in=list(target_ids))
+    rows = list(queryset.values_list('pk', 'ra', 'dec', 'phot_classification_done'))
+
+    summary = {
+        'targets': 0,
+        'classified': 0,
+        'unclassifiable': 0,
+        'pending': 0,
+        'queried': {catalog: 0 for catalog in CATALOGS},
+        'failed_queries': [],
+    }
+    for chunk in _chunks(rows, _batch_size(batch_size)):
+        _classify_chunk(chunk, classifier, model_version, summary, refresh_catalogs=refresh_catalogs, offline=offline)
+    logger.info('Batch photometric classification finished: %s', summary)
+    return summary
+
+
+def _classify_chunk(rows, classifier, model_version, summary, *, refresh_catalogs=False, offline=False):
+    cached_rows = TargetCatalogPhotometry.objects.in_bulk([pk for pk, _ra, _dec, _done in rows], field_name='target_id')
+    entries = {}
+    for pk, ra, dec, done in rows:
+        cached = cached_rows.get(pk)
+        if cached is not None and _coordinates_moved(cached, ra, dec):
+            cached.photometry = {}
+        stale = (
+            cached is None
+            or refresh_catalogs
+            or not done
+            or cached.model_version != model_version
+            or not all(catalog in cached.photometry for catalog in CATALOGS)
+        )
+        if not stale:
+            continue
+        if cached is None:
+            cached = TargetCatalogPhotometry(target_id=pk, photometry={})
+        elif refresh_catalogs:
+            cached.photometry = {}
+        cached.ra = ra
+        cached.dec = dec
+        entries[pk] = cached
+    if not entries:
+        return
+    summary['targets'] += len(entries)
+
+    for catalog in CATALOGS:
+        missing = [pk for pk, entry in entries.items() if catalog not in entry.photometry]
+        if not missing or offline:
+            continue
+        positions = pd.DataFrame({
+            'target_id': missing,
+            'ra': [entries[pk].ra for pk in missing],
+            'dec': [entries[pk].dec for pk in missing],
+        })
+        try:
+            matches = query_catalog_batch(catalog, positions)
+        except Exception as exc:
+            logger.warning('Batch %s cross-match of %s targets failed: %s', catalog, len(missing), exc)
+            summary['failed_queries'].append(f'{catalog}: {type(exc).__name__}: {exc}')
+            continue
+        summary['queried'][catalog] += len(missing)
+        for pk in missing:
+            entries[pk].photometry[catalog] = matches.get(pk, {})
+
+    ready = {pk: entry for pk, entry in entries.items() if all(catalog in entry.photometry for catalog in CATALOGS)}
+    summary['pending'] += len(entries) - len(ready)
+    results = classify_magnitudes(magnitudes_frame({pk: entry.photometry for pk, entry in ready.items()}), classifier)
+
+    now = timezone.now()
+    targets = []
+    for pk, entry in ready.items():
+        entry.phot_class = results[pk]
+        entry.model_version = model_version
+        entry.classified_at = now
+        targets.append(Target(pk=pk, phot_class=entry.phot_class, phot_classification_done=True))
+        summary['classified' if entry.phot_class != '--' else 'unclassifiable'] += 1
+
+    # Pending targets keep the magnitudes that were matched, so the next run only queries the rest.
+    created = [entry for entry in entries.values() if entry.pk is None]
+    updated = [entry for entry in entries.values() if entry.pk is not None]
+    for entry in updated:
+        entry.modified = now
+    fields = ['ra', 'dec', 'photometry', 'model_version', 'phot_class', 'classified_at', 'modified']
+    with transaction.atomic():
+        TargetCatalogPhotometry.objects.bulk_create(created)
+        TargetCatalogPhotometry.objects.bulk_update(updated, fields)
+        Target.objects.bulk_update(targets, ['phot_class', 'phot_classification_done'])
@@ -37,3 +37,9 @@ MODEL_PATHS: Dict[ClassificationSource, str] = {
     ClassificationSource.WISE: str(BASE_DIR / "models" / "wise_rfc.pickle"),
     ClassificationSource.TWO_MASS: str(BASE_DIR / "models" / "2mass_rfc.pickle")
 }
+
+TREE_MODEL_PATHS: Dict[ClassificationSource, str] = {
+    ClassificationSource.GAIA: str(BASE_DIR / "models" / "gaia_rfc.npz"),
+    ClassificationSource.WISE: str(BASE_DIR / "models" / "wise_rfc.npz"),
+    ClassificationSource.TWO_MASS: str(BASE_DIR / "models" / "2mass_rfc.npz")
+}
@@ -2,9 +2,8 @@ import numpy as np
 import logging
 from typing import Dict, List, Tuple
 
-from sklearn.ensemble import RandomForestClassifier
-from .random_forest_classifier import load_rfc
 from .classification_source import ClassificationSource
+from .tree_model import TreeEnsembleModel, load_tree_model
 
 logger: logging.Logger = logging.getLogger(__name__)
 
@@ -30,7 +29,7 @@ CLASSIFIER_LABELS: Dict[ClassificationSource, Dict[str, str]] = {
 }
 
 
-def classification_results_response(classifier: RandomForestClassifier,
+def classification_results_response(classifier: TreeEnsembleModel,
                                     descriptive_classes: Dict[str, str],
                                     predictions: List[List[float]]) -> List[List[str]]:
     results: List[List[str]] = []
@@ -41,20 +40,20 @@ def classification_results_response(classifier: RandomForestClassifier,
 
 class Classifier:
     def __init__(self):
-        self.__gaia_rfc: RandomForestClassifier = load_rfc(ClassificationSource.GAIA)
-        self.__2mass_rfc: RandomForestClassifier = load_rfc(ClassificationSource.TWO_MASS)
-        self.__wise_rfc: RandomForestClassifier = load_rfc(ClassificationSource.WISE)
+        self.__gaia_rfc: TreeEnsembleModel = load_tree_model(ClassificationSource.GAIA)
+        self.__2mass_rfc: TreeEnsembleModel = load_tree_model(ClassificationSource.TWO_MASS)
+        self.__wise_rfc: TreeEnsembleModel = load_tree_model(ClassificationSource.WISE)
 
     @property
-    def gaia_rfc(self) -> RandomForestClassifier:
+    def gaia_rfc(self) -> TreeEnsembleModel:
         return self.__gaia_rfc
 
     @property
-    def twomass_rfc(self) -> RandomForestClassifier:
+    def twomass_rfc(self) -> TreeEnsembleModel:
         return self.__2mass_rfc
 
     @property
-    def wise_rfc(self) -> RandomForestClassifier:
+    def wise_rfc(self) -> TreeEnsembleModel:
         return self.__wise_rfc
 
     def classify(self, points: np.array) -> Tuple[List[List[str]], str, int]:
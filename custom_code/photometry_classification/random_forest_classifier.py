@@ -1,4 +1,5 @@
 import logging
+import os
 import pickle
 from typing import List
 
@@ -62,6 +63,7 @@ def load_rfc(source: ClassificationSource) -> RandomForestClassifier:
     except Exception as e:
         logger.warning('Could not load RFC for %s from file; retraining model. Reason: %s', source.name, e)
         rfc: RandomForestClassifier = train_rfc(source)
+        os.makedirs(os.path.dirname(MODEL_PATHS.get(source, '')), exist_ok=True)
         with open(MODEL_PATHS.get(source, ''), 'wb') as handle:
             pickle.dump(rfc, handle)
         return rfc
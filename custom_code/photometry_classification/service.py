@@ -5,16 +5,34 @@ from typing import Optional
 from .calculate_colors import colors_df
 from .catalog_query import query_for_object
 from .classifier import Classifier
+from .tree_model import tree_model_version
 
 
 logger = logging.getLogger(__name__)
 
 
 @lru_cache(maxsize=1)
-def get_classifier() -> Classifier:
+def _classifier_for_version(version: Optional[str]) -> Classifier:
     return Classifier()
 
 
+def get_classifier() -> Classifier:
+    """The classifier of this process, loaded once and reloaded when the model files change."""
+    return _classifier_for_version(tree_model_version())
+
+
+def preload_classifier() -> bool:
+    """Load the exported models now, so that forked children share them copy-on-write.
+
+    Nothing is loaded (or trained) while a model has not been exported yet.
+    """
+    if tree_model_version() is None:
+        logger.info('Photometric classifier models are not exported yet; they are loaded on first use.')
+        return False
+    get_classifier()
+    return True
+
+
 def classify_target_coordinates(ra: Optional[float], dec: Optional[float]) -> str:
     if ra is None or dec is None:
         return "-"
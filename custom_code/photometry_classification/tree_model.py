@@ -0,0 +1,172 @@
+"""RandomForest models as plain NumPy tree arrays.
+
+The pickled scikit-learn forests are slow to unpickle, tied to the
+scikit-learn version that wrote them and hold many small Python objects.
+TreeEnsembleModel keeps the nodes of all trees in a few flat arrays, saved
+as one .npz file per model without pickles, and predicts by walking every
+tree for every sample at once. Loaded before a fork, the arrays are shared
+copy-on-write with the child processes.
+"""
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .classification_source import ClassificationSource, MODEL_PATHS, TREE_MODEL_PATHS
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+TREE_MODEL_FORMAT_VERSION: int = 1
+
+# Samples evaluated at once; bounds the (samples x trees) node index arrays.
+PREDICT_CHUNK_SIZE: int = 1024
+
+
+class TreeEnsembleModel:
+    """A forest of binary decision trees with the predict_proba() of a RandomForestClassifier.
+
+    Node ``i`` sends a sample to ``left[i]`` when its ``feature[i]`` value is
+    at most ``threshold[i]`` and to ``right[i]`` otherwise; leaves point at
+    themselves and ``value`` holds their class probabilities.
+    """
+
+    ARRAYS: List[str] = ['roots', 'left', 'right', 'feature', 'threshold', 'value']
+
+    def __init__(self, classes, feature_names, roots, left, right, feature, threshold, value):
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names) if feature_names is not None else None
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.value = np.asarray(value, dtype=np.float64)
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_forest(cls, forest) -> 'TreeEnsembleModel':
+        """Export a fitted single-output RandomForestClassifier."""
+        roots, left, right, feature, threshold, value = [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left < 0
+            roots.append(offset)
+            left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            # Per-node class counts (or fractions in newer scikit-learn) become probabilities.
+            counts = tree.value[:, 0, :].astype(np.float64)
+            totals = counts.sum(axis=1, keepdims=True)
+            value.append(counts / np.where(totals > 0, totals, 1.0))
+            offset += tree.node_count
+        return cls(
+            forest.classes_,
+            getattr(forest, 'feature_names_in_', None),
+            roots,
+            np.concatenate(left),
+            np.concatenate(right),
+            np.concatenate(feature),
+            np.concatenate(threshold),
+            np.concatenate(value),
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f'{path}.{os.getpid()}.partial'
+        with open(partial, 'wb') as handle:
+            np.savez(
+                handle,
+                format_version=np.array(TREE_MODEL_FORMAT_VERSION),
+                classes=self.classes_.astype(str),
+                feature_names=np.array([] if self.feature_names_in_ is None else self.feature_names_in_, dtype=str),
+                **{name: getattr(self, name) for name in self.ARRAYS},
+            )
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TreeEnsembleModel':
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['format_version'])
+            if version != TREE_MODEL_FORMAT_VERSION:
+                raise ValueError(f'Unsupported tree model format {version} in {path}')
+            feature_names = data['feature_names']
+            return cls(
+                data['classes'],
+                feature_names if len(feature_names) else None,
+                **{name: data[name] for name in cls.ARRAYS},
+            )
+
+    def _feature_matrix(self, points) -> np.ndarray:
+        if isinstance(points, pd.DataFrame) and self.feature_names_in_ is not None:
+            points = points[list(self.feature_names_in_)]
+        # Like scikit-learn, compare the features in single precision against the thresholds.
+        return np.asarray(points, dtype=np.float32).astype(np.float64)
+
+    def predict_proba(self, points) -> np.ndarray:
+        features = self._feature_matrix(points)
+        probabilities = np.empty((features.shape[0], len(self.classes_)))
+        for start in range(0, features.shape[0], PREDICT_CHUNK_SIZE):
+            chunk = features[start:start + PREDICT_CHUNK_SIZE]
+            # One entry per (sample, tree); each step moves the entries that are not at a leaf yet one level down.
+            nodes = np.tile(self.roots, chunk.shape[0])
+            samples = np.repeat(np.arange(chunk.shape[0]), self.n_estimators)
+            active = np.flatnonzero(self.left[nodes] != nodes)
+            while active.size:
+                current = nodes[active]
+                go_left = chunk[samples[active], self.feature[current]] <= self.threshold[current]
+                current = np.where(go_left, self.left[current], self.right[current])
+                nodes[active] = current
+                active = active[self.left[current] != current]
+            leaf_values = self.value[nodes].reshape(chunk.shape[0], self.n_estimators, -1)
+            probabilities[start:start + PREDICT_CHUNK_SIZE] = leaf_values.mean(axis=1)
+        return probabilities
+
+    def predict(self, points) -> np.ndarray:
+        return self.classes_[self.predict_proba(points).argmax(axis=1)]
+
+
+def _newer(path: str, than: str) -> bool:
+    try:
+        return os.path.getmtime(path) > os.path.getmtime(than)
+    except OSError:
+        return False
+
+
+def load_tree_model(source: ClassificationSource) -> TreeEnsembleModel:
+    """The model for ``source``, exported from the pickled forest when there is no up-to-date .npz."""
+    from .random_forest_classifier import load_rfc
+
+    path: str = TREE_MODEL_PATHS[source]
+    if os.path.exists(path) and not _newer(MODEL_PATHS[source], path):
+        try:
+            return TreeEnsembleModel.load(path)
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning('Could not load tree model for %s from %s; exporting it again. Reason: %s', source.name, path, e)
+
+    model = TreeEnsembleModel.from_forest(load_rfc(source))
+    try:
+        model.save(path)
+    except OSError as e:
+        logger.warning('Could not save tree model for %s to %s: %s', source.name, path, e)
+    return model
+
+
+def tree_model_version() -> Optional[str]:
+    """Size and modification time of the model files, or None when one is missing."""
+    parts = []
+    for source in ClassificationSource:
+        try:
+            stat = os.stat(TREE_MODEL_PATHS[source])
+        except OSError:
+            return None
+        parts.append(f'{source.name}:{stat.st_size}:{stat.st_mtime_ns}')
+    return ';'.join(parts)
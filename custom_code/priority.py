@@ -23,12 +23,13 @@ def _compute_priority(dt, importance, cadence):
     return float(around((dt / cadence) * importance, 1))
 
 
-def compute_target_priority_values(target: Target):
+def compute_target_priority_values(target: Target, mjd_now=None):
     imp = _to_float_or(getattr(target, 'importance', 0.0), 1.0)
     cadence = _to_float_or(getattr(target, 'cadence', 0.0), 1.0)
     mjd_last = _to_float_or(getattr(target, 'mjd_last', 0.0), 0.0)
 
-    mjd_now = Time(datetime.now(timezone.utc)).mjd
+    if mjd_now is None:
+        mjd_now = Time(datetime.now(timezone.utc)).mjd
     try:
         dt = float(mjd_now - mjd_last)
     except (TypeError, ValueError):
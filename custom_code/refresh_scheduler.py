@@ -0,0 +1,314 @@
+import heapq
+import logging
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+from tom_targets.models import Target
+
+from custom_code.models import DataServiceRefreshState
+from custom_code.priority import _to_float_or
+from custom_code.sun_separation import refresh_target_sun_separation
+
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400.0
+# Scheduled refreshes are enqueued below the default task priority (0), so jobs
+# enqueued interactively (new targets, manual refreshes) always run first.
+SCHEDULED_TASK_PRIORITY_MIN = -100
+SCHEDULED_TASK_PRIORITY_MAX = -1
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def service_refresh_cadence_seconds(service_name, service_class):
+    """How often the archive behind a DataService publishes new data, in seconds.
+
+    DATA_SERVICES_REFRESH_CADENCE_SECONDS overrides the ``refresh_cadence_seconds``
+    class attribute; services without either fall back to the daily interval.
+    """
+    overrides = _setting('DATA_SERVICES_REFRESH_CADENCE_SECONDS', {}) or {}
+    value = overrides.get(service_name)
+    if value is None:
+        value = getattr(service_class, 'refresh_cadence_seconds', None)
+    if value is None:
+        value = _setting('DATA_SERVICES_UPDATE_INTERVAL_SECONDS', SECONDS_PER_DAY)
+    return max(1.0, _to_float_or(value, SECONDS_PER_DAY))
+
+
+def target_near_sun(target):
+    sun_separation = getattr(target, 'sun_separation', None)
+    if sun_separation is None:
+        return False
+    min_separation = _to_float_or(_setting('DATA_SERVICES_MIN_SUN_SEPARATION_DEG', 15.0), 15.0)
+    return _to_float_or(sun_separation, 180.0) < min_separation
+
+
+def adaptive_interval_factor(interval_factor, produced_new_data):
+    """Next interval multiplier after a refresh that did or did not bring anything new.
+
+    Empty refreshes back off exponentially, productive ones tighten the interval,
+    both bounded by DATA_SERVICES_REFRESH_MAX_BACKOFF_FACTOR and
+    DATA_SERVICES_REFRESH_MIN_TIGHTEN_FACTOR.
+    """
+    factor = _to_float_or(interval_factor, 1.0) or 1.0
+    if produced_new_data:
+        factor *= _to_float_or(_setting('DATA_SERVICES_REFRESH_TIGHTEN_MULTIPLIER', 0.75), 0.75)
+    else:
+        factor *= _to_float_or(_setting('DATA_SERVICES_REFRESH_BACKOFF_MULTIPLIER', 2.0), 2.0)
+    min_factor = _to_float_or(_setting('DATA_SERVICES_REFRESH_MIN_TIGHTEN_FACTOR', 0.25), 0.25)
+    max_factor = _to_float_or(_setting('DATA_SERVICES_REFRESH_MAX_BACKOFF_FACTOR', 32.0), 32.0)
+    return min(max_factor, max(min_factor, factor))
+
+
+def compute_refresh_interval_seconds(target, service_cadence_seconds, state=None):
+    """Seconds between two refreshes of one (target, service) pair.
+
+    The service cadence is scaled by importance (10 refreshes four times as often
+    as 5, 0 four times less often), tightened to the requested target cadence and
+    shortened up to 2x for targets whose priority shows they are overdue. The
+    learned ``interval_factor`` of the refresh state then stretches or tightens it.
+    Targets close to the Sun are pushed out to the conjunction deferral.
+    """
+    importance = min(10.0, max(0.0, _to_float_or(getattr(target, 'importance', 0.0), 0.0)))
+    interval = service_cadence_seconds * 2.0 ** ((5.0 - importance) / 2.5)
+
+    cadence_days = _to_float_or(getattr(target, 'cadence', 0.0), 0.0)
+    if cadence_days > 0:
+        interval = min(interval, cadence_days * SECONDS_PER_DAY)
+
+    priority = min(10.0, max(0.0, _to_float_or(getattr(target, 'priority', 0.0), 0.0)))
+    interval /= 1.0 + priority / 10.0
+    if state is not None:
+        interval *= _to_float_or(state.interval_factor, 1.0) or 1.0
+
+    min_interval = _to_float_or(_setting('DATA_SERVICES_MIN_REFRESH_INTERVAL_SECONDS', 3600), 3600.0)
+    max_interval = _to_float_or(_setting('DATA_SERVICES_MAX_REFRESH_INTERVAL_SECONDS', 30 * SECONDS_PER_DAY), 30 * SECONDS_PER_DAY)
+    interval = min(max_interval, max(min_interval, interval))
+
+    if target_near_sun(target):
+        defer = _to_float_or(_setting('DATA_SERVICES_SUN_CONJUNCTION_DEFER_SECONDS', 7 * SECONDS_PER_DAY), 7 * SECONDS_PER_DAY)
+        interval = max(interval, defer)
+    return interval
+
+
+def compute_refresh_urgency(target, next_due_at, interval_seconds, now):
+    """Relative urgency of a due refresh; larger runs first."""
+    lateness = max(0.0, (now - next_due_at).total_seconds()) / max(1.0, interval_seconds)
+    importance = max(0.0, _to_float_or(getattr(target, 'importance', 0.0), 0.0))
+    priority = min(10.0, max(0.0, _to_float_or(getattr(target, 'priority', 0.0), 0.0)))
+    return (1.0 + math.log1p(lateness)) * (1.0 + importance) * (1.0 + priority / 10.0)
+
+
+def urgency_to_task_priority(urgency):
+    # Urgency of a fresh, unimportant target is 1 and of a very late, important and
+    # overdue one a few hundred; map it logarithmically onto the scheduled band.
+    span = SCHEDULED_TASK_PRIORITY_MAX - SCHEDULED_TASK_PRIORITY_MIN
+    scaled = int(round(span * min(1.0, math.log10(max(1.0, urgency)) / 3.0)))
+    return SCHEDULED_TASK_PRIORITY_MIN + scaled
+
+
+def _seed_missing_refresh_states(importance_gt, service_names, now):
+    incomplete_target_ids = list(
+        Target.objects
+        .filter(importance__gt=importance_gt)
+        .annotate(
+            refresh_state_count=Count(
+                'dataservice_refresh_states',
+                filter=Q(dataservice_refresh_states__service_name__in=service_names),
+            )
+        )
+        .filter(refresh_state_count__lt=len(service_names))
+        .values_list('pk', flat=True)
+    )
+    if not incomplete_target_ids:
+        return 0
+
+    existing = set(
+        DataServiceRefreshState.objects
+        .filter(target_id__in=incomplete_target_ids, service_name__in=service_names)
+        .values_list('target_id', 'service_name')
+    )
+    missing = [
+        DataServiceRefreshState(target_id=target_id, service_name=service_name, next_due_at=now)
+        for target_id in incomplete_target_ids
+        for service_name in service_names
+        if (target_id, service_name) not in existing
+    ]
+    DataServiceRefreshState.objects.bulk_create(missing, ignore_conflicts=True, batch_size=1000)
+    return len(missing)
+
+
+def _outstanding_scheduled_jobs():
+    from django_tasks import ResultStatus
+    from django_tasks.backends.database.models import DBTaskResult
+    from custom_code.tasks import update_target_dataservice_for_target
+
+    return DBTaskResult.objects.filter(
+        status=ResultStatus.NEW,
+        task_path=update_target_dataservice_for_target.module_path,
+        priority__lt=0,
+    ).count()
+
+
+def enqueue_due_dataservice_refreshes(importance_gt=0.0, window=None, now=None):
+    """Enqueue the most urgent due (target, service) refreshes.
+
+    At most ``window`` scheduled jobs are outstanding at any time, so a backlog
+    never grows past what the workers can drain and newly urgent targets are not
+    stuck behind thousands of routine refreshes.
+    """
+    from custom_code.tasks import _iter_selected_data_service_classes, update_target_dataservice_for_target
+
+    now = now or timezone.now()
+    if window is None:
+        window = int(_setting('DATA_SERVICES_SCHEDULER_WINDOW', 200))
+    summary = {'seeded': 0, 'due': 0, 'enqueued': 0, 'deferred_near_sun': 0, 'outstanding': 0}
+
+    service_classes = dict(_iter_selected_data_service_classes(include_create_only=False))
+    if not service_classes:
+        return summary
+    service_names = sorted(service_classes)
+    summary['seeded'] = _seed_missing_refresh_states(importance_gt, service_names, now)
+
+    summary['outstanding'] = _outstanding_scheduled_jobs()
+    capacity = max(0, window - summary['outstanding'])
+    if capacity == 0:
+        return summary
+
+    # Urgency depends on each row's interval, so every due row is ranked: they are
+    # streamed in batches and only the ``capacity`` most urgent ones are kept.
+    due_states = (
+        DataServiceRefreshState.objects
+        .filter(
+            next_due_at__lte=now,
+            service_name__in=service_names,
+            target__importance__gt=importance_gt,
+        )
+        .select_related('target')
+        .order_by('pk')
+    )
+    sun_checked = {}
+    ranked = []
+    deferred = []
+    for state in due_states.iterator(chunk_size=int(_setting('DATA_SERVICES_SCHEDULER_BATCH_SIZE', 2000))):
+        summary['due'] += 1
+        # Share one instance per checked target so a refreshed sun separation applies to all its services.
+        target = sun_checked.get(state.target_id, state.target)
+        if target_near_sun(target) and target.pk not in sun_checked:
+            # Sun separation is only refreshed by DataService runs, so refresh it
+            # here before deciding to keep skipping a target.
+            sun_checked[target.pk] = target
+            try:
+                refresh_target_sun_separation(target.pk)
+                target.refresh_from_db(fields=['sun_separation', 'priority'])
+            except Exception as exc:
+                logger.warning('Could not refresh sun separation for target %s: %s', target.pk, exc)
+        interval = compute_refresh_interval_seconds(
+            target,
+            service_refresh_cadence_seconds(state.service_name, service_classes[state.service_name]),
+            state,
+        )
+        if target_near_sun(target):
+            state.interval_seconds = interval
+            state.next_due_at = now + timedelta(seconds=interval)
+            deferred.append(state)
+            continue
+        entry = (compute_refresh_urgency(target, state.next_due_at, interval, now), -state.pk, interval, state)
+        if len(ranked) < capacity:
+            heapq.heappush(ranked, entry)
+        elif entry[:2] > ranked[0][:2]:
+            heapq.heapreplace(ranked, entry)
+
+    ranked.sort(key=lambda item: item[:2], reverse=True)
+    enqueued = []
+    for urgency, _order, interval, state in ranked:
+        update_target_dataservice_for_target.using(priority=urgency_to_task_priority(urgency)).enqueue(
+            state.target_id,
+            state.service_name,
+            False,
+            False,
+        )
+        state.interval_seconds = interval
+        state.last_enqueued_at = now
+        state.next_due_at = now + timedelta(seconds=interval)
+        enqueued.append(state)
+
+    DataServiceRefreshState.objects.bulk_update(
+        enqueued + deferred,
+        ['interval_seconds', 'last_enqueued_at', 'next_due_at'],
+        batch_size=500,
+    )
+    summary['enqueued'] = len(enqueued)
+    summary['deferred_near_sun'] = len(deferred)
+    return summary
+
+
+def _apply_refresh_outcome(state, produced_new_data, finished_at):
+    if produced_new_data:
+        state.last_new_data_at = finished_at
+        state.empty_refreshes = 0
+    else:
+        state.empty_refreshes += 1
+    state.interval_factor = adaptive_interval_factor(state.interval_factor, produced_new_data)
+
+
+def record_dataservice_refresh(target, service_name, service_class, produced_new_data=None, finished_at=None):
+    """Store the outcome of a (target, service) refresh and when it is next due.
+
+    ``produced_new_data`` is None when the outcome is unknown (failed runs and
+    services that deliver data later, such as ATLAS), which leaves the learned
+    interval untouched.
+    """
+    finished_at = finished_at or timezone.now()
+    state, _created = DataServiceRefreshState.objects.get_or_create(
+        target_id=target.pk,
+        service_name=service_name,
+        defaults={'next_due_at': finished_at},
+    )
+    if produced_new_data is not None:
+        _apply_refresh_outcome(state, produced_new_data, finished_at)
+    interval = compute_refresh_interval_seconds(
+        target,
+        service_refresh_cadence_seconds(service_name, service_class),
+        state,
+    )
+    state.interval_seconds = interval
+    state.last_finished_at = finished_at
+    state.next_due_at = finished_at + timedelta(seconds=interval)
+    state.save()
+    return interval
+
+
+def record_dataservice_data_arrival(target_id, service_name, service_class, produced_new_data, arrived_at=None):
+    """Feed the outcome of an asynchronously delivered refresh back into its learned interval.
+
+    The next refresh is rescheduled from the last finished run, as
+    :func:`record_dataservice_refresh` would have done had the outcome been known then.
+    """
+    arrived_at = arrived_at or timezone.now()
+    state = (
+        DataServiceRefreshState.objects
+        .select_related('target')
+        .filter(target_id=target_id, service_name=service_name)
+        .first()
+    )
+    if state is None:
+        return None
+    _apply_refresh_outcome(state, produced_new_data, arrived_at)
+    interval = compute_refresh_interval_seconds(
+        state.target,
+        service_refresh_cadence_seconds(service_name, service_class),
+        state,
+    )
+    state.interval_seconds = interval
+    state.next_due_at = (state.last_finished_at or arrived_at) + timedelta(seconds=interval)
+    state.save(update_fields=[
+        'last_new_data_at', 'empty_refreshes', 'interval_factor', 'interval_seconds', 'next_due_at',
+    ])
+    return interval
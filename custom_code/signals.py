@@ -11,11 +11,16 @@ from django.dispatch import receiver
 from django.utils import timezone as django_timezone
 
 from tom_dataproducts.models import ReducedDatum
-from tom_targets.models import Target
+from tom_targets.models import Target, TargetName
 
 from custom_code.last_photometry import refresh_target_last_photometry
+from custom_code.models import TransitEphemeris
+from custom_code.nonsidereal_ephemeris import enqueue_nonsidereal_ephemeris_refresh
 from custom_code.orcid import build_orcid_about, canonicalize_orcid, orcid_public_url, profile_has_orcid_note
 from custom_code.priority import refresh_target_priority
+from custom_code.sky_index import target_healpix_index
+from custom_code.target_names import index_alias, index_target_name
+from custom_code.transit_calendar import enqueue_transit_calendar_refresh
 
 logger = logging.getLogger(__name__)
 
@@ -192,6 +197,13 @@ def update_target_last_photometry_on_delete(sender, instance, **kwargs):
     refresh_target_priority(instance.target_id)
 
 
+@receiver(pre_save, sender=Target, dispatch_uid='custom_code.index_target_coordinates_on_target_save')
+def index_target_coordinates_on_target_save(sender, instance, raw=False, **kwargs):
+    if raw or instance is None:
+        return
+    instance.healpix_index = target_healpix_index(instance)
+
+
 @receiver(post_save, sender=Target, dispatch_uid='custom_code.update_target_priority_on_target_save')
 def update_target_priority_on_target_save(sender, instance, **kwargs):
     if instance is None or instance.pk is None:
@@ -199,6 +211,37 @@ def update_target_priority_on_target_save(sender, instance, **kwargs):
     refresh_target_priority(instance.pk)
 
 
+@receiver(post_save, sender=Target, dispatch_uid='custom_code.index_target_name_on_target_save')
+def index_target_name_on_target_save(sender, instance, raw=False, **kwargs):
+    if raw or instance is None or instance.pk is None:
+        return
+    index_target_name(instance)
+
+
+@receiver(post_save, sender=Target, dispatch_uid='custom_code.refresh_nonsidereal_ephemeris_on_target_save')
+def refresh_nonsidereal_ephemeris_on_target_save(sender, instance, raw=False, **kwargs):
+    # Queues a grid computation only when the orbital elements changed.
+    if raw or instance is None or instance.pk is None:
+        return
+    enqueue_nonsidereal_ephemeris_refresh(instance)
+
+
+@receiver(post_save, sender=TransitEphemeris, dispatch_uid='custom_code.refresh_transit_calendar_on_ephemeris_save')
+def refresh_transit_calendar_on_ephemeris_save(sender, instance, raw=False, **kwargs):
+    # Queues a recomputation of the transit events only when their inputs changed.
+    if raw or instance is None or instance.pk is None:
+        return
+    enqueue_transit_calendar_refresh(instance)
+
+
+@receiver(post_save, sender=TargetName, dispatch_uid='custom_code.index_alias_on_target_name_save')
+def index_alias_on_target_name_save(sender, instance, raw=False, **kwargs):
+    # Deleted names drop out of the index through the cascading foreign key.
+    if raw or instance is None or instance.pk is None or instance.target_id is None:
+        return
+    index_alias(instance)
+
+
 def _raw_delete_related_rows(app_label, model_name, **filters):
     """
     Delete dependent rows before target deletion.
@@ -0,0 +1,375 @@
+"""HEALPix index of target coordinates for cone, box and polygon searches.
+
+Every target with coordinates stores the nested HEALPix pixel of its RA/Dec at
+order ``HEALPIX_ORDER`` (about 3 arcsec pixels) in the indexed
+``healpix_index`` column, set on save. In the nested scheme the order-16 pixels
+inside a coarser pixel p of order k are the contiguous range
+[p * 4**(16-k), (p+1) * 4**(16-k)), so one column serves searches of any size:
+a region is covered with at most ``MAX_COVER_PIXELS`` pixels of the coarsest
+orders that resolve it, the covering pixels become a few index ranges, and only
+the targets in those ranges are checked against the exact region.
+
+The pixelisation follows the HEALPix reference implementation (Gorski et al.
+2005) and is written with NumPy so that it needs no extra dependency.
+"""
+import logging
+import math
+
+import numpy as np
+from django.db import transaction
+from django.db.models import ExpressionWrapper, FloatField, Q
+from django.db.models.functions import ACos, Cos, Least, Pi, Radians, Sin
+
+
+logger = logging.getLogger(__name__)
+
+HEALPIX_ORDER = 16
+# Budget of covering pixels per search; the boundary is refined while it stays below this.
+MAX_COVER_PIXELS = 256
+# Upper bound of the angular distance between a pixel centre and its corners, times nside.
+# It is about 0.84 at order 0 and slightly above 1.0 at higher orders.
+_PIXEL_RADIUS_FACTOR = 1.4
+_JRLL = np.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4], dtype=np.int64)
+_JPLL = np.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7], dtype=np.int64)
+
+
+def _spread_bits(values):
+    """Interleave zero bits into ``values``: bit i moves to bit 2i."""
+    values = values.astype(np.int64) & 0xFFFFFFFF
+    values = (values | (values << 16)) & 0x0000FFFF0000FFFF
+    values = (values | (values << 8)) & 0x00FF00FF00FF00FF
+    values = (values | (values << 4)) & 0x0F0F0F0F0F0F0F0F
+    values = (values | (values << 2)) & 0x3333333333333333
+    return (values | (values << 1)) & 0x5555555555555555
+
+
+def _compress_bits(values):
+    """Inverse of _spread_bits() for the even bits of ``values``."""
+    values = values.astype(np.int64) & 0x5555555555555555
+    values = (values | (values >> 1)) & 0x3333333333333333
+    values = (values | (values >> 2)) & 0x0F0F0F0F0F0F0F0F
+    values = (values | (values >> 4)) & 0x00FF00FF00FF00FF
+    values = (values | (values >> 8)) & 0x0000FFFF0000FFFF
+    return (values | (values >> 16)) & 0x00000000FFFFFFFF
+
+
+def healpix_index(ra, dec, order=HEALPIX_ORDER):
+    """Nested HEALPix pixels of ``ra``/``dec`` (degrees, scalars or arrays) at ``order``."""
+    nside = 1 << order
+    z = np.sin(np.radians(np.asarray(dec, dtype=float)))
+    tt = np.mod(np.radians(np.asarray(ra, dtype=float)) / (0.5 * math.pi), 4.0)
+    z, tt = np.broadcast_arrays(z, tt)
+    za = np.abs(z)
+
+    # Equatorial belt: the indices of the ascending and descending pixel edge lines.
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * (0.75 * z)
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix = jm & (nside - 1)
+    iy = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps.
+    polar = za > 2.0 / 3.0
+    if np.any(polar):
+        ntt = np.minimum(3, tt.astype(np.int64))
+        tp = tt - ntt
+        tmp = nside * np.sqrt(3.0 * (1.0 - np.minimum(za, 1.0)))
+        jp_polar = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+        jm_polar = np.minimum(((1.0 - tp) * tmp).astype(np.int64), nside - 1)
+        north = z >= 0
+        face = np.where(polar, np.where(north, ntt, ntt + 8), face)
+        ix = np.where(polar, np.where(north, nside - jm_polar - 1, jp_polar), ix)
+        iy = np.where(polar, np.where(north, nside - jp_polar - 1, jm_polar), iy)
+
+    return (face.astype(np.int64) << (2 * order)) + _spread_bits(ix) + (_spread_bits(iy) << 1)
+
+
+def healpix_centers(pixels, order):
+    """(ra, dec) in degrees of the centres of nested HEALPix ``pixels`` at ``order``."""
+    pixels = np.asarray(pixels, dtype=np.int64)
+    nside = 1 << order
+    npface = nside * nside
+    face = pixels >> (2 * order)
+    within_face = pixels & (npface - 1)
+    ix = _compress_bits(within_face)
+    iy = _compress_bits(within_face >> 1)
+
+    fact2 = 4.0 / (12 * npface)
+    fact1 = 2 * nside * fact2
+    jr = _JRLL[face] * nside - ix - iy - 1
+    north_cap = jr < nside
+    south_cap = jr > 3 * nside
+    nr = np.where(north_cap, jr, np.where(south_cap, 4 * nside - jr, nside))
+    z = np.where(
+        north_cap,
+        1.0 - nr * nr * fact2,
+        np.where(south_cap, nr * nr * fact2 - 1.0, (2 * nside - jr) * fact1),
+    )
+    kshift = np.where(north_cap | south_cap, 0, (jr - nside) & 1)
+    jp = (_JPLL[face] * nr + ix - iy + 1 + kshift) // 2
+    jp = np.where(jp > 4 * nside, jp - 4 * nside, jp)
+    jp = np.where(jp < 1, jp + 4 * nside, jp)
+    phi = (jp - (kshift + 1) * 0.5) * (0.5 * math.pi / nr)
+    return np.degrees(phi) % 360.0, np.degrees(np.arcsin(np.clip(z, -1.0, 1.0)))
+
+
+def _unit_vectors(ra, dec):
+    ra = np.radians(np.asarray(ra, dtype=float))
+    dec = np.radians(np.asarray(dec, dtype=float))
+    return np.stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1)
+
+
+def _angle_between(vectors, vector):
+    return np.arccos(np.clip(vectors @ vector, -1.0, 1.0))
+
+
+def _cone_test(center, radius):
+    def test(ra, dec, pixel_radius):
+        distance = _angle_between(_unit_vectors(ra, dec), center)
+        return distance <= radius + pixel_radius, distance + pixel_radius <= radius
+    return test
+
+
+def _box_test(ra_min, ra_max, dec_min, dec_max):
+    width = (ra_max - ra_min) % 360.0 or 360.0
+    mid = math.radians(ra_min + width / 2.0)
+    half_width = math.radians(width / 2.0)
+    dec_low, dec_high = math.radians(dec_min), math.radians(dec_max)
+    # Meridian edges, each split in two so that no arc is longer than 90 degrees.
+    dec_mid = (dec_min + dec_max) / 2.0
+    edges = [
+        (_unit_vectors(edge_ra, start), _unit_vectors(edge_ra, end))
+        for edge_ra in (ra_min, ra_max)
+        for start, end in ((dec_min, dec_mid), (dec_mid, dec_max))
+    ]
+
+    def test(ra, dec, pixel_radius):
+        dec = np.radians(dec)
+        if width >= 360.0:
+            return (dec + pixel_radius >= dec_low) & (dec - pixel_radius <= dec_high), (
+                (dec - pixel_radius >= dec_low) & (dec + pixel_radius <= dec_high)
+            )
+        vectors = _unit_vectors(ra, np.degrees(dec))
+        in_ra = np.abs((np.radians(ra) - mid + math.pi) % (2.0 * math.pi) - math.pi) <= half_width
+        edge_distance = np.min([_arc_distances(vectors, start, end) for start, end in edges], axis=0)
+        # Outside the RA range the nearest point of the box lies on a meridian edge, inside it straight north or south.
+        distance = np.where(in_ra, np.maximum.reduce([dec_low - dec, dec - dec_high, np.zeros_like(dec)]), edge_distance)
+        inside = in_ra & (dec - pixel_radius >= dec_low) & (dec + pixel_radius <= dec_high) & (edge_distance >= pixel_radius)
+        return distance <= pixel_radius, inside
+    return test
+
+
+def _polygon_frame(ra, dec):
+    """Centre and gnomonic basis of a polygon; great-circle edges are straight lines in this projection."""
+    vertices = _unit_vectors(ra, dec)
+    center = vertices.sum(axis=0)
+    norm = np.linalg.norm(center)
+    if norm < 1e-9:
+        raise ValueError('Polygon has no defined centre.')
+    center /= norm
+    if np.any(vertices @ center <= 1e-6):
+        raise ValueError('Polygon must fit within a hemisphere.')
+    axis = np.array([0.0, 0.0, 1.0]) if abs(center[2]) < 0.9 else np.array([1.0, 0.0, 0.0])
+    east = np.cross(axis, center)
+    east /= np.linalg.norm(east)
+    north = np.cross(center, east)
+    return vertices, center, east, north
+
+
+def _gnomonic(vectors, center, east, north):
+    depth = vectors @ center
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.stack([(vectors @ east) / depth, (vectors @ north) / depth], axis=-1), depth
+
+
+def _points_in_polygon(points, polygon):
+    """Even-odd rule test of planar ``points`` against the closed ``polygon`` vertices."""
+    inside = np.zeros(len(points), dtype=bool)
+    x, y = points[:, 0], points[:, 1]
+    for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        crosses = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def _arc_distances(vectors, start, end):
+    """Angular distance of each of ``vectors`` from the great-circle arc start-end."""
+    normal = np.cross(start, end)
+    if np.linalg.norm(normal) < 1e-12:
+        return _angle_between(vectors, start)
+    normal /= np.linalg.norm(normal)
+    to_circle = np.arcsin(np.clip(np.abs(vectors @ normal), 0.0, 1.0))
+    projected = vectors - np.outer(vectors @ normal, normal)
+    # The foot of the perpendicular lies on the arc when it is on the inner side of both end points.
+    on_arc = (np.cross(start, projected) @ normal >= 0) & (np.cross(projected, end) @ normal >= 0)
+    ends = np.minimum(_angle_between(vectors, start), _angle_between(vectors, end))
+    return np.where(on_arc, to_circle, ends)
+
+
+def _polygon_test(ra, dec):
+    vertices, center, east, north = _polygon_frame(ra, dec)
+    plane, _depth = _gnomonic(vertices, center, east, north)
+
+    def test(pixel_ra, pixel_dec, pixel_radius):
+        vectors = _unit_vectors(pixel_ra, pixel_dec)
+        points, depth = _gnomonic(vectors, center, east, north)
+        inside = (depth > 0) & _points_in_polygon(np.nan_to_num(points), plane)
+        distance = np.min(
+            [_arc_distances(vectors, start, end) for start, end in zip(vertices, np.roll(vertices, -1, axis=0))],
+            axis=0,
+        )
+        return inside | (distance <= pixel_radius), inside & (distance >= pixel_radius)
+    return test
+
+
+def points_in_polygon(ra, dec, polygon_ra, polygon_dec):
+    """Whether each ``ra``/``dec`` lies inside the polygon with great-circle edges between the given vertices."""
+    _vertices, center, east, north = _polygon_frame(polygon_ra, polygon_dec)
+    plane, _depth = _gnomonic(_unit_vectors(polygon_ra, polygon_dec), center, east, north)
+    points, depth = _gnomonic(_unit_vectors(ra, dec), center, east, north)
+    return (depth > 0) & _points_in_polygon(np.nan_to_num(np.atleast_2d(points)), plane)
+
+
+def covering_ranges(test, order=HEALPIX_ORDER, max_pixels=MAX_COVER_PIXELS):
+    """[start, stop) ranges of ``order`` pixels covering the region of ``test``.
+
+    ``test(ra, dec, pixel_radius)`` gets pixel centres and their maximum radius
+    in radians and returns whether each pixel may intersect the region and
+    whether it lies entirely inside it. Pixels inside are kept whole and the
+    boundary ones are split while fewer than ``max_pixels`` are kept.
+    """
+    kept = []
+    level = 0
+    pixels = np.arange(12, dtype=np.int64)
+    while pixels.size:
+        pixel_radius = min(math.pi, _PIXEL_RADIUS_FACTOR / (1 << level))
+        ra, dec = healpix_centers(pixels, level)
+        intersects, inside = test(ra, dec, pixel_radius)
+        kept.extend((level, int(pixel)) for pixel in pixels[intersects & inside])
+        boundary = pixels[intersects & ~inside]
+        if level >= order or len(kept) + 4 * boundary.size > max_pixels:
+            kept.extend((level, int(pixel)) for pixel in boundary)
+            break
+        pixels = (boundary[:, None] * 4 + np.arange(4, dtype=np.int64)).ravel()
+        level += 1
+
+    ranges = sorted(
+        (pixel << (2 * (order - level)), (pixel + 1) << (2 * (order - level)))
+        for level, pixel in kept
+    )
+    merged = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return [tuple(item) for item in merged]
+
+
+def _ranges_filter(ranges):
+    # Rows not indexed yet (saved before the index existed) always go to the exact check.
+    condition = Q(healpix_index__isnull=True, ra__isnull=False, dec__isnull=False)
+    for start, stop in ranges:
+        condition |= Q(healpix_index__gte=start, healpix_index__lt=stop)
+    return condition
+
+
+def cone_search(queryset, ra, dec, radius):
+    """Targets of ``queryset`` within ``radius`` degrees of ``ra``/``dec``, annotated with their ``separation`` (degrees)."""
+    ra = float(ra) % 360.0
+    dec = float(dec)
+    radius = float(radius)
+    if not -90.0 <= dec <= 90.0 or not radius >= 0.0:
+        return queryset.none()
+    test = _cone_test(_unit_vectors(ra, dec), math.radians(min(radius, 180.0)))
+    separation = ExpressionWrapper(
+        ACos(Least(
+            Sin(math.radians(dec)) * Sin(Radians('dec'))
+            + Cos(math.radians(dec)) * Cos(Radians('dec')) * Cos(math.radians(ra) - Radians('ra')),
+            1.0,
+        )) * 180 / Pi(),
+        FloatField(),
+    )
+    return queryset.filter(_ranges_filter(covering_ranges(test))).annotate(separation=separation).filter(
+        separation__lte=radius
+    )
+
+
+def box_search(queryset, ra_min, ra_max, dec_min, dec_max):
+    """Targets of ``queryset`` with RA in [ra_min, ra_max] (wrapping through 0 when ra_min > ra_max) and Dec in [dec_min, dec_max]."""
+    ra_min, ra_max = float(ra_min) % 360.0, float(ra_max) % 360.0
+    dec_min, dec_max = max(-90.0, float(dec_min)), min(90.0, float(dec_max))
+    if dec_min > dec_max:
+        return queryset.none()
+    test = _box_test(ra_min, ra_max, dec_min, dec_max)
+    if ra_min <= ra_max:
+        ra_condition = Q(ra__gte=ra_min, ra__lte=ra_max)
+    else:
+        ra_condition = Q(ra__gte=ra_min) | Q(ra__lte=ra_max)
+    return queryset.filter(_ranges_filter(covering_ranges(test))).filter(
+        ra_condition, dec__gte=dec_min, dec__lte=dec_max
+    )
+
+
+def polygon_search(queryset, vertices):
+    """Targets of ``queryset`` inside the polygon of (ra, dec) ``vertices``, joined by great-circle edges.
+
+    The polygon must fit within a hemisphere; other polygons raise ValueError.
+    """
+    if len(vertices) < 3:
+        raise ValueError('A polygon needs at least three vertices.')
+    polygon_ra = [float(vertex[0]) for vertex in vertices]
+    polygon_dec = [float(vertex[1]) for vertex in vertices]
+    if any(not -90.0 <= dec <= 90.0 for dec in polygon_dec):
+        raise ValueError('Polygon declinations must be within -90..90 degrees.')
+    candidates = list(
+        queryset.filter(_ranges_filter(covering_ranges(_polygon_test(polygon_ra, polygon_dec))))
+        .values_list('pk', 'ra', 'dec')
+    )
+    if not candidates:
+        return queryset.none()
+    pks, ra, dec = zip(*candidates)
+    inside = points_in_polygon(ra, dec, polygon_ra, polygon_dec)
+    return queryset.filter(pk__in=[pk for pk, matched in zip(pks, inside) if matched])
+
+
+def target_healpix_index(target):
+    """The ``healpix_index`` value of ``target``, or None without coordinates."""
+    if target.ra is None or target.dec is None:
+        return None
+    try:
+        ra, dec = float(target.ra), float(target.dec)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(ra) and math.isfinite(dec) and -90.0 <= dec <= 90.0):
+        return None
+    return int(healpix_index(ra, dec))
+
+
+def rebuild_target_sky_index(target_ids=None, batch_size=1000):
+    """Recompute ``healpix_index`` of ``target_ids`` (all targets when None); returns the number of targets changed."""
+    from tom_targets.models import Target
+
+    queryset = Target.objects.order_by('pk')
+    if target_ids is not None:
+        queryset = queryset.filter(pk__in=list(target_ids))
+    pks = list(queryset.values_list('pk', flat=True))
+    changed = 0
+    for start in range(0, len(pks), batch_size):
+        targets = list(Target.objects.filter(pk__in=pks[start:start + batch_size]).only('pk', 'ra', 'dec', 'healpix_index'))
+        stale = []
+        for target in targets:
+            value = target_healpix_index(target)
+            if value != target.healpix_index:
+                target.healpix_index = value
+                stale.append(target)
+        with transaction.atomic():
+            Target.objects.bulk_update(stale, ['healpix_index'])
+        changed += len(stale)
+    return changed
@@ -0,0 +1,267 @@
+"""Local cache of the external solar-system queries made by the Pallas pages.
+
+MPC observation sets, JPL Horizons ephemeris tables and target names, and
+SsODNet lookups are stored as SolarSystemQuery rows keyed by the query kind and
+its parameters (designation, location, epoch span, quantities). A page reads the
+stored payload and only queries the service itself for a query it has never
+made, so a slow upstream holds a web worker only for new objects.
+
+Expired rows are still served: reading one queues a refresh in db_worker, and
+db_worker's periodic pass (``SOLAR_SYSTEM_CACHE_REFRESH_INTERVAL_SECONDS``)
+refreshes rows read since their last fetch shortly before they expire and
+removes rows unused for ``SOLAR_SYSTEM_CACHE_KEEP_SECONDS``. A refresh only
+rewrites a payload that changed; otherwise it just moves the expiry forward.
+
+The live fetchers stay on the Pallas view classes, so they are imported inside
+functions.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from io import StringIO
+
+from astropy.table import Table
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from custom_code.models import SolarSystemQuery
+
+
+logger = logging.getLogger(__name__)
+
+TTL_SETTINGS = {
+    SolarSystemQuery.KIND_MPC_OBSERVATIONS: ('SOLAR_SYSTEM_CACHE_MPC_TTL_SECONDS', 6 * 3600),
+    SolarSystemQuery.KIND_HORIZONS_EPHEMERIDES: ('SOLAR_SYSTEM_CACHE_HORIZONS_TTL_SECONDS', 86400),
+    SolarSystemQuery.KIND_HORIZONS_TARGET_NAME: ('SOLAR_SYSTEM_CACHE_HORIZONS_TTL_SECONDS', 86400),
+    SolarSystemQuery.KIND_SSODNET_CANDIDATES: ('SOLAR_SYSTEM_CACHE_SSODNET_TTL_SECONDS', 7 * 86400),
+    SolarSystemQuery.KIND_SSODNET_OBJECT: ('SOLAR_SYSTEM_CACHE_SSODNET_TTL_SECONDS', 7 * 86400),
+}
+# A queued refresh that has not finished after this long may be queued again.
+REFRESH_REQUEUE_SECONDS = 3600
+# A failed refresh is retried after this long (or the TTL, when shorter); the old payload is served meanwhile.
+FAILED_REFRESH_RETRY_SECONDS = 1800
+REFRESH_BATCH_SIZE = 200
+# Only these ADES fields of an MPC observation are used by the photometry page.
+MPC_RECORD_FIELDS = ('obsid', 'obstime', 'stn', 'mag', 'rmsmag', 'band', 'ra', 'dec')
+
+
+def _setting_seconds(name, default):
+    try:
+        return max(0, int(getattr(settings, name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def ttl_seconds(kind):
+    name, default = TTL_SETTINGS[kind]
+    return _setting_seconds(name, default)
+
+
+def query_key(kind, parameters):
+    """The stored key of one query: a hash of its kind and parameters."""
+    encoded = json.dumps([kind, parameters], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def table_to_payload(table):
+    """A JSON payload holding ``table`` as ECSV text, which keeps its column types, units and masks."""
+    table = table.copy(copy_data=False)
+    table.meta.clear()
+    output = StringIO()
+    table.write(output, format='ascii.ecsv')
+    return {'ecsv': output.getvalue()}
+
+
+def table_from_payload(payload):
+    return Table.read(payload['ecsv'], format='ascii.ecsv')
+
+
+def trim_mpc_records(records):
+    return [
+        {field: record.get(field) for field in MPC_RECORD_FIELDS if field in record}
+        for record in records
+        if isinstance(record, dict)
+    ]
+
+
+def _observation_identity(record):
+    return record.get('obsid') or '|'.join(str(record.get(field) or '') for field in ('obstime', 'stn', 'ra', 'dec'))
+
+
+def _added_observations(kind, stored, fetched):
+    if kind != SolarSystemQuery.KIND_MPC_OBSERVATIONS:
+        return 0
+    known = {_observation_identity(record) for record in (stored or {}).get('records') or []}
+    return sum(1 for record in fetched.get('records') or [] if _observation_identity(record) not in known)
+
+
+def _fetch_payload(kind, parameters):
+    from custom_code.views import BhtomPallasEphemerisView, BhtomPallasPhotometryView
+
+    if kind == SolarSystemQuery.KIND_MPC_OBSERVATIONS:
+        records = BhtomPallasPhotometryView._download_mpc_observations(parameters['designation'])
+        return {'records': trim_mpc_records(records)}
+    if kind == SolarSystemQuery.KIND_HORIZONS_EPHEMERIDES:
+        return table_to_payload(BhtomPallasEphemerisView._fetch_horizons_ephemerides(
+            target_query=parameters['target'],
+            location=parameters['location'],
+            epochs=parameters['epochs'],
+            quantities=parameters['quantities'],
+            target_record=parameters['target_record'],
+        ))
+    if kind == SolarSystemQuery.KIND_HORIZONS_TARGET_NAME:
+        return {'name': BhtomPallasPhotometryView._lookup_horizons_target_name(parameters['target'])}
+    if kind == SolarSystemQuery.KIND_SSODNET_CANDIDATES:
+        return {'data': BhtomPallasPhotometryView._download_ssodnet_candidates(parameters['path'], parameters['query'])}
+    if kind == SolarSystemQuery.KIND_SSODNET_OBJECT:
+        return {'object': BhtomPallasPhotometryView._download_ssodnet_object(parameters['id'])}
+    raise ValueError(f'Unknown solar system query kind {kind!r}.')
+
+
+def _store(kind, key, designation, parameters, payload, now):
+    try:
+        with transaction.atomic():
+            SolarSystemQuery.objects.update_or_create(
+                key=key,
+                defaults={
+                    'kind': kind,
+                    'designation': str(designation or '')[:200],
+                    'parameters': parameters,
+                    'payload': payload,
+                    'fetched_at': now,
+                    'expires_at': now + timedelta(seconds=ttl_seconds(kind)),
+                    'last_used': now,
+                    'refresh_queued_at': None,
+                    'error': '',
+                },
+            )
+    except IntegrityError:
+        # Another process stored the same query first; its row is as fresh as ours.
+        pass
+
+
+def _claim_refresh(entry_ids, now):
+    """Mark the given rows as queued for a refresh; returns the ids this call claimed."""
+    retry_before = now - timedelta(seconds=REFRESH_REQUEUE_SECONDS)
+    claimable = Q(refresh_queued_at__isnull=True) | Q(refresh_queued_at__lt=retry_before)
+    claimed = []
+    for entry_id in entry_ids:
+        if SolarSystemQuery.objects.filter(claimable, pk=entry_id).update(refresh_queued_at=now):
+            claimed.append(entry_id)
+    return claimed
+
+
+def _enqueue_refreshes(entry_ids, now):
+    from custom_code.tasks import refresh_solar_system_query_task
+
+    claimed = _claim_refresh(entry_ids, now)
+    for entry_id in claimed:
+        refresh_solar_system_query_task.enqueue(entry_id)
+    return len(claimed)
+
+
+def solar_system_query(kind, parameters, *, designation=''):
+    """The payload of one external query, read from the local cache.
+
+    A query that was never made is fetched live (its errors propagate and
+    nothing is stored); an expired one is served as stored and refreshed in
+    db_worker.
+    """
+    key = query_key(kind, parameters)
+    now = timezone.now()
+    entry = SolarSystemQuery.objects.filter(key=key).only('pk', 'payload', 'expires_at').first()
+    if entry is None:
+        payload = _fetch_payload(kind, parameters)
+        _store(kind, key, designation, parameters, payload, now)
+        return payload
+
+    SolarSystemQuery.objects.filter(pk=entry.pk).update(last_used=now)
+    if entry.expires_at <= now:
+        _enqueue_refreshes([entry.pk], now)
+    return entry.payload
+
+
+def run_solar_system_refresh(entry_id):
+    """Fetch one stored query again and store the answer if it changed."""
+    entry = SolarSystemQuery.objects.filter(pk=entry_id).first()
+    if entry is None:
+        return {'status': 'missing'}
+
+    now = timezone.now()
+    ttl = ttl_seconds(entry.kind)
+    try:
+        fetched = _fetch_payload(entry.kind, entry.parameters)
+    except Exception as exc:
+        logger.warning('Refreshing %s query for %s failed: %s', entry.kind, entry.designation, exc)
+        SolarSystemQuery.objects.filter(pk=entry.pk).update(
+            refresh_queued_at=None,
+            expires_at=now + timedelta(seconds=min(ttl, FAILED_REFRESH_RETRY_SECONDS)),
+            error=str(exc)[:2000],
+            modified=now,
+        )
+        return {'status': 'failed', 'error': str(exc)}
+
+    added = _added_observations(entry.kind, entry.payload, fetched)
+    updates = {
+        'fetched_at': now,
+        'expires_at': now + timedelta(seconds=ttl),
+        'refresh_queued_at': None,
+        'error': '',
+        'modified': now,
+    }
+    changed = fetched != entry.payload
+    if changed:
+        updates['payload'] = fetched
+    SolarSystemQuery.objects.filter(pk=entry.pk).update(**updates)
+    if added:
+        logger.info('Stored %s new MPC observations of %s.', added, entry.designation)
+    return {'status': 'updated' if changed else 'unchanged', 'added': added}
+
+
+def enqueue_due_solar_system_refreshes(now=None, limit=REFRESH_BATCH_SIZE):
+    """Queue refreshes of rows expiring before the next pass, and drop rows nobody reads.
+
+    Only rows read since their last fetch are refreshed ahead of time; the
+    others are refreshed when they are read again.
+    """
+    now = now or timezone.now()
+    keep = timedelta(seconds=_setting_seconds('SOLAR_SYSTEM_CACHE_KEEP_SECONDS', 30 * 86400))
+    removed, _ = SolarSystemQuery.objects.filter(last_used__lt=now - keep).delete()
+
+    lead = timedelta(seconds=max(60, _setting_seconds('SOLAR_SYSTEM_CACHE_REFRESH_INTERVAL_SECONDS', 900)))
+    retry_before = now - timedelta(seconds=REFRESH_REQUEUE_SECONDS)
+    due_ids = list(
+        SolarSystemQuery.objects
+        .filter(expires_at__lt=now + lead, last_used__gt=F('fetched_at'))
+        .filter(Q(refresh_queued_at__isnull=True) | Q(refresh_queued_at__lt=retry_before))
+        .order_by('expires_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    return {'due': len(due_ids), 'enqueued': _enqueue_refreshes(due_ids, now), 'removed': removed}
+
+
+def refresh_solar_system_queries(queryset, *, background=False):
+    """Refresh every row of ``queryset`` now, or queue the refreshes in db_worker."""
+    entry_ids = list(queryset.order_by('expires_at').values_list('pk', flat=True))
+    if background:
+        return {'enqueued': _enqueue_refreshes(entry_ids, timezone.now())}
+    summary = {}
+    for entry_id in entry_ids:
+        status = run_solar_system_refresh(entry_id)['status']
+        summary[status] = summary.get(status, 0) + 1
+    return summary
+
+
+def prefetch_designation(designation):
+    """Store the MPC observations and Horizons name of ``designation`` if they are not stored yet."""
+    from custom_code.views import BhtomPallasPhotometryView
+
+    solar_system_query(
+        SolarSystemQuery.KIND_MPC_OBSERVATIONS,
+        {'designation': designation},
+        designation=designation,
+    )
+    BhtomPallasPhotometryView._resolve_horizons_target_label(designation)
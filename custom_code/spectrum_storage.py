@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import math
+import os
+import tempfile
+
+import numpy as np
+from astropy.units import Quantity
+from django.conf import settings
+from specutils import Spectrum1D
+
+
+logger = logging.getLogger(__name__)
+
+SPECTRUM_FILE_KEY = 'spectrum_file'
+SPECTRUM_ARRAYS_KEY = 'spectrum_arrays'
+SPECTRUM_POINTS_KEY = 'spectrum_points'
+# Serialized spectrum fields that hold one value per wavelength point.
+SPECTRUM_ARRAY_FIELDS = ('wavelength', 'flux', 'error', 'flux_error')
+
+
+def spectrum_storage_backend():
+    return str(getattr(settings, 'SPECTRUM_STORAGE_BACKEND', 'npy') or 'inline').lower()
+
+
+def spectrum_storage_dir():
+    return getattr(settings, 'SPECTRUM_STORAGE_DIR', '') or os.path.join(settings.MEDIA_ROOT, 'spectra')
+
+
+def spectrum_file_path(relative_name):
+    return os.path.join(spectrum_storage_dir(), relative_name)
+
+
+def is_stored_spectrum(value):
+    return isinstance(value, dict) and bool(value.get(SPECTRUM_FILE_KEY))
+
+
+def _array_fields(value):
+    flux = value.get('flux')
+    wavelength = value.get('wavelength')
+    if not isinstance(flux, (list, tuple, np.ndarray)) or not isinstance(wavelength, (list, tuple, np.ndarray)):
+        return []
+    if len(flux) == 0 or len(flux) != len(wavelength):
+        return []
+    return [
+        field for field in SPECTRUM_ARRAY_FIELDS
+        if isinstance(value.get(field), (list, tuple, np.ndarray)) and len(value[field]) == len(flux)
+    ]
+
+
+def is_inline_spectrum(value):
+    """True for a spectrum value that still carries its arrays as JSON lists."""
+    return isinstance(value, dict) and not is_stored_spectrum(value) and bool(_array_fields(value))
+
+
+def _to_float32(values):
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float32)
+    return np.array([np.nan if item is None else item for item in values], dtype=np.float32)
+
+
+def _write_spectrum_file(path, arrays):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.npy.part')
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            np.save(temp_file, arrays, allow_pickle=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def store_spectrum_value(value):
+    """Move the per-point arrays of a serialized spectrum into an NPY sidecar file.
+
+    The arrays are written as one float32 ``(fields, points)`` array named after
+    the SHA-256 of its content, so storing the same spectrum twice gives the same
+    ``value`` and get_or_create() keeps deduplicating. The returned value keeps
+    the units and metadata and points at the file. Values that are not spectra,
+    are already stored, or have ragged arrays are returned unchanged.
+    """
+    if spectrum_storage_backend() != 'npy' or not isinstance(value, dict) or is_stored_spectrum(value):
+        return value
+    fields = _array_fields(value)
+    if not fields:
+        return value
+    try:
+        arrays = np.stack([_to_float32(value[field]) for field in fields])
+    except (TypeError, ValueError) as exc:
+        logger.warning('Keeping spectrum inline; its arrays are not numeric: %s', exc)
+        return value
+
+    digest = hashlib.sha256()
+    digest.update(','.join(fields).encode())
+    digest.update(arrays.tobytes())
+    digest = digest.hexdigest()
+    relative_name = f'{digest[:2]}/{digest}.npy'
+    path = spectrum_file_path(relative_name)
+    if not os.path.exists(path):
+        _write_spectrum_file(path, arrays)
+
+    stored = {key: item for key, item in value.items() if key not in fields}
+    stored[SPECTRUM_FILE_KEY] = relative_name
+    stored[SPECTRUM_ARRAYS_KEY] = fields
+    stored[SPECTRUM_POINTS_KEY] = int(arrays.shape[1])
+    return stored
+
+
+def load_spectrum_arrays(value):
+    """Per-point arrays of a spectrum value, keyed by field name.
+
+    Arrays of stored spectra are read-only views of a memory-mapped NPY file;
+    inline JSON lists are converted to float arrays.
+    """
+    if not is_stored_spectrum(value):
+        return {
+            field: np.asarray([np.nan if item is None else item for item in value[field]], dtype=float)
+            for field in (_array_fields(value) if isinstance(value, dict) else [])
+        }
+    arrays = np.load(spectrum_file_path(value[SPECTRUM_FILE_KEY]), mmap_mode='r', allow_pickle=False)
+    return {field: arrays[index] for index, field in enumerate(value.get(SPECTRUM_ARRAYS_KEY) or [])}
+
+
+def inline_spectrum_value(value):
+    """The JSON-list form of a spectrum value, as SpectrumSerializer.serialize() produces it."""
+    if not is_stored_spectrum(value):
+        return value
+    inline = {
+        key: item for key, item in value.items()
+        if key not in (SPECTRUM_FILE_KEY, SPECTRUM_ARRAYS_KEY, SPECTRUM_POINTS_KEY)
+    }
+    for field, array in load_spectrum_arrays(value).items():
+        # str() of a float32 is its shortest round-trip form, so 0.1 comes back as 0.1.
+        inline[field] = [None if math.isnan(item) else float(str(item)) for item in array]
+    return inline
+
+
+def spectrum_from_value(value):
+    """Build a Spectrum1D from a stored or inline spectrum value."""
+    arrays = load_spectrum_arrays(value)
+    return Spectrum1D(
+        flux=Quantity(value=arrays['flux'], unit=value['flux_units']),
+        spectral_axis=Quantity(value=arrays['wavelength'], unit=value['wavelength_units']),
+    )
+
+
+def remove_orphaned_spectrum_files(referenced_names):
+    """Delete sidecar files under the storage directory that no value points at."""
+    referenced = {os.path.normpath(name) for name in referenced_names}
+    root = spectrum_storage_dir()
+    removed = 0
+    for directory, _subdirs, file_names in os.walk(root):
+        for file_name in file_names:
+            if not file_name.endswith('.npy'):
+                continue
+            path = os.path.join(directory, file_name)
+            if os.path.normpath(os.path.relpath(path, root)) not in referenced:
+                os.remove(path)
+                removed += 1
+    for directory, _subdirs, _file_names in os.walk(root, topdown=False):
+        if directory != root and not os.listdir(directory):
+            os.rmdir(directory)
+    return removed
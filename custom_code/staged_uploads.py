@@ -0,0 +1,316 @@
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from guardian.shortcuts import assign_perm
+from tom_common.hooks import run_hook
+from tom_dataproducts.data_processor import run_data_processor
+from tom_dataproducts.exceptions import InvalidFileFormatException
+from tom_dataproducts.models import DataProduct, ReducedDatum
+
+from custom_code.bhtom2_uploads import (
+    enqueue_bhtom2_forward,
+    load_extra_data_dict,
+    normalize_fits_upload,
+    save_extra_data_dict,
+)
+from custom_code.models import StagedDataProductUpload
+
+
+logger = logging.getLogger(__name__)
+
+COPY_BLOCK_SIZE = 65536
+TERMINAL_STATUSES = (StagedDataProductUpload.STATUS_DONE, StagedDataProductUpload.STATUS_FAILED)
+
+
+class StagedUploadError(Exception):
+    pass
+
+
+class StagedUploadOffsetError(StagedUploadError):
+    def __init__(self, received_bytes):
+        super().__init__(f'Expected a chunk at offset {received_bytes}.')
+        self.received_bytes = received_bytes
+
+
+def upload_chunk_size():
+    return max(COPY_BLOCK_SIZE, int(getattr(settings, 'DATA_PRODUCT_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)))
+
+
+def staging_dir():
+    path = getattr(settings, 'DATA_PRODUCT_UPLOAD_STAGING_DIR', '') or os.path.join(settings.MEDIA_ROOT, 'upload_staging')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def staged_file_path(upload):
+    return os.path.join(staging_dir(), f'{upload.upload_id}.part')
+
+
+def _remove_staged_file(upload):
+    try:
+        os.remove(staged_file_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def purge_abandoned_staged_uploads(now=None):
+    """Drop staged uploads untouched for DATA_PRODUCT_UPLOAD_STAGING_MAX_AGE_SECONDS and their files."""
+    max_age = int(getattr(settings, 'DATA_PRODUCT_UPLOAD_STAGING_MAX_AGE_SECONDS', 86400))
+    cutoff = (now or timezone.now()) - timedelta(seconds=max_age)
+    abandoned = list(
+        StagedDataProductUpload.objects
+        .filter(modified__lt=cutoff)
+        .exclude(status__in=(StagedDataProductUpload.STATUS_QUEUED, StagedDataProductUpload.STATUS_PROCESSING))
+    )
+    for upload in abandoned:
+        _remove_staged_file(upload)
+    StagedDataProductUpload.objects.filter(pk__in=[upload.pk for upload in abandoned]).delete()
+    return len(abandoned)
+
+
+def staged_upload_status(upload):
+    return {
+        'upload_id': upload.upload_id,
+        'file_name': upload.file_name,
+        'status': upload.status,
+        'stage': upload.stage,
+        'message': upload.message,
+        'total_bytes': upload.total_bytes,
+        'received_bytes': upload.received_bytes,
+        'dataproduct_id': upload.dataproduct_id,
+    }
+
+
+def _queue_staged_upload(upload):
+    from custom_code.tasks import process_staged_dataproduct_upload
+
+    upload.status = StagedDataProductUpload.STATUS_QUEUED
+    upload.stage = ''
+    upload.message = 'Waiting for a worker.'
+    upload.save(update_fields=['status', 'stage', 'message', 'received_bytes', 'modified'])
+    process_staged_dataproduct_upload.enqueue(upload.upload_id)
+
+
+def create_staged_uploads(user, files, *, target=None, observation_record=None, data_product_type='', groups=(),
+                          bhtom2_options=None, resume_ids=None):
+    """Register one staged upload per ``(file_name, total_bytes)`` pair of a form submission.
+
+    A ``resume_ids`` entry naming an unfinished upload of the same user and file
+    continues that upload instead of starting over. Empty files are queued at once.
+    Returns the batch id and the uploads in ``files`` order.
+    """
+    purge_abandoned_staged_uploads()
+    if target is None and observation_record is not None:
+        target = observation_record.target
+    resume_ids = list(resume_ids or [])
+    batch_id = uuid.uuid4().hex
+    uploads = []
+    for index, (file_name, total_bytes) in enumerate(files):
+        resume_id = resume_ids[index] if index < len(resume_ids) else ''
+        upload = None
+        if resume_id:
+            upload = StagedDataProductUpload.objects.filter(
+                upload_id=resume_id,
+                user=user,
+                file_name=file_name,
+                total_bytes=total_bytes,
+                status=StagedDataProductUpload.STATUS_UPLOADING,
+            ).first()
+        if upload is None:
+            upload = StagedDataProductUpload(
+                upload_id=uuid.uuid4().hex,
+                user=user,
+                file_name=file_name,
+                total_bytes=max(0, int(total_bytes)),
+            )
+            with open(staged_file_path(upload), 'wb'):
+                pass
+        upload.batch_id = batch_id
+        upload.target = target
+        upload.observation_record = observation_record
+        upload.data_product_type = data_product_type or ''
+        upload.group_ids = [group.pk for group in groups]
+        upload.bhtom2_options = dict(bhtom2_options or {})
+        upload.save()
+        if upload.received_bytes >= upload.total_bytes:
+            _queue_staged_upload(upload)
+        uploads.append(upload)
+    return batch_id, uploads
+
+
+def _check_chunk_offset(upload, offset):
+    if upload.status != StagedDataProductUpload.STATUS_UPLOADING:
+        raise StagedUploadError(f'Upload of {upload.file_name} is already {upload.status}.')
+    if offset != upload.received_bytes:
+        raise StagedUploadOffsetError(upload.received_bytes)
+
+
+def append_staged_chunk(upload, offset, stream):
+    """Append the chunk read from ``stream`` at byte ``offset`` of a staged upload.
+
+    Raises StagedUploadOffsetError when ``offset`` is not where the upload stands,
+    so a client resuming after an interruption learns where to continue. The last
+    chunk queues the processing job.
+
+    The chunk is read into a temporary file before the upload row is locked, so
+    a slow client never holds the database write lock.
+    """
+    upload = StagedDataProductUpload.objects.get(pk=upload.pk)
+    _check_chunk_offset(upload, offset)
+
+    remaining = upload.total_bytes - offset
+    with tempfile.TemporaryFile(dir=staging_dir()) as chunk_file:
+        written = 0
+        while True:
+            block = stream.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            written += len(block)
+            if written > remaining:
+                raise StagedUploadError(f'Chunk runs past the declared size of {upload.file_name}.')
+            chunk_file.write(block)
+
+        with transaction.atomic():
+            upload = StagedDataProductUpload.objects.select_for_update().get(pk=upload.pk)
+            # Another request may have appended this chunk while it was being read.
+            _check_chunk_offset(upload, offset)
+            chunk_file.seek(0)
+            with open(staged_file_path(upload), 'r+b') as staged_file:
+                staged_file.seek(offset)
+                staged_file.truncate()
+                shutil.copyfileobj(chunk_file, staged_file, COPY_BLOCK_SIZE)
+
+            upload.received_bytes = offset + written
+            if upload.received_bytes >= upload.total_bytes:
+                _queue_staged_upload(upload)
+            else:
+                upload.save(update_fields=['received_bytes', 'modified'])
+    return upload
+
+
+def stage_uploaded_file(upload, uploaded_file):
+    """Copy a file that arrived in one form request into its staged upload and queue it."""
+    if upload.status != StagedDataProductUpload.STATUS_UPLOADING:
+        return
+    with open(staged_file_path(upload), 'wb') as staged_file:
+        for chunk in uploaded_file.chunks(COPY_BLOCK_SIZE):
+            staged_file.write(chunk)
+    upload.received_bytes = upload.total_bytes
+    _queue_staged_upload(upload)
+
+
+def _set_stage(upload, stage, message=''):
+    upload.stage = stage
+    upload.message = message
+    upload.save(update_fields=['stage', 'message', 'modified'])
+
+
+def _finish(upload, status, message, dataproduct=None):
+    upload.status = status
+    upload.stage = ''
+    upload.message = message
+    upload.dataproduct = dataproduct
+    upload.save(update_fields=['status', 'stage', 'message', 'dataproduct', 'modified'])
+    _remove_staged_file(upload)
+
+
+def _save_staged_dataproduct(upload):
+    dataproduct = DataProduct(
+        target=upload.target,
+        observation_record=upload.observation_record,
+        product_id=None,
+        data_product_type=upload.data_product_type,
+    )
+    normalization_metadata = None
+    with open(staged_file_path(upload), 'rb') as staged_handle:
+        staged_file = File(staged_handle, name=upload.file_name)
+        if upload.data_product_type == 'fits_file':
+            staged_file, normalization_metadata = normalize_fits_upload(staged_file)
+            staged_file.seek(0)
+        dataproduct.data.save(os.path.basename(staged_file.name), staged_file, save=False)
+    dataproduct.save()
+    if normalization_metadata is not None:
+        metadata = load_extra_data_dict(dataproduct)
+        metadata['fits_normalization'] = normalization_metadata
+        save_extra_data_dict(dataproduct, metadata)
+    return dataproduct
+
+
+def _queue_bhtom2_forward(upload, dataproduct):
+    options = upload.bhtom2_options or {}
+    try:
+        enqueue_bhtom2_forward(
+            dataproduct,
+            observatory=options.get('observatory', ''),
+            calibration_filter=options.get('calibration_filter') or 'GaiaSP/any',
+            comment=options.get('comment', ''),
+            user_id=upload.user_id,
+        )
+    except Exception as exc:
+        logger.warning('BHTOM2 FITS forwarding could not be queued for dataproduct %s: %s', dataproduct.pk, exc)
+        return f'Local FITS upload succeeded but BHTOM2 forwarding failed: {exc}'
+    return 'Uploaded; queued for BHTOM2.'
+
+
+def process_staged_upload(upload_id):
+    """Normalise, save and process one staged upload as a DataProduct."""
+    with transaction.atomic():
+        upload = (
+            StagedDataProductUpload.objects
+            .select_for_update()
+            .select_related('user', 'target', 'observation_record')
+            .filter(upload_id=upload_id)
+            .first()
+        )
+        if upload is None or upload.status != StagedDataProductUpload.STATUS_QUEUED:
+            logger.info('Skipping staged upload %s: not queued.', upload_id)
+            return {'upload_id': upload_id, 'status': getattr(upload, 'status', 'missing')}
+        upload.status = StagedDataProductUpload.STATUS_PROCESSING
+        upload.stage = 'normalising'
+        upload.message = ''
+        upload.save(update_fields=['status', 'stage', 'message', 'modified'])
+
+    dataproduct = None
+    try:
+        dataproduct = _save_staged_dataproduct(upload)
+        _set_stage(upload, 'processing')
+        run_hook('data_product_post_upload', dataproduct)
+        reduced_data = run_data_processor(dataproduct)
+        _set_stage(upload, 'ingesting')
+        if not settings.TARGET_PERMISSIONS_ONLY:
+            for group in Group.objects.filter(pk__in=upload.group_ids):
+                assign_perm('tom_dataproducts.view_dataproduct', group, dataproduct)
+                assign_perm('tom_dataproducts.delete_dataproduct', group, dataproduct)
+                assign_perm('tom_dataproducts.view_reduceddatum', group, reduced_data)
+    except InvalidFileFormatException as exc:
+        _discard_dataproduct(dataproduct)
+        _finish(upload, StagedDataProductUpload.STATUS_FAILED, f'File format invalid for file {upload.file_name} -- error was {exc}')
+        return staged_upload_status(upload)
+    except Exception as exc:
+        logger.exception('Processing staged upload %s (%s) failed: %s', upload.upload_id, upload.file_name, exc)
+        _discard_dataproduct(dataproduct)
+        _finish(upload, StagedDataProductUpload.STATUS_FAILED, f'There was a problem processing your file: {upload.file_name}')
+        return staged_upload_status(upload)
+
+    message = 'Uploaded.'
+    if upload.data_product_type == 'fits_file':
+        message = _queue_bhtom2_forward(upload, dataproduct)
+    _finish(upload, StagedDataProductUpload.STATUS_DONE, message, dataproduct=dataproduct)
+    logger.info('Processed staged upload %s into dataproduct %s.', upload.upload_id, dataproduct.pk)
+    return staged_upload_status(upload)
+
+
+def _discard_dataproduct(dataproduct):
+    if dataproduct is None or dataproduct.pk is None:
+        return
+    ReducedDatum.objects.filter(data_product=dataproduct).delete()
+    dataproduct.delete()
@@ -7,6 +7,7 @@ from typing import Optional
 from astropy import units as u
 from astropy.coordinates import AltAz, EarthLocation, SkyCoord, get_body
 from astropy.time import Time
+import numpy as np
 from numpy import around
 
 from tom_targets.models import Target
@@ -340,6 +341,26 @@ def compute_sun_separation(
     return float(around(sun_pos.separation(obj_in_sun_frame).deg, 0))
 
 
+def compute_sun_separations(ra, dec, time_to_compute: Optional[Time] = None):
+    """compute_sun_separation() of arrays of geocentric ICRS coordinates, with one transformation."""
+    tt = _coerce_time_utc(time_to_compute)
+    sun_pos = get_body("sun", tt)
+    obj_pos = SkyCoord(ra=np.asarray(ra, dtype=float) * u.deg, dec=np.asarray(dec, dtype=float) * u.deg, frame="icrs")
+    return around(sun_pos.separation(obj_pos.transform_to(sun_pos.frame)).deg, 0)
+
+
+def _non_sidereal_sun_separation(target, tt: Time):
+    """Geocentric Sun separation from the precomputed ephemeris grid, rounded like compute_sun_separation()."""
+    from custom_code.nonsidereal_ephemeris import interpolated_elongation
+
+    try:
+        elongation = interpolated_elongation(target, tt)
+    except Exception:
+        logger.exception("Reading the ephemeris grid of non-sidereal target %s failed.", target.name)
+        return None
+    return None if elongation is None else float(around(elongation, 0))
+
+
 def _resolve_target_coordinates_now(
     target,
     time_to_compute: Optional[Time] = None,
@@ -347,6 +368,8 @@ def _resolve_target_coordinates_now(
     observer_lon_deg=None,
     observer_elevation_m=None,
 ):
+    from custom_code.nonsidereal_ephemeris import interpolated_ra_dec
+
     tt = _coerce_time_utc(time_to_compute)
 
     if target.type != Target.NON_SIDEREAL:
@@ -354,6 +377,21 @@ def _resolve_target_coordinates_now(
             return None
         return float(target.ra), float(target.dec)
 
+    try:
+        coords = interpolated_ra_dec(
+            target,
+            tt,
+            observer_location=_observer_location(
+                observer_lat_deg=observer_lat_deg,
+                observer_lon_deg=observer_lon_deg,
+                observer_elevation_m=observer_elevation_m,
+            ),
+        )
+        if coords is not None:
+            return coords
+    except Exception:
+        logger.exception("Reading the ephemeris grid of non-sidereal target %s failed.", target.name)
+
     try:
         coords = _non_sidereal_ra_dec_now(
             target,
@@ -434,17 +472,22 @@ def get_live_target_values(
         }
 
     ra, dec = coordinates
-    return {
-        "ra": ra,
-        "dec": dec,
-        "sun_separation": compute_sun_separation(
+    sun_separation = None
+    if _observer_location(observer_lat_deg, observer_lon_deg, observer_elevation_m) is None:
+        sun_separation = _non_sidereal_sun_separation(target, tt)
+    if sun_separation is None:
+        sun_separation = compute_sun_separation(
             ra,
             dec,
             time_to_compute=tt,
             observer_lat_deg=observer_lat_deg,
             observer_lon_deg=observer_lon_deg,
             observer_elevation_m=observer_elevation_m,
-        ),
+        )
+    return {
+        "ra": ra,
+        "dec": dec,
+        "sun_separation": sun_separation,
         "altitude_deg": compute_target_altitude(
             ra,
             dec,
@@ -468,7 +511,11 @@ def refresh_target_sun_separation(target_id: int) -> None:
         return
     ra, dec = coordinates
 
-    sun_separation = compute_sun_separation(ra, dec, time_to_compute=tt)
+    sun_separation = None
+    if target.type == Target.NON_SIDEREAL:
+        sun_separation = _non_sidereal_sun_separation(target, tt)
+    if sun_separation is None:
+        sun_separation = compute_sun_separation(ra, dec, time_to_compute=tt)
     Target.objects.filter(pk=target_id).update(sun_separation=sun_separation)
     # Priority depends on current MJD (dt), so refresh it whenever "now" based
     # quantities like sun separation are refreshed.
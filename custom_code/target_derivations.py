@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict
+from typing import Dict, List
 
 import astropy.units as u
 from astropy.coordinates import FK5, SkyCoord, get_constellation
@@ -45,6 +45,34 @@ def derive_sidereal_target_fields(target: Target) -> Dict[str, object]:
     }
 
 
+def derive_sidereal_target_fields_batch(targets) -> List[Dict[str, object]]:
+    """derive_sidereal_target_fields() of many targets, with one coordinate transformation per epoch."""
+    results = [{} for _ in targets]
+    indices_by_epoch = {}
+    for index, target in enumerate(targets):
+        if getattr(target, 'type', None) != Target.SIDEREAL or target.ra is None or target.dec is None:
+            continue
+        indices_by_epoch.setdefault(getattr(target, 'epoch', None), []).append(index)
+
+    for epoch, indices in indices_by_epoch.items():
+        coords = SkyCoord(
+            ra=[float(targets[index].ra) for index in indices] * u.deg,
+            dec=[float(targets[index].dec) for index in indices] * u.deg,
+            frame=_sidereal_coordinate_frame(epoch),
+        )
+        galactic = coords.galactic
+        galactic_lng = around(galactic.l.degree, 6)
+        galactic_lat = around(galactic.b.degree, 6)
+        constellations = get_constellation(coords, short_name=False)
+        for position, index in enumerate(indices):
+            results[index] = {
+                'galactic_lng': float(galactic_lng[position]),
+                'galactic_lat': float(galactic_lat[position]),
+                'constellation': str(constellations[position]),
+            }
+    return results
+
+
 def refresh_target_derived_fields(target_id: int) -> None:
     try:
         target = Target.objects.get(pk=target_id)
@@ -0,0 +1,470 @@
+"""Bulk import of sidereal targets from CSV, VOTable and ECSV tables.
+
+Creating targets one by one runs the post-save signals and the target_post_save
+hook for each of them: a galactic/constellation transformation, a Sun position,
+a priority, a name index row and one queued job per DataService, per target.
+Here the whole table is validated and checked against the name index first,
+the derived fields of every batch are computed with one array transformation
+(sidereal coordinates per epoch, Sun separations), and the targets, aliases
+and index rows are written with bulk inserts. The DataServices of the new
+targets then run in a single queued job that handles
+``TARGET_IMPORT_DATASERVICES_BATCH_SIZE`` targets and re-queues the rest
+``TARGET_IMPORT_DATASERVICES_INTERVAL_SECONDS`` later, so an import of a few
+thousand targets does not flood the queue or the external services.
+"""
+import logging
+import math
+import os
+import re
+from datetime import timedelta
+
+from astropy import units as u
+from astropy.coordinates import Angle
+from astropy.table import Table
+from astropy.time import Time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from guardian.shortcuts import assign_perm
+from tom_targets.models import Target, TargetName
+
+from custom_code.models import TargetNameIndex
+from custom_code.priority import compute_target_priority_values
+from custom_code.sky_index import healpix_index
+from custom_code.sun_separation import compute_sun_separations
+from custom_code.target_derivations import derive_sidereal_target_fields_batch
+from custom_code.target_names import alias_key
+
+
+logger = logging.getLogger(__name__)
+
+TABLE_FORMATS = {
+    '.csv': 'ascii.csv',
+    '.ecsv': 'ascii.ecsv',
+    '.xml': 'votable',
+    '.vot': 'votable',
+    '.votable': 'votable',
+}
+# Accepted column names (case-insensitive) of each imported field.
+COLUMN_ALIASES = {
+    'name': ('name', 'target', 'target_name', 'object', 'main_id'),
+    'ra': ('ra', 'ra_deg', 'raj2000', '_raj2000', 'ra_icrs'),
+    'dec': ('dec', 'dec_deg', 'dej2000', 'decj2000', '_dej2000', 'de_icrs', 'dec_icrs'),
+    'epoch': ('epoch',),
+    'pm_ra': ('pm_ra', 'pmra'),
+    'pm_dec': ('pm_dec', 'pmdec', 'pmde'),
+    'parallax': ('parallax', 'plx'),
+    'parallax_error': ('parallax_error', 'e_plx', 'plx_error'),
+    'classification': ('classification', 'class', 'type'),
+    'importance': ('importance',),
+    'cadence': ('cadence',),
+    'description': ('description', 'comment'),
+    'aliases': ('aliases', 'alias', 'other_names'),
+}
+# Units the numeric fields are stored in; table columns with other units are converted.
+FIELD_UNITS = {
+    'ra': u.deg,
+    'dec': u.deg,
+    'pm_ra': u.mas / u.yr,
+    'pm_dec': u.mas / u.yr,
+    'parallax': u.mas,
+    'parallax_error': u.mas,
+}
+FLOAT_FIELDS = ('epoch', 'pm_ra', 'pm_dec', 'parallax', 'parallax_error', 'importance', 'cadence')
+_ALIAS_SEPARATORS = re.compile(r'[;,|]')
+
+
+def _setting_int(name, default, minimum=0):
+    try:
+        return max(minimum, int(getattr(settings, name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def read_target_table(path, table_format=None):
+    """The astropy Table of ``path``; the format is taken from the file extension unless given."""
+    if table_format is None:
+        extension = os.path.splitext(str(path))[1].lower()
+        table_format = TABLE_FORMATS.get(extension)
+        if table_format is None:
+            raise ValueError(f'Unsupported target table extension "{extension}"; use one of {", ".join(TABLE_FORMATS)}.')
+    return Table.read(path, format=table_format)
+
+
+def _column_names(table):
+    lowered = {name.strip().lower(): name for name in table.colnames}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        column = next((lowered[alias] for alias in aliases if alias in lowered), None)
+        if column is not None:
+            columns[field] = column
+    return columns
+
+
+def _column_values(table, column, field):
+    """The values of one column as Python objects, converted to the unit of ``field``; masked cells are None."""
+    data = table[column]
+    target_unit = FIELD_UNITS.get(field)
+    if target_unit is not None and data.unit is not None and data.dtype.kind in 'fiu':
+        data = data.quantity.to_value(target_unit)
+    mask = getattr(table[column], 'mask', None)
+    values = []
+    for index, value in enumerate(data):
+        if mask is not None and bool(mask[index]):
+            values.append(None)
+            continue
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', errors='replace')
+        values.append(value.item() if hasattr(value, 'item') else value)
+    return values
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _parse_float(value, label):
+    if _blank(value):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{label} "{value}" is not a number.')
+    if not math.isfinite(number):
+        return None
+    return number
+
+
+def _parse_angle(value, label, sexagesimal_unit):
+    """Degrees of a decimal or sexagesimal angle ("12:34:56.7", "12h34m56.7s", "-01 02 03")."""
+    if _blank(value):
+        raise ValueError(f'{label} is required.')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(Angle(str(value).strip(), unit=sexagesimal_unit).deg)
+    except (TypeError, ValueError, u.UnitsError):
+        raise ValueError(f'{label} "{value}" is not a valid angle.')
+
+
+def _classification_value(value):
+    if _blank(value):
+        return None
+    known = {str(key).lower(): key for key, _label in settings.CLASSIFICATION_TYPES}
+    classification = known.get(str(value).strip().lower())
+    if classification is None:
+        raise ValueError(f'Unknown classification "{value}".')
+    return classification
+
+
+def _parse_row(values):
+    name = '' if _blank(values.get('name')) else str(values['name']).strip()
+    if not name:
+        raise ValueError('Name is required.')
+    if len(name) > 100:
+        raise ValueError(f'Name "{name}" is longer than 100 characters.')
+
+    fields = {'name': name}
+    fields['ra'] = _parse_angle(values.get('ra'), 'RA', u.hourangle)
+    fields['dec'] = _parse_angle(values.get('dec'), 'Dec', u.deg)
+    if not 0.0 <= fields['ra'] < 360.0:
+        raise ValueError(f'RA {fields["ra"]} is outside 0-360 degrees.')
+    if not -90.0 <= fields['dec'] <= 90.0:
+        raise ValueError(f'Dec {fields["dec"]} is outside -90..90 degrees.')
+    for field in FLOAT_FIELDS:
+        number = _parse_float(values.get(field), field)
+        if number is not None:
+            fields[field] = number
+    if 'epoch' in fields and not 1000.0 <= fields['epoch'] <= 2100.0:
+        raise ValueError(f'Epoch {fields["epoch"]} is outside 1000-2100.')
+    if not 0.0 <= fields.get('importance', 0.0) <= 10.0:
+        raise ValueError(f'Importance {fields["importance"]} is outside 0-10.')
+    if not 0.0 <= fields.get('cadence', 0.0) <= 100.0:
+        raise ValueError(f'Cadence {fields["cadence"]} is outside 0-100 days.')
+
+    classification = _classification_value(values.get('classification'))
+    if classification is not None:
+        fields['classification'] = classification
+    if not _blank(values.get('description')):
+        fields['description'] = str(values['description']).strip()
+
+    aliases = []
+    if not _blank(values.get('aliases')):
+        aliases = [alias.strip() for alias in _ALIAS_SEPARATORS.split(str(values['aliases'])) if alias.strip()]
+    return fields, aliases
+
+
+def parse_target_table(table):
+    """Validate the rows of ``table``.
+
+    Returns ``(rows, invalid)``: rows are ``(line, fields, aliases)`` with the
+    Target field values of each valid row, invalid are ``(line, message)``.
+    Lines count table rows from 1.
+    """
+    columns = _column_names(table)
+    missing = [field for field in ('name', 'ra', 'dec') if field not in columns]
+    if missing:
+        raise ValueError(f'Target table has no {", ".join(missing)} column.')
+    column_values = {field: _column_values(table, column, field) for field, column in columns.items()}
+
+    rows, invalid = [], []
+    for index in range(len(table)):
+        line = index + 1
+        try:
+            fields, aliases = _parse_row({field: values[index] for field, values in column_values.items()})
+        except ValueError as exc:
+            invalid.append((line, str(exc)))
+            continue
+        rows.append((line, fields, aliases))
+    return rows, invalid
+
+
+def _existing_keys(keys, names):
+    """{key: target_id} of the names and aliases among ``keys`` / ``names`` that already belong to a target."""
+    existing = {}
+    keys = sorted(keys)
+    for start in range(0, len(keys), 1000):
+        for key, target_id in TargetNameIndex.objects.filter(key__in=keys[start:start + 1000]).values_list('key', 'target_id'):
+            existing.setdefault(key, target_id)
+    names = sorted(names)
+    for start in range(0, len(names), 1000):
+        chunk = names[start:start + 1000]
+        for name, target_id in Target.objects.filter(name__in=chunk).values_list('name', 'pk'):
+            existing.setdefault(alias_key(name), target_id)
+        for name, target_id in TargetName.objects.filter(name__in=chunk).values_list('name', 'target_id'):
+            existing.setdefault(alias_key(name), target_id)
+    return existing
+
+
+def deduplicate_target_rows(rows):
+    """Split parsed rows into new ones and duplicates.
+
+    A row whose name folds (alias_key()) to the name or an alias of an existing
+    target is reported as existing, and one folding to the name or an alias of
+    an earlier row as a duplicate. Aliases already in use are dropped from the
+    row. Returns ``(new_rows, existing, duplicates)``, the latter two as
+    ``(line, name, message)``.
+    """
+    keys, names = set(), set()
+    for _line, fields, aliases in rows:
+        for name in [fields['name'], *aliases]:
+            keys.add(alias_key(name))
+            names.add(name)
+    existing_keys = _existing_keys(keys - {''}, names)
+
+    new_rows, existing, duplicates = [], [], []
+    seen = {}
+    for line, fields, aliases in rows:
+        key = alias_key(fields['name'])
+        if key in existing_keys:
+            existing.append((line, fields['name'], f'Matches existing target {existing_keys[key]}.'))
+            continue
+        if key in seen:
+            duplicates.append((line, fields['name'], f'Same name as line {seen[key]}.'))
+            continue
+        seen[key] = line
+        kept = []
+        for alias in aliases:
+            alias_name_key = alias_key(alias)
+            if not alias_name_key or alias_name_key == key or alias_name_key in existing_keys or alias_name_key in seen:
+                logger.info('Skipping alias "%s" of imported target %s because it is already in use.', alias, fields['name'])
+                continue
+            seen[alias_name_key] = line
+            kept.append(alias[:100])
+        new_rows.append((line, fields, kept))
+    return new_rows, existing, duplicates
+
+
+def _build_targets(rows, permissions, when):
+    """Unsaved Target instances of ``rows`` with their derived fields filled in."""
+    targets = []
+    for _line, fields, _aliases in rows:
+        target = Target(type=Target.SIDEREAL, **fields)
+        if permissions:
+            target.permissions = permissions
+        targets.append(target)
+
+    for target, derived in zip(targets, derive_sidereal_target_fields_batch(targets)):
+        for field, value in derived.items():
+            setattr(target, field, value)
+    if targets:
+        # Imported coordinates are used as they are; a year of proper motion does not change the rounded separation.
+        separations = compute_sun_separations(
+            [target.ra for target in targets],
+            [target.dec for target in targets],
+            time_to_compute=when,
+        )
+        for target, separation in zip(targets, separations):
+            target.sun_separation = float(separation)
+        # The pre_save signal that sets the HEALPix index does not run for bulk inserts.
+        pixels = healpix_index([target.ra for target in targets], [target.dec for target in targets])
+        for target, pixel in zip(targets, pixels):
+            target.healpix_index = int(pixel)
+    for target in targets:
+        target.priority, target.cadence_priority = compute_target_priority_values(target, mjd_now=when.mjd)
+    return targets
+
+
+def _bulk_insert_targets(targets):
+    """Insert ``targets`` with one query per table; returns {name: pk}.
+
+    Target extends the concrete BaseTarget, and bulk_create() refuses
+    multi-table models, so the BaseTarget rows are bulk-created first and the
+    Target rows are then inserted pointing at them.
+    """
+    parent_link = Target._meta.pk
+    parent_model = parent_link.remote_field.model
+    parent_fields = [field.attname for field in parent_model._meta.concrete_fields if not field.primary_key]
+    parent_model.objects.bulk_create([
+        parent_model(**{field: getattr(target, field) for field in parent_fields}) for target in targets
+    ])
+    target_ids = dict(parent_model.objects.filter(name__in=[target.name for target in targets]).values_list('name', 'pk'))
+    for target in targets:
+        setattr(target, parent_link.attname, target_ids[target.name])
+    Target._base_manager._insert(targets, fields=Target._meta.local_concrete_fields)
+    return target_ids
+
+
+def _untaken_aliases(name, aliases, taken):
+    kept = []
+    for alias in aliases:
+        if alias_key(alias) in taken:
+            logger.info('Skipping alias "%s" of imported target %s because it is already in use.', alias, name)
+            continue
+        kept.append(alias)
+    return kept
+
+
+def _create_batch(rows, permissions, groups, when):
+    """Create the targets of ``rows`` with their aliases and name index rows.
+
+    Rows whose name was taken by a target created since the table was checked
+    are skipped as existing, aliases taken since then are dropped, and a batch
+    still hitting a unique constraint is not created. Returns the new target ids
+    and the ``(line, name, message)`` errors of the existing and of the
+    conflicting rows.
+    """
+    targets = _build_targets(rows, permissions, when)
+    try:
+        with transaction.atomic():
+            names = [name for _line, fields, aliases in rows for name in [fields['name'], *aliases]]
+            taken = _existing_keys({alias_key(name) for name in names}, names)
+            existing = [
+                (line, fields['name'], f'Matches existing target {taken[alias_key(fields["name"])]}.')
+                for line, fields, _aliases in rows
+                if alias_key(fields['name']) in taken
+            ]
+            if existing:
+                kept = [alias_key(fields['name']) not in taken for _line, fields, _aliases in rows]
+                rows = [row for row, keep in zip(rows, kept) if keep]
+                targets = [target for target, keep in zip(targets, kept) if keep]
+            if not targets:
+                return [], existing, []
+            rows = [(line, fields, _untaken_aliases(fields['name'], aliases, taken)) for line, fields, aliases in rows]
+            names = [target.name for target in targets]
+            # Bulk inserts send no post_save signals: the index rows, priorities and derived fields are written here.
+            target_ids = _bulk_insert_targets(targets)
+            TargetName.objects.bulk_create([
+                TargetName(target_id=target_ids[fields['name']], name=alias)
+                for _line, fields, aliases in rows
+                for alias in aliases
+            ])
+            index_rows = [TargetNameIndex(target_id=target_ids[name], key=alias_key(name)) for name in names]
+            aliases = TargetName.objects.filter(target_id__in=list(target_ids.values())).values_list('pk', 'target_id', 'name')
+            index_rows.extend(
+                TargetNameIndex(target_id=target_id, target_name_id=pk, key=alias_key(name))
+                for pk, target_id, name in aliases
+            )
+            TargetNameIndex.objects.bulk_create(index_rows)
+            created = Target.objects.filter(pk__in=list(target_ids.values()))
+            for group in groups or ():
+                for permission in ('view_target', 'change_target', 'delete_target'):
+                    assign_perm(f'{Target._meta.app_label}.{permission}', group, created)
+    except IntegrityError as exc:
+        # A target or alias of this batch was created concurrently; the whole batch was rolled back.
+        logger.warning('Could not import a batch of %s targets: %s', len(rows), exc)
+        conflicts = [(line, fields['name'], f'Not created, conflicts with a concurrent change: {exc}') for line, fields, _aliases in rows]
+        return [], [], conflicts
+    return [target_ids[name] for name in names], existing, []
+
+
+def import_targets(path, *, table_format=None, permissions=None, groups=None, dry_run=False, run_dataservices=True):
+    """Import the sidereal targets of a CSV, VOTable or ECSV table.
+
+    ``permissions`` sets the access level of the new targets (the TOM default
+    otherwise) and ``groups`` get view/change/delete permissions on them.
+    Targets are written in batches of ``TARGET_IMPORT_BATCH_SIZE``; with
+    ``dry_run`` nothing is written. Returns a summary with the row counts, the
+    ``errors`` of the skipped rows as ``(line, name, message)`` and the new
+    ``target_ids``.
+    """
+    rows, invalid = parse_target_table(read_target_table(path, table_format))
+    new_rows, existing, duplicates = deduplicate_target_rows(rows)
+    summary = {
+        'rows': len(rows) + len(invalid),
+        'created': 0,
+        'existing': len(existing),
+        'duplicates': len(duplicates),
+        'invalid': len(invalid),
+        'conflicts': 0,
+        'errors': sorted(
+            [(line, '', message) for line, message in invalid] + existing + duplicates,
+            key=lambda error: error[0],
+        ),
+        'target_ids': [],
+    }
+    if dry_run:
+        summary['created'] = len(new_rows)
+        return summary
+
+    batch_size = _setting_int('TARGET_IMPORT_BATCH_SIZE', 500, minimum=1)
+    when = Time(timezone.now())
+    for start in range(0, len(new_rows), batch_size):
+        target_ids, batch_existing, conflicts = _create_batch(new_rows[start:start + batch_size], permissions, groups, when)
+        summary['target_ids'].extend(target_ids)
+        summary['existing'] += len(batch_existing)
+        summary['conflicts'] += len(conflicts)
+        summary['errors'].extend(batch_existing + conflicts)
+    summary['errors'].sort(key=lambda error: error[0])
+    summary['created'] = len(summary['target_ids'])
+    logger.info(
+        'Imported %s targets from %s (%s existing, %s duplicate, %s invalid and %s conflicting rows).',
+        summary['created'], path, summary['existing'], summary['duplicates'], summary['invalid'], summary['conflicts'],
+    )
+
+    if run_dataservices and summary['target_ids']:
+        target_ids = list(summary['target_ids'])
+        transaction.on_commit(lambda: enqueue_imported_targets_dataservices(target_ids))
+    return summary
+
+
+def enqueue_imported_targets_dataservices(target_ids):
+    """Queue one job running the DataServices of the imported targets, unless they are off for new targets."""
+    from custom_code.tasks import import_targets_dataservices_task
+
+    if not getattr(settings, 'AUTO_QUERY_DATA_SERVICES_ON_TARGET_CREATE', True):
+        logger.info('Skipping DataServices of %s imported targets because AUTO_QUERY_DATA_SERVICES_ON_TARGET_CREATE is disabled.', len(target_ids))
+        return None
+    return import_targets_dataservices_task.enqueue(list(target_ids))
+
+
+def run_imported_targets_dataservices(target_ids):
+    """Run the DataServices of the first ``TARGET_IMPORT_DATASERVICES_BATCH_SIZE`` targets and re-queue the rest."""
+    from custom_code.tasks import import_targets_dataservices_task, run_target_dataservices_for_target
+
+    target_ids = list(target_ids)
+    batch_size = _setting_int('TARGET_IMPORT_DATASERVICES_BATCH_SIZE', 20, minimum=1)
+    batch, remaining = target_ids[:batch_size], target_ids[batch_size:]
+    for target_id in batch:
+        try:
+            run_target_dataservices_for_target(target_id)
+        except Exception:
+            logger.exception('DataServices of imported target %s failed.', target_id)
+    if remaining:
+        interval = _setting_int('TARGET_IMPORT_DATASERVICES_INTERVAL_SECONDS', 60)
+        import_targets_dataservices_task.using(
+            run_after=timezone.now() + timedelta(seconds=interval),
+        ).enqueue(remaining)
+    return {'processed': len(batch), 'remaining': len(remaining)}
@@ -0,0 +1,228 @@
+"""Indexed target name and alias lookups.
+
+Every primary target name and alias has a TargetNameIndex row holding its
+alias_key(): the name case-folded, without spaces, dashes, underscores and
+parentheses, and with a few prefix spellings folded (TNS "AT"/"SN", KMTNet,
+zero-padded microlensing event numbers). "Gaia 24abc" and "gaia24ABC", or
+"OGLE-2024-BLG-0001" and "ogle 2024 blg 1", get the same key, so lookups are
+one indexed equality (or prefix) match instead of iexact/icontains scans.
+
+This module is imported while the Target model is being built (it provides the
+MATCH_MANAGERS target matcher), so models are only imported inside functions.
+"""
+import logging
+import re
+
+from django.db import transaction
+from tom_targets.base_models import TargetMatchManager
+
+
+logger = logging.getLogger(__name__)
+
+NAME_KEY_MAX_LENGTH = 100
+
+_SEPARATORS = re.compile(r'[\s\-_()]+')
+_PREFIX_SPELLINGS = (
+    ('kmtnet', 'kmt'),
+)
+_TNS_NAME = re.compile(r'^(?:at|sn)(\d{4}[a-z]{2,})$')
+_MICROLENSING_EVENT = re.compile(r'^(ogle|moa|kmt)(\d{4})([a-z]+)0*(\d+)$')
+
+
+def alias_key(name):
+    """The folded lookup key of a target name or alias ('' for blank names)."""
+    key = _SEPARATORS.sub('', str(name or '').strip().casefold())
+    for spelling, canonical in _PREFIX_SPELLINGS:
+        if key.startswith(spelling):
+            key = canonical + key[len(spelling):]
+            break
+    key = _TNS_NAME.sub(r'\1', key)
+    key = _MICROLENSING_EVENT.sub(r'\1\2\3\4', key)
+    return key[:NAME_KEY_MAX_LENGTH]
+
+
+def _index_model():
+    from custom_code.models import TargetNameIndex
+    return TargetNameIndex
+
+
+def index_target_name(target):
+    """Create or update the index row of ``target``'s primary name."""
+    TargetNameIndex = _index_model()
+    key = alias_key(target.name)
+    if not TargetNameIndex.objects.filter(target_id=target.pk, target_name__isnull=True).update(key=key):
+        TargetNameIndex.objects.create(target_id=target.pk, key=key)
+
+
+def index_alias(alias):
+    """Create or update the index row of one TargetName."""
+    TargetNameIndex = _index_model()
+    key = alias_key(alias.name)
+    if not TargetNameIndex.objects.filter(target_name_id=alias.pk).update(key=key, target_id=alias.target_id):
+        TargetNameIndex.objects.create(target_id=alias.target_id, target_name_id=alias.pk, key=key)
+
+
+def rebuild_target_name_index(target_ids=None, batch_size=1000):
+    """Rebuild the index rows of ``target_ids`` (all targets when None); returns the number of rows written."""
+    from tom_targets.models import Target, TargetName
+    TargetNameIndex = _index_model()
+
+    queryset = Target.objects.order_by('pk')
+    if target_ids is not None:
+        queryset = queryset.filter(pk__in=list(target_ids))
+    pks = list(queryset.values_list('pk', flat=True))
+    written = 0
+    for start in range(0, len(pks), batch_size):
+        chunk = pks[start:start + batch_size]
+        rows = [
+            TargetNameIndex(target_id=pk, key=alias_key(name))
+            for pk, name in Target.objects.filter(pk__in=chunk).values_list('pk', 'name')
+        ]
+        rows.extend(
+            TargetNameIndex(target_id=target_id, target_name_id=pk, key=alias_key(name))
+            for pk, target_id, name in TargetName.objects.filter(target_id__in=chunk).values_list('pk', 'target_id', 'name')
+        )
+        with transaction.atomic():
+            TargetNameIndex.objects.filter(target_id__in=chunk).delete()
+            TargetNameIndex.objects.bulk_create(rows, batch_size=batch_size)
+        written += len(rows)
+    return written
+
+
+def _target_ids_with_key(**lookup):
+    return _index_model().objects.filter(**lookup).values('target_id')
+
+
+def targets_matching_name(name, queryset=None):
+    """Targets whose primary name or an alias has the same key as ``name``."""
+    from tom_targets.models import Target
+
+    queryset = Target.objects.all() if queryset is None else queryset
+    key = alias_key(name)
+    if not key:
+        return queryset.none()
+    return queryset.filter(pk__in=_target_ids_with_key(key=key))
+
+
+def targets_with_name_prefix(prefix, queryset):
+    """Targets with a primary name or alias whose key starts with the key of ``prefix``."""
+    key = alias_key(prefix)
+    if not key:
+        return queryset
+    return queryset.filter(pk__in=_target_ids_with_key(key__startswith=key))
+
+
+def find_target_by_name(name):
+    return targets_matching_name(name).first()
+
+
+def name_is_taken(name, exclude_target_id=None):
+    """Whether another target already uses ``name``, or a name folding to the same key, as name or alias."""
+    key = alias_key(name)
+    if not key:
+        return False
+    entries = _index_model().objects.filter(key=key)
+    if exclude_target_id is not None:
+        entries = entries.exclude(target_id=exclude_target_id)
+    return entries.exists()
+
+
+def upsert_target_aliases(target, names):
+    """Add the aliases in ``names`` to ``target`` with a fixed number of queries.
+
+    Returns ``{name: (TargetName or None, created)}`` for every non-blank name.
+    Names folding to the target's primary name are skipped, names folding to one
+    of its aliases return that alias, and names used by another target are
+    skipped with a warning.
+    """
+    from tom_targets.models import TargetName
+    TargetNameIndex = _index_model()
+
+    requested = {}
+    for name in names:
+        name = str(name or '').strip()
+        if name and name not in requested:
+            requested[name] = alias_key(name)
+    results = {name: (None, False) for name in requested}
+    requested = {name: key for name, key in requested.items() if key}
+    if not requested:
+        return results
+
+    primary_key = alias_key(target.name)
+    entries = {}
+    for entry in TargetNameIndex.objects.filter(key__in=set(requested.values())).select_related('target_name'):
+        entries.setdefault(entry.key, []).append(entry)
+    existing_names = {alias.name: alias for alias in TargetName.objects.filter(name__in=list(requested))}
+
+    to_create = {}
+    for name, key in requested.items():
+        if key == primary_key:
+            logger.info('Skipping alias "%s" for target %s because it matches the primary target name.', name, target.name)
+            continue
+        alias = existing_names.get(name)
+        owners = {entry.target_id for entry in entries.get(key, [])}
+        if alias is not None:
+            owners.add(alias.target_id)
+        if owners - {target.pk}:
+            logger.warning(
+                'Skipping alias "%s" for target %s because it already belongs to target %s.',
+                name,
+                target.name,
+                min(owners - {target.pk}),
+            )
+            continue
+        if alias is None:
+            alias = next((entry.target_name for entry in entries.get(key, []) if entry.target_name is not None), None)
+        if alias is not None:
+            results[name] = (alias, False)
+        elif key not in to_create.values():
+            to_create[name] = key
+
+    if to_create:
+        with transaction.atomic():
+            # Names taken concurrently are ignored here and reported as conflicts below.
+            TargetName.objects.bulk_create(
+                [TargetName(target=target, name=name) for name in to_create],
+                ignore_conflicts=True,
+            )
+            created = {alias.name: alias for alias in TargetName.objects.filter(name__in=list(to_create))}
+            ours = [alias for alias in created.values() if alias.target_id == target.pk]
+            # bulk_create() sends no post_save signals, so the new aliases are indexed here.
+            TargetNameIndex.objects.bulk_create(
+                [TargetNameIndex(target_id=target.pk, target_name=alias, key=alias_key(alias.name)) for alias in ours],
+                ignore_conflicts=True,
+            )
+        for name in to_create:
+            alias = created.get(name)
+            if alias is None or alias.target_id != target.pk:
+                logger.warning(
+                    'Skipping alias "%s" for target %s because it was created concurrently for target %s.',
+                    name,
+                    target.name,
+                    getattr(alias, 'target_id', None),
+                )
+                continue
+            results[name] = (alias, True)
+    return results
+
+
+class BhtomTargetMatchManager(TargetMatchManager):
+    """TOM target matcher (MATCH_MANAGERS['Target']) that compares names through the name index."""
+
+    def match_fuzzy_name(self, name, input_queryset=None):
+        queryset = self.get_queryset() if input_queryset is None else input_queryset
+        key = alias_key(name)
+        if not key:
+            return queryset.none()
+        return queryset.filter(pk__in=_target_ids_with_key(key=key))
+
+    def simplify_name(self, name):
+        return alias_key(name)
+
+    def match_cone_search(self, ra, dec, radius):
+        """Targets within ``radius`` arcseconds of ``ra``/``dec``, prefiltered by the HEALPix index."""
+        from custom_code.sky_index import cone_search
+
+        if ra is None or dec is None or radius is None or not -90 <= dec <= 90:
+            return self.get_queryset().none()
+        return cone_search(self.get_queryset(), ra, dec, radius / 3600.0)
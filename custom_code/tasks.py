@@ -8,7 +8,6 @@ from queue import Empty
 
 from django.apps import apps
 from django.conf import settings
-from django.db import IntegrityError
 from django.db import close_old_connections
 from django.db import transaction
 from django.utils.module_loading import import_string
@@ -17,10 +16,23 @@ from django_tasks import task
 from tom_dataproducts.models import ReducedDatum
 from tom_observations import facility
 from tom_targets.models import Target, TargetName
+from custom_code.bhtom2_uploads import run_bhtom2_forward
 from custom_code.last_photometry import refresh_target_last_photometry
+from custom_code.lco_frame_sync import run_lco_frame_sync
 from custom_code.models import TargetAliasInfo, TransitEphemeris
+from custom_code.nonsidereal_ephemeris import refresh_nonsidereal_ephemeris
+from custom_code.periodicity import run_periodicity_search
+from custom_code.photometry_classification.batch import run_batch_classification
 from custom_code.priority import refresh_target_priority
+from custom_code.refresh_scheduler import record_dataservice_refresh
+from custom_code.solar_system_cache import run_solar_system_refresh
+from custom_code.spectrum_storage import store_spectrum_value
+from custom_code.staged_uploads import process_staged_upload
+from custom_code.tle_catalogue import refresh_geotarget_tles
+from custom_code.transit_calendar import refresh_transit_calendars
 from custom_code.sun_separation import refresh_target_sun_separation
+from custom_code.target_import import run_imported_targets_dataservices
+from custom_code.target_names import upsert_target_aliases
 
 
 logger = logging.getLogger(__name__)
@@ -117,12 +129,18 @@ def _run_query_targets_with_timeout(service, built_parameters, timeout_seconds):
     raise DataServiceExecutionError(error_text)
 
 
+def _update_facility_observation_statuses(facility_name):
+    from custom_code.observation_status import update_facility_observation_statuses
+
+    instance = facility.get_service_class(facility_name)()
+    instance.set_user(None)
+    return update_facility_observation_statuses(instance, target=None)
+
+
 def _observation_status_child(queue, facility_name):
     close_old_connections()
     try:
-        instance = facility.get_service_class(facility_name)()
-        instance.set_user(None)
-        result = instance.update_all_observation_statuses(target=None)
+        result = _update_facility_observation_statuses(facility_name)
     except BaseException as exc:
         queue.put({
             'ok': False,
@@ -136,39 +154,7 @@ def _observation_status_child(queue, facility_name):
         close_old_connections()
 
 
-def _run_observation_status_facility_with_timeout(facility_name, timeout_seconds):
-    if not timeout_seconds or timeout_seconds <= 0:
-        instance = facility.get_service_class(facility_name)()
-        instance.set_user(None)
-        return instance.update_all_observation_statuses(target=None)
-
-    try:
-        context = multiprocessing.get_context('fork')
-    except ValueError:
-        logger.warning(
-            'Fork multiprocessing context is unavailable; running observation status update without hard process cancellation.'
-        )
-        instance = facility.get_service_class(facility_name)()
-        instance.set_user(None)
-        return instance.update_all_observation_statuses(target=None)
-
-    queue = context.Queue(maxsize=1)
-    process = context.Process(
-        target=_observation_status_child,
-        args=(queue, facility_name),
-        daemon=True,
-    )
-    process.start()
-    deadline = time.monotonic() + timeout_seconds
-    payload = None
-    while time.monotonic() < deadline:
-        try:
-            payload = queue.get(timeout=0.2)
-            break
-        except Empty:
-            if not process.is_alive():
-                break
-
+def _finish_observation_status_child(facility_name, process, queue, payload, timeout_seconds):
     if payload is None and process.is_alive():
         process.terminate()
         process.join(10)
@@ -198,6 +184,79 @@ def _run_observation_status_facility_with_timeout(facility_name, timeout_seconds
     raise ObservationStatusExecutionError(error_text)
 
 
+def _run_observation_status_facilities_with_timeout(facility_names, timeout_seconds, max_parallel):
+    """Update several facilities at once, each in its own forked child with its own deadline.
+
+    Returns ``{facility_name: (result, exception, elapsed_seconds)}``; a slow or
+    failing facility never delays or breaks the others.
+    """
+    outcomes = {}
+    context = None
+    if timeout_seconds and timeout_seconds > 0:
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            logger.warning(
+                'Fork multiprocessing context is unavailable; running observation status update without hard process cancellation.'
+            )
+
+    if context is None:
+        for facility_name in facility_names:
+            started_at = time.monotonic()
+            result, error = None, None
+            try:
+                result = _update_facility_observation_statuses(facility_name)
+            except Exception as exc:
+                error = exc
+            outcomes[facility_name] = (result, error, time.monotonic() - started_at)
+        return outcomes
+
+    pending = list(facility_names)
+    running = {}
+    while pending or running:
+        while pending and len(running) < max(1, max_parallel):
+            facility_name = pending.pop(0)
+            queue = context.Queue(maxsize=1)
+            process = context.Process(
+                target=_observation_status_child,
+                args=(queue, facility_name),
+                daemon=True,
+            )
+            process.start()
+            running[facility_name] = (process, queue, time.monotonic())
+
+        for facility_name, (process, queue, started_at) in list(running.items()):
+            try:
+                payload = queue.get_nowait()
+            except Empty:
+                payload = None
+            elapsed = time.monotonic() - started_at
+            if payload is None and process.is_alive() and elapsed < timeout_seconds:
+                continue
+            del running[facility_name]
+            try:
+                result = _finish_observation_status_child(facility_name, process, queue, payload, timeout_seconds)
+            except Exception as exc:
+                outcomes[facility_name] = (None, exc, elapsed)
+            else:
+                outcomes[facility_name] = (result, None, elapsed)
+
+        if running:
+            time.sleep(0.2)
+    return outcomes
+
+
+def _run_observation_status_facility_with_timeout(facility_name, timeout_seconds):
+    result, exc, _elapsed = _run_observation_status_facilities_with_timeout(
+        [facility_name],
+        timeout_seconds,
+        max_parallel=1,
+    )[facility_name]
+    if exc is not None:
+        raise exc
+    return result
+
+
 def _normalize_alias_result(alias):
     if isinstance(alias, dict):
         name = str(alias.get('name') or '').strip()
@@ -260,6 +319,8 @@ def _bulk_insert_reduced_datums(target, service_name, service, result, reduced_d
             value = datum.get('value')
             if timestamp is None or value is None:
                 continue
+            if data_type == 'spectroscopy':
+                value = store_spectrum_value(value)
             key = _reduced_datum_identity(timestamp, value)
             if key in candidate_keys:
                 continue
@@ -305,37 +366,7 @@ def _get_or_create_target_alias(target, alias_name):
     alias_name = str(alias_name or '').strip()
     if not alias_name:
         return None, False
-    if alias_name.casefold() == str(target.name or '').strip().casefold():
-        logger.info('Skipping alias "%s" for target %s because it matches the primary target name.', alias_name, target.name)
-        return None, False
-
-    alias_obj = TargetName.objects.filter(name=alias_name).first()
-    if alias_obj is not None:
-        if alias_obj.target_id != target.id:
-            logger.warning(
-                'Skipping alias "%s" for target %s because it already belongs to target %s.',
-                alias_name,
-                target.name,
-                alias_obj.target_id,
-            )
-            return None, False
-        return alias_obj, False
-
-    try:
-        return TargetName.objects.create(target=target, name=alias_name), True
-    except IntegrityError:
-        alias_obj = TargetName.objects.filter(name=alias_name).first()
-        if alias_obj is None:
-            raise
-        if alias_obj.target_id != target.id:
-            logger.warning(
-                'Skipping alias "%s" for target %s because it was created concurrently for target %s.',
-                alias_name,
-                target.name,
-                alias_obj.target_id,
-            )
-            return None, False
-        return alias_obj, False
+    return upsert_target_aliases(target, [alias_name])[alias_name]
 
 
 def _cleanup_moa_aliases(target, result, service_name):
@@ -353,19 +384,23 @@ def _cleanup_moa_aliases(target, result, service_name):
         return
 
     alias_url = str((result or {}).get('source_location') or '').strip()
+    aliases_by_name = {alias.name: alias for alias in target.aliases.all()}
+    stale_ids = []
     for canonical_name in canonical_names:
         bare_name = canonical_name[4:]
 
-        canonical_alias = target.aliases.filter(name=canonical_name).first()
+        canonical_alias = aliases_by_name.get(canonical_name)
         if canonical_alias is not None and alias_url:
             TargetAliasInfo.objects.update_or_create(
                 target_name=canonical_alias,
                 defaults={'url': alias_url, 'source_name': service_name},
             )
 
-        stale_alias = target.aliases.filter(name=bare_name).first()
+        stale_alias = aliases_by_name.get(bare_name)
         if stale_alias is not None:
-            stale_alias.delete()
+            stale_ids.append(stale_alias.pk)
+    if stale_ids:
+        TargetName.objects.filter(pk__in=stale_ids).delete()
 
 
 def _cleanup_ogle_aliases(target, result, service_name):
@@ -383,19 +418,23 @@ def _cleanup_ogle_aliases(target, result, service_name):
         return
 
     alias_url = str((result or {}).get('source_location') or '').strip()
+    aliases_by_name = {alias.name: alias for alias in target.aliases.all()}
+    stale_ids = []
     for canonical_name in canonical_names:
         bare_name = canonical_name[5:]
 
-        canonical_alias = target.aliases.filter(name=canonical_name).first()
+        canonical_alias = aliases_by_name.get(canonical_name)
         if canonical_alias is not None and alias_url:
             TargetAliasInfo.objects.update_or_create(
                 target_name=canonical_alias,
                 defaults={'url': alias_url, 'source_name': service_name},
             )
 
-        stale_alias = target.aliases.filter(name=bare_name).first()
+        stale_alias = aliases_by_name.get(bare_name)
         if stale_alias is not None:
-            stale_alias.delete()
+            stale_ids.append(stale_alias.pk)
+    if stale_ids:
+        TargetName.objects.filter(pk__in=stale_ids).delete()
 
 
 def _cleanup_wise_aliases(target, result, service_name):
@@ -412,12 +451,15 @@ def _cleanup_wise_aliases(target, result, service_name):
         r'(?i)^allwise\+j',
         r'(?i)^neowise\+j',
     )
-    for alias in list(target.aliases.all()):
+    stale_ids = []
+    for alias in target.aliases.all():
         alias_name = str(alias.name or '').strip()
         is_stale_generated = any(re.match(pattern, alias_name) for pattern in stale_patterns)
         is_stale_literal = alias_name.upper() == 'WISE'
         if (is_stale_generated or is_stale_literal) and alias_name not in current_alias_names:
-            alias.delete()
+            stale_ids.append(alias.pk)
+    if stale_ids:
+        TargetName.objects.filter(pk__in=stale_ids).delete()
 
 def _get_data_service_classes():
     """
@@ -475,29 +517,29 @@ def run_observation_status_update():
     close_old_connections()
     failed_records = {}
     timeout_seconds = getattr(settings, 'OBSERVATION_STATUS_FACILITY_TIMEOUT', 300)
-    for facility_name in facility.get_service_classes():
-        started_at = time.monotonic()
-        try:
-            logger.info(
-                'Starting observation status update for facility "%s" timeout=%ss.',
-                facility_name,
-                timeout_seconds,
-            )
-            failed_records[facility_name] = _run_observation_status_facility_with_timeout(
-                facility_name,
-                timeout_seconds,
-            )
-        except Exception as exc:
-            elapsed = time.monotonic() - started_at
-            logger.exception(
-                'Observation status update failed for facility "%s" elapsed=%.2fs exception=%s.',
+    max_parallel = getattr(settings, 'OBSERVATION_STATUS_MAX_PARALLEL_FACILITIES', 10)
+    facility_names = list(facility.get_service_classes())
+    logger.info(
+        'Starting observation status update for facilities %s timeout=%ss max_parallel=%s.',
+        facility_names,
+        timeout_seconds,
+        max_parallel,
+    )
+    outcomes = _run_observation_status_facilities_with_timeout(facility_names, timeout_seconds, max_parallel)
+    for facility_name in facility_names:
+        result, exc, elapsed = outcomes[facility_name]
+        if exc is not None:
+            logger.error(
+                'Observation status update failed for facility "%s" elapsed=%.2fs exception=%s: %s',
                 facility_name,
                 elapsed,
                 exc.__class__.__name__,
+                exc,
+                exc_info=exc,
             )
             failed_records[facility_name] = [str(exc)]
             continue
-        elapsed = time.monotonic() - started_at
+        failed_records[facility_name] = result
         logger.info(
             'Finished observation status update for facility "%s" elapsed=%.2fs; failed_records=%s.',
             facility_name,
@@ -533,7 +575,8 @@ def run_target_dataservices_for_target(target_id, include_create_only=True, forc
         include_create_only=include_create_only,
         force_all_services=force_all_services,
     ):
-        _run_service_for_target(target, service_name, clazz, force_all_services=force_all_services)
+        produced_new_data = _run_service_for_target(target, service_name, clazz, force_all_services=force_all_services)
+        _record_dataservice_refresh(target, service_name, clazz, produced_new_data)
 
     _refresh_target_summary_fields(target.id, 'task end')
 
@@ -560,10 +603,26 @@ def run_target_dataservice_for_target(target_id, service_name, include_create_on
         )
         return
 
-    _run_service_for_target(target, service_name, clazz, force_all_services=force_all_services)
+    produced_new_data = _run_service_for_target(target, service_name, clazz, force_all_services=force_all_services)
+    _record_dataservice_refresh(target, service_name, clazz, produced_new_data)
     _refresh_target_summary_fields(target.id, f'service "{service_name}" task end')
 
 
+def _record_dataservice_refresh(target, service_name, service_class, produced_new_data):
+    if getattr(service_class, 'delivers_data_asynchronously', False):
+        # The outcome is only known once the results are ingested later.
+        produced_new_data = None
+    try:
+        record_dataservice_refresh(target, service_name, service_class, produced_new_data)
+    except Exception as exc:
+        logger.warning(
+            'Could not record DataService "%s" refresh for target %s: %s',
+            service_name,
+            target.id,
+            exc,
+        )
+
+
 def _iter_selected_data_service_classes(include_create_only=True, force_all_services=False):
     service_classes = _get_data_service_classes()
     service_names = getattr(settings, 'AUTO_QUERY_DATA_SERVICE_NAMES', None)
@@ -636,7 +695,82 @@ def update_target_dataservice_for_target(target_id, service_name, include_create
     )
 
 
+@task
+def forward_dataproduct_to_bhtom2_task(dataproduct_id, forward_id, observatory, calibration_filter, comment='',
+                                       user_id=None, site_token=False, attempt=1):
+    close_old_connections()
+    return run_bhtom2_forward(
+        dataproduct_id,
+        forward_id,
+        observatory,
+        calibration_filter,
+        comment=comment,
+        user_id=user_id,
+        site_token=site_token,
+        attempt=attempt,
+    )
+
+
+@task
+def process_staged_dataproduct_upload(upload_id):
+    close_old_connections()
+    return process_staged_upload(upload_id)
+
+
+@task
+def sync_lco_frames_task(record_id, sync_id):
+    close_old_connections()
+    return run_lco_frame_sync(record_id, sync_id)
+
+
+@task
+def classify_targets_batch_task(target_ids=None, refresh_catalogs=False, offline=False, batch_size=None):
+    close_old_connections()
+    return run_batch_classification(target_ids, refresh_catalogs=refresh_catalogs, offline=offline, batch_size=batch_size)
+
+
+@task
+def periodicity_search_task(search_id):
+    close_old_connections()
+    return run_periodicity_search(search_id)
+
+
+@task
+def refresh_solar_system_query_task(entry_id):
+    close_old_connections()
+    return run_solar_system_refresh(entry_id)
+
+
+@task
+def refresh_nonsidereal_ephemeris_task(target_id):
+    close_old_connections()
+    return refresh_nonsidereal_ephemeris(target_id)
+
+
+@task
+def refresh_transit_calendar_task(ephemeris_ids):
+    close_old_connections()
+    return refresh_transit_calendars(ephemeris_ids)
+
+
+@task
+def sync_tle_catalogue_task(force=False):
+    close_old_connections()
+    return refresh_geotarget_tles(force=force)
+
+
+@task
+def import_targets_dataservices_task(target_ids):
+    close_old_connections()
+    return run_imported_targets_dataservices(target_ids)
+
+
 def _run_service_for_target(target, service_name, service_class, force_all_services=False):
+    """Run one DataService for a target.
+
+    Returns True when the run added datums or aliases or changed target fields,
+    False when it found nothing new and None when the service failed.
+    """
     from custom_code.data_services.service_utils import configure_data_service_timeouts
 
     started_at = time.monotonic()
@@ -685,7 +819,7 @@ def _run_service_for_target(target, service_name, service_class, force_all_servi
             exc.__class__.__name__,
             exc,
         )
-        return
+        return None
 
     if not target_results:
         elapsed = time.monotonic() - started_at
@@ -696,28 +830,33 @@ def _run_service_for_target(target, service_name, service_class, force_all_servi
             target.name,
             elapsed,
         )
-        return
+        return False
 
     aliases_added = 0
     aliases_found = 0
     alias_urls_updated = 0
     datapoints_returned = 0
     datapoints_added = 0
+    target_fields_changed = 0
     for result in target_results:
         target_updates = result.get('target_updates') or {}
         if target_updates:
+            target_fields_changed += sum(
+                1 for field_name, value in target_updates.items()
+                if getattr(target, field_name, None) != value
+            )
             Target.objects.filter(pk=target.pk).update(**target_updates)
             for field_name, value in target_updates.items():
                 setattr(target, field_name, value)
         transit_ephemeris_updates = result.get('transit_ephemeris_updates') or {}
         if transit_ephemeris_updates:
             TransitEphemeris.objects.update_or_create(target=target, defaults=transit_ephemeris_updates)
-        for alias in result.get('aliases', []):
-            alias_data = _normalize_alias_result(alias)
-            if not alias_data['name']:
-                continue
+        alias_results = [_normalize_alias_result(alias) for alias in result.get('aliases', [])]
+        alias_results = [alias_data for alias_data in alias_results if alias_data['name']]
+        upserted_aliases = upsert_target_aliases(target, [alias_data['name'] for alias_data in alias_results])
+        for alias_data in alias_results:
             aliases_found += 1
-            alias_obj, created = _get_or_create_target_alias(target, alias_data['name'])
+            alias_obj, created = upserted_aliases.get(alias_data['name'], (None, False))
             if alias_obj is None:
                 continue
             alias_url = _resolve_alias_url(alias_data, result, service)
@@ -759,6 +898,7 @@ def _run_service_for_target(target, service_name, service_class, force_all_servi
         datapoints_returned,
         datapoints_added,
     )
+    return bool(datapoints_added or aliases_added or target_fields_changed)
 
 
 def _service_enabled_for_run(service_class, include_create_only=True):
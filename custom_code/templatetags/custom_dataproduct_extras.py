@@ -12,11 +12,11 @@ import astropy.units as u
 import json
 
 from tom_dataproducts.models import ReducedDatum
-from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_observations.models import ObservationRecord
 from tom_targets.models import Target
 
 from custom_code.forms import BhtomDataProductUploadForm
+from custom_code.spectrum_storage import spectrum_from_value
 
 
 register = template.Library()
@@ -643,7 +643,6 @@ def custom_spectroscopy_for_target(context, target, dataproduct=None):
             klass=datums,
         )
 
-    serializer = SpectrumSerializer()
     #flux_count_data = []
     #flux_other_data = []
 
@@ -651,7 +650,8 @@ def custom_spectroscopy_for_target(context, target, dataproduct=None):
 
     for datum in datums.order_by('timestamp'):
         try:
-            spectrum = serializer.deserialize(datum.value)
+            # Stored spectra are read from memory-mapped sidecar files, see custom_code.spectrum_storage.
+            spectrum = spectrum_from_value(datum.value)
         except Exception:
             continue
 
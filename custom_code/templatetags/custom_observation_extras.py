@@ -1,9 +1,9 @@
 from django import template
-from django.core.cache import cache
 from plotly import offline
 from plotly import graph_objs as go
 from tom_observations.facility import get_service_classes
 
+from custom_code.caching import cached_value
 from custom_code.forms import NonSiderealTargetVisibilityForm
 from custom_code.facility_proposals import get_current_proposals_for_user
 from custom_code.non_sidereal_visibility import get_non_sidereal_visibility
@@ -13,6 +13,10 @@ register = template.Library()
 NON_SIDEREAL_PLAN_INTERVAL_MINUTES = 30
 TARGET_PLAN_MAX_PLOTTED_AIRMASS = 3.0
 TARGET_PLAN_CACHE_VERSION = 2
+# Plots are recomputed after TARGET_PLAN_CACHE_SECONDS; until TARGET_PLAN_STALE_SECONDS more have passed
+# the previous plot is shown while one process redraws it in the background.
+TARGET_PLAN_CACHE_SECONDS = 300
+TARGET_PLAN_STALE_SECONDS = 3600
 
 
 def _target_plan_plot_data(visibility_data):
@@ -40,6 +44,29 @@ def _target_plan_layout(width, height, background):
     )
 
 
+def _target_plan_graph(visibility_data, width, height, background, label_color, grid):
+    layout = _target_plan_layout(width, height, background)
+    layout.legend.font.color = label_color
+    fig = go.Figure(data=_target_plan_plot_data(visibility_data), layout=layout)
+    fig.update_yaxes(
+        title='Airmass',
+        showgrid=grid,
+        color=label_color,
+        showline=True,
+        linecolor=label_color,
+        mirror=True,
+    )
+    fig.update_xaxes(
+        title='Date',
+        showgrid=grid,
+        color=label_color,
+        showline=True,
+        linecolor=label_color,
+        mirror=True,
+    )
+    return offline.plot(fig, output_type='div', show_link=False)
+
+
 @register.inclusion_tag('tom_observations/partials/observing_buttons.html', takes_context=True)
 def proposal_observing_buttons(context, target):
     request = context['request']
@@ -84,31 +111,20 @@ def sidereal_target_plan(
             f'{end_time.strftime("%Y%m%d%H%M")}:'
             f'{airmass_limit}'
         )
-        visibility_graph = cache.get(cache_key, '')
-        if not visibility_graph:
-            visibility_data = get_sidereal_visibility(context['object'], start_time, end_time, 10, airmass_limit)
-            plot_data = _target_plan_plot_data(visibility_data)
-            layout = _target_plan_layout(width, height, background)
-            layout.legend.font.color = label_color
-            fig = go.Figure(data=plot_data, layout=layout)
-            fig.update_yaxes(
-                title='Airmass',
-                showgrid=grid,
-                color=label_color,
-                showline=True,
-                linecolor=label_color,
-                mirror=True,
-            )
-            fig.update_xaxes(
-                title='Date',
-                showgrid=grid,
-                color=label_color,
-                showline=True,
-                linecolor=label_color,
-                mirror=True,
-            )
-            visibility_graph = offline.plot(fig, output_type='div', show_link=False)
-            cache.set(cache_key, visibility_graph, 300)
+        target = context['object']
+        visibility_graph = cached_value(
+            cache_key,
+            lambda: _target_plan_graph(
+                get_sidereal_visibility(target, start_time, end_time, 10, airmass_limit),
+                width,
+                height,
+                background,
+                label_color,
+                grid,
+            ),
+            TARGET_PLAN_CACHE_SECONDS,
+            stale_timeout=TARGET_PLAN_STALE_SECONDS,
+        )
 
     return {
         'form': form,
@@ -148,37 +164,26 @@ def nonsidereal_target_plan(
             f'{end_time.strftime("%Y%m%d%H%M")}:'
             f'{airmass_limit}'
         )
-        visibility_graph = cache.get(cache_key, '')
-        if not visibility_graph:
-            visibility_data = get_non_sidereal_visibility(
-                context['object'],
-                start_time,
-                end_time,
-                NON_SIDEREAL_PLAN_INTERVAL_MINUTES,
-                airmass_limit,
-            )
-            plot_data = _target_plan_plot_data(visibility_data)
-            layout = _target_plan_layout(width, height, background)
-            layout.legend.font.color = label_color
-            fig = go.Figure(data=plot_data, layout=layout)
-            fig.update_yaxes(
-                title='Airmass',
-                showgrid=grid,
-                color=label_color,
-                showline=True,
-                linecolor=label_color,
-                mirror=True,
-            )
-            fig.update_xaxes(
-                title='Date',
-                showgrid=grid,
-                color=label_color,
-                showline=True,
-                linecolor=label_color,
-                mirror=True,
-            )
-            visibility_graph = offline.plot(fig, output_type='div', show_link=False)
-            cache.set(cache_key, visibility_graph, 300)
+        target = context['object']
+        visibility_graph = cached_value(
+            cache_key,
+            lambda: _target_plan_graph(
+                get_non_sidereal_visibility(
+                    target,
+                    start_time,
+                    end_time,
+                    NON_SIDEREAL_PLAN_INTERVAL_MINUTES,
+                    airmass_limit,
+                ),
+                width,
+                height,
+                background,
+                label_color,
+                grid,
+            ),
+            TARGET_PLAN_CACHE_SECONDS,
+            stale_timeout=TARGET_PLAN_STALE_SECONDS,
+        )
 
     return {
         'form': plan_form,
@@ -1,6 +1,8 @@
 import gzip
 import json
+import os
 import requests
+import urllib.request
 import time
 from io import BytesIO
 from datetime import datetime, timedelta
@@ -18,12 +20,13 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.http import QueryDict
 from django.test.client import RequestFactory
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from guardian.shortcuts import assign_perm
 import numpy as np
 from rest_framework.authtoken.models import Token
 from tom_catalogs.harvester import MissingDataException
+from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.models import DataProduct, ReducedDatum
 from tom_observations.models import ObservationRecord
 from tom_targets.models import Target, TargetName
@@ -55,6 +58,7 @@ from custom_code.data_services.moa_dataservice import (
     _parse_photometry_rows as _parse_moa_photometry_rows,
     _parse_event_page,
 )
+from custom_code.archive_simulator import ArchiveProfile, ArchiveRecorder, ArchiveSimulator
 from custom_code.astrometry import can_compute_current_coordinates, compute_current_coordinates
 from custom_code.data_services.allwise_dataservice import AllWISEDataService
 from custom_code.data_services.asassn_dataservice import ASASSNDataService, _normalize_transient_name
@@ -72,6 +76,7 @@ from custom_code.data_services.kmt_dataservice import (
 from custom_code.data_services.lamost_dataservice import LAMOSTDataService
 from custom_code.data_services.neowise_dataservice import NeoWISEDataService
 from custom_code.data_services.twomass_dataservice import TwoMASSDataService
+from custom_code.data_services.ztf_dataservice import ZTFDataService
 from custom_code.bhtom_catalogs.harvesters.simbad import target_from_result
 from custom_code.bhtom_catalogs.harvesters.crts import CRTSHarvester
 from custom_code.bhtom_catalogs.harvesters.gaia_alerts import GaiaAlertsHarvester
@@ -93,7 +98,15 @@ from custom_code.data_services.forms import (
     WISEQueryForm,
 )
 from custom_code.data_services.service_utils import resolve_query_coordinates
-from custom_code.bhtom2_uploads import has_successful_bhtom2_upload, is_supported_fits_filename, normalize_fits_upload
+from custom_code.bhtom2_uploads import (
+    StreamingMultipartBody,
+    enqueue_bhtom2_forward,
+    get_bhtom2_upload_state,
+    has_successful_bhtom2_upload,
+    is_supported_fits_filename,
+    normalize_fits_file,
+    normalize_fits_upload,
+)
 from custom_code.forms import (
     ALL_DATA_SERVICES_VALUE,
     BhtomCatalogQueryForm,
@@ -109,12 +122,15 @@ from custom_code.forms import (
 )
 from custom_code.models import (
     BhtomUserProfile,
+    DataServiceRefreshState,
     Facility,
     FacilityAccount,
     FacilityAccountMembership,
     FacilityProposal,
     FacilityProposalMembership,
     GeoTarget,
+    LCOFrameSync,
+    StagedDataProductUpload,
     TransitEphemeris,
     UserBhtom2UploadPreference,
 )
@@ -124,6 +140,12 @@ from custom_code.facility_proposals import (
     sync_remote_proposals_for_account,
 )
 from custom_code.orcid import canonicalize_orcid, unique_orcid_username, validate_orcid
+from custom_code.refresh_scheduler import (
+    compute_refresh_interval_seconds,
+    enqueue_due_dataservice_refreshes,
+    record_dataservice_data_arrival,
+    record_dataservice_refresh,
+)
 from custom_code.non_sidereal_visibility import get_non_sidereal_visibility
 from custom_code.signals import cleanup_target_relations_on_target_delete
 from custom_code.templatetags.custom_observation_extras import (
@@ -135,10 +157,15 @@ from custom_code.templatetags.custom_target_extras import bhtom_target_data, non
 from custom_code.templatetags.custom_target_extras import truncate_decimals
 from custom_code.tasks import _build_query_parameters_for_service, _run_service_for_target
 from custom_code.tasks import _get_or_create_target_alias, run_observation_status_update
+from custom_code.tasks import forward_dataproduct_to_bhtom2_task, process_staged_dataproduct_upload, sync_lco_frames_task
+from custom_code.staged_uploads import StagedUploadOffsetError, append_staged_chunk, create_staged_uploads
+from custom_code.staged_uploads import staged_file_path
 from custom_code.sun_separation import get_live_target_values
 from custom_code.target_derivations import derive_sidereal_target_fields
 from custom_code.views import (
     BhtomCatalogQueryView,
+    BhtomDataProductUploadBatchStatusView,
+    BhtomDataProductUploadChunkView,
     BhtomCreateTargetFromQueryView,
     _annotate_results_with_existing_targets,
     _build_data_service_result_row,
@@ -572,6 +599,64 @@ class ObservationStatusTaskTests(TestCase):
         self.assertEqual(result['Broken'], ['portal down'])
         self.assertEqual(result['LCO'], [])
 
+    def test_slow_facility_times_out_without_delaying_others(self):
+        def update_facility(facility_name):
+            if facility_name == 'Slow':
+                time.sleep(30)
+            return []
+
+        started_at = time.monotonic()
+        with patch('custom_code.tasks.facility.get_service_classes', return_value=['Slow', 'LCO', 'Swift']), \
+             patch('custom_code.tasks._update_facility_observation_statuses', side_effect=update_facility), \
+             self.settings(OBSERVATION_STATUS_FACILITY_TIMEOUT=2, OBSERVATION_STATUS_MAX_PARALLEL_FACILITIES=3):
+            result = run_observation_status_update()
+
+        self.assertLess(time.monotonic() - started_at, 15)
+        self.assertIn('exceeded 2 seconds', result['Slow'][0])
+        self.assertEqual(result['LCO'], [])
+        self.assertEqual(result['Swift'], [])
+
+    def test_stock_facility_statuses_are_looked_up_once_and_bulk_updated(self):
+        from custom_code.observation_status import update_facility_observation_statuses
+        from tom_observations.facility import BaseRoboticObservationFacility
+
+        target = Target.objects.create(name='StatusTarget', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0)
+        for observation_id in ('1', '1', '2', '3'):
+            ObservationRecord.objects.create(
+                target=target,
+                facility='Fake',
+                parameters={},
+                observation_id=observation_id,
+                status='PENDING',
+            )
+        lookups = []
+
+        class FakeFacility(BaseRoboticObservationFacility):
+            name = 'Fake'
+
+            def get_observation_status(self, observation_id):
+                lookups.append(observation_id)
+                if observation_id == '3':
+                    raise RuntimeError('portal down')
+                return {'state': 'COMPLETED', 'scheduled_start': '2026-05-01T10:00:00Z', 'scheduled_end': None}
+
+            def get_terminal_observing_states(self):
+                return ['COMPLETED']
+
+            def data_products(self, observation_id, product_id=None):
+                return []
+
+        with patch.object(FakeFacility, '__abstractmethods__', frozenset()), \
+             patch('custom_code.observation_status.run_hook') as run_hook:
+            failed = update_facility_observation_statuses(FakeFacility())
+
+        self.assertEqual(sorted(lookups), ['1', '2', '3'])
+        self.assertEqual(failed, [('3', 'portal down')])
+        self.assertEqual(run_hook.call_count, 3)
+        completed = ObservationRecord.objects.filter(facility='Fake', status='COMPLETED')
+        self.assertEqual(completed.count(), 3)
+        self.assertEqual(completed.first().scheduled_start, datetime(2026, 5, 1, 10, tzinfo=timezone.utc))
+
 
 class MOADataServiceTests(TestCase):
     def test_helpers_normalize_names_and_parse_calibration(self):
@@ -4002,10 +4087,7 @@ class LCOFacilityAccountRoutingTests(TestCase):
                     'next': None,
                 }),
             ),
-            Mock(
-                raise_for_status=Mock(),
-                content=_build_test_fits_bytes(),
-            ),
+            _streamed_response(_build_test_fits_bytes()),
         ]
         mock_bhtom2_observatory_post.return_value = Mock(
             raise_for_status=Mock(),
@@ -4023,17 +4105,23 @@ class LCOFacilityAccountRoutingTests(TestCase):
         )
 
         with self.settings(BHTOM2_API_TOKEN='auto-token', BHTOM2_UPLOAD_SERVICE_URL='http://upload.example/api/upload'):
-            LCOFacility().update_observation_status('4205507')
+            with self.captureOnCommitCallbacks(execute=True):
+                LCOFacility().update_observation_status('4205507')
+            self.assertFalse(DataProduct.objects.filter(observation_record=record).exists())
+            with self.captureOnCommitCallbacks(execute=True):
+                _run_queued_tasks(sync_lco_frames_task)
+            _run_queued_tasks(forward_dataproduct_to_bhtom2_task)
 
         record.refresh_from_db()
         self.assertEqual(record.status, 'COMPLETED')
+        self.assertEqual(record.lco_frame_sync.status, LCOFrameSync.STATUS_DONE)
         dataproduct = DataProduct.objects.get(observation_record=record, product_id='123456')
         self.assertEqual(dataproduct.data_product_type, 'fits_file')
         self.assertTrue(has_successful_bhtom2_upload(dataproduct))
         self.assertEqual(dataproduct.get_file_name(), 'tfn0m410-sq01-20260601-0001-e91.fits')
         self.assertEqual(mock_upload_post.call_args.kwargs['headers']['Authorization'], 'Token auto-token')
         self.assertEqual(
-            mock_upload_post.call_args.kwargs['data']['observatory'],
+            mock_upload_post.call_args.kwargs['data'].fields['observatory'],
             'LCOGT-Teide-40cm_QHY600M',
         )
         self.assertEqual(mock_requests_get.call_args_list[0].kwargs['headers']['Authorization'], 'Token account-api-key')
@@ -4094,13 +4182,181 @@ class LCOFacilityAccountRoutingTests(TestCase):
         dataproduct.save(update_fields=['extra_data'])
 
         with self.settings(BHTOM2_API_TOKEN='auto-token', BHTOM2_UPLOAD_SERVICE_URL='http://upload.example/api/upload'):
-            LCOFacility().update_observation_status('4205507')
+            with self.captureOnCommitCallbacks(execute=True):
+                LCOFacility().update_observation_status('4205507')
+            _run_queued_tasks(sync_lco_frames_task)
 
         dataproduct.refresh_from_db()
         self.assertTrue(has_successful_bhtom2_upload(dataproduct))
         self.assertEqual(mock_requests_get.call_count, 1)
         mock_post.assert_not_called()
 
+    @patch('bhtom3.bhtom_observations.facilities.lco.requests.post')
+    @patch('bhtom3.bhtom_observations.facilities.lco.requests.get')
+    def test_frame_sync_pages_through_archive_and_resumes_failed_page(self, mock_requests_get, mock_observatory_post):
+        import tempfile
+        from custom_code.lco_frame_sync import enqueue_lco_frame_sync
+
+        cache.delete('lco_bhtom2_onames_v1')
+        mock_observatory_post.return_value = Mock(
+            raise_for_status=Mock(),
+            content=b'{}',
+            json=Mock(return_value=_bhtom2_lco_observatory_payload()),
+        )
+        frames = [
+            {
+                'id': frame_id,
+                'basename': f'tfn0m410-sq01-20260601-000{frame_id}-e91',
+                'extension': '.fits',
+                'url': f'https://archive-api.lco.global/frames/{frame_id}/file',
+                'version_set': [{'md5': f'md5-{frame_id}'}],
+                'reduction_level': 91,
+            }
+            for frame_id in (1, 2, 3)
+        ]
+        broken_urls = {frames[2]['url']}
+        downloads = []
+
+        def fake_get(url, params=None, **kwargs):
+            if params is not None:
+                page = frames[params['offset']:params['offset'] + params['limit']]
+                has_more = params['offset'] + params['limit'] < len(frames)
+                return Mock(raise_for_status=Mock(), json=Mock(return_value={'results': page, 'next': has_more or None}))
+            downloads.append(url)
+            if url in broken_urls:
+                broken_urls.discard(url)
+                return _streamed_response(b'', status_code=503)
+            return _streamed_response(_build_test_fits_bytes())
+
+        mock_requests_get.side_effect = fake_get
+        record = ObservationRecord.objects.create(
+            target=self.target,
+            user=self.user,
+            facility='LCO',
+            parameters={'proposal': str(self.proposal.pk)},
+            observation_id='4205507',
+            status='COMPLETED',
+        )
+
+        def run_sync_jobs():
+            with self.captureOnCommitCallbacks(execute=True):
+                return _run_queued_tasks(sync_lco_frames_task)
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        with self.settings(
+            MEDIA_ROOT=media_root.name,
+            ARCHIVE_DOWNLOAD_CACHE_DIR=os.path.join(media_root.name, 'archive_cache'),
+            LCO_FRAME_SYNC_PAGE_SIZE=2,
+            BHTOM2_API_TOKEN='auto-token',
+            BHTOM2_UPLOAD_SERVICE_URL='http://upload.example/api/upload',
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(enqueue_lco_frame_sync(record))
+                self.assertFalse(enqueue_lco_frame_sync(record))
+
+            self.assertEqual(run_sync_jobs()[0]['status'], 'continuing')
+            sync = LCOFrameSync.objects.get(observation_record=record)
+            self.assertEqual(sync.next_offset, 2)
+
+            self.assertEqual(run_sync_jobs()[0]['status'], 'retrying')
+            sync.refresh_from_db()
+            self.assertEqual((sync.status, sync.next_offset, sync.attempts), (LCOFrameSync.STATUS_QUEUED, 2, 1))
+            self.assertIn('HTTP 503', sync.error)
+
+            result = run_sync_jobs()[0]
+            self.assertEqual(result['status'], LCOFrameSync.STATUS_DONE)
+            self.assertEqual((result['frames_seen'], result['created'], result['forwarded']), (3, 3, 3))
+            self.assertEqual(DataProduct.objects.filter(observation_record=record).count(), 3)
+            self.assertEqual(len(downloads), 4)
+
+            # A forced re-sync compares archive checksums and does not download unchanged frames again.
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(enqueue_lco_frame_sync(record, force=True))
+            run_sync_jobs()
+            result = run_sync_jobs()[0]
+
+        self.assertEqual((result['status'], result['refreshed']), (LCOFrameSync.STATUS_DONE, 3))
+        self.assertEqual(len(downloads), 4)
+        cached_files = [name for _, _, names in os.walk(os.path.join(media_root.name, 'archive_cache', 'objects')) for name in names]
+        self.assertEqual(cached_files, [])
+
+    @patch('bhtom3.bhtom_observations.facilities.lco.requests.post')
+    @patch('bhtom3.bhtom_observations.facilities.lco.requests.get')
+    def test_frame_sync_counts_frames_stored_before_a_failed_frame_on_the_same_page(
+        self,
+        mock_requests_get,
+        mock_observatory_post,
+    ):
+        import tempfile
+        from custom_code.lco_frame_sync import enqueue_lco_frame_sync
+
+        cache.delete('lco_bhtom2_onames_v1')
+        mock_observatory_post.return_value = Mock(
+            raise_for_status=Mock(),
+            content=b'{}',
+            json=Mock(return_value=_bhtom2_lco_observatory_payload()),
+        )
+        frames = [
+            {
+                'id': frame_id,
+                'basename': f'tfn0m410-sq01-20260601-000{frame_id}-e91',
+                'extension': '.fits',
+                'url': f'https://archive-api.lco.global/frames/{frame_id}/file',
+                'version_set': [{'md5': f'md5-{frame_id}'}],
+                'reduction_level': 91,
+            }
+            for frame_id in (1, 2)
+        ]
+        broken_urls = {frames[1]['url']}
+
+        def fake_get(url, params=None, **kwargs):
+            if params is not None:
+                return Mock(raise_for_status=Mock(), json=Mock(return_value={'results': frames, 'next': None}))
+            if url in broken_urls:
+                broken_urls.discard(url)
+                return _streamed_response(b'', status_code=503)
+            return _streamed_response(_build_test_fits_bytes())
+
+        mock_requests_get.side_effect = fake_get
+        record = ObservationRecord.objects.create(
+            target=self.target,
+            user=self.user,
+            facility='LCO',
+            parameters={'proposal': str(self.proposal.pk)},
+            observation_id='4205507',
+            status='COMPLETED',
+        )
+
+        def run_sync_jobs():
+            with self.captureOnCommitCallbacks(execute=True):
+                return _run_queued_tasks(sync_lco_frames_task)
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        with self.settings(
+            MEDIA_ROOT=media_root.name,
+            ARCHIVE_DOWNLOAD_CACHE_DIR=os.path.join(media_root.name, 'archive_cache'),
+            LCO_FRAME_SYNC_PAGE_SIZE=2,
+            BHTOM2_API_TOKEN='auto-token',
+            BHTOM2_UPLOAD_SERVICE_URL='http://upload.example/api/upload',
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(enqueue_lco_frame_sync(record))
+
+            self.assertEqual(run_sync_jobs()[0]['status'], 'retrying')
+            sync = LCOFrameSync.objects.get(observation_record=record)
+            self.assertEqual((sync.next_offset, sync.summary['created'], sync.summary['failed']), (0, 1, 1))
+
+            result = run_sync_jobs()[0]
+
+        self.assertEqual(result['status'], LCOFrameSync.STATUS_DONE)
+        self.assertEqual(
+            (result['frames_seen'], result['created'], result['forwarded'], result['failed']),
+            (2, 2, 2, 0),
+        )
+        self.assertEqual(DataProduct.objects.filter(observation_record=record).count(), 2)
+
     @patch('bhtom3.bhtom_observations.facilities.lco.BaseLCOFacility.submit_observation', autospec=True)
     def test_submit_uses_imported_lco_proposal_id(self, mock_submit_observation):
         self.proposal.external_id = '24'
@@ -4695,6 +4951,30 @@ def _build_test_fits_bytes():
     return handle.getvalue()
 
 
+def _streamed_response(payload, status_code=200):
+    response = Mock(status_code=status_code, ok=status_code < 400, headers={})
+    response.__enter__ = Mock(return_value=response)
+    response.__exit__ = Mock(return_value=False)
+    response.iter_content = Mock(return_value=iter([payload]))
+    return response
+
+
+def _run_queued_tasks(queued_task):
+    from django_tasks import ResultStatus
+    from django_tasks.backends.database.models import DBTaskResult
+
+    results = []
+    while True:
+        job = DBTaskResult.objects.filter(
+            status=ResultStatus.NEW,
+            task_path=queued_task.module_path,
+        ).order_by('enqueued_at').first()
+        if job is None:
+            return results
+        job.delete()
+        results.append(queued_task.call(*job.args_kwargs['args'], **job.args_kwargs['kwargs']))
+
+
 class Bhtom2FitsUploadTests(TestCase):
     def setUp(self):
         self.user = get_user_model().objects.create_user(username='fits-user', password='secret')
@@ -4748,7 +5028,7 @@ class Bhtom2FitsUploadTests(TestCase):
         header['FILTER'] = 'rp'
         header['DATE-OBS'] = '2026-06-03T01:02:03'
 
-        payload = io.BytesIO()
+        payload = BytesIO()
         fits.HDUList([
             fits.PrimaryHDU(header=primary),
             fits.ImageHDU(data=np.ones((4, 4), dtype=np.int16), header=header),
@@ -4883,9 +5163,65 @@ class Bhtom2FitsUploadTests(TestCase):
             self.assertNotIn('XTENSION', hdul[0].header)
             self.assertNotIn('EXTNAME', hdul[0].header)
 
+    def test_flattening_copies_scaled_image_bytes_unchanged(self):
+        image = np.arange(16, dtype=np.uint16).reshape((4, 4)) + 40000
+        payload = BytesIO()
+        fits.HDUList([
+            fits.PrimaryHDU(header=fits.Header({'ORIGIN': 'LCO'})),
+            fits.ImageHDU(data=image, header=fits.Header({'EXTNAME': 'SCI', 'FILTER': 'V'})),
+            fits.ImageHDU(data=np.zeros((4, 4), dtype=np.int16), name='BPM'),
+        ]).writeto(payload)
+
+        normalized_file, _metadata = normalize_fits_upload(
+            SimpleUploadedFile('image.fits.gz', gzip.compress(payload.getvalue()), content_type='application/gzip'),
+            preserve_extensions=False,
+        )
+
+        with fits.open(normalized_file, do_not_scale_image_data=True) as hdul:
+            hdul.verify('exception')
+            self.assertEqual(len(hdul), 1)
+            self.assertEqual(hdul[0].header['BITPIX'], 16)
+            self.assertEqual(hdul[0].header['BZERO'], 32768)
+            self.assertEqual(hdul[0].header['ORIGIN'], 'LCO')
+            self.assertEqual(hdul[0].header['FILTER'], 'V')
+            np.testing.assert_array_equal(hdul[0].data.astype(np.int64) + 32768, image)
+
+    @patch('custom_code.bhtom2_uploads.shutil.which', return_value='/usr/bin/funpack')
+    @patch('custom_code.bhtom2_uploads.subprocess.run')
+    def test_normalize_fits_file_unpacks_staged_file_from_disk(self, mock_run, _mock_which):
+        import tempfile
+
+        unpacked_payload = BytesIO()
+        fits.HDUList([
+            fits.PrimaryHDU(data=np.ones((4, 4), dtype=np.float32), header=fits.Header({'EXTNAME': 'SCI'})),
+            fits.ImageHDU(data=np.zeros((4, 4), dtype=np.int16), name='BPM'),
+        ]).writeto(unpacked_payload)
+
+        def _mock_funpack(cmd, capture_output, check):
+            self.assertTrue(cmd[3].endswith('.fz'))
+            self.assertTrue(os.path.samefile(cmd[3], staged_path))
+            with open(cmd[2], 'wb') as output_handle:
+                output_handle.write(unpacked_payload.getvalue())
+            return Mock(stdout=b'', stderr=b'')
+
+        mock_run.side_effect = _mock_funpack
+
+        with tempfile.TemporaryDirectory() as staging_dir:
+            staged_path = os.path.join(staging_dir, 'upload.part')
+            with open(staged_path, 'wb') as staged_handle:
+                staged_handle.write(b'fake-compressed-payload')
+            with tempfile.TemporaryFile() as output:
+                normalized_name, metadata = normalize_fits_file(staged_path, 'frame.fits.fz', output)
+                output.seek(0)
+                self.assertEqual(output.read(), unpacked_payload.getvalue())
+
+        self.assertEqual(normalized_name, 'frame.fits')
+        self.assertEqual(metadata['decompression_method'], 'funpack')
+
+    @override_settings(BHTOM2_UPLOAD_SERVICE_URL='http://upload.example/api/upload')
     @patch('custom_code.bhtom2_uploads.requests.post')
-    @patch('custom_code.views.run_data_processor', return_value=ReducedDatum.objects.none())
-    @patch('custom_code.views.run_hook')
+    @patch('custom_code.staged_uploads.run_data_processor', return_value=ReducedDatum.objects.none())
+    @patch('custom_code.staged_uploads.run_hook')
     def test_manage_data_fits_upload_forwards_to_bhtom2_and_saves_preferences(
         self,
         mock_run_hook,
@@ -4894,21 +5230,27 @@ class Bhtom2FitsUploadTests(TestCase):
     ):
         mock_post.return_value = Mock(status_code=201, json=Mock(return_value={'ok': True}), text='created')
 
-        response = self.client.post(
-            reverse('dataproduct-upload'),
-            data={
-                'target': self.target.pk,
-                'data_product_type': 'fits_file',
-                'bhtom2_upload_token': 'token-123',
-                'bhtom2_upload_oname': 'OBS-01',
-                'bhtom2_upload_filter': 'GaiaSP/any',
-                'referrer': reverse('targets:detail', kwargs={'pk': self.target.pk}),
-                'files': SimpleUploadedFile('managed.fits.gz', gzip.compress(_build_test_fits_bytes())),
-            },
-            follow=True,
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('dataproduct-upload'),
+                data={
+                    'target': self.target.pk,
+                    'data_product_type': 'fits_file',
+                    'bhtom2_upload_token': 'token-123',
+                    'bhtom2_upload_oname': 'OBS-01',
+                    'bhtom2_upload_filter': 'GaiaSP/any',
+                    'referrer': reverse('targets:detail', kwargs={'pk': self.target.pk}),
+                    'files': SimpleUploadedFile('managed.fits.gz', gzip.compress(_build_test_fits_bytes())),
+                },
+                follow=True,
+            )
 
         self.assertEqual(response.status_code, 200)
+        self.assertFalse(DataProduct.objects.filter(target=self.target).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            _run_queued_tasks(process_staged_dataproduct_upload)
+        mock_post.assert_not_called()
+        _run_queued_tasks(forward_dataproduct_to_bhtom2_task)
         preference = UserBhtom2UploadPreference.objects.get(user=self.user)
         self.assertEqual(preference.token, 'token-123')
         self.assertEqual(preference.oname, 'OBS-01')
@@ -4916,10 +5258,10 @@ class Bhtom2FitsUploadTests(TestCase):
 
         dataproduct = DataProduct.objects.get(target=self.target)
         self.assertTrue(has_successful_bhtom2_upload(dataproduct))
-        self.assertEqual(mock_post.call_args.kwargs['data']['observatory'], 'OBS-01')
-        upload_tuple = mock_post.call_args.kwargs['files']['file_0']
-        self.assertEqual(upload_tuple[0], 'managed.fits')
+        self.assertEqual(mock_post.call_args.kwargs['data'].fields['observatory'], 'OBS-01')
+        self.assertEqual(mock_post.call_args.kwargs['data'].file_name, 'managed.fits')
 
+    @override_settings(BHTOM2_UPLOAD_SERVICE_URL='http://upload.example/api/upload')
     @patch('custom_code.bhtom2_uploads.requests.post')
     @patch('custom_code.views.run_hook')
     def test_observation_save_forwards_fits_using_saved_profile_preferences(self, mock_run_hook, mock_post):
@@ -4950,11 +5292,13 @@ class Bhtom2FitsUploadTests(TestCase):
             service = Mock()
             service.save_data_products.return_value = [dataproduct]
             mock_get_service_class.return_value = service
-            response = self.client.post(
-                reverse('observation-dataproduct-save', kwargs={'pk': observation.pk}),
-                data={'facility': 'LCO', 'products': ['product-1']},
-                follow=True,
-            )
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('observation-dataproduct-save', kwargs={'pk': observation.pk}),
+                    data={'facility': 'LCO', 'products': ['product-1']},
+                    follow=True,
+                )
+        _run_queued_tasks(forward_dataproduct_to_bhtom2_task)
 
         self.assertEqual(response.status_code, 200)
         dataproduct.refresh_from_db()
@@ -4964,6 +5308,237 @@ class Bhtom2FitsUploadTests(TestCase):
         self.assertEqual(mock_post.call_args.kwargs['headers']['Authorization'], 'Token token-xyz')
 
 
+class Bhtom2ForwardQueueTests(TestCase):
+    def setUp(self):
+        self.target = Target.objects.create(
+            name='Gaia26queue',
+            type=Target.SIDEREAL,
+            ra=1.23,
+            dec=4.56,
+            epoch=2000.0,
+        )
+        self.dataproduct = DataProduct.objects.create(
+            target=self.target,
+            product_id='queued-1',
+            data=SimpleUploadedFile('queued.fits', _build_test_fits_bytes()),
+            data_product_type='fits_file',
+        )
+        self.user = get_user_model().objects.create_user(username='forward-user', password='secret')
+        UserBhtom2UploadPreference.objects.create(user=self.user, token='token-abc', oname='OBS-01')
+
+    def _enqueue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return enqueue_bhtom2_forward(
+                self.dataproduct,
+                observatory='OBS-01',
+                calibration_filter='GaiaSP/any',
+                user_id=self.user.pk,
+            )
+
+    @override_settings(
+        BHTOM2_UPLOAD_SERVICE_URL='http://upload.example/api/upload',
+        BHTOM2_FORWARD_MAX_ATTEMPTS=3,
+        BHTOM2_FORWARD_BACKOFF_SECONDS=60,
+    )
+    @patch('custom_code.bhtom2_uploads.requests.post')
+    def test_forward_retries_with_backoff_and_is_idempotent_per_dataproduct(self, mock_post):
+        from django_tasks.backends.database.models import DBTaskResult
+
+        mock_post.side_effect = [
+            Mock(status_code=503, json=Mock(return_value={'detail': 'busy'}), text='busy', headers={}),
+            Mock(status_code=201, json=Mock(return_value={'ok': True}), text='created', headers={}),
+        ]
+
+        self.assertTrue(self._enqueue())
+        self.assertFalse(self._enqueue())
+        self.assertEqual(DBTaskResult.objects.count(), 1)
+        self.assertEqual(get_bhtom2_upload_state(self.dataproduct)['status'], 'queued')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first, = _run_queued_tasks(forward_dataproduct_to_bhtom2_task)
+        self.assertEqual(first['status'], 'retrying')
+        retry_job = DBTaskResult.objects.get()
+        self.assertIsNotNone(retry_job.run_after)
+        self.assertEqual(retry_job.args_kwargs['args'][-1], 2)
+        self.dataproduct.refresh_from_db()
+        self.assertEqual(get_bhtom2_upload_state(self.dataproduct)['status'], 'retrying')
+        self.assertFalse(self._enqueue())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second, = _run_queued_tasks(forward_dataproduct_to_bhtom2_task)
+        self.assertEqual(second['status'], 'uploaded')
+        self.dataproduct.refresh_from_db()
+        state = get_bhtom2_upload_state(self.dataproduct)
+        self.assertTrue(has_successful_bhtom2_upload(self.dataproduct))
+        self.assertEqual([entry['status'] for entry in state['attempts']], ['retrying', 'uploaded'])
+        self.assertEqual(state['attempt_count'], 2)
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertFalse(self._enqueue())
+
+        stale_job = retry_job.args_kwargs['args']
+        duplicate = forward_dataproduct_to_bhtom2_task.call(*stale_job)
+        self.assertEqual(duplicate['status'], 'skipped')
+        self.assertEqual(mock_post.call_count, 2)
+
+    @override_settings(BHTOM2_UPLOAD_SERVICE_URL='http://upload.example/api/upload')
+    @patch('custom_code.bhtom2_uploads.requests.post')
+    def test_forward_job_carries_no_token_and_fails_when_token_is_removed(self, mock_post):
+        from django_tasks.backends.database.models import DBTaskResult
+
+        self.assertTrue(self._enqueue())
+        job = DBTaskResult.objects.get()
+        self.assertNotIn('token-abc', json.dumps(job.args_kwargs))
+
+        UserBhtom2UploadPreference.objects.filter(user=self.user).update(token='')
+        result, = _run_queued_tasks(forward_dataproduct_to_bhtom2_task)
+
+        self.assertEqual(result['status'], 'failed')
+        mock_post.assert_not_called()
+        self.dataproduct.refresh_from_db()
+        self.assertEqual(get_bhtom2_upload_state(self.dataproduct)['status'], 'failed')
+
+    def test_streaming_multipart_body_reads_file_in_chunks(self):
+        content = _build_test_fits_bytes()
+        body = StreamingMultipartBody(
+            {'target': 'Gaia26queue', 'no_plot': False},
+            'file_0',
+            'queued.fits',
+            BytesIO(content),
+            chunk_size=1024,
+        )
+        expected_length = len(body)
+        chunks = list(body)
+
+        self.assertEqual(sum(len(chunk) for chunk in chunks), expected_length)
+        self.assertTrue(all(len(chunk) <= 1024 for chunk in chunks))
+        payload = b''.join(chunks)
+        self.assertIn(content, payload)
+        self.assertIn(b'name="no_plot"\r\n\r\nFalse\r\n', payload)
+        self.assertIn(b'filename="queued.fits"', payload)
+        self.assertTrue(payload.endswith(f'--{body.boundary}--\r\n'.encode()))
+
+
+class StagedDataProductUploadTests(TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.staging_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.staging_dir.cleanup)
+        settings_override = self.settings(DATA_PRODUCT_UPLOAD_STAGING_DIR=self.staging_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = get_user_model().objects.create_user(username='chunk-user', password='secret')
+        self.target = Target.objects.create(
+            name='Gaia26chunk',
+            type=Target.SIDEREAL,
+            ra=1.23,
+            dec=4.56,
+            epoch=2000.0,
+        )
+        self.content = b'time,filter,magnitude,error\n' + b''.join(
+            f'2460000.{index:04d},V,15.{index % 10},0.01\n'.encode() for index in range(200)
+        )
+
+    def _register(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _batch_id, uploads = create_staged_uploads(
+                self.user,
+                [('lightcurve.csv', len(self.content))],
+                target=self.target,
+                data_product_type='photometry',
+            )
+        return uploads[0]
+
+    @patch('custom_code.staged_uploads.run_hook')
+    @patch('custom_code.staged_uploads.run_data_processor', return_value=ReducedDatum.objects.none())
+    def test_chunked_upload_resumes_at_received_offset_and_is_processed_in_background(self, mock_processor, _mock_hook):
+        upload = self._register()
+        half = len(self.content) // 2
+
+        append_staged_chunk(upload, 0, BytesIO(self.content[:half]))
+        with self.assertRaises(StagedUploadOffsetError) as raised:
+            append_staged_chunk(upload, 0, BytesIO(self.content[:half]))
+        self.assertEqual(raised.exception.received_bytes, half)
+        with self.captureOnCommitCallbacks(execute=True):
+            upload = append_staged_chunk(upload, half, BytesIO(self.content[half:]))
+        self.assertEqual(upload.status, StagedDataProductUpload.STATUS_QUEUED)
+        self.assertFalse(DataProduct.objects.exists())
+
+        result, = _run_queued_tasks(process_staged_dataproduct_upload)
+
+        upload.refresh_from_db()
+        self.assertEqual(result['status'], StagedDataProductUpload.STATUS_DONE)
+        self.assertEqual(upload.status, StagedDataProductUpload.STATUS_DONE)
+        with upload.dataproduct.data.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertEqual(upload.dataproduct.data_product_type, 'photometry')
+        mock_processor.assert_called_once_with(upload.dataproduct)
+        self.assertEqual(os.listdir(self.staging_dir.name), [])
+
+    def test_chunk_is_read_before_the_upload_is_locked_and_rechecked_after(self):
+        upload = self._register()
+        half = len(self.content) // 2
+
+        class RetriedWhileReading(BytesIO):
+            # The client retries the same chunk on a second connection while this one is still being read.
+            def read(inner, size=-1):
+                if not inner.tell():
+                    append_staged_chunk(upload, 0, BytesIO(self.content[:half]))
+                return super().read(size)
+
+        with self.assertRaises(StagedUploadOffsetError) as raised:
+            append_staged_chunk(upload, 0, RetriedWhileReading(b'x' * half))
+
+        self.assertEqual(raised.exception.received_bytes, half)
+        with open(staged_file_path(upload), 'rb') as staged:
+            self.assertEqual(staged.read(), self.content[:half])
+        self.assertEqual(len(os.listdir(self.staging_dir.name)), 1)
+
+    @patch('custom_code.staged_uploads.run_hook')
+    @patch('custom_code.staged_uploads.run_data_processor', side_effect=InvalidFileFormatException('bad columns'))
+    def test_invalid_staged_file_fails_and_leaves_no_dataproduct(self, _mock_processor, _mock_hook):
+        upload = self._register()
+        with self.captureOnCommitCallbacks(execute=True):
+            append_staged_chunk(upload, 0, BytesIO(self.content))
+
+        _run_queued_tasks(process_staged_dataproduct_upload)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, StagedDataProductUpload.STATUS_FAILED)
+        self.assertIn('bad columns', upload.message)
+        self.assertFalse(DataProduct.objects.exists())
+
+    def test_chunk_and_batch_status_endpoints_report_progress(self):
+        upload = self._register()
+        factory = RequestFactory()
+
+        request = factory.post(
+            reverse('dataproduct-upload-chunk', kwargs={'upload_id': upload.upload_id}) + '?offset=5',
+            data=self.content[:10],
+            content_type='application/octet-stream',
+        )
+        request.user = self.user
+        response = BhtomDataProductUploadChunkView.as_view()(request, upload_id=upload.upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)['received_bytes'], 0)
+
+        request = factory.post(
+            reverse('dataproduct-upload-chunk', kwargs={'upload_id': upload.upload_id}) + '?offset=0',
+            data=self.content[:10],
+            content_type='application/octet-stream',
+        )
+        request.user = self.user
+        response = BhtomDataProductUploadChunkView.as_view()(request, upload_id=upload.upload_id)
+        self.assertEqual(response.status_code, 200)
+
+        request = factory.get(reverse('dataproduct-upload-batch-status', kwargs={'batch_id': upload.batch_id}))
+        request.user = self.user
+        payload = json.loads(BhtomDataProductUploadBatchStatusView.as_view()(request, batch_id=upload.batch_id).content)
+        self.assertFalse(payload['finished'])
+        self.assertEqual(payload['uploads'][0]['received_bytes'], 10)
+        self.assertEqual(payload['uploads'][0]['status'], StagedDataProductUpload.STATUS_UPLOADING)
+
+
 class FRAMDataServiceTests(TestCase):
     def test_parse_mjd_photometry_skips_comments_and_invalid_rows(self):
         rows = _parse_mjd_photometry(
@@ -5052,3 +5627,1742 @@ class FRAMDataServiceTests(TestCase):
 
         mock_query_service.return_value['photometry_rows'] = []
         self.assertEqual(FRAMDataService().query_targets({'ra': 12.3, 'dec': -45.6}), [])
+
+
+class ArchiveSimulatorTests(TestCase):
+    def _fixtures(self):
+        return {
+            'IRSA': [{
+                'method': 'GET',
+                'host': 'irsa.ipac.caltech.edu',
+                'path': '/cgi-bin/Gator/nph-query',
+                'query': 'catalog=allwise_p3as_mep',
+                'status': 200,
+                'headers': {'Content-Type': 'text/plain'},
+                'body': '| ra | dec |\n1.0 2.0\n3.0 4.0\n',
+            }],
+        }
+
+    def test_simulator_replays_recorded_response_through_requests(self):
+        with ArchiveSimulator(self._fixtures()) as simulator:
+            response = requests.get('https://irsa.ipac.caltech.edu/cgi-bin/Gator/nph-query?catalog=allwise_p3as_mep')
+            missing = requests.get('https://irsa.ipac.caltech.edu/other')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('3.0 4.0', response.text)
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(simulator.stats['IRSA']['matched'], 1)
+        self.assertEqual(simulator.stats['IRSA']['unmatched'], 1)
+
+    def test_simulator_scales_payload_and_injects_failures(self):
+        profiles = {'IRSA': ArchiveProfile(payload_scale=3.0)}
+        with ArchiveSimulator(self._fixtures(), profiles=profiles):
+            response = requests.get('https://irsa.ipac.caltech.edu/cgi-bin/Gator/nph-query?catalog=allwise_p3as_mep')
+        self.assertEqual(response.text.count('\n'), 7)
+        self.assertTrue(response.text.startswith('| ra | dec |'))
+
+        failing = ArchiveSimulator(self._fixtures(), default_profile=ArchiveProfile(failure_rate=1.0), seed=3)
+        with failing:
+            response = requests.get('https://irsa.ipac.caltech.edu/cgi-bin/Gator/nph-query?catalog=allwise_p3as_mep')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(failing.stats['IRSA']['failed'], 1)
+
+    def test_recorder_writes_fixtures_that_the_simulator_can_replay(self):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as fixtures_dir:
+            recorder = ArchiveRecorder(fixtures_dir)
+            with ArchiveSimulator(self._fixtures()):
+                with recorder:
+                    requests.get('https://irsa.ipac.caltech.edu/cgi-bin/Gator/nph-query?catalog=allwise_p3as_mep')
+
+            self.assertTrue(os.path.exists(os.path.join(fixtures_dir, 'IRSA.json')))
+            with ArchiveSimulator(fixtures_dir=fixtures_dir):
+                with urllib.request.urlopen(
+                    'https://irsa.ipac.caltech.edu/cgi-bin/Gator/nph-query?catalog=allwise_p3as_mep'
+                ) as handle:
+                    body = handle.read().decode('utf-8')
+        self.assertIn('1.0 2.0', body)
+
+    def test_benchmark_record_writes_fixtures_from_worker_jobs(self):
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from django_tasks.backends.database.models import DBTaskResult
+        from requests.adapters import HTTPAdapter
+        from custom_code.tasks import update_target_dataservice_for_target
+
+        class ProbeDataService:
+            update_on_daily_refresh = True
+
+            def build_query_parameters(self, parameters):
+                return parameters
+
+            def query_targets(self, parameters):
+                requests.get(f"https://irsa.ipac.caltech.edu/cgi-bin/Gator/nph-query?target={parameters['target_id']}")
+                return []
+
+        class InlineThread:
+            def __init__(self, target, name=None):
+                self.target = target
+
+            def start(self):
+                self.target()
+
+            def join(self):
+                return None
+
+        def archive_send(adapter, request, **kwargs):
+            response = requests.Response()
+            response.status_code = 200
+            response.headers['Content-Type'] = 'text/plain'
+            response._content = b'| ra | dec |\n1.0 2.0\n'
+            response.url = request.url
+            return response
+
+        tasks_setting = {
+            'default': {'BACKEND': 'django_tasks.backends.database.DatabaseBackend', 'ENQUEUE_ON_COMMIT': False},
+        }
+        with tempfile.TemporaryDirectory() as fixtures_dir, \
+                patch('custom_code.tasks._get_data_service_classes', return_value={'Probe': ProbeDataService}), \
+                patch('custom_code.management.commands.benchmark_dataservices.threading.Thread', InlineThread), \
+                patch.object(HTTPAdapter, 'send', archive_send), \
+                self.settings(TASKS=tasks_setting, DATA_SERVICE_JOB_TIMEOUT=300):
+            unrelated = update_target_dataservice_for_target.enqueue(0, 'Probe', False, False)
+            call_command(
+                'benchmark_dataservices', '--record', '--fixtures', fixtures_dir, '--targets', '2',
+                '--services', 'Probe', '--workers', '1', stdout=StringIO(),
+            )
+            with open(os.path.join(fixtures_dir, 'IRSA.json'), encoding='utf-8') as handle:
+                recorded = json.load(handle)['responses']
+
+        self.assertEqual(len(recorded), 2)
+        self.assertEqual(recorded[0]['body'], '| ra | dec |\n1.0 2.0\n')
+        self.assertEqual(DBTaskResult.objects.get(id=unrelated.id).status, 'NEW')
+
+
+class DataServiceRefreshSchedulerTests(TestCase):
+    def test_refresh_interval_follows_importance_cadence_and_sun_separation(self):
+        important = Target(name='Important', importance=10, cadence=0, priority=0)
+        dormant = Target(name='Dormant', importance=1, cadence=0, priority=0)
+        frequent = Target(name='Frequent', importance=1, cadence=0.25, priority=0)
+        near_sun = Target(name='NearSun', importance=10, cadence=0, priority=0, sun_separation=5.0)
+
+        with self.settings(
+            DATA_SERVICES_MIN_REFRESH_INTERVAL_SECONDS=3600,
+            DATA_SERVICES_SUN_CONJUNCTION_DEFER_SECONDS=7 * 86400,
+        ):
+            self.assertAlmostEqual(compute_refresh_interval_seconds(important, 86400), 21600.0)
+            self.assertGreater(compute_refresh_interval_seconds(dormant, 86400), 86400.0)
+            self.assertAlmostEqual(compute_refresh_interval_seconds(frequent, 86400), 21600.0)
+            self.assertEqual(compute_refresh_interval_seconds(near_sun, 86400), 7 * 86400)
+
+    def test_scheduler_enqueues_most_urgent_pairs_within_window(self):
+        from django_tasks.backends.database.models import DBTaskResult
+
+        important = Target.objects.create(name='Urgent', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0, importance=9)
+        Target.objects.create(name='Routine', type=Target.SIDEREAL, ra=3.0, dec=4.0, epoch=2000.0, importance=1)
+
+        with patch(
+            'custom_code.tasks._iter_selected_data_service_classes',
+            side_effect=lambda **kwargs: iter([('ZTF', ZTFDataService)]),
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                summary = enqueue_due_dataservice_refreshes(importance_gt=0, window=1)
+            second = enqueue_due_dataservice_refreshes(importance_gt=0, window=1)
+
+        self.assertEqual(summary['seeded'], 2)
+        self.assertEqual(summary['enqueued'], 1)
+        self.assertEqual(second['outstanding'], 1)
+        self.assertEqual(second['enqueued'], 0)
+        job = DBTaskResult.objects.get()
+        self.assertEqual(job.args_kwargs['args'][:2], [important.pk, 'ZTF'])
+        self.assertLess(job.priority, 0)
+        state = DataServiceRefreshState.objects.get(target=important, service_name='ZTF')
+        self.assertIsNotNone(state.last_enqueued_at)
+        self.assertGreater(state.next_due_at, state.last_enqueued_at)
+
+    def test_scheduler_ranks_urgent_pair_behind_a_backlog_of_overdue_routine_pairs(self):
+        from django_tasks.backends.database.models import DBTaskResult
+
+        now = datetime(2026, 5, 1, tzinfo=timezone.utc)
+        for index in range(6):
+            routine = Target.objects.create(
+                name=f'Backlog{index}', type=Target.SIDEREAL, ra=index, dec=2.0, epoch=2000.0, importance=0.5,
+            )
+            DataServiceRefreshState.objects.create(
+                target=routine, service_name='ZTF', next_due_at=now - timedelta(days=3),
+            )
+        urgent = Target.objects.create(name='JustDue', type=Target.SIDEREAL, ra=9.0, dec=2.0, epoch=2000.0, importance=10)
+        DataServiceRefreshState.objects.create(target=urgent, service_name='ZTF', next_due_at=now - timedelta(minutes=1))
+
+        with patch(
+            'custom_code.tasks._iter_selected_data_service_classes',
+            side_effect=lambda **kwargs: iter([('ZTF', ZTFDataService)]),
+        ), self.settings(DATA_SERVICES_SCHEDULER_BATCH_SIZE=2):
+            with self.captureOnCommitCallbacks(execute=True):
+                summary = enqueue_due_dataservice_refreshes(importance_gt=0, window=1, now=now)
+
+        self.assertEqual(summary['due'], 7)
+        self.assertEqual(summary['enqueued'], 1)
+        self.assertEqual(DBTaskResult.objects.get().args_kwargs['args'][:2], [urgent.pk, 'ZTF'])
+
+    def test_recorded_refresh_outcomes_back_off_and_tighten_interval(self):
+        target = Target.objects.create(name='Quiet', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0, importance=5)
+        finished_at = datetime(2026, 5, 1, tzinfo=timezone.utc)
+
+        with self.settings(
+            DATA_SERVICES_MIN_REFRESH_INTERVAL_SECONDS=3600,
+            DATA_SERVICES_MAX_REFRESH_INTERVAL_SECONDS=30 * 86400,
+            DATA_SERVICES_REFRESH_MAX_BACKOFF_FACTOR=8,
+            DATA_SERVICES_REFRESH_MIN_TIGHTEN_FACTOR=0.5,
+        ):
+            first = record_dataservice_refresh(target, 'ZTF', ZTFDataService, False, finished_at)
+            for _ in range(5):
+                backed_off = record_dataservice_refresh(target, 'ZTF', ZTFDataService, False, finished_at)
+            unknown = record_dataservice_refresh(target, 'ZTF', ZTFDataService, None, finished_at)
+            for _ in range(10):
+                tightened = record_dataservice_refresh(target, 'ZTF', ZTFDataService, True, finished_at)
+
+        state = DataServiceRefreshState.objects.get(target=target, service_name='ZTF')
+        self.assertEqual(first, 2 * 86400)
+        self.assertEqual(backed_off, 8 * 86400)
+        self.assertEqual(unknown, 8 * 86400)
+        self.assertEqual(tightened, 0.5 * 86400)
+        self.assertEqual(state.empty_refreshes, 0)
+        self.assertEqual(state.last_new_data_at, finished_at)
+        self.assertEqual(state.next_due_at, finished_at + timedelta(seconds=0.5 * 86400))
+
+    def test_data_arriving_later_reschedules_the_next_refresh(self):
+        target = Target.objects.create(name='Delayed', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0, importance=5)
+        finished_at = datetime(2026, 5, 1, tzinfo=timezone.utc)
+        arrived_at = finished_at + timedelta(hours=3)
+
+        with self.settings(DATA_SERVICES_MIN_REFRESH_INTERVAL_SECONDS=3600):
+            # The outcome of a refresh whose data is delivered later is unknown when it finishes.
+            unknown = record_dataservice_refresh(target, 'ZTF', ZTFDataService, None, finished_at)
+            tightened = record_dataservice_data_arrival(target.pk, 'ZTF', ZTFDataService, True, arrived_at)
+
+        state = DataServiceRefreshState.objects.get(target=target, service_name='ZTF')
+        self.assertEqual(unknown, 86400)
+        self.assertEqual(tightened, 0.75 * 86400)
+        self.assertEqual(state.interval_seconds, tightened)
+        self.assertEqual(state.last_new_data_at, arrived_at)
+        self.assertEqual(state.next_due_at, finished_at + timedelta(seconds=tightened))
+        self.assertIsNone(record_dataservice_data_arrival(target.pk, 'Gaia', ZTFDataService, True, arrived_at))
+
+
+class ATLASPollerTests(TestCase):
+    RESULT_TEXT = '###MJD m dm F mag5sig\n60000.1 15.1 0.05 o 19.0\n60000.2 15.2 0.05 c 19.0\n'
+
+    def setUp(self):
+        from custom_code.data_services import atlas_dataservice
+
+        atlas_dataservice._POLL_THROTTLED_UNTIL = 0.0
+        self.addCleanup(setattr, atlas_dataservice, '_POLL_THROTTLED_UNTIL', 0.0)
+        self.first = Target.objects.create(name='AtlasOne', type=Target.SIDEREAL, ra=10.0, dec=-5.0, epoch=2000.0)
+        self.second = Target.objects.create(name='AtlasTwo', type=Target.SIDEREAL, ra=20.0, dec=5.0, epoch=2000.0)
+
+    def _job(self, target, task_url, submitted_minutes_ago):
+        from custom_code.models import ATLASForcedPhotJob
+
+        job = ATLASForcedPhotJob.objects.create(target=target, task_url=task_url)
+        ATLASForcedPhotJob.objects.filter(pk=job.pk).update(
+            submitted_at=datetime.now(timezone.utc) - timedelta(minutes=submitted_minutes_ago)
+        )
+        return job
+
+    def _session(self, responses):
+        def get(url, **kwargs):
+            status, payload, headers = responses[url]
+            response = Mock(status_code=status, headers=headers, text=payload if isinstance(payload, str) else '')
+            response.json.return_value = payload
+            response.raise_for_status.side_effect = None if status < 400 else requests.HTTPError(str(status))
+            return response
+
+        session = Mock()
+        session.get.side_effect = get
+        return session
+
+    def test_poller_ingests_finished_jobs_in_one_batch_and_skips_queued_ones(self):
+        from custom_code.data_services.atlas_dataservice import poll_pending_atlas_jobs
+
+        done = self._job(self.first, 'https://atlas.test/task/1', 30)
+        queued = self._job(self.second, 'https://atlas.test/task/2', 20)
+        behind = self._job(self.second, 'https://atlas.test/task/3', 10)
+        session = self._session({
+            done.task_url: (200, {'finishtimestamp': 'x', 'result_url': 'https://atlas.test/result/1'}, {}),
+            'https://atlas.test/result/1': (200, self.RESULT_TEXT, {}),
+            queued.task_url: (200, {'finishtimestamp': None, 'starttimestamp': None}, {}),
+            behind.task_url: (200, {'finishtimestamp': None, 'starttimestamp': None}, {}),
+        })
+
+        with patch('custom_code.data_services.atlas_dataservice.ATLASDataService._resolve_token', return_value='tok'), \
+             patch('custom_code.data_services.atlas_dataservice._authed_session', return_value=session), \
+             patch('custom_code.data_services.atlas_dataservice.ReducedDatum.objects.bulk_create', wraps=ReducedDatum.objects.bulk_create) as bulk_create, \
+             self.settings(ATLAS_POLL_WORKERS=1):
+            summary = poll_pending_atlas_jobs()
+
+        self.assertEqual(summary['completed'], 1)
+        self.assertEqual(summary['ingested'], 2)
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(bulk_create.call_count, 1)
+        done.refresh_from_db()
+        queued.refresh_from_db()
+        behind.refresh_from_db()
+        self.assertEqual(done.status, 'done')
+        self.assertEqual(done.datapoints_added, 2)
+        self.assertEqual(queued.attempts, 1)
+        self.assertEqual(behind.attempts, 0)
+        self.assertEqual(ReducedDatum.objects.filter(target=self.first, source_name='ATLAS').count(), 2)
+
+    def test_poller_backs_off_after_throttling(self):
+        from custom_code.data_services.atlas_dataservice import poll_pending_atlas_jobs
+
+        job = self._job(self.first, 'https://atlas.test/task/1', 5)
+        session = self._session({job.task_url: (429, {}, {'Retry-After': '120'})})
+
+        with patch('custom_code.data_services.atlas_dataservice.ATLASDataService._resolve_token', return_value='tok'), \
+             patch('custom_code.data_services.atlas_dataservice._authed_session', return_value=session):
+            first = poll_pending_atlas_jobs()
+            second = poll_pending_atlas_jobs()
+
+        self.assertEqual(first['skipped'], 1)
+        self.assertEqual(second['checked'], 0)
+        self.assertEqual(session.get.call_count, 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.attempts, 0)
+
+
+class SpectrumStorageTests(TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.storage_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.storage_dir.cleanup)
+        settings_override = self.settings(SPECTRUM_STORAGE_BACKEND='npy', SPECTRUM_STORAGE_DIR=self.storage_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.target = Target.objects.create(
+            name='Gaia26spec',
+            type=Target.SIDEREAL,
+            ra=10.0,
+            dec=-20.0,
+            epoch=2000.0,
+        )
+        self.value = {
+            'flux': [1.5, 2.5, 3.5],
+            'flux_units': 'erg / (Angstrom cm2 s)',
+            'wavelength': [4000.0, 4001.0, 4002.0],
+            'wavelength_units': 'Angstrom',
+            'flux_error': [0.1, None, 0.3],
+            'flux_error_units': 'erg / (Angstrom cm2 s)',
+        }
+
+    def test_stored_spectrum_keeps_metadata_and_reads_back_from_sidecar(self):
+        from custom_code.spectrum_storage import (
+            SPECTRUM_FILE_KEY,
+            inline_spectrum_value,
+            load_spectrum_arrays,
+            spectrum_from_value,
+            store_spectrum_value,
+        )
+
+        stored = store_spectrum_value(self.value)
+
+        self.assertNotIn('flux', stored)
+        self.assertEqual(stored['flux_units'], self.value['flux_units'])
+        self.assertEqual(stored['spectrum_points'], 3)
+        self.assertTrue(os.path.exists(os.path.join(self.storage_dir.name, stored[SPECTRUM_FILE_KEY])))
+        self.assertEqual(store_spectrum_value(dict(self.value)), stored)
+
+        arrays = load_spectrum_arrays(stored)
+        self.assertEqual(arrays['flux'].dtype, np.float32)
+        self.assertTrue(np.isnan(arrays['flux_error'][1]))
+        self.assertEqual(inline_spectrum_value(stored), self.value)
+        spectrum = spectrum_from_value(stored)
+        self.assertEqual(spectrum.spectral_axis.unit, u.AA)
+        np.testing.assert_allclose(spectrum.flux.value, [1.5, 2.5, 3.5])
+
+    def test_migrate_command_converts_inline_spectra_and_reverts_them(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from custom_code.spectrum_storage import is_stored_spectrum
+
+        datum = ReducedDatum.objects.create(
+            target=self.target,
+            data_type='spectroscopy',
+            source_name='LAMOST',
+            timestamp=datetime(2026, 1, 2, tzinfo=timezone.utc),
+            value=self.value,
+        )
+        ReducedDatum.objects.create(
+            target=self.target,
+            data_type='photometry',
+            source_name='ZTF',
+            timestamp=datetime(2026, 1, 2, tzinfo=timezone.utc),
+            value={'magnitude': 15.0, 'filter': 'g'},
+        )
+
+        call_command('migrate_spectrum_storage', '--dry-run', stdout=StringIO())
+        datum.refresh_from_db()
+        self.assertFalse(is_stored_spectrum(datum.value))
+
+        call_command('migrate_spectrum_storage', stdout=StringIO())
+        datum.refresh_from_db()
+        self.assertTrue(is_stored_spectrum(datum.value))
+
+        call_command('migrate_spectrum_storage', '--inline', '--prune', stdout=StringIO())
+        datum.refresh_from_db()
+        self.assertEqual(datum.value, self.value)
+        self.assertEqual(os.listdir(self.storage_dir.name), [])
+
+    def test_scheduled_refresh_stores_spectra_in_sidecar_files_once(self):
+        from custom_code.spectrum_storage import is_stored_spectrum
+
+        value = self.value
+
+        class StubService:
+            name = 'LAMOST'
+
+            @classmethod
+            def get_form_class(cls):
+                return LAMOSTDataService.get_form_class()
+
+            def build_query_parameters(self, parameters, **kwargs):
+                return parameters
+
+            def query_targets(self, query_parameters, **kwargs):
+                return [{
+                    'reduced_datums': {
+                        'spectroscopy': [{'timestamp': datetime(2026, 1, 2, tzinfo=timezone.utc), 'value': dict(value)}],
+                    },
+                }]
+
+        self.assertTrue(_run_service_for_target(self.target, 'LAMOST', StubService))
+        self.assertFalse(_run_service_for_target(self.target, 'LAMOST', StubService))
+
+        datum = ReducedDatum.objects.get(target=self.target, data_type='spectroscopy')
+        self.assertTrue(is_stored_spectrum(datum.value))
+
+
+class ArchiveDownloadTests(TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        settings_override = self.settings(ARCHIVE_DOWNLOAD_CACHE_DIR=self.cache_dir.name, ARCHIVE_DOWNLOAD_MAX_CONCURRENCY=4)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _response(self, status_code, chunks, headers=None, fail_after=False):
+        response = Mock(status_code=status_code, ok=status_code < 400, headers=headers or {})
+        response.__enter__ = Mock(return_value=response)
+        response.__exit__ = Mock(return_value=False)
+
+        def iter_content(chunk_size=None):
+            yield from chunks
+            if fail_after:
+                raise requests.exceptions.ChunkedEncodingError('connection reset')
+
+        response.iter_content = iter_content
+        return response
+
+    def test_interrupted_download_resumes_with_range_and_is_cached_by_checksum(self):
+        import hashlib
+        from custom_code.data_services.archive_downloads import download_product
+
+        payload = b'SIMPLE  =                    T' + b'x' * 100
+        session = Mock()
+        session.get.side_effect = [
+            self._response(200, [payload[:40]], fail_after=True),
+            self._response(206, [payload[40:]]),
+        ]
+
+        product = download_product('https://archive.test/spec.fits', session=session)
+
+        self.assertEqual(session.get.call_count, 2)
+        self.assertEqual(session.get.call_args_list[1].kwargs['headers'], {'Range': 'bytes=40-'})
+        self.assertEqual(product.sha256, hashlib.sha256(payload).hexdigest())
+        with open(product.path, 'rb') as stored:
+            self.assertEqual(stored.read(), payload)
+
+        self.assertEqual(download_product('https://archive.test/spec.fits', session=session), product)
+        self.assertEqual(session.get.call_count, 2)
+
+    def test_compressed_tar_products_are_decoded_to_fits_on_disk(self):
+        import bz2
+        import tarfile
+        from custom_code.data_services.archive_downloads import decode_fits_product, download_product
+
+        fits_buffer = BytesIO()
+        fits.PrimaryHDU(data=np.arange(60.0), header=fits.Header({'MJD-OBS': 60000.5})).writeto(fits_buffer)
+        tar_buffer = BytesIO()
+        with tarfile.open(fileobj=tar_buffer, mode='w') as archive:
+            for name, content in (('README', b'not a spectrum'), ('spec.fits.gz', gzip.compress(fits_buffer.getvalue()))):
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, BytesIO(content))
+        session = Mock()
+        session.get.return_value = self._response(200, [bz2.compress(tar_buffer.getvalue())])
+
+        fits_path = decode_fits_product(download_product('https://archive.test/spec.tar.bz2', session=session))
+
+        with fits.open(fits_path) as hdul:
+            self.assertEqual(hdul[0].header['MJD-OBS'], 60000.5)
+            np.testing.assert_array_equal(hdul[0].data, np.arange(60.0))
+
+    def test_shared_payloads_survive_discards_and_recently_used_products_survive_pruning(self):
+        import gc
+        import os
+        import time
+        from custom_code.data_services import archive_downloads
+
+        payload = b'SIMPLE  =                    T' + b'y' * 100
+        session = Mock()
+        session.get.side_effect = lambda *args, **kwargs: self._response(200, [payload])
+
+        first = archive_downloads.download_product('https://archive.test/a.fits', session=session)
+        second = archive_downloads.download_product('https://mirror.test/a.fits', session=session)
+        self.assertEqual(first.path, second.path)
+
+        archive_downloads.discard_cached_product(first)
+        self.assertIsNone(archive_downloads.cached_product(first.key))
+        self.assertTrue(os.path.exists(second.path))
+        self.assertEqual(archive_downloads.cached_product(second.key), second)
+
+        # An old payload that is read again must outlive the pruning window.
+        stale = time.time() - 30 * 86400
+        for directory, _subdirs, file_names in os.walk(self.cache_dir.name):
+            for file_name in file_names:
+                os.utime(os.path.join(directory, file_name), (stale, stale))
+        self.assertIsNotNone(archive_downloads.cached_product(second.key))
+        archive_downloads.prune_archive_cache()
+        self.assertEqual(archive_downloads.cached_product(second.key), second)
+
+        archive_downloads.discard_cached_product(second)
+        self.assertFalse(os.path.exists(second.path))
+
+        gc.collect()
+        self.assertEqual(len(archive_downloads._key_locks), 0)
+
+    def test_gemini_skips_ingested_products_and_stops_at_the_cap(self):
+        from custom_code.data_services import gemini_spectra_dataservice as gemini
+
+        rows = [{'obs_id': f'GN-{index}'} for index in range(6)]
+        seen = []
+
+        def datum_from_row(row):
+            seen.append(row['obs_id'])
+            return None if row['obs_id'] == 'GN-2' else {'source_id': row['obs_id']}
+
+        target = Target.objects.create(name='Gaia26gem', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0)
+        ReducedDatum.objects.create(
+            target=target,
+            data_type='spectroscopy',
+            source_name='GeminiSpectra',
+            timestamp=datetime(2026, 1, 2, tzinfo=timezone.utc),
+            value={'source_id': 'GN-0', 'spectrum_type': 'Gemini_spectrum'},
+        )
+        skip_product_ids = gemini.ingested_product_ids({'target_id': target.id}, 'GeminiSpectra')
+        self.assertEqual(skip_product_ids, {'GN-0'})
+        self.assertEqual(gemini.ingested_product_ids({'target_id': target.id, 'force': True}, 'GeminiSpectra'), set())
+
+        service = gemini.GeminiSpectraDataService()
+        with patch.object(gemini, 'MAX_SPECTRA', 3), \
+             patch.object(service, '_datum_from_obscore_row', side_effect=datum_from_row):
+            datums = service._build_spectroscopy_datums(rows, skip_product_ids=skip_product_ids)
+
+        self.assertEqual([datum['source_id'] for datum in datums], ['GN-1', 'GN-3', 'GN-4'])
+        self.assertNotIn('GN-0', seen)
+        self.assertNotIn('GN-5', seen)
+
+
+class ExposureTimeCalculatorTests(TestCase):
+    def test_grid_matches_the_per_filter_lco_calculator(self):
+        from bhtom3.bhtom_observations.facilities.lco import LCO_ETC_MODELS
+
+        filters = ['gp', 'rp', 'unknown']
+        magnitudes = [14.0, 19.4]
+        grid = LCO_ETC_MODELS['1m0'].exposure_time_grid(
+            filters,
+            magnitudes,
+            airmasses=[1.0, 2.0],
+            moon_phases=[0, 2],
+            signal_to_noise=[10, 100],
+        )
+
+        self.assertEqual(grid.shape, (3, 2, 2, 2, 2))
+        self.assertTrue(np.isnan(grid[2]).all())
+        for f_index, m_index, a_index, p_index, s_index in np.ndindex(2, 2, 2, 2, 2):
+            self.assertEqual(
+                grid[f_index, m_index, a_index, p_index, s_index],
+                calculate_lco_etc_exposure_time(
+                    '1m0',
+                    filters[f_index],
+                    magnitudes[m_index],
+                    signal_to_noise=[10, 100][s_index],
+                    moon_phase=[0, 2][p_index],
+                    airmass=[1.0, 2.0][a_index],
+                ),
+            )
+        # Fainter targets, higher airmass, brighter sky and higher S/N all need longer exposures.
+        self.assertTrue((np.diff(grid[:2], axis=1) >= 0).all())
+        self.assertTrue((np.diff(grid[:2], axis=2) >= 0).all())
+        self.assertTrue((np.diff(grid[:2], axis=3) >= 0).all())
+        self.assertTrue((np.diff(grid[:2], axis=4) >= 0).all())
+        self.assertGreater(grid[0, 1, 0, 0, 1], grid[0, 1, 0, 0, 0])
+        self.assertIsNone(calculate_lco_etc_exposure_time('1m0', 'gp', None))
+
+    def test_latest_magnitudes_are_cached_per_target_until_photometry_changes(self):
+        from bhtom3.bhtom_observations.facilities.lco import _lco_etc_latest_magnitudes_by_filter
+
+        target = Target.objects.create(name='Gaia26etc', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0)
+        for hour, magnitude, filter_name in ((1, 19.4, 'ZTF(g)'), (2, 18.9, 'LCO(r)'), (3, 19.1, 'ZTF(g)')):
+            ReducedDatum.objects.create(
+                target=target,
+                data_type='photometry',
+                timestamp=datetime(2026, 6, 1, hour, 0, tzinfo=timezone.utc),
+                value={'magnitude': magnitude, 'filter': filter_name},
+            )
+
+        self.assertEqual(_lco_etc_latest_magnitudes_by_filter(target.id), {'gp': 19.1, 'R': 18.9})
+        with self.assertNumQueries(1):
+            self.assertEqual(_lco_etc_latest_magnitudes_by_filter(target.id), {'gp': 19.1, 'R': 18.9})
+
+        ReducedDatum.objects.create(
+            target=target,
+            data_type='photometry',
+            timestamp=datetime(2026, 6, 1, 4, 0, tzinfo=timezone.utc),
+            value={'magnitude': 18.2, 'filter': 'ZTF(g)'},
+        )
+        self.assertEqual(_lco_etc_latest_magnitudes_by_filter(target.id)['gp'], 18.2)
+
+
+class BatchPhotometricClassificationTests(TestCase):
+    def _model(self, classes, probabilities):
+        return Mock(
+            classes_=np.array(classes),
+            predict_proba=Mock(side_effect=lambda features: np.tile(probabilities, (len(features), 1))),
+        )
+
+    def test_batch_queries_each_catalogue_once_and_reclassifies_offline(self):
+        from custom_code.models import TargetCatalogPhotometry
+        from custom_code.photometry_classification import batch
+
+        full = Target.objects.create(name='Gaia26cls1', type=Target.SIDEREAL, ra=10.0, dec=-5.0, epoch=2000.0)
+        gaia_only = Target.objects.create(name='Gaia26cls2', type=Target.SIDEREAL, ra=11.0, dec=-5.0, epoch=2000.0)
+        unmatched = Target.objects.create(name='Gaia26cls3', type=Target.SIDEREAL, ra=12.0, dec=-5.0, epoch=2000.0)
+        Target.objects.create(name='Comet', type=Target.NON_SIDEREAL, epoch=2000.0)
+
+        matches = {
+            'gaia': {full.pk: {'g': 15.0, 'rp': 14.5, 'bp': 15.6}, gaia_only.pk: {'g': 16.0, 'rp': 15.2, 'bp': 16.9}},
+            '2mass': {full.pk: {'h': 13.1, 'j': 13.6, 'k': 12.9}},
+            'wise': {full.pk: {'w1': 12.7, 'w2': 12.6}},
+        }
+        calls = []
+
+        def query(catalog, positions):
+            calls.append((catalog, sorted(positions['target_id'])))
+            return matches[catalog]
+
+        classifier = Mock(
+            gaia_rfc=self._model(['C', 'N'], [0.25, 0.75]),
+            twomass_rfc=self._model(['B', 'U', 'E', 'Y'], [0.1, 0.6, 0.2, 0.1]),
+            wise_rfc=self._model(['B', 'S', 'R', 'E', 'Y'], [0.1, 0.1, 0.5, 0.2, 0.1]),
+        )
+        with patch.object(batch, 'load_classifier', return_value=(classifier, 'v1')), \
+                patch.object(batch, 'query_catalog_batch', side_effect=query):
+            summary = batch.run_batch_classification()
+            self.assertEqual(batch.run_batch_classification()['targets'], 0)
+
+        ids = sorted([full.pk, gaia_only.pk, unmatched.pk])
+        self.assertEqual(calls, [('gaia', ids), ('2mass', ids), ('wise', ids)])
+        self.assertEqual(summary['classified'], 2)
+        self.assertEqual(summary['unclassifiable'], 1)
+        self.assertEqual(classifier.wise_rfc.predict_proba.call_args.args[0].shape, (1, 28))
+        self.assertEqual(classifier.gaia_rfc.predict_proba.call_args.args[0].shape, (1, 3))
+        classifier.twomass_rfc.predict_proba.assert_not_called()
+        full.refresh_from_db()
+        gaia_only.refresh_from_db()
+        unmatched.refresh_from_db()
+        self.assertEqual(full.phot_class, 'Red Giant 50.0%')
+        self.assertEqual(gaia_only.phot_class, 'Not Ulens 75.0%')
+        self.assertEqual(unmatched.phot_class, '--')
+        self.assertTrue(unmatched.phot_classification_done)
+        self.assertEqual(TargetCatalogPhotometry.objects.get(target=unmatched).photometry, {'gaia': {}, '2mass': {}, 'wise': {}})
+
+        # A new model reclassifies from the cached magnitudes without any network query.
+        classifier.gaia_rfc = self._model(['C', 'N'], [0.9, 0.1])
+        with patch.object(batch, 'load_classifier', return_value=(classifier, 'v2')), \
+                patch.object(batch, 'query_catalog_batch', side_effect=AssertionError('no network')):
+            summary = batch.run_batch_classification(offline=True)
+
+        self.assertEqual(summary['targets'], 3)
+        self.assertEqual(summary['pending'], 0)
+        gaia_only.refresh_from_db()
+        self.assertEqual(gaia_only.phot_class, 'Ulens Candidate 90.0%')
+        self.assertEqual(TargetCatalogPhotometry.objects.get(target=gaia_only).model_version, 'v2')
+
+
+    def test_enqueued_classification_keeps_the_batch_size(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from custom_code.tasks import classify_targets_batch_task
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('classify_targets', '--enqueue', '--offline', '--batch-size', '25', stdout=StringIO())
+
+        with patch('custom_code.tasks.run_batch_classification', return_value={}) as run:
+            _run_queued_tasks(classify_targets_batch_task)
+
+        run.assert_called_once_with(None, refresh_catalogs=False, offline=True, batch_size=25)
+
+
+class TreeModelParityTests(TestCase):
+    def test_exported_tree_model_matches_the_pickled_forest(self):
+        import pickle
+        import tempfile
+        from sklearn.ensemble import RandomForestClassifier
+        from custom_code.photometry_classification.classification_source import (
+            MODEL_PATHS,
+            SELECTED_FEATURES,
+            TREE_MODEL_PATHS,
+            ClassificationSource,
+        )
+        from custom_code.photometry_classification.random_forest_classifier import read_training_data
+        from custom_code.photometry_classification.tree_model import TreeEnsembleModel, load_tree_model
+
+        source = ClassificationSource.TWO_MASS
+        features = SELECTED_FEATURES[source]
+        training = read_training_data(source)
+        forest = RandomForestClassifier(n_estimators=25, random_state=42)
+        forest.fit(training[features].iloc[::2], training['class'].iloc[::2])
+        held_out = training[features].iloc[1::2]
+
+        with tempfile.TemporaryDirectory() as directory:
+            pickle_path = os.path.join(directory, 'models', '2mass_rfc.pickle')
+            npz_path = os.path.join(directory, 'models', '2mass_rfc.npz')
+            os.makedirs(os.path.dirname(pickle_path))
+            with open(pickle_path, 'wb') as handle:
+                pickle.dump(forest, handle)
+            with patch.dict(MODEL_PATHS, {source: pickle_path}), patch.dict(TREE_MODEL_PATHS, {source: npz_path}):
+                exported = load_tree_model(source)
+                self.assertTrue(os.path.exists(npz_path))
+                loaded = load_tree_model(source)
+
+            with open(pickle_path, 'rb') as handle:
+                expected = pickle.load(handle).predict_proba(held_out)
+
+        self.assertIsInstance(loaded, TreeEnsembleModel)
+        self.assertEqual(list(loaded.classes_), list(forest.classes_))
+        np.testing.assert_allclose(exported.predict_proba(held_out), expected, rtol=0, atol=1e-12)
+        # Columns are matched by name, and single rows take the same path as batches.
+        np.testing.assert_allclose(loaded.predict_proba(held_out[features[::-1]]), expected, rtol=0, atol=1e-12)
+        np.testing.assert_allclose(loaded.predict_proba(held_out.iloc[:1]), expected[:1], rtol=0, atol=1e-12)
+        self.assertEqual(list(loaded.predict(held_out)), list(forest.predict(held_out)))
+
+
+class TargetNameIndexTests(TestCase):
+    def test_names_and_aliases_resolve_through_folded_keys_kept_in_sync(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from custom_code.data_services.service_utils import resolve_target_by_name
+        from custom_code.filters import BhtomTargetFilterSet
+        from custom_code.models import TargetNameIndex
+
+        target = Target.objects.create(name='Gaia24abc', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0)
+        alias = TargetName.objects.create(target=target, name='OGLE-2024-BLG-0001')
+        other = Target.objects.create(name='KMT-2024-BLG-0012', type=Target.SIDEREAL, ra=3.0, dec=4.0, epoch=2000.0)
+
+        self.assertEqual(resolve_target_by_name('gaia 24ABC'), target)
+        self.assertEqual(resolve_target_by_name('ogle 2024 blg 1'), target)
+        self.assertEqual(resolve_target_by_name('KMTNet-2024-BLG-12'), other)
+        self.assertIsNone(resolve_target_by_name('Gaia24abd'))
+        self.assertFalse(Target.matches.is_unique(Target(name='GAIA-24ABC')))
+        self.assertEqual(list(BhtomTargetFilterSet({'name': 'ogle 2024'}, queryset=Target.objects.all()).qs), [target])
+
+        alias.name = 'MOA-2024-BLG-0007'
+        alias.save()
+        self.assertIsNone(resolve_target_by_name('OGLE-2024-BLG-0001'))
+        self.assertEqual(resolve_target_by_name('moa-2024-blg-7'), target)
+        alias.delete()
+        self.assertEqual(TargetNameIndex.objects.filter(target=target).count(), 1)
+
+        TargetNameIndex.objects.all().delete()
+        call_command('rebuild_target_name_index', stdout=StringIO())
+        self.assertEqual(resolve_target_by_name('kmt 2024 blg 12'), other)
+
+    def test_dataservice_aliases_are_upserted_in_one_pass(self):
+        from custom_code.target_names import upsert_target_aliases
+
+        target = Target.objects.create(name='Gaia24xyz', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0)
+        owner = Target.objects.create(name='Gaia24own', type=Target.SIDEREAL, ra=3.0, dec=4.0, epoch=2000.0)
+        TargetName.objects.create(target=owner, name='SharedAlias')
+        existing = TargetName.objects.create(target=target, name='AT2024xyz')
+
+        names = ['gaia 24 XYZ', 'SN 2024xyz', 'shared alias', 'ZTF24aaaaaaa', 'ztf24AAAAAAA', 'ASASSN-24ab']
+        # Two lookups, then both inserts and a re-read in one savepoint, however many names there are.
+        with self.assertNumQueries(7):
+            results = upsert_target_aliases(target, names)
+
+        self.assertEqual(results['gaia 24 XYZ'], (None, False))
+        self.assertEqual(results['SN 2024xyz'], (existing, False))
+        self.assertEqual(results['shared alias'], (None, False))
+        self.assertTrue(results['ZTF24aaaaaaa'][1])
+        self.assertEqual(results['ztf24AAAAAAA'], (None, False))
+        self.assertTrue(results['ASASSN-24ab'][1])
+        self.assertEqual(
+            sorted(target.aliases.values_list('name', flat=True)),
+            ['ASASSN-24ab', 'AT2024xyz', 'ZTF24aaaaaaa'],
+        )
+        self.assertEqual(Target.objects.get(name__in=['Gaia24xyz']).name_index.count(), 4)
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        import tempfile
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(CACHES={
+            'default': {
+                'BACKEND': 'custom_code.caching.TieredCache',
+                'OPTIONS': {'SHARED_CACHE': 'tiered-test-shared', 'LOCAL_TIMEOUT': 0.2},
+            },
+            'tiered-test-shared': {
+                'BACKEND': 'custom_code.caching.SQLiteCache',
+                'LOCATION': os.path.join(directory.name, 'cache.sqlite3'),
+            },
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def test_local_tier_serves_values_until_shared_changes_are_due(self):
+        from django.core.cache import caches
+
+        shared = caches['tiered-test-shared']
+        cache.set('plan', {'rows': [1, 2]}, 60)
+        self.assertEqual(shared.get('plan'), {'rows': [1, 2]})
+
+        # Another process replaces the value: this process sees it once its local copy expires.
+        shared.set('plan', {'rows': [3]}, 60)
+        self.assertEqual(cache.get('plan'), {'rows': [1, 2]})
+        time.sleep(0.25)
+        self.assertEqual(cache.get('plan'), {'rows': [3]})
+
+        cache.delete('plan')
+        self.assertIsNone(cache.get('plan'))
+        self.assertTrue(cache.add('lock', 'a', 60))
+        self.assertFalse(cache.add('lock', 'b', 60))
+        self.assertEqual(shared.get('lock'), 'a')
+
+    def test_concurrent_misses_compute_once_and_stale_entries_revalidate_in_background(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from custom_code.caching import cached_value, wait_for_revalidations
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.3)
+            return len(calls)
+
+        with self.settings(CACHE_LOCK_POLL_SECONDS=0.02):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                values = list(pool.map(lambda _: cached_value('table', compute, 0.5, stale_timeout=60), range(4)))
+            self.assertEqual(values, [1, 1, 1, 1])
+            self.assertEqual(len(calls), 1)
+
+            time.sleep(0.6)
+            started = time.monotonic()
+            self.assertEqual(cached_value('table', compute, 0.5, stale_timeout=60), 1)
+            self.assertLess(time.monotonic() - started, 0.2)
+            wait_for_revalidations(timeout=5)
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(cached_value('table', compute, 0.5, stale_timeout=60), 2)
+
+
+class PeriodicitySearchTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='periodicity-user', password='secret')
+        self.target = Target.objects.create(name='PeriodicStar', type=Target.SIDEREAL, ra=10.0, dec=20.0, epoch=2000.0)
+        rng = np.random.default_rng(7)
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        days = np.sort(rng.uniform(0.0, 60.0, 120))
+        ReducedDatum.objects.bulk_create([
+            ReducedDatum(
+                target=self.target,
+                data_type='photometry',
+                source_name='Survey',
+                timestamp=start + timedelta(days=float(day)),
+                value={
+                    'magnitude': float(15.0 + 0.8 * (index % 2) + 0.3 * np.sin(2 * np.pi * day / 1.7)),
+                    'error': 0.02,
+                    'filter': 'g' if index % 2 == 0 else 'r',
+                },
+            )
+            for index, day in enumerate(days)
+        ])
+
+    def _post(self, body):
+        from custom_code.views import TargetPeriodicityComputeView
+
+        request = RequestFactory().post(
+            reverse('target-periodicity-compute', kwargs={'pk': self.target.pk}),
+            data=json.dumps(body),
+            content_type='application/json',
+        )
+        request.user = self.user
+        return TargetPeriodicityComputeView.as_view()(request, pk=self.target.pk)
+
+    def _get_status(self, payload):
+        from custom_code.views import TargetPeriodicitySearchView
+
+        request = RequestFactory().get(payload['status_url'])
+        request.user = self.user
+        return TargetPeriodicitySearchView.as_view()(request, pk=self.target.pk, search_id=payload['search_id'])
+
+    def test_multiband_search_is_computed_from_the_database_once_per_photometry_version(self):
+        from custom_code.periodicity import light_curve_series, load_light_curve, photometry_queryset
+
+        series = light_curve_series(load_light_curve(photometry_queryset(self.target)))
+        self.assertEqual(sorted(series), ['g', 'r'])
+        self.assertEqual(len(series['g']['Survey']['mjd']), 60)
+        self.assertEqual(series['g']['Survey']['err'][0], 0.02)
+
+        response = self._post({'method': 'lomb_scargle', 'min_period': 0.5, 'max_period': 20})
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content)
+        self.assertEqual(result['bands'], ['g', 'r'])
+        self.assertAlmostEqual(result['best_period'], 1.7, places=2)
+        self.assertAlmostEqual(abs(result['fit']['amplitude']), 0.3, places=2)
+
+        with patch('custom_code.periodicity.compute_periodogram') as compute:
+            again = self._post({'min_period': 0.5, 'max_period': 20, 'filters': []})
+        compute.assert_not_called()
+        self.assertEqual(json.loads(again.content)['search_id'], result['search_id'])
+
+        ReducedDatum.objects.create(
+            target=self.target,
+            data_type='photometry',
+            timestamp=datetime(2024, 3, 5, tzinfo=timezone.utc),
+            value={'magnitude': 15.1, 'error': 0.02, 'filter': 'g'},
+        )
+        pdm = json.loads(self._post({'method': 'pdm', 'min_period': 0.5, 'max_period': 20, 'filters': ['g']}).content)
+        self.assertNotEqual(pdm['search_id'], result['search_id'])
+        self.assertEqual(pdm['n_points'], 61)
+        self.assertAlmostEqual(pdm['best_period'], 1.7, places=1)
+        self.assertEqual(self._post({'method': 'bls', 'min_period': 0.01}).status_code, 400)
+
+    def test_large_searches_and_group_runs_are_computed_by_db_worker(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from tom_targets.models import TargetList
+        from custom_code.models import PeriodicitySearch
+        from custom_code.tasks import periodicity_search_task
+
+        with self.settings(PERIODICITY_SYNC_MAX_WORK=1000), self.captureOnCommitCallbacks(execute=True):
+            response = self._post({'method': 'bls', 'min_period': 0.5, 'max_period': 20})
+        queued = json.loads(response.content)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(queued['status'], PeriodicitySearch.STATUS_QUEUED)
+
+        self.assertEqual(_run_queued_tasks(periodicity_search_task), [{'search_id': queued['search_id'], 'status': 'done'}])
+        response = self._get_status(queued)
+        finished = json.loads(response.content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(finished['progress'], 1.0)
+        self.assertIn('depth', finished['bls'])
+
+        group = TargetList.objects.create(name='Variables')
+        group.targets.add(self.target, Target.objects.create(name='Empty', type=Target.SIDEREAL, ra=1.0, dec=2.0, epoch=2000.0))
+        output = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('compute_periodograms', '--group', 'Variables', '--min-period', '0.5', '--enqueue', stdout=output)
+        self.assertIn('queued=1, skipped=1', output.getvalue())
+        _run_queued_tasks(periodicity_search_task)
+        self.assertEqual(
+            sorted(PeriodicitySearch.objects.filter(target=self.target).values_list('status', flat=True)),
+            [PeriodicitySearch.STATUS_DONE, PeriodicitySearch.STATUS_DONE],
+        )
+
+
+class SolarSystemQueryCacheTests(TestCase):
+    @staticmethod
+    def _mpc_response(records):
+        response = Mock()
+        response.raise_for_status.return_value = None
+        response.json.return_value = [{'ADES_DF': records}]
+        return response
+
+    @staticmethod
+    def _mpc_record(obsid, obstime, mag):
+        return {
+            'obsid': obsid, 'obstime': obstime, 'stn': 'T08', 'mag': mag, 'rmsmag': 0.05,
+            'band': 'o', 'ra': '10.0', 'dec': '20.0', 'remarks': 'not stored',
+        }
+
+    def test_mpc_observations_are_served_locally_and_refreshed_in_the_background(self):
+        from custom_code.models import SolarSystemQuery
+        from custom_code.tasks import refresh_solar_system_query_task
+        from custom_code.views import BhtomPallasPhotometryView
+
+        first = [self._mpc_record('a1', '2025-01-01T00:00:00Z', 15.1)]
+        second = first + [self._mpc_record('a2', '2025-01-02T00:00:00Z', 15.3)]
+        with patch('custom_code.views.requests.get', return_value=self._mpc_response(first)) as get:
+            counts = BhtomPallasPhotometryView._fetch_mpc_observation_counts('1', resolved_display_label='(1) Ceres')
+            again = BhtomPallasPhotometryView._fetch_mpc_observation_counts('1', resolved_display_label='(1) Ceres')
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(counts['plotted'], 1)
+        self.assertEqual(again['plotted'], 1)
+        entry = SolarSystemQuery.objects.get(kind=SolarSystemQuery.KIND_MPC_OBSERVATIONS)
+        self.assertNotIn('remarks', entry.payload['records'][0])
+
+        SolarSystemQuery.objects.filter(pk=entry.pk).update(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        with patch('custom_code.views.requests.get', return_value=self._mpc_response(second)) as get:
+            with self.captureOnCommitCallbacks(execute=True):
+                stale = BhtomPallasPhotometryView._fetch_mpc_observation_counts('1', resolved_display_label='(1) Ceres')
+                BhtomPallasPhotometryView._fetch_mpc_observation_counts('1', resolved_display_label='(1) Ceres')
+            self.assertEqual(get.call_count, 0)
+            self.assertEqual(stale['plotted'], 1)
+            results = _run_queued_tasks(refresh_solar_system_query_task)
+        self.assertEqual(results, [{'status': 'updated', 'added': 1}])
+        entry.refresh_from_db()
+        self.assertGreater(entry.expires_at, datetime.now(timezone.utc))
+        self.assertIsNone(entry.refresh_queued_at)
+        refreshed = BhtomPallasPhotometryView._fetch_mpc_observation_counts('1', resolved_display_label='(1) Ceres')
+        self.assertEqual(refreshed['plotted'], 2)
+
+    def test_horizons_tables_keep_their_columns_and_masks_when_stored(self):
+        from custom_code.models import SolarSystemQuery
+        from custom_code.views import BhtomPallasEphemerisView
+
+        calls = []
+
+        class FakeHorizons:
+            def __init__(self, **kwargs):
+                calls.append(kwargs)
+
+            def ephemerides(self, quantities):
+                table = Table(masked=True)
+                table['targetname'] = ['1 Ceres (A801 AA)', '1 Ceres (A801 AA)']
+                table['datetime_str'] = ['2025-Jan-01 00:00', '2025-Jan-01 01:00']
+                table['RA'] = [10.5, 10.6] * u.deg
+                table['V'] = [7.1, 7.2]
+                table['V'].mask = [False, True]
+                return table
+
+        epochs = {'start': '2025-01-01 00:00:00', 'stop': '2025-01-01 02:00:00', 'step': '1h'}
+        with patch('custom_code.views.Horizons', FakeHorizons):
+            first = BhtomPallasEphemerisView._query_horizons_ephemerides('Ceres', '500', epochs, '1,9')
+            second = BhtomPallasEphemerisView._query_horizons_ephemerides('Ceres', '500', epochs, '1,9')
+            BhtomPallasEphemerisView._query_horizons_ephemerides('Ceres', 'T08', epochs, '1,9')
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(SolarSystemQuery.objects.filter(kind=SolarSystemQuery.KIND_HORIZONS_EPHEMERIDES).count(), 2)
+        self.assertEqual(first.colnames, second.colnames)
+        self.assertEqual(str(second[0]['targetname']), '1 Ceres (A801 AA)')
+        self.assertEqual(second['RA'].unit, u.deg)
+        self.assertTrue(second['V'].mask[1])
+        self.assertAlmostEqual(float(second['V'][0]), 7.1)
+
+    def test_spans_within_the_same_days_are_sliced_from_one_stored_window(self):
+        from custom_code.models import SolarSystemQuery
+        from custom_code.views import BhtomPallasEphemerisView
+
+        calls = []
+
+        class FakeHorizons:
+            def __init__(self, **kwargs):
+                calls.append(kwargs['epochs'])
+
+            def ephemerides(self, quantities):
+                table = Table()
+                table['datetime_jd'] = [Time('2025-01-01T00:00:00').jd + hour / 24.0 for hour in range(49)]
+                table['RA'] = [float(hour) for hour in range(49)]
+                return table
+
+        morning = {'start': '2025-01-01 06:00:00', 'stop': '2025-01-02 06:00:00', 'step': '1h'}
+        evening = {'start': '2025-01-01 20:00:00', 'stop': '2025-01-02 20:00:00', 'step': '1h'}
+        with patch('custom_code.views.Horizons', FakeHorizons):
+            first = BhtomPallasEphemerisView._query_horizons_ephemerides('Ceres', '500', morning, '1')
+            second = BhtomPallasEphemerisView._query_horizons_ephemerides('Ceres', '500', evening, '1')
+
+        self.assertEqual(calls, [{'start': '2025-01-01 00:00:00', 'stop': '2025-01-03 00:00:00', 'step': '1h'}])
+        self.assertEqual(SolarSystemQuery.objects.filter(kind=SolarSystemQuery.KIND_HORIZONS_EPHEMERIDES).count(), 1)
+        self.assertEqual(list(first['RA'][[0, -1]]), [6.0, 30.0])
+        self.assertEqual(list(second['RA'][[0, -1]]), [20.0, 44.0])
+
+
+@override_settings(NON_SIDEREAL_EPHEMERIS_PAST_DAYS=2, NON_SIDEREAL_EPHEMERIS_FUTURE_DAYS=2)
+class NonSiderealEphemerisTests(TestCase):
+    def setUp(self):
+        self.target = Target.objects.create(
+            name='GridMinorPlanet',
+            type=Target.NON_SIDEREAL,
+            scheme='MPC_MINOR_PLANET',
+            semimajor_axis=2.35,
+            eccentricity=0.17,
+            inclination=8.4,
+            arg_of_perihelion=132.5,
+            lng_asc_node=76.2,
+            mean_anomaly=48.1,
+            epoch_of_elements=61000.0,
+            mean_daily_motion=0.274,
+        )
+        self.now = Time('2026-04-08T12:00:00', scale='utc')
+
+    def test_interpolated_positions_match_direct_propagation(self):
+        from custom_code.models import NonSiderealEphemeris
+        from custom_code.nonsidereal_ephemeris import refresh_nonsidereal_ephemeris
+        from custom_code.sun_separation import (
+            _non_sidereal_ra_dec_now,
+            _resolve_target_coordinates_now,
+            compute_sun_separation,
+            get_live_target_values,
+        )
+
+        summary = refresh_nonsidereal_ephemeris(self.target.pk, now=self.now)
+        self.assertEqual(summary['status'], 'computed')
+        self.assertEqual(summary['samples'], 97)
+        self.assertEqual(NonSiderealEphemeris.objects.get(target=self.target).samples, 97)
+
+        target = Target.objects.get(pk=self.target.pk)
+        tt = Time('2026-04-09T03:31:00', scale='utc')
+        site = {'observer_lat_deg': 52.0, 'observer_lon_deg': 21.4, 'observer_elevation_m': 100.0}
+        for observer in ({}, site):
+            with patch('custom_code.sun_separation._non_sidereal_ra_dec_now') as direct:
+                ra, dec = _resolve_target_coordinates_now(target, time_to_compute=tt, **observer)
+            direct.assert_not_called()
+            expected = SkyCoord(*_non_sidereal_ra_dec_now(target, tt, **observer), unit='deg')
+            self.assertLess(SkyCoord(ra, dec, unit='deg').separation(expected).arcsec, 1.0)
+
+        values = get_live_target_values(target, time_to_compute=tt)
+        self.assertEqual(values['sun_separation'], compute_sun_separation(values['ra'], values['dec'], time_to_compute=tt))
+        with patch('custom_code.sun_separation._non_sidereal_ra_dec_now', return_value=(1.0, 2.0)):
+            outside = _resolve_target_coordinates_now(target, time_to_compute=Time('2026-05-01T00:00:00', scale='utc'))
+        self.assertEqual(outside, (1.0, 2.0))
+
+    def test_grid_is_extended_incrementally_and_recomputed_when_elements_change(self):
+        from custom_code.nonsidereal_ephemeris import due_nonsidereal_ephemeris_targets, load_ephemeris, refresh_nonsidereal_ephemeris
+        from custom_code.tasks import refresh_nonsidereal_ephemeris_task
+
+        self.assertEqual(due_nonsidereal_ephemeris_targets(now=self.now), [self.target.pk])
+        refresh_nonsidereal_ephemeris(self.target.pk, now=self.now)
+        self.assertEqual(due_nonsidereal_ephemeris_targets(now=self.now), [])
+        later = Time('2026-04-09T18:00:00', scale='utc')
+        self.assertEqual(due_nonsidereal_ephemeris_targets(now=later), [self.target.pk])
+        extended = refresh_nonsidereal_ephemeris(self.target.pk, now=later)
+        self.assertEqual((extended['reused'], extended['computed']), (67, 30))
+
+        target = Target.objects.get(pk=self.target.pk)
+        self.assertIsNotNone(load_ephemeris(target))
+        with self.captureOnCommitCallbacks(execute=True):
+            target.eccentricity = 0.2
+            target.save()
+        self.assertIsNone(load_ephemeris(target))
+        self.assertEqual(due_nonsidereal_ephemeris_targets(now=later), [self.target.pk])
+        results = _run_queued_tasks(refresh_nonsidereal_ephemeris_task)
+        self.assertEqual([result['status'] for result in results], ['computed'])
+        self.assertIsNotNone(load_ephemeris(Target.objects.get(pk=self.target.pk)))
+
+    def test_scheduler_skips_targets_with_a_queued_grid_computation(self):
+        from django_tasks.backends.database.models import DBTaskResult
+        from custom_code.nonsidereal_ephemeris import enqueue_due_nonsidereal_ephemerides
+        from custom_code.tasks import refresh_nonsidereal_ephemeris_task
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = enqueue_due_nonsidereal_ephemerides(now=self.now)
+        with self.captureOnCommitCallbacks(execute=True):
+            second = enqueue_due_nonsidereal_ephemerides(now=self.now)
+
+        self.assertEqual(first, {'due': 1, 'pending': 0, 'enqueued': 1})
+        self.assertEqual(second, {'due': 1, 'pending': 1, 'enqueued': 0})
+        self.assertEqual(DBTaskResult.objects.filter(task_path=refresh_nonsidereal_ephemeris_task.module_path).count(), 1)
+
+
+class TransitCalendarTests(TestCase):
+    SITES = (
+        ('LT', 'La Palma', 28.762, -17.879, 2363.0),
+        ('LCO', 'Siding Spring', -31.272, 149.07, 1116.0),
+    )
+
+    def setUp(self):
+        sites = patch('custom_code.transit_calendar.observing_sites', return_value=self.SITES)
+        sites.start()
+        self.addCleanup(sites.stop)
+        self.now = Time('2026-04-08T12:00:00', scale='utc')
+        self.target = Target.objects.create(
+            name='CalendarPlanet',
+            type=Target.SIDEREAL,
+            ra=195.0,
+            dec=20.0,
+            epoch=2000.0,
+            permissions=Target.Permissions.OPEN,
+        )
+        # Mid-transits at 01:00 UTC: night at La Palma, day at Siding Spring.
+        self.ephemeris = TransitEphemeris.objects.create(
+            target=self.target,
+            planet_name='CalendarPlanet b',
+            t0_bjd_tdb=Time('2026-04-09T01:00:00', scale='utc').tdb.jd,
+            period_days=1.0,
+            duration_hours=2.0,
+            depth_r_mmag=12.0,
+            v_mag=11.5,
+        )
+
+    @override_settings(TRANSIT_CALENDAR_HORIZON_DAYS=3)
+    def test_calendar_rolls_forward_and_recomputes_changed_ephemerides(self):
+        from astroplan import Observer
+        from custom_code.models import TransitEvent, TransitEventVisibility
+        from custom_code.tasks import refresh_transit_calendar_task
+        from custom_code.transit_calendar import due_transit_ephemerides, refresh_transit_calendars
+
+        self.assertEqual(due_transit_ephemerides(now=self.now), [self.ephemeris.pk])
+        summary = refresh_transit_calendars([self.ephemeris.pk], now=self.now)
+        self.assertEqual((summary['events'], summary['computed'], summary['reused']), (3, 3, 0))
+        self.assertEqual(due_transit_ephemerides(now=self.now), [])
+        self.assertEqual(TransitEventVisibility.objects.count(), 6)
+        self.assertEqual(
+            sorted(TransitEventVisibility.objects.filter(observable=True).values_list('site', flat=True)),
+            ['La Palma'] * 3,
+        )
+
+        event = TransitEvent.objects.order_by('epoch').first()
+        self.assertLess(abs((event.mid - datetime(2026, 4, 9, 1, tzinfo=timezone.utc)).total_seconds()), 1.0)
+        self.assertAlmostEqual((event.egress - event.ingress).total_seconds(), 7200.0, places=2)
+        visibility = event.visibilities.get(site='La Palma')
+        observer = Observer(latitude=28.762 * u.deg, longitude=-17.879 * u.deg, elevation=2363.0 * u.m)
+        expected = observer.altaz(Time(event.mid), SkyCoord(195.0, 20.0, unit='deg')).alt.deg
+        self.assertAlmostEqual(visibility.mid_altitude, expected, places=2)
+
+        later = Time('2026-04-09T12:00:00', scale='utc')
+        self.assertEqual(due_transit_ephemerides(now=later), [self.ephemeris.pk])
+        rolled = refresh_transit_calendars([self.ephemeris.pk], now=later)
+        self.assertEqual((rolled['computed'], rolled['reused'], rolled['removed']), (1, 2, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ephemeris.period_days = 1.01
+            self.ephemeris.save()
+        _run_queued_tasks(refresh_transit_calendar_task)
+        self.assertTrue(TransitEvent.objects.exists())
+        self.assertFalse(TransitEvent.objects.filter(epoch__lte=3).exists())
+        self.assertEqual(due_transit_ephemerides(), [])
+
+    @override_settings(TRANSIT_CALENDAR_HORIZON_DAYS=3)
+    def test_api_lists_observable_transits_with_filters(self):
+        from django.contrib.auth.models import AnonymousUser
+        from custom_code.transit_calendar import refresh_transit_calendars
+        from custom_code.views import TransitCalendarApiView, TransitCalendarView
+
+        refresh_transit_calendars([self.ephemeris.pk], now=self.now)
+
+        def transits(**params):
+            request = RequestFactory().get(
+                reverse('transit-calendar-api'),
+                {'start': '2026-04-08T12:00:00', 'days': '3', **params},
+            )
+            request.user = AnonymousUser()
+            response = TransitCalendarApiView.as_view()(request)
+            return response.status_code, json.loads(response.content)
+
+        status, payload = transits()
+        self.assertEqual(status, 200)
+        self.assertEqual(payload['count'], 3)
+        self.assertEqual({row['site'] for row in payload['transits']}, {'La Palma'})
+        self.assertEqual(payload['transits'][0]['planet_name'], 'CalendarPlanet b')
+        self.assertEqual(payload['transits'][0]['magnitude'], 11.5)
+        self.assertEqual(transits(facility='LCO')[1]['count'], 0)
+        self.assertEqual(transits(min_depth='10', max_mag='12', max_duration='3')[1]['count'], 3)
+        self.assertEqual(transits(min_depth='15')[1]['count'], 0)
+        self.assertEqual(transits(days='1')[1]['count'], 1)
+        self.assertEqual(transits(max_mag='bright')[0], 400)
+
+        request = RequestFactory().get(reverse('transit-calendar'), {'start': '2026-04-09', 'max_mag': 'bright'})
+        request.user = AnonymousUser()
+        context = TransitCalendarView.as_view()(request).context_data
+        self.assertEqual(context['filter_error'], 'max_mag must be a number.')
+        self.assertEqual(list(context['transits']), [])
+
+        Target.objects.filter(pk=self.target.pk).update(permissions=Target.Permissions.PRIVATE)
+        self.assertEqual(transits()[1]['count'], 0)
+
+
+class TleCatalogueTests(TestCase):
+    @staticmethod
+    def _tle(norad_id, epoch):
+        return (
+            f'1 {norad_id:05d}U 98067A   {epoch}  .00000000  00000-0  00000-0 0  9991',
+            f'2 {norad_id:05d}   0.0164  90.0000 0001000   0.0000 180.0000  1.00270000    05',
+        )
+
+    def _geotarget(self, norad_id, epoch):
+        from custom_code.tle_catalogue import tle_element_fields
+
+        line1, line2 = self._tle(norad_id, epoch)
+        return GeoTarget.objects.create(
+            norad_id=norad_id,
+            name=f'SAT-{norad_id}',
+            tle_name=f'SAT-{norad_id}',
+            tle_line1=line1,
+            tle_line2=line2,
+            **tle_element_fields(line1, line2),
+        )
+
+    def _group_text(self, *satellites):
+        lines = ['garbage header']
+        for name, norad_id, epoch in satellites:
+            lines.append(name)
+            lines.extend(self._tle(norad_id, epoch))
+        return '\n'.join(lines) + '\n'
+
+    def test_directory_sync_updates_only_older_geotarget_tles(self):
+        import tempfile
+        from custom_code.models import TleCatalogueEntry, TleCatalogueGroup
+        from custom_code.tle_catalogue import apply_tle_catalogue, sync_tle_catalogue
+
+        older = self._geotarget(12345, '26100.50000000')
+        newer = self._geotarget(23456, '26120.50000000')
+        self._geotarget(34567, '26100.50000000')
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'geo.tle'), 'w') as handle:
+                handle.write(self._group_text(('SAT A', 12345, '26112.50000000'), ('SAT B', 23456, '26110.50000000')))
+            with open(os.path.join(directory, 'notes.md'), 'w') as handle:
+                handle.write('not a TLE file')
+
+            summary = sync_tle_catalogue(directory=directory)
+            self.assertEqual((summary['groups'], summary['records'], summary['added']), (1, 2, 2))
+            self.assertEqual(sync_tle_catalogue(directory=directory)['unchanged'], 2)
+
+        self.assertEqual(TleCatalogueEntry.objects.get(norad_id=12345).name, 'SAT A')
+        self.assertEqual(TleCatalogueGroup.objects.get(name='geo').records, 2)
+
+        result = apply_tle_catalogue()
+        self.assertEqual((result['checked'], result['updated'], result['missing']), (3, 1, [34567]))
+        older.refresh_from_db()
+        newer.refresh_from_db()
+        self.assertEqual(older.tle_line1, self._tle(12345, '26112.50000000')[0])
+        self.assertEqual(older.tle_name, 'SAT A')
+        self.assertAlmostEqual(older.epoch_jd, 2461153.0)
+        self.assertEqual(newer.tle_line1, self._tle(23456, '26120.50000000')[0])
+        self.assertEqual(apply_tle_catalogue()['updated'], 0)
+
+    def test_downloaded_groups_respect_minimum_fetch_interval_and_feed_get_tle(self):
+        from custom_code import geosat
+        from custom_code.models import TleCatalogueGroup
+        from custom_code.tle_catalogue import sync_tle_catalogue, tle_age_days, tle_is_stale
+
+        text = self._group_text(('SAT A', 12345, '26112.50000000'))
+        with override_settings(TLE_CATALOGUE_DIRECTORY='', TLE_CATALOGUE_GROUPS='geo'):
+            with patch('custom_code.tle_catalogue._download_group', return_value=('https://example.test/geo', text)) as download:
+                self.assertEqual(sync_tle_catalogue()['groups'], 1)
+                self.assertEqual(sync_tle_catalogue()['skipped'], 1)
+                self.assertEqual(sync_tle_catalogue(force=True)['groups'], 1)
+            self.assertEqual(download.call_count, 2)
+
+            with patch('custom_code.tle_catalogue._download_group', side_effect=urllib.error.URLError('offline')):
+                self.assertEqual(sync_tle_catalogue(force=True)['failed'], 1)
+            self.assertEqual(TleCatalogueGroup.objects.get(name='geo').error, '<urlopen error offline>')
+
+            with patch('custom_code.geosat.fetch_tle_by_norad_id') as fetch:
+                self.assertEqual(geosat.get_tle(12345), ('SAT A', *self._tle(12345, '26112.50000000')))
+            fetch.assert_not_called()
+
+        when = datetime(2026, 4, 26, 12, tzinfo=timezone.utc)
+        self.assertAlmostEqual(tle_age_days(2461153.0, when), 4.0)
+        self.assertTrue(tle_is_stale(tle_age_days(2461153.0, when)))
+        self.assertFalse(tle_is_stale(1.5))
+        self.assertTrue(tle_is_stale(None))
+
+
+class GeoTomLiveStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.targets = [
+            GeoTarget.objects.create(
+                norad_id=norad_id,
+                name=name,
+                tle_name=name,
+                is_debris=is_debris,
+                tle_line1=f'1 {norad_id}U 98067A   26112.50000000  .00000000  00000-0  00000-0 0  9991',
+                tle_line2=f'2 {norad_id}   0.0164  90.0000 0001000   0.0000 180.0000  1.00270000    05',
+            )
+            for norad_id, name, is_debris in ((12345, 'ALPHA-SAT', False), (23456, 'BETA-DEB', True))
+        ]
+        self.altitude = 12.3456
+        self.sun_payload = {
+            'sun_alt_deg': -20.0,
+            'sun_az_deg': 180.0,
+            'curve_points': [{'az_deg': 180.0, 'alt_deg': 0.0}],
+        }
+
+    def _sat_payload(self, **kwargs):
+        return {
+            'tle_name': kwargs['tle_name'],
+            'alt_deg': self.altitude,
+            'az_deg': 234.5678,
+            'ra_icrf_hours': 5.5,
+            'dec_deg': -12.25,
+            'hour_angle_hours': 1.25,
+            'distance_km': 41000.0,
+            'solar_elongation_deg': 120.0,
+            'phase_angle_deg': 60.0,
+            'estimated_vmag': 10.1234,
+            'computed_at_utc': None,
+        }
+
+    @staticmethod
+    def _event(chunk):
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+        return fields['event'], int(fields['id']), json.loads(fields['data'])
+
+    @override_settings(GEOTOM_LIVE_STREAM_SECONDS=0)
+    def test_stream_sends_filtered_snapshot(self):
+        from custom_code.views import GeoTomLiveStreamView
+
+        request = RequestFactory().get(reverse('geotom-live-stream'), {'object_class': 'debris'})
+        request.session = {}
+        with patch('custom_code.views.geosat_alt_az_from_tle', side_effect=self._sat_payload), \
+             patch('custom_code.views.sun_visibility_curve', return_value=self.sun_payload):
+            response = GeoTomLiveStreamView.as_view()(request)
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(chunks[0], 'retry: 1000\n\n')
+        event, _, data = self._event(chunks[1])
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual([row['target_id'] for row in data['rows']], [self.targets[1].pk])
+        self.assertEqual(data['rows'][0]['estimated_vmag'], 10.12)
+        self.assertEqual([target['norad_id'] for target in data['targets']], [23456])
+        self.assertEqual(data['sun_altaz'], {'az_deg': 180.0, 'alt_deg': -20.0})
+        self.assertEqual(len(chunks), 2)
+
+    def test_positions_are_computed_once_per_tick_and_site_for_all_viewers(self):
+        from custom_code.views import LIST_OBSERVER_PRESETS, _geotom_live_events
+
+        observer = LIST_OBSERVER_PRESETS['warsaw']
+        filters = {'name': '', 'norad_id': '', 'object_class': 'all', 'visible_only': False}
+        clock = Mock()
+        clock.time.return_value = 1_800_000_000.25
+        clock.monotonic.return_value = 0.0
+        with patch('custom_code.views.time', clock), \
+             patch('custom_code.views.geosat_alt_az_from_tle', side_effect=self._sat_payload) as compute, \
+             patch('custom_code.views.sun_visibility_curve', return_value=self.sun_payload):
+            first = _geotom_live_events(observer, filters, 1.0, 60)
+            second = _geotom_live_events(observer, {**filters, 'name': 'alpha'}, 1.0, 60)
+            next(first), next(second)
+            _, tick, snapshot = self._event(next(first))
+            _, _, other = self._event(next(second))
+            self.assertEqual(compute.call_count, 2)
+            self.assertEqual(tick, 1_800_000_000)
+            self.assertEqual(len(snapshot['rows']), 2)
+            self.assertEqual([row['target_id'] for row in other['rows']], [self.targets[0].pk])
+
+            event, _, unchanged = self._event(next(first))
+            self.assertEqual((event, unchanged['rows']), ('delta', []))
+            self.assertNotIn('targets', unchanged)
+            self.assertEqual(compute.call_count, 2)
+
+            clock.time.return_value += 1
+            self.altitude = 13.0
+            _, tick, moved = self._event(next(first))
+            self.assertEqual(tick, 1_800_000_001)
+            self.assertEqual([row['alt_deg'] for row in moved['rows']], [13.0, 13.0])
+            self.assertEqual(compute.call_count, 4)
+            self.assertEqual(clock.sleep.call_count, 2)
+
+
+class GeoSatSunCurveTests(TestCase):
+    site = (52.2297, 21.0122, 100.0)
+    when = datetime(2026, 4, 21, 12, 34, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_curves_are_computed_together_and_cached_per_site_and_sun_bucket(self):
+        from custom_code import geosat
+
+        other_site = (-29.2567, -70.7346, 2400.0)
+        with patch('custom_code.geosat.sun_altaz_at_sites', wraps=geosat.sun_altaz_at_sites) as sun_positions:
+            curves = geosat.sun_visibility_curves([self.site, other_site], self.when)
+            self.assertEqual(sun_positions.call_count, 1)
+            again = geosat.sun_visibility_curve(*self.site, when_utc=self.when + timedelta(seconds=30))
+            self.assertEqual(sun_positions.call_count, 1)
+            geosat.sun_visibility_curve(*self.site, when_utc=self.when + timedelta(seconds=60))
+            self.assertEqual(sun_positions.call_count, 2)
+
+        self.assertEqual(again['curve_points'], curves[0]['curve_points'])
+        self.assertEqual(again['computed_at_utc'], self.when + timedelta(seconds=30))
+        self.assertNotEqual(curves[0]['sun_az_deg'], curves[1]['sun_az_deg'])
+        for curve in curves:
+            points = [point for point in curve['curve_points'] if point['alt_deg'] is not None]
+            self.assertEqual(len(points), 361)
+            elongations = geosat.solar_elongation(
+                [point['alt_deg'] for point in points],
+                [point['az_deg'] for point in points],
+                curve['sun_alt_deg'],
+                curve['sun_az_deg'],
+            )
+            np.testing.assert_allclose(elongations, 90.0, atol=1e-6)
+
+        points = [point for point in curves[0]['curve_points'] if point['alt_deg'] is not None]
+        hadec = [point for point in geosat.convert_altaz_curve_to_hadec(curves[0]['curve_points'], self.site[0]) if point['ha_hours'] is not None]
+        self.assertEqual(len(hadec), len(points))
+        for point, source in zip(hadec, points):
+            self.assertEqual((point['ha_hours'], point['dec_deg']), geosat.altaz_to_hadec_point(source['alt_deg'], source['az_deg'], self.site[0]))
+
+    def test_altaz_to_hadec_broadcasts_over_directions_and_sites(self):
+        from custom_code.geosat import altaz_to_hadec, altaz_to_hadec_point
+
+        alt_deg = np.array([90.0, 30.0, 10.0])
+        az_deg = np.array([0.0, 180.0, 270.0])
+        latitudes = np.array([52.2297, -29.2567])
+        ha_hours, dec_deg = altaz_to_hadec(alt_deg[:, None], az_deg[:, None], latitudes[None, :])
+
+        self.assertEqual(ha_hours.shape, (3, 2))
+        np.testing.assert_allclose(dec_deg[0], latitudes, atol=1e-9)
+        self.assertAlmostEqual(min(ha_hours[1, 0], 24.0 - ha_hours[1, 0]), 0.0)
+        self.assertAlmostEqual(dec_deg[1, 0], 52.2297 - 60.0)
+        for i in range(3):
+            for j in range(2):
+                self.assertEqual((ha_hours[i, j], dec_deg[i, j]), altaz_to_hadec_point(alt_deg[i], az_deg[i], latitudes[j]))
+
+    def test_sun_exclusion_grid_marks_the_sky_near_the_sun(self):
+        from django.contrib.auth.models import AnonymousUser
+        from custom_code.geosat import sun_exclusion_grid
+        from custom_code.views import GeoTomSunExclusionView
+
+        grid = sun_exclusion_grid(*self.site, when_utc=self.when, step_deg=5.0)
+        self.assertEqual((len(grid['alt_deg']), len(grid['az_deg'])), (19, 73))
+        excluded = np.array(grid['excluded'])
+        sun_row = int(round(grid['sun_alt_deg'] / 5.0))
+        sun_column = int(round(grid['sun_az_deg'] / 5.0))
+        self.assertEqual(excluded[sun_row, sun_column], 1)
+        self.assertEqual(excluded[0, (sun_column + 36) % 72], 0)
+
+        hadec = sun_exclusion_grid(*self.site, when_utc=self.when, frame='hadec', step_deg=5.0)
+        self.assertEqual((len(hadec['dec_deg']), len(hadec['ha_hours'])), (37, 73))
+        self.assertEqual(np.array(hadec['excluded'])[int(round((hadec['sun_dec_deg'] + 90.0) / 5.0)), int(round(hadec['sun_ha_hours'] * 3.0))], 1)
+        with self.assertRaises(ValueError):
+            sun_exclusion_grid(*self.site, when_utc=self.when, frame='galactic')
+
+        def response(**params):
+            request = RequestFactory().get(reverse('geotom-sun-exclusion'), params)
+            request.user = AnonymousUser()
+            request.session = {}
+            return GeoTomSunExclusionView.as_view()(request)
+
+        payload = json.loads(response(time_utc='2026-04-21T12:34:00', step='5', frame='hadec').content)
+        self.assertEqual(payload['frame'], 'hadec')
+        self.assertEqual(payload['excluded'], hadec['excluded'])
+        self.assertEqual(response(step='0.01').status_code, 400)
+
+
+class TargetImportTests(TestCase):
+    def _table(self, text, suffix='.csv'):
+        import tempfile
+
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        with handle:
+            handle.write(text)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    @override_settings(TARGET_IMPORT_BATCH_SIZE=2)
+    def test_import_deduplicates_validates_and_matches_scalar_derived_fields(self):
+        from custom_code.models import TargetNameIndex
+        from custom_code.priority import compute_target_priority_values
+        from custom_code.sun_separation import compute_sun_separation
+        from custom_code.target_import import import_targets
+
+        existing = Target.objects.create(name='Gaia24abc', type=Target.SIDEREAL, ra=10.0, dec=10.0, epoch=2000.0)
+        TargetName.objects.create(target=existing, name='OGLE-2024-BLG-0001')
+        path = self._table(
+            'Name,RA,Dec,epoch,classification,importance,cadence,aliases\n'
+            'ImportOne,12:30:00,-45:30:00,2000,Nova,5,2,Alias One; gaia 24 abc\n'
+            'ImportTwo,200.5,30.25,1950,,,,\n'
+            'import one,100,10,,,,,\n'
+            'gaia 24 ABC,100,10,,,,,\n'
+            'ogle 2024 blg 1,100,10,,,,,\n'
+            'BadDec,100,95,,,,,\n'
+            'BadClass,100,10,,Comet-ish,,,\n'
+            'ImportThree,300,-10,,,3,1,\n'
+        )
+
+        with self.captureOnCommitCallbacks(execute=False):
+            summary = import_targets(path, run_dataservices=False)
+
+        self.assertEqual(
+            {key: summary[key] for key in ('rows', 'created', 'existing', 'duplicates', 'invalid')},
+            {'rows': 8, 'created': 3, 'existing': 2, 'duplicates': 1, 'invalid': 2},
+        )
+        self.assertEqual([error[0] for error in summary['errors']], [3, 4, 5, 6, 7])
+        one = Target.objects.get(name='ImportOne')
+        self.assertAlmostEqual(one.ra, 187.5)
+        self.assertAlmostEqual(one.dec, -45.5)
+        self.assertEqual((one.classification, one.importance, one.cadence), ('Nova', 5.0, 2.0))
+        self.assertEqual(list(one.aliases.values_list('name', flat=True)), ['Alias One'])
+        self.assertEqual(
+            set(TargetNameIndex.objects.filter(target=one).values_list('key', flat=True)),
+            {'importone', 'aliasone'},
+        )
+        for target in Target.objects.filter(pk__in=summary['target_ids']):
+            self.assertEqual(
+                {field: getattr(target, field) for field in ('galactic_lng', 'galactic_lat', 'constellation')},
+                derive_sidereal_target_fields(target),
+            )
+            self.assertAlmostEqual(target.sun_separation, compute_sun_separation(target.ra, target.dec), delta=1.0)
+            self.assertAlmostEqual(target.priority, compute_target_priority_values(target)[0], delta=0.2)
+
+        dry_run = import_targets(path, dry_run=True)
+        self.assertEqual((dry_run['created'], dry_run['existing']), (0, 6))
+
+    @override_settings(
+        AUTO_QUERY_DATA_SERVICES_ON_TARGET_CREATE=True,
+        TARGET_IMPORT_DATASERVICES_BATCH_SIZE=2,
+        TARGET_IMPORT_DATASERVICES_INTERVAL_SECONDS=30,
+    )
+    def test_imported_targets_share_one_rate_limited_dataservice_job(self):
+        from django_tasks.backends.database.models import DBTaskResult
+        from custom_code.tasks import import_targets_dataservices_task, update_target_dataservice_for_target
+        from custom_code.target_import import import_targets
+
+        path = self._table(
+            '# %ECSV 1.0\n'
+            '# ---\n'
+            '# datatype:\n'
+            '# - {name: name, datatype: string}\n'
+            '# - {name: ra, unit: hourangle, datatype: float64}\n'
+            '# - {name: dec, unit: deg, datatype: float64}\n'
+            'name ra dec\n'
+            'EcsvOne 1.0 10.0\n'
+            'EcsvTwo 2.0 20.0\n'
+            'EcsvThree 3.0 30.0\n',
+            suffix='.ecsv',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = import_targets(path)
+
+        self.assertEqual(summary['created'], 3)
+        self.assertAlmostEqual(Target.objects.get(name='EcsvTwo').ra, 30.0)
+        self.assertEqual(DBTaskResult.objects.filter(task_path=update_target_dataservice_for_target.module_path).count(), 0)
+        queued = DBTaskResult.objects.get(task_path=import_targets_dataservices_task.module_path)
+        self.assertEqual(queued.args_kwargs['args'], [summary['target_ids']])
+
+        with patch('custom_code.tasks.run_target_dataservices_for_target') as run_services:
+            with self.captureOnCommitCallbacks(execute=True):
+                first, = _run_queued_tasks(import_targets_dataservices_task)
+            retry_job = DBTaskResult.objects.get(task_path=import_targets_dataservices_task.module_path)
+            self.assertGreater(retry_job.run_after, queued.enqueued_at + timedelta(seconds=29))
+            with self.captureOnCommitCallbacks(execute=True):
+                second, = _run_queued_tasks(import_targets_dataservices_task)
+        self.assertEqual([first, second], [{'processed': 2, 'remaining': 1}, {'processed': 1, 'remaining': 0}])
+        self.assertEqual([call.args[0] for call in run_services.call_args_list], summary['target_ids'])
+
+    @override_settings(TARGET_IMPORT_BATCH_SIZE=1)
+    def test_targets_created_during_the_import_are_reported_not_raised(self):
+        from django.db import IntegrityError
+        from custom_code import target_import
+        from custom_code.models import TargetNameIndex
+
+        path = self._table('name,ra,dec,aliases\nRaceOne,10,10,\nRaceTwo,20,20,\nRaceThree,30,30,Race Alias;Race Other\n')
+        deduplicate = target_import.deduplicate_target_rows
+
+        def deduplicate_then_race(rows):
+            result = deduplicate(rows)
+            Target.objects.create(name='RaceOne', type=Target.SIDEREAL, ra=10.0, dec=10.0, epoch=2000.0)
+            other = Target.objects.create(name='RaceRival', type=Target.SIDEREAL, ra=40.0, dec=40.0, epoch=2000.0)
+            TargetName.objects.create(target=other, name='RACE-ALIAS')
+            return result
+
+        insert = target_import._bulk_insert_targets
+
+        def conflicting_insert(targets):
+            if targets[0].name == 'RaceTwo':
+                raise IntegrityError('UNIQUE constraint failed: tom_targets_basetarget.name')
+            return insert(targets)
+
+        with patch('custom_code.target_import.deduplicate_target_rows', side_effect=deduplicate_then_race), \
+                patch('custom_code.target_import._bulk_insert_targets', side_effect=conflicting_insert):
+            summary = target_import.import_targets(path, run_dataservices=False)
+
+        self.assertEqual((summary['created'], summary['existing'], summary['conflicts']), (1, 1, 1))
+        self.assertEqual([error[:2] for error in summary['errors']], [(1, 'RaceOne'), (2, 'RaceTwo')])
+        self.assertEqual(Target.objects.filter(name__startswith='Race').count(), 3)
+        # The alias taken while the table was imported is dropped, the other one is kept.
+        three = Target.objects.get(name='RaceThree')
+        self.assertEqual(list(three.aliases.values_list('name', flat=True)), ['Race Other'])
+        self.assertEqual(TargetNameIndex.objects.filter(key='racealias').count(), 1)
+
+
+class SkyIndexTests(TestCase):
+    def test_healpix_pixels_nest_and_cover_regions_exactly(self):
+        from custom_code import sky_index
+
+        rng = np.random.default_rng(5)
+        ra = rng.uniform(0.0, 360.0, 20000)
+        dec = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, 20000)))
+        pixels = sky_index.healpix_index(ra, dec)
+        for order in (0, 3, 9):
+            coarse = sky_index.healpix_index(ra, dec, order)
+            self.assertTrue(np.array_equal(pixels >> (2 * (sky_index.HEALPIX_ORDER - order)), coarse))
+            self.assertTrue(np.array_equal(sky_index.healpix_index(*sky_index.healpix_centers(coarse, order), order), coarse))
+        self.assertEqual(len(np.unique(sky_index.healpix_index(ra, dec, 1))), 48)
+
+        def covered(ranges):
+            starts = np.array([start for start, _stop in ranges])
+            stops = np.array([stop for _start, stop in ranges])
+            position = np.searchsorted(starts, pixels, side='right') - 1
+            return (position >= 0) & (pixels < stops[np.maximum(position, 0)])
+
+        vectors = sky_index._unit_vectors(ra, dec)
+        for center_ra, center_dec, radius in ((359.9, 0.0, 2.0), (45.0, 89.5, 1.5), (200.0, -30.0, 15.0)):
+            center = sky_index._unit_vectors(center_ra, center_dec)
+            inside = np.degrees(np.arccos(np.clip(vectors @ center, -1.0, 1.0))) <= radius
+            ranges = sky_index.covering_ranges(sky_index._cone_test(center, np.radians(radius)))
+            self.assertTrue(np.all(covered(ranges)[inside]))
+            self.assertLess(covered(ranges).sum(), 3 * inside.sum() + 20)
+        ranges = sky_index.covering_ranges(sky_index._box_test(350.0, 20.0, 60.0, 90.0))
+        self.assertTrue(np.all(covered(ranges)[((ra >= 350.0) | (ra <= 20.0)) & (dec >= 60.0)]))
+
+    def test_target_searches_match_brute_force(self):
+        from custom_code.filters import BhtomTargetFilterSet
+        from custom_code.sky_index import rebuild_target_sky_index, target_healpix_index
+
+        positions = [
+            ('SkyWrapA', 359.999, 0.5), ('SkyWrapB', 0.002, 0.5), ('SkyPole', 120.0, 89.9999),
+            ('SkyPoleFar', 300.0, 89.98), ('SkyBox', 10.0, 20.0), ('SkyFar', 180.0, -45.0),
+        ]
+        targets = {
+            name: Target.objects.create(name=name, type=Target.SIDEREAL, ra=ra, dec=dec, epoch=2000.0)
+            for name, ra, dec in positions
+        }
+        self.assertEqual(targets['SkyBox'].healpix_index, target_healpix_index(targets['SkyBox']))
+        Target.objects.filter(pk=targets['SkyFar'].pk).update(healpix_index=None)
+        self.assertEqual(rebuild_target_sky_index(), 1)
+
+        def names(**params):
+            return set(BhtomTargetFilterSet(params, queryset=Target.objects.all()).qs.values_list('name', flat=True))
+
+        self.assertEqual(names(cone_search='0.0, 0.5, 0.01'), {'SkyWrapA', 'SkyWrapB'})
+        self.assertEqual(names(cone_search='0, 90, 0.001'), {'SkyPole'})
+        self.assertEqual(names(cone_search='300, 89.98, 0.05'), {'SkyPole', 'SkyPoleFar'})
+        self.assertEqual(names(box_search='359, 11, 0, 30'), {'SkyWrapA', 'SkyWrapB', 'SkyBox'})
+        self.assertEqual(names(polygon_search='9 19, 11 19, 11 21, 10 19.5, 9 21'), set())
+        self.assertEqual(names(polygon_search='9 19, 11 19, 11 21, 10 20.5, 9 21'), {'SkyBox'})
+        self.assertEqual(names(polygon_search='0 0, 90 0, 180 0'), set())
+        self.assertEqual(
+            set(Target.matches.match_cone_search(0.0005, 0.5, 10.0).values_list('name', flat=True)),
+            {'SkyWrapA', 'SkyWrapB'},
+        )
+
+        Target.objects.filter(pk=targets['SkyWrapB'].pk).update(healpix_index=None)
+        self.assertEqual(names(cone_search='0.0, 0.5, 0.01'), {'SkyWrapA', 'SkyWrapB'})
+        self.assertEqual(names(box_search='359, 11, 0, 30'), {'SkyWrapA', 'SkyWrapB', 'SkyBox'})
+        self.assertEqual(names(polygon_search='359 0, 1 0, 1 1, 359 1'), {'SkyWrapA', 'SkyWrapB'})
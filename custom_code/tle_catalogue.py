@@ -0,0 +1,309 @@
+"""Local mirror of the TLE catalogue used by GeoTOM.
+
+Refreshing GeoTOM used to fetch one TLE per satellite from CelesTrak. Instead,
+whole CelesTrak groups (``TLE_CATALOGUE_GROUPS``, one request per group) are read
+into TleCatalogueEntry rows keyed by NORAD id, and every GeoTarget whose mirrored
+TLE has a newer epoch is updated in one bulk pass. Installs without network
+access set ``TLE_CATALOGUE_DIRECTORY``; each *.tle, *.txt or *.3le file in it is
+then read as a group named after the file.
+
+A group is downloaded at most every ``TLE_CATALOGUE_MIN_FETCH_SECONDS`` (CelesTrak
+updates them a few times a day), and db_worker syncs the catalogue every
+``TLE_CATALOGUE_SYNC_INTERVAL_SECONDS``. Only entries whose TLE changed are
+rewritten. get_tle() reads the mirror before asking CelesTrak for a single object.
+"""
+import logging
+import math
+import os
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from sgp4.api import Satrec
+
+from custom_code.models import GeoTarget, TleCatalogueEntry, TleCatalogueGroup
+
+
+logger = logging.getLogger(__name__)
+
+TLE_FILE_EXTENSIONS = (".tle", ".txt", ".3le")
+DOWNLOAD_TIMEOUT_SECONDS = 60
+WRITE_BATCH_SIZE = 500
+# Mirrored TLEs read from CelesTrak longer ago than this are not served by get_tle().
+MIRROR_MAX_AGE_SECONDS = 24 * 3600
+ELEMENT_FIELDS = (
+    "epoch_jd",
+    "inclination_deg",
+    "eccentricity",
+    "raan_deg",
+    "arg_perigee_deg",
+    "mean_anomaly_deg",
+    "mean_motion_rev_per_day",
+    "bstar",
+)
+
+
+def _setting_seconds(name, default):
+    try:
+        return max(0, int(getattr(settings, name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def configured_groups():
+    groups = getattr(settings, "TLE_CATALOGUE_GROUPS", "geo") or ""
+    if isinstance(groups, str):
+        groups = groups.split(",")
+    return [group.strip() for group in groups if group and group.strip()]
+
+
+def tle_directory():
+    return str(getattr(settings, "TLE_CATALOGUE_DIRECTORY", "") or "").strip()
+
+
+def tle_element_fields(line1, line2):
+    """The GeoTarget orbital element fields of one TLE."""
+    sat = Satrec.twoline2rv(line1, line2)
+    return {
+        "epoch_jd": float(sat.jdsatepoch + sat.jdsatepochF),
+        "inclination_deg": float(math.degrees(sat.inclo)),
+        "eccentricity": float(sat.ecco),
+        "raan_deg": float(math.degrees(sat.nodeo)),
+        "arg_perigee_deg": float(math.degrees(sat.argpo)),
+        "mean_anomaly_deg": float(math.degrees(sat.mo)),
+        "mean_motion_rev_per_day": float(sat.no_kozai * 1440.0 / (2.0 * math.pi)),
+        "bstar": float(sat.bstar),
+    }
+
+
+def parse_tle_text(text):
+    """TLE records of a two- or three-line element file, as dicts; malformed sets are skipped."""
+    records = []
+    name = ""
+    lines = [line.rstrip() for line in (text or "").splitlines() if line.strip()]
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        following = lines[index + 1] if index + 1 < len(lines) else ""
+        if not (line.startswith("1 ") and following.startswith("2 ")):
+            name = line[2:].strip() if line.startswith("0 ") else line.strip()
+            index += 1
+            continue
+        index += 2
+        if len(line) < 69 or len(following) < 69 or line[2:7] != following[2:7]:
+            name = ""
+            continue
+        sat = Satrec.twoline2rv(line, following)
+        if sat.error:
+            name = ""
+            continue
+        records.append({
+            "norad_id": int(sat.satnum),
+            "name": name[:128],
+            "line1": line[:128],
+            "line2": following[:128],
+            "epoch_jd": float(sat.jdsatepoch + sat.jdsatepochF),
+        })
+        name = ""
+    return records
+
+
+def _download_group(group):
+    url_template = getattr(settings, "TLE_CATALOGUE_URL", "https://celestrak.org/NORAD/elements/gp.php?GROUP={group}&FORMAT=tle")
+    url = url_template.format(group=urllib.request.quote(group))
+    with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+        return url, response.read().decode("utf-8", errors="replace")
+
+
+def _directory_files(directory):
+    """{group: path} of the TLE files in ``directory``."""
+    files = {}
+    for filename in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(filename)
+        path = os.path.join(directory, filename)
+        if extension.lower() in TLE_FILE_EXTENSIONS and os.path.isfile(path):
+            files[stem[:64]] = path
+    return files
+
+
+def store_tle_records(records, group, fetched_at):
+    """Write the records of one group to the mirror; returns how many were added, updated and unchanged.
+
+    A stored entry is only rewritten for a different TLE with the same or a
+    newer epoch; the others just get the new read time.
+    """
+    latest = {}
+    for record in records:
+        known = latest.get(record["norad_id"])
+        if known is None or record["epoch_jd"] >= known["epoch_jd"]:
+            latest[record["norad_id"]] = record
+
+    summary = {"added": 0, "updated": 0, "unchanged": 0}
+    norad_ids = sorted(latest)
+    for start in range(0, len(norad_ids), WRITE_BATCH_SIZE):
+        chunk = norad_ids[start:start + WRITE_BATCH_SIZE]
+        stored = {entry.norad_id: entry for entry in TleCatalogueEntry.objects.filter(norad_id__in=chunk)}
+        created, changed, unchanged = [], [], []
+        for norad_id in chunk:
+            record = latest[norad_id]
+            entry = stored.get(norad_id)
+            if entry is None:
+                created.append(TleCatalogueEntry(group=group, fetched_at=fetched_at, **record))
+            elif record["epoch_jd"] >= entry.epoch_jd and (record["line1"], record["line2"]) != (entry.line1, entry.line2):
+                entry.name = record["name"] or entry.name
+                entry.line1 = record["line1"]
+                entry.line2 = record["line2"]
+                entry.epoch_jd = record["epoch_jd"]
+                entry.group = group
+                entry.fetched_at = fetched_at
+                entry.modified = fetched_at
+                changed.append(entry)
+            else:
+                unchanged.append(norad_id)
+        TleCatalogueEntry.objects.bulk_create(created, ignore_conflicts=True)
+        TleCatalogueEntry.objects.bulk_update(changed, ["name", "line1", "line2", "epoch_jd", "group", "fetched_at", "modified"])
+        TleCatalogueEntry.objects.filter(norad_id__in=unchanged).update(group=group, fetched_at=fetched_at)
+        summary["added"] += len(created)
+        summary["updated"] += len(changed)
+        summary["unchanged"] += len(unchanged)
+    return summary
+
+
+def _group_is_fresh(group, now):
+    min_fetch = timedelta(seconds=_setting_seconds("TLE_CATALOGUE_MIN_FETCH_SECONDS", 7200))
+    return TleCatalogueGroup.objects.filter(name=group, fetched_at__gt=now - min_fetch, error="").exists()
+
+
+def sync_tle_catalogue(groups=None, *, directory=None, force=False, now=None):
+    """Read the TLE groups into the mirror.
+
+    Groups come from CelesTrak, or from the files of ``directory`` (default:
+    ``TLE_CATALOGUE_DIRECTORY``) when it is set; ``groups`` then selects files by
+    name. Groups downloaded within ``TLE_CATALOGUE_MIN_FETCH_SECONDS`` are
+    skipped unless ``force`` is set.
+    """
+    now = now or datetime.now(timezone.utc)
+    directory = tle_directory() if directory is None else directory
+    summary = {"groups": 0, "skipped": 0, "failed": 0, "records": 0, "added": 0, "updated": 0, "unchanged": 0}
+    if directory:
+        try:
+            files = _directory_files(directory)
+        except OSError as exc:
+            logger.warning("Could not list the TLE directory %s: %s", directory, exc)
+            summary["failed"] += 1
+            return summary
+        sources = {group: path for group, path in files.items() if not groups or group in groups}
+    else:
+        sources = {group: None for group in (groups or configured_groups())}
+
+    for group, path in sources.items():
+        if not force and not path and _group_is_fresh(group, now):
+            summary["skipped"] += 1
+            continue
+        try:
+            if path:
+                source = path
+                with open(path, encoding="utf-8", errors="replace") as handle:
+                    text = handle.read()
+            else:
+                source, text = _download_group(group)
+            records = parse_tle_text(text)
+            if not records:
+                raise ValueError("no TLE records found")
+        except (OSError, urllib.error.URLError, TimeoutError, ValueError) as exc:
+            logger.warning("Could not read TLE group %s: %s", group, exc)
+            TleCatalogueGroup.objects.update_or_create(name=group, defaults={"error": str(exc)[:2000]})
+            summary["failed"] += 1
+            continue
+
+        stored = store_tle_records(records, group, now)
+        TleCatalogueGroup.objects.update_or_create(
+            name=group,
+            defaults={"source": source[:500], "fetched_at": now, "records": len(records), "error": ""},
+        )
+        summary["groups"] += 1
+        summary["records"] += len(records)
+        for key, count in stored.items():
+            summary[key] += count
+    return summary
+
+
+def apply_tle_catalogue(queryset=None):
+    """Copy newer mirrored TLEs onto GeoTargets in bulk.
+
+    Returns how many targets were checked and updated, and the NORAD ids of
+    those without a mirrored TLE.
+    """
+    targets = list((queryset if queryset is not None else GeoTarget.objects.all()).only(
+        "pk", "norad_id", "tle_line1", "tle_line2", "epoch_jd"
+    ))
+    entries = {}
+    norad_ids = [target.norad_id for target in targets]
+    for start in range(0, len(norad_ids), WRITE_BATCH_SIZE):
+        for entry in TleCatalogueEntry.objects.filter(norad_id__in=norad_ids[start:start + WRITE_BATCH_SIZE]):
+            entries[entry.norad_id] = entry
+
+    now = datetime.now(timezone.utc)
+    changed = []
+    missing = []
+    for target in targets:
+        entry = entries.get(target.norad_id)
+        if entry is None:
+            missing.append(target.norad_id)
+            continue
+        if (entry.line1, entry.line2) == (target.tle_line1, target.tle_line2):
+            continue
+        if target.epoch_jd is not None and entry.epoch_jd < target.epoch_jd:
+            continue
+        target.tle_name = entry.name or target.tle_name
+        target.tle_line1 = entry.line1
+        target.tle_line2 = entry.line2
+        for field, value in tle_element_fields(entry.line1, entry.line2).items():
+            setattr(target, field, value)
+        target.modified = now
+        changed.append(target)
+
+    GeoTarget.objects.bulk_update(
+        changed,
+        ["tle_name", "tle_line1", "tle_line2", *ELEMENT_FIELDS, "modified"],
+        batch_size=WRITE_BATCH_SIZE,
+    )
+    return {"checked": len(targets), "updated": len(changed), "missing": missing}
+
+
+def refresh_geotarget_tles(*, force=False):
+    """Sync the mirror and bring every GeoTarget up to date from it."""
+    summary = sync_tle_catalogue(force=force)
+    summary.update(apply_tle_catalogue())
+    return summary
+
+
+def mirrored_tle(norad_id):
+    """(name, line1, line2) of ``norad_id`` from the mirror, or None when it is missing or was read too long ago.
+
+    Entries from a local TLE directory are always served.
+    """
+    entry = TleCatalogueEntry.objects.filter(norad_id=norad_id).first()
+    if entry is None:
+        return None
+    max_age = timedelta(seconds=MIRROR_MAX_AGE_SECONDS)
+    if not tle_directory() and entry.fetched_at < datetime.now(timezone.utc) - max_age:
+        return None
+    return entry.name, entry.line1, entry.line2
+
+
+def tle_age_days(epoch_jd, when_utc):
+    """Days between the TLE epoch and ``when_utc``, or None without an epoch."""
+    if epoch_jd is None:
+        return None
+    when_jd = when_utc.timestamp() / 86400.0 + 2440587.5
+    return when_jd - float(epoch_jd)
+
+
+def tle_is_stale(age_days):
+    try:
+        stale_days = float(getattr(settings, "TLE_CATALOGUE_STALE_DAYS", 3))
+    except (TypeError, ValueError):
+        stale_days = 3.0
+    return age_days is None or age_days > stale_days
@@ -0,0 +1,428 @@
+"""Precomputed transit calendar of TransitEphemeris planets.
+
+Listing the transits observable from a site tonight or this week used to mean
+walking every TransitEphemeris and checking the target and Sun altitudes event
+by event. Instead, each ephemeris is expanded into TransitEvent rows (ingress,
+mid-transit and egress in UTC) for the transits that end after now and reach
+mid-transit within ``TRANSIT_CALENDAR_HORIZON_DAYS``, and every event gets a
+TransitEventVisibility row per observing site of the configured facilities
+with the target altitudes at ingress, mid-transit and egress, the highest Sun
+altitude and whether the transit is observable there
+(``TRANSIT_CALENDAR_MIN_ALTITUDE_DEG``, ``TRANSIT_CALENDAR_MAX_SUN_ALTITUDE_DEG``).
+The altitudes of all new events of a batch of ephemerides are computed with one
+AltAz transformation per site.
+
+A TransitEphemeris save queues a recomputation when its inputs changed, and
+db_worker's periodic pass (``TRANSIT_CALENDAR_REFRESH_INTERVAL_SECONDS``) drops
+past events and adds the transits entering the horizon. Events computed from
+the current inputs are kept.
+"""
+import hashlib
+import logging
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import AltAz, EarthLocation, SkyCoord, get_sun
+from astropy.time import Time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Min
+from django.db.models.functions import Coalesce
+from tom_observations import facility
+from tom_targets.models import Target
+from tom_targets.permissions import targets_for_user
+
+from custom_code.models import TransitEphemeris, TransitEvent, TransitEventVisibility
+
+
+logger = logging.getLogger(__name__)
+
+REFRESH_BATCH_SIZE = 200
+# Longest calendar of one ephemeris; shorter periods are only expanded this far.
+MAX_EVENTS_PER_EPHEMERIS = 500
+MAX_LISTED_TRANSITS = 5000
+EPHEMERIS_FIELDS = ('t0_bjd_tdb', 'period_days', 'duration_hours')
+
+
+def _setting_float(name, default):
+    try:
+        return float(getattr(settings, name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def horizon_days():
+    return max(1.0, _setting_float('TRANSIT_CALENDAR_HORIZON_DAYS', 14))
+
+
+@lru_cache(maxsize=1)
+def observing_sites():
+    """(facility, site, latitude, longitude, elevation) of every site of the configured facilities.
+
+    The facility classes come from settings, so the list is read once per process.
+    """
+    sites = []
+    for facility_name in facility.get_service_classes():
+        try:
+            site_details = facility.get_service_class(facility_name)().get_observing_sites() or {}
+        except Exception as exc:
+            logger.warning('Could not read the observing sites of %s: %s', facility_name, exc)
+            continue
+        for site, details in site_details.items():
+            latitude = details.get('latitude')
+            longitude = details.get('longitude')
+            if latitude in (None, '') or longitude in (None, ''):
+                continue
+            sites.append((
+                str(facility_name)[:64],
+                str(site)[:100],
+                float(latitude),
+                float(longitude),
+                float(details.get('elevation') or 0),
+            ))
+    return tuple(sorted(sites))
+
+
+def calendar_hash(ephemeris, sites):
+    """A digest of everything the events of ``ephemeris`` and their visibilities are computed from."""
+    values = [repr(getattr(ephemeris, field)) for field in EPHEMERIS_FIELDS]
+    values += [repr(ephemeris.target.ra), repr(ephemeris.target.dec)]
+    values += [
+        repr(_setting_float('TRANSIT_CALENDAR_MIN_ALTITUDE_DEG', 30)),
+        repr(_setting_float('TRANSIT_CALENDAR_MAX_SUN_ALTITUDE_DEG', -12)),
+    ]
+    values += [repr(site) for site in sites]
+    return hashlib.sha1('|'.join(values).encode('utf-8')).hexdigest()
+
+
+def planned_epochs(ephemeris, now, horizon):
+    """Epochs and BJD_TDB mid-transit times of the transits of ``ephemeris`` in the calendar at ``now``.
+
+    These are the transits ending after ``now`` whose mid-transit falls within
+    ``horizon`` days; none when the ephemeris or the target coordinates are incomplete.
+    """
+    empty = np.array([], dtype=int), np.array([], dtype=float)
+    if ephemeris.t0_bjd_tdb is None or not ephemeris.period_days or ephemeris.period_days <= 0:
+        return empty
+    if ephemeris.target.ra is None or ephemeris.target.dec is None:
+        return empty
+
+    t0 = float(ephemeris.t0_bjd_tdb)
+    period = float(ephemeris.period_days)
+    half_duration = float(ephemeris.duration_hours or 0) / 48.0
+    now_jd = now.tdb.jd
+    first = math.ceil((now_jd - half_duration - t0) / period)
+    last = min(math.floor((now_jd + horizon - t0) / period), first + MAX_EVENTS_PER_EPHEMERIS - 1)
+    if last < first:
+        return empty
+    epochs = np.arange(first, last + 1)
+    return epochs, t0 + epochs * period
+
+
+def compute_altitudes(ra_deg, dec_deg, times, sites):
+    """Target and Sun altitudes in degrees at ``times`` from every site.
+
+    ``ra_deg``, ``dec_deg`` and ``times`` are arrays of one shape; returns
+    {(facility, site): (target altitudes, Sun altitudes)} with that shape.
+    """
+    coords = SkyCoord(ra=ra_deg * u.deg, dec=dec_deg * u.deg, frame='icrs')
+    sun = get_sun(times)
+    altitudes = {}
+    for facility_name, site, latitude, longitude, elevation in sites:
+        location = EarthLocation.from_geodetic(lon=longitude * u.deg, lat=latitude * u.deg, height=elevation * u.m)
+        frame = AltAz(obstime=times, location=location)
+        altitudes[(facility_name, site)] = (coords.transform_to(frame).alt.deg, sun.transform_to(frame).alt.deg)
+    return altitudes
+
+
+def _event_times(mid_jd, duration_hours):
+    """UTC Time array of shape (3, N): ingress, mid-transit and egress of each event."""
+    half_duration = np.asarray(duration_hours, dtype=float) / 48.0
+    offsets = np.stack([-half_duration, np.zeros_like(half_duration), half_duration])
+    return Time(np.asarray(mid_jd)[np.newaxis, :] + offsets, format='jd', scale='tdb').utc
+
+
+def _store_events(ephemeris, digest, epochs, times, altitudes, columns):
+    """Insert the events of one ephemeris (``columns`` selects them in the batch arrays) with their visibilities."""
+    min_altitude = _setting_float('TRANSIT_CALENDAR_MIN_ALTITUDE_DEG', 30)
+    max_sun_altitude = _setting_float('TRANSIT_CALENDAR_MAX_SUN_ALTITUDE_DEG', -12)
+    datetimes = times[:, columns].to_datetime(timezone=dt_timezone.utc)
+    try:
+        with transaction.atomic():
+            events = TransitEvent.objects.bulk_create([
+                TransitEvent(
+                    ephemeris=ephemeris,
+                    target_id=ephemeris.target_id,
+                    epoch=int(epoch),
+                    ingress=datetimes[0, index],
+                    mid=datetimes[1, index],
+                    egress=datetimes[2, index],
+                    calendar_hash=digest,
+                )
+                for index, epoch in enumerate(epochs)
+            ])
+            visibilities = []
+            for (facility_name, site), (target_altitudes, sun_altitudes) in altitudes.items():
+                target_altitudes = target_altitudes[:, columns]
+                sun_altitudes = sun_altitudes[:, columns]
+                visible = (target_altitudes >= min_altitude) & (sun_altitudes <= max_sun_altitude)
+                for index, event in enumerate(events):
+                    visibilities.append(TransitEventVisibility(
+                        event=event,
+                        facility=facility_name,
+                        site=site,
+                        mid=event.mid,
+                        ingress_altitude=float(target_altitudes[0, index]),
+                        mid_altitude=float(target_altitudes[1, index]),
+                        egress_altitude=float(target_altitudes[2, index]),
+                        sun_altitude=float(sun_altitudes[:, index].max()),
+                        observable=bool(visible[:, index].all()),
+                        partial=bool(visible[:, index].any()),
+                    ))
+            TransitEventVisibility.objects.bulk_create(visibilities, batch_size=1000)
+    except IntegrityError:
+        # Another refresh of this ephemeris stored the same epochs first.
+        return 0
+    return len(epochs)
+
+
+def refresh_transit_calendars(ephemeris_ids, now=None):
+    """Bring the events of the given ephemerides up to date with ``now``.
+
+    Events that already ended or were computed from other inputs are deleted;
+    the missing ones are added with their visibilities, computed for the whole
+    batch at once.
+    """
+    now = now or Time.now()
+    horizon = horizon_days()
+    sites = observing_sites()
+    ephemerides = TransitEphemeris.objects.select_related('target').filter(pk__in=list(ephemeris_ids)).order_by('pk')
+
+    summary = {'ephemerides': 0, 'skipped': 0, 'events': 0, 'computed': 0, 'reused': 0, 'removed': 0}
+    pending = []
+    for ephemeris in ephemerides:
+        epochs, mid_jd = planned_epochs(ephemeris, now, horizon)
+        digest = calendar_hash(ephemeris, sites)
+        stale = TransitEvent.objects.filter(ephemeris=ephemeris).exclude(calendar_hash=digest, epoch__in=epochs.tolist())
+        _, deleted = stale.delete()
+        summary['removed'] += deleted.get(TransitEvent._meta.label, 0)
+        if not len(epochs):
+            summary['skipped'] += 1
+            continue
+
+        stored = set(TransitEvent.objects.filter(ephemeris=ephemeris).values_list('epoch', flat=True))
+        missing = ~np.isin(epochs, list(stored))
+        summary['ephemerides'] += 1
+        summary['events'] += len(epochs)
+        summary['reused'] += int(len(epochs) - missing.sum())
+        if missing.any():
+            pending.append((ephemeris, digest, epochs[missing], mid_jd[missing]))
+
+    if not pending:
+        return summary
+
+    mid_jd = np.concatenate([entry[3] for entry in pending])
+    repeat = [len(entry[2]) for entry in pending]
+    durations = np.repeat([float(entry[0].duration_hours or 0) for entry in pending], repeat)
+    ra = np.repeat([float(entry[0].target.ra) for entry in pending], repeat)
+    dec = np.repeat([float(entry[0].target.dec) for entry in pending], repeat)
+    times = _event_times(mid_jd, durations)
+    altitudes = compute_altitudes(
+        np.broadcast_to(ra, times.shape),
+        np.broadcast_to(dec, times.shape),
+        times,
+        sites,
+    )
+
+    offset = 0
+    for ephemeris, digest, epochs, _ in pending:
+        columns = slice(offset, offset + len(epochs))
+        offset += len(epochs)
+        summary['computed'] += _store_events(ephemeris, digest, epochs, times, altitudes, columns)
+    return summary
+
+
+def transit_calendar_is_current(ephemeris, now=None):
+    """Whether the stored events of ``ephemeris`` were computed from its current inputs and reach the horizon."""
+    now = now or Time.now()
+    epochs, _ = planned_epochs(ephemeris, now, horizon_days())
+    events = TransitEvent.objects.filter(ephemeris_id=ephemeris.pk)
+    if not len(epochs):
+        return not events.exists()
+    digest = calendar_hash(ephemeris, observing_sites())
+    stored = events.aggregate(last_epoch=Max('epoch'), low_hash=Min('calendar_hash'), high_hash=Max('calendar_hash'))
+    return (
+        stored['low_hash'] == digest
+        and stored['high_hash'] == digest
+        and stored['last_epoch'] >= int(epochs[-1])
+    )
+
+
+def enqueue_transit_calendar_refresh(ephemeris):
+    """Queue a recomputation of the events of ``ephemeris`` unless they are current; returns whether one was queued."""
+    from custom_code.tasks import refresh_transit_calendar_task
+
+    if transit_calendar_is_current(ephemeris):
+        return False
+    refresh_transit_calendar_task.enqueue([ephemeris.pk])
+    return True
+
+
+def due_transit_ephemerides(now=None):
+    """Ids of the ephemerides whose events are outdated or do not reach the horizon yet."""
+    now = now or Time.now()
+    horizon = horizon_days()
+    sites = observing_sites()
+    stored = {
+        row['ephemeris_id']: row
+        for row in TransitEvent.objects.values('ephemeris_id').annotate(
+            last_epoch=Max('epoch'),
+            low_hash=Min('calendar_hash'),
+            high_hash=Max('calendar_hash'),
+        )
+    }
+    due = []
+    ephemerides = TransitEphemeris.objects.select_related('target').only(
+        'pk', 'target', 'target__ra', 'target__dec', *EPHEMERIS_FIELDS
+    ).order_by('pk')
+    for ephemeris in ephemerides.iterator():
+        epochs, _ = planned_epochs(ephemeris, now, horizon)
+        row = stored.get(ephemeris.pk)
+        if not len(epochs):
+            if row is not None:
+                due.append(ephemeris.pk)
+            continue
+        digest = calendar_hash(ephemeris, sites)
+        if row is None or row['low_hash'] != digest or row['high_hash'] != digest or row['last_epoch'] < int(epochs[-1]):
+            due.append(ephemeris.pk)
+    return due
+
+
+def enqueue_due_transit_calendars(now=None, batch_size=REFRESH_BATCH_SIZE):
+    """Drop the transits that ended and queue one refresh per batch of due ephemerides."""
+    from custom_code.tasks import refresh_transit_calendar_task
+
+    now = now or Time.now()
+    _, deleted = TransitEvent.objects.filter(egress__lt=now.utc.to_datetime(timezone=dt_timezone.utc)).delete()
+    removed = deleted.get(TransitEvent._meta.label, 0)
+    due = due_transit_ephemerides(now=now)
+    batches = [due[start:start + batch_size] for start in range(0, len(due), batch_size)]
+    for batch in batches:
+        refresh_transit_calendar_task.enqueue(batch)
+    return {'due': len(due), 'enqueued': len(batches), 'removed': removed}
+
+
+def _parse_float(params, name):
+    value = (params.get(name) or '').strip()
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number.')
+    if not math.isfinite(number):
+        raise ValueError(f'{name} must be a number.')
+    return number
+
+
+def transit_filters(params, now=None):
+    """The observable_transits() arguments of a query string; raises ValueError on invalid values.
+
+    ``start`` is an ISO UTC time (default: now) and ``days`` the length of the
+    listed span (default: 1, at most the calendar horizon).
+    """
+    start_value = (params.get('start') or '').strip()
+    if start_value:
+        try:
+            start = datetime.fromisoformat(start_value)
+        except ValueError:
+            raise ValueError('start must be an ISO date or time.')
+        start = start.replace(tzinfo=dt_timezone.utc) if start.tzinfo is None else start.astimezone(dt_timezone.utc)
+    else:
+        start = now or datetime.now(dt_timezone.utc)
+    days = _parse_float(params, 'days')
+    days = 1.0 if days is None else days
+    if days <= 0:
+        raise ValueError('days must be positive.')
+    return {
+        'start': start,
+        'end': start + timedelta(days=min(days, horizon_days())),
+        'facility_name': (params.get('facility') or '').strip() or None,
+        'site': (params.get('site') or '').strip() or None,
+        'partial': str(params.get('partial', '')).lower() in ('1', 'true', 'yes', 'on'),
+        'min_depth_mmag': _parse_float(params, 'min_depth'),
+        'min_duration_hours': _parse_float(params, 'min_duration'),
+        'max_duration_hours': _parse_float(params, 'max_duration'),
+        'max_magnitude': _parse_float(params, 'max_mag'),
+    }
+
+
+def observable_transits(
+    user,
+    start,
+    end,
+    *,
+    facility_name=None,
+    site=None,
+    partial=False,
+    min_depth_mmag=None,
+    min_duration_hours=None,
+    max_duration_hours=None,
+    max_magnitude=None,
+):
+    """Site visibilities of the transits with mid-transit between ``start`` and ``end``, by mid-transit time.
+
+    Only transits observable in full (or, with ``partial``, in part) from the
+    site and of targets ``user`` may view are listed. The magnitude is V,
+    falling back to r and Gaia G.
+    """
+    rows = TransitEventVisibility.objects.filter(mid__gte=start, mid__lt=end)
+    rows = rows.filter(partial=True) if partial else rows.filter(observable=True)
+    if facility_name:
+        rows = rows.filter(facility=facility_name)
+    if site:
+        rows = rows.filter(site=site)
+    if min_depth_mmag is not None:
+        rows = rows.filter(event__ephemeris__depth_r_mmag__gte=min_depth_mmag)
+    if min_duration_hours is not None:
+        rows = rows.filter(event__ephemeris__duration_hours__gte=min_duration_hours)
+    if max_duration_hours is not None:
+        rows = rows.filter(event__ephemeris__duration_hours__lte=max_duration_hours)
+    rows = rows.annotate(
+        magnitude=Coalesce('event__ephemeris__v_mag', 'event__ephemeris__r_mag', 'event__ephemeris__gaia_g_mag')
+    )
+    if max_magnitude is not None:
+        rows = rows.filter(magnitude__lte=max_magnitude)
+    visible_targets = targets_for_user(user, Target.objects.all(), 'view_target').values('pk')
+    rows = rows.filter(event__target_id__in=visible_targets)
+    return rows.select_related('event', 'event__ephemeris', 'event__target').order_by('mid', 'facility', 'site')
+
+
+def transit_payload(row):
+    """JSON-ready description of one observable_transits() row."""
+    event = row.event
+    ephemeris = event.ephemeris
+    return {
+        'target_id': event.target_id,
+        'target_name': event.target.name,
+        'planet_name': ephemeris.planet_name or event.target.name,
+        'epoch': event.epoch,
+        'ingress': event.ingress.isoformat(),
+        'mid': event.mid.isoformat(),
+        'egress': event.egress.isoformat(),
+        'facility': row.facility,
+        'site': row.site,
+        'ingress_altitude': round(row.ingress_altitude, 2),
+        'mid_altitude': round(row.mid_altitude, 2),
+        'egress_altitude': round(row.egress_altitude, 2),
+        'sun_altitude': round(row.sun_altitude, 2),
+        'observable': row.observable,
+        'partial': row.partial,
+        'depth_r_mmag': ephemeris.depth_r_mmag,
+        'duration_hours': ephemeris.duration_hours,
+        'magnitude': row.magnitude,
+        'priority': ephemeris.priority,
+    }
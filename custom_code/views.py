@@ -5,6 +5,7 @@ import os
 import re
 import requests
 import csv
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta, timezone
 from io import StringIO
@@ -14,7 +15,6 @@ import numpy as np
 from astropy import units as u
 from astropy.coordinates import SkyCoord
 from astropy.time import Time
-from astropy.timeseries import LombScargle
 from astroquery.jplhorizons import Horizons
 from astroquery.mpc import MPC
 from plotly import graph_objs as go
@@ -31,7 +31,7 @@ from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
 from django.core.serializers.json import DjangoJSONEncoder
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.shortcuts import get_object_or_404
 from django.shortcuts import resolve_url
@@ -45,16 +45,12 @@ from django.db.models import Count, Q
 from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
 from django_comments.models import Comment
-from guardian.shortcuts import assign_perm
 from rest_framework.authtoken.models import Token
 
 from tom_common.hints import add_hint
 from tom_common.hooks import run_hook
 from tom_catalogs.harvester import MissingDataException, get_service_classes
-from tom_dataproducts.data_processor import run_data_processor
-from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.forms import AddProductToGroupForm
-from tom_dataproducts.models import DataProduct
 from tom_dataproducts.models import ReducedDatum
 from tom_targets.forms import TargetExtraFormset
 from tom_targets.models import Target
@@ -77,11 +73,22 @@ from tom_observations.models import ObservationRecord
 
 from custom_code.filters import BhtomTargetFilterSet
 from custom_code.bhtom2_uploads import (
+    enqueue_bhtom2_forward,
     ensure_fits_dataproduct_type,
-    forward_dataproduct_to_bhtom2,
     has_successful_bhtom2_upload,
 )
+from custom_code.staged_uploads import (
+    TERMINAL_STATUSES as STAGED_UPLOAD_TERMINAL_STATUSES,
+    StagedUploadError,
+    StagedUploadOffsetError,
+    append_staged_chunk,
+    create_staged_uploads,
+    stage_uploaded_file,
+    staged_upload_status,
+    upload_chunk_size,
+)
 from custom_code.astrometry import can_compute_current_coordinates, compute_current_coordinates
+from custom_code.caching import cached_value
 from custom_code.forms import (
     ALL_DATA_SERVICES_LABEL,
     ALL_DATA_SERVICES_VALUE,
@@ -122,14 +129,27 @@ from custom_code.facility_proposals import (
     sync_memberships_for_account,
     sync_memberships_for_proposal,
 )
-from custom_code.models import Facility, GeoTarget, TransitEphemeris
-from custom_code.models import UserBhtom2UploadPreference
+from custom_code.models import Facility, GeoTarget, PeriodicitySearch, SolarSystemQuery, TransitEphemeris
+from custom_code.models import StagedDataProductUpload, TransitEventVisibility, UserBhtom2UploadPreference
+from custom_code.periodicity import (
+    METHOD_CHOICES,
+    light_curve_series,
+    load_light_curve,
+    photometry_queryset,
+    search_parameters,
+    search_payload,
+    start_periodicity_search,
+)
+from custom_code.solar_system_cache import solar_system_query, table_from_payload
 from custom_code.data_services.forms import AllDataServicesQueryForm
 from custom_code.geosat import (
+    SUN_AVOIDANCE_ELONGATION_DEG,
+    altaz_to_hadec,
     altaz_to_hadec_point,
     convert_altaz_curve_to_hadec,
     geosat_alt_az,
     geosat_alt_az_from_tle,
+    sun_exclusion_grid,
     sun_visibility_curve,
 )
 from custom_code.data_services.geosat_dataservice import GeoSatDataService
@@ -137,6 +157,15 @@ from custom_code.tasks import enqueue_target_dataservices_update
 from custom_code.bhtom_catalogs.harvesters import gaia_alerts as gaia_alerts_harvester
 from custom_code.bhtom_catalogs.harvesters import ogle_ews as ogle_ews_harvester
 from custom_code.sun_separation import get_live_target_values
+from custom_code.target_names import find_target_by_name
+from custom_code.tle_catalogue import refresh_geotarget_tles, tle_age_days, tle_directory, tle_is_stale
+from custom_code.transit_calendar import (
+    MAX_LISTED_TRANSITS,
+    observable_transits,
+    observing_sites,
+    transit_filters,
+    transit_payload,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -157,6 +186,8 @@ LIST_OBSERVER_PRESETS = {
     'piwnice': {'name': 'Piwnice', 'lat_deg': 53.09546, 'lon_deg': 18.56406, 'elevation_m': 87.0},
     'lasilla': {'name': 'La Silla', 'lat_deg': -29.2567, 'lon_deg': -70.7346, 'elevation_m': 2400.0},
 }
+GEOTOM_LIVE_MAX_ROWS = 500
+GEOTOM_LIVE_MAP_INTERVAL_SECONDS = 5.0
 GENERIC_TARGET_SEARCH_RADIUS_ARCSEC = 3.0
 ALL_CATALOG_QUERY_SERVICE_NAMES = (
     'ExoClock',
@@ -189,11 +220,7 @@ def _find_existing_target_by_name(name):
     normalized = str(name or '').strip()
     if not normalized:
         return None
-    return (
-        Target.objects.filter(Q(name__iexact=normalized) | Q(aliases__name__iexact=normalized))
-        .distinct()
-        .first()
-    )
+    return find_target_by_name(normalized)
 
 
 def _annotate_results_with_existing_targets(results):
@@ -270,10 +297,9 @@ def _build_bhtom2_comment(user, source_label):
     return f'{source_label} by {username}'
 
 
-def _upload_dataproduct_to_bhtom2(dataproduct, *, user, token, oname, calibration_filter, comment):
-    return forward_dataproduct_to_bhtom2(
+def _queue_dataproduct_for_bhtom2(dataproduct, *, user, oname, calibration_filter, comment):
+    return enqueue_bhtom2_forward(
         dataproduct,
-        token=token,
         observatory=oname,
         calibration_filter=calibration_filter,
         comment=comment,
@@ -601,7 +627,7 @@ def _format_geotom_row(target, sat):
         })
         return row
 
-    is_visible = sat["alt_deg"] > 0 and sat["solar_elongation_deg"] >= 90.0
+    is_visible = sat["alt_deg"] > 0 and sat["solar_elongation_deg"] >= SUN_AVOIDANCE_ELONGATION_DEG
     row.update({
         "alt_deg": sat["alt_deg"],
         "az_deg": sat["az_deg"],
@@ -619,6 +645,12 @@ def _format_geotom_row(target, sat):
 
 
 def _build_geotom_payload(object_list, observer, calculation_time_utc, visible_only=False):
+    sun_curve_altaz = sun_visibility_curve(
+        observer_lat_deg=observer['lat_deg'],
+        observer_lon_deg=observer['lon_deg'],
+        observer_elevation_m=observer['elevation_m'],
+        when_utc=calculation_time_utc,
+    )
     map_targets = []
     geotom_rows = []
     for target in object_list:
@@ -630,8 +662,11 @@ def _build_geotom_payload(object_list, observer, calculation_time_utc, visible_o
             observer_lon_deg=observer['lon_deg'],
             observer_elevation_m=observer['elevation_m'],
             when_utc=calculation_time_utc,
+            sun_altaz=(sun_curve_altaz['sun_alt_deg'], sun_curve_altaz['sun_az_deg']),
         )
         row = _format_geotom_row(target, sat)
+        row['tle_age_days'] = tle_age_days(target.epoch_jd, calculation_time_utc)
+        row['tle_is_stale'] = tle_is_stale(row['tle_age_days'])
         if visible_only and not row['is_visible']:
             continue
         geotom_rows.append(row)
@@ -639,11 +674,6 @@ def _build_geotom_payload(object_list, observer, calculation_time_utc, visible_o
         if sat is None:
             continue
 
-        plot_ha_hours, plot_dec_deg = altaz_to_hadec_point(
-            sat['alt_deg'],
-            sat['az_deg'],
-            observer['lat_deg'],
-        )
         map_targets.append({
             'target_id': target.pk,
             'target_name': target.name,
@@ -652,19 +682,23 @@ def _build_geotom_payload(object_list, observer, calculation_time_utc, visible_o
             'tle_name': sat['tle_name'],
             'alt_deg': sat['alt_deg'],
             'az_deg': sat['az_deg'],
-            'hour_angle_hours': plot_ha_hours,
-            'dec_deg': plot_dec_deg,
+            'hour_angle_hours': None,
+            'dec_deg': None,
             'solar_elongation_deg': sat['solar_elongation_deg'],
             'distance_km': sat['distance_km'],
             'estimated_vmag': sat['estimated_vmag'],
         })
 
-    sun_curve_altaz = sun_visibility_curve(
-        observer_lat_deg=observer['lat_deg'],
-        observer_lon_deg=observer['lon_deg'],
-        observer_elevation_m=observer['elevation_m'],
-        when_utc=calculation_time_utc,
+    # The map plots the apparent alt/az directions as hour angle and declination.
+    plot_ha_hours, plot_dec_deg = altaz_to_hadec(
+        [target['alt_deg'] for target in map_targets],
+        [target['az_deg'] for target in map_targets],
+        observer['lat_deg'],
     )
+    for target, ha_hours, dec_deg in zip(map_targets, plot_ha_hours.tolist(), plot_dec_deg.tolist()):
+        target['hour_angle_hours'] = ha_hours
+        target['dec_deg'] = dec_deg
+
     sun_hadec = altaz_to_hadec_point(
         sun_curve_altaz['sun_alt_deg'],
         sun_curve_altaz['sun_az_deg'],
@@ -690,6 +724,138 @@ def _build_geotom_payload(object_list, observer, calculation_time_utc, visible_o
     }
 
 
+def _geotom_live_row(row):
+    return {
+        'target_id': row['target'].pk,
+        'alt_deg': row['alt_deg'],
+        'az_deg': row['az_deg'],
+        'hour_angle_sex': row['hour_angle_sex'],
+        'ra_icrf_sex': row['ra_icrf_sex'],
+        'dec_sex': row['dec_sex'],
+        'estimated_vmag': row['estimated_vmag'],
+        'tle_age_days': row['tle_age_days'],
+        'tle_is_stale': row['tle_is_stale'],
+    }
+
+
+def _geotom_live_frame(observer, tick, tick_seconds):
+    """Positions of every GeoTarget seen from ``observer`` at the start of ``tick``.
+
+    The frame is computed by one process and shared through the cache, so the
+    cost depends on the number of satellites and observer sites, not on the
+    number of open streams.
+    """
+    calculation_time_utc = datetime.fromtimestamp(tick * tick_seconds, tz=timezone.utc)
+
+    def compute():
+        targets = list(GeoTarget.objects.order_by('name'))
+        payload = _build_geotom_payload(targets, observer, calculation_time_utc)
+        rows = []
+        index = {}
+        for row in payload['rows']:
+            target = row['target']
+            rows.append(_geotom_live_row(row))
+            index[target.pk] = (target.name or '', target.tle_name or '', target.norad_id, bool(target.is_debris), row['is_visible'])
+        return {
+            'generated_utc': calculation_time_utc.strftime('%Y-%m-%dT%H:%M:%S'),
+            'generated_utc_display': calculation_time_utc.strftime('%Y-%m-%d %H:%M:%S'),
+            'rows': rows,
+            'index': index,
+            'targets': payload['targets'],
+            'visibility_curve_altaz': payload['visibility_curve_altaz'],
+            'visibility_curve_hadec': payload['visibility_curve_hadec'],
+            'sun_altaz': payload['sun_altaz'],
+            'sun_hadec': payload['sun_hadec'],
+        }
+
+    key = 'geotom_live_{:.5f}_{:.5f}_{:.0f}_{}_{}'.format(
+        observer['lat_deg'], observer['lon_deg'], observer['elevation_m'], tick_seconds, tick,
+    )
+    return cached_value(key, compute, max(5, int(tick_seconds * 5)))
+
+
+def _geotom_live_filters(request):
+    return {
+        'name': (request.GET.get('name') or '').strip().lower(),
+        'norad_id': (request.GET.get('norad_id') or '').strip(),
+        'object_class': (request.GET.get('object_class') or 'all').strip().lower(),
+        'visible_only': str(request.GET.get('visible_only', '')).lower() in ('1', 'true', 'yes', 'on'),
+    }
+
+
+def _geotom_live_selection(frame, filters):
+    """The rows and map targets of ``frame`` matching the GeoTOM list filters."""
+    try:
+        norad_id = int(filters['norad_id']) if filters['norad_id'] else None
+    except ValueError:
+        return [], []
+    rows = []
+    for row in frame['rows']:
+        name, tle_name, target_norad_id, is_debris, is_visible = frame['index'][row['target_id']]
+        if filters['name'] and filters['name'] not in name.lower() and filters['name'] not in tle_name.lower():
+            continue
+        if norad_id is not None and target_norad_id != norad_id:
+            continue
+        if (filters['object_class'] == 'debris' and not is_debris) or (filters['object_class'] == 'satellite' and is_debris):
+            continue
+        if filters['visible_only'] and not is_visible:
+            continue
+        rows.append(row)
+        if len(rows) >= GEOTOM_LIVE_MAX_ROWS:
+            break
+    selected = {row['target_id'] for row in rows}
+    return rows, [target for target in frame['targets'] if target['target_id'] in selected]
+
+
+def _geotom_compact_row(row):
+    compact = dict(row)
+    for field, digits in (('alt_deg', 3), ('az_deg', 3), ('estimated_vmag', 2), ('tle_age_days', 2)):
+        if compact[field] is not None:
+            compact[field] = round(compact[field], digits)
+    return compact
+
+
+def _geotom_sse_event(event, data, event_id=None):
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, cls=DjangoJSONEncoder))
+    return '\n'.join(lines) + '\n\n'
+
+
+def _geotom_live_events(observer, filters, tick_seconds, stream_seconds):
+    """Server-sent events for one viewer: a ``snapshot`` of the selected rows, then a ``delta`` per tick.
+
+    Deltas hold only the rows whose displayed values changed; the map data is
+    sent every GEOTOM_LIVE_MAP_INTERVAL_SECONDS. The stream ends after
+    ``stream_seconds`` and the browser reconnects after one tick.
+    """
+    yield f'retry: {int(tick_seconds * 1000)}\n\n'
+    map_every = max(1, round(GEOTOM_LIVE_MAP_INTERVAL_SECONDS / tick_seconds))
+    deadline = time.monotonic() + stream_seconds
+    sent = {}
+    events = 0
+    while True:
+        tick = int(time.time() // tick_seconds)
+        frame = _geotom_live_frame(observer, tick, tick_seconds)
+        rows, targets = _geotom_live_selection(frame, filters)
+        rows = [_geotom_compact_row(row) for row in rows]
+        data = {
+            'generated_utc': frame['generated_utc'],
+            'generated_utc_display': frame['generated_utc_display'],
+            'rows': [row for row in rows if sent.get(row['target_id']) != row],
+        }
+        if events % map_every == 0:
+            data['targets'] = targets
+            for key in ('visibility_curve_altaz', 'visibility_curve_hadec', 'sun_altaz', 'sun_hadec'):
+                data[key] = frame[key]
+        sent = {row['target_id']: row for row in rows}
+        yield _geotom_sse_event('delta' if events else 'snapshot', data, event_id=tick)
+        events += 1
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(max(0.0, (tick + 1) * tick_seconds - time.time()))
+
+
 def _resolve_list_observer(request, observer_presets=None, default_key='warsaw', include_unspecified=False):
     observer_presets = observer_presets or LIST_OBSERVER_PRESETS
     saved = request.session.get(TARGET_LIST_OBSERVER_SESSION_KEY, {}) if hasattr(request, 'session') else {}
@@ -1110,6 +1276,20 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
 
     @classmethod
     def _query_ssodnet_candidates(cls, path, query):
+        data = solar_system_query(
+            SolarSystemQuery.KIND_SSODNET_CANDIDATES,
+            {'path': path, 'query': query},
+            designation=query,
+        )['data']
+        candidates = []
+        for item in data:
+            if not cls._is_supported_ssodnet_candidate(item):
+                continue
+            candidates.append(cls._build_ssodnet_candidate(item))
+        return candidates
+
+    @classmethod
+    def _download_ssodnet_candidates(cls, path, query):
         try:
             response = requests.get(
                 f'{cls.SSODNET_BASE_URL}{path}',
@@ -1129,16 +1309,21 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
         data = payload.get('data') if isinstance(payload, dict) else None
         if not isinstance(data, list):
             raise ValueError('SsODNet / IMCCE target lookup response had an unexpected format.')
-
-        candidates = []
-        for item in data:
-            if not cls._is_supported_ssodnet_candidate(item):
-                continue
-            candidates.append(cls._build_ssodnet_candidate(item))
-        return candidates
+        return data
 
     @classmethod
     def _fetch_ssodnet_object_by_id(cls, object_id):
+        payload = solar_system_query(
+            SolarSystemQuery.KIND_SSODNET_OBJECT,
+            {'id': object_id},
+            designation=object_id,
+        )['object']
+        if not cls._is_supported_ssodnet_candidate(payload):
+            raise ValueError('The selected SsODNet / IMCCE object is not supported for MPC photometry.')
+        return payload
+
+    @classmethod
+    def _download_ssodnet_object(cls, object_id):
         try:
             response = requests.get(
                 f'{cls.SSODNET_BASE_URL}/{quote(object_id, safe="")}',
@@ -1154,7 +1339,7 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
         except ValueError as exc:
             raise ValueError('SsODNet / IMCCE target selection response was not valid JSON.') from exc
 
-        if not cls._is_supported_ssodnet_candidate(payload):
+        if not isinstance(payload, dict):
             raise ValueError('The selected SsODNet / IMCCE object is not supported for MPC photometry.')
         return payload
 
@@ -1266,7 +1451,7 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
         return bool(re.match(r'^\d+$', value))
 
     @classmethod
-    def _fetch_mpc_observation_counts(cls, target_query, resolved_display_label=''):
+    def _download_mpc_observations(cls, target_query):
         try:
             response = requests.get(
                 cls.MPC_OBSERVATIONS_URL,
@@ -1299,6 +1484,15 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
         records = first_result['ADES_DF']
         if not isinstance(records, list):
             raise ValueError('MPC observations ADES_DF records had an unexpected format.')
+        return records
+
+    @classmethod
+    def _fetch_mpc_observation_counts(cls, target_query, resolved_display_label=''):
+        records = solar_system_query(
+            SolarSystemQuery.KIND_MPC_OBSERVATIONS,
+            {'designation': target_query},
+            designation=target_query,
+        )['records']
 
         resolved_target_label = str(resolved_display_label or '').strip()
         if not resolved_target_label:
@@ -1437,6 +1631,19 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
 
     @classmethod
     def _resolve_horizons_target_label(cls, target_query):
+        try:
+            target_name = solar_system_query(
+                SolarSystemQuery.KIND_HORIZONS_TARGET_NAME,
+                {'target': target_query},
+                designation=target_query,
+            )['name']
+        except Exception as exc:
+            logger.warning('BHTOM-PALLAS Horizons name resolution failed for target %s: %s', target_query, exc)
+            return target_query
+        return target_name or target_query
+
+    @classmethod
+    def _lookup_horizons_target_name(cls, target_query):
         now = datetime.now(timezone.utc)
         epochs = {
             'start': now.strftime('%Y-%m-%d %H:%M:%S'),
@@ -1444,7 +1651,7 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
             'step': '1h',
         }
         try:
-            table = BhtomPallasEphemerisView._query_horizons_ephemerides(
+            table = BhtomPallasEphemerisView._fetch_horizons_ephemerides(
                 target_query=target_query,
                 location='500',
                 epochs=epochs,
@@ -1453,14 +1660,13 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
         except Exception as exc:
             table = cls._resolve_ambiguous_horizons_target(target_query, epochs, exc)
             if table is None:
-                logger.warning('BHTOM-PALLAS Horizons name resolution failed for target %s: %s', target_query, exc)
-                return target_query
+                raise
 
         if len(table) and 'targetname' in table.colnames:
             target_name = str(table[0]['targetname']).strip()
             if target_name:
                 return cls._format_horizons_target_name(target_name)
-        return target_query
+        return ''
 
     @classmethod
     def _resolve_ambiguous_horizons_target(cls, target_query, epochs, exc):
@@ -1482,7 +1688,7 @@ class BhtomPallasPhotometryView(BhtomPallasBaseMixin, TemplateView):
             if not record_id:
                 continue
             try:
-                return BhtomPallasEphemerisView._query_horizons_ephemerides(
+                return BhtomPallasEphemerisView._fetch_horizons_ephemerides(
                     target_query=target_query,
                     location='500',
                     epochs=epochs,
@@ -2092,7 +2298,8 @@ class BhtomPallasEphemerisView(BhtomPallasBaseMixin, TemplateView):
         step_number_raw = str(step_number_input or '').strip()
         step_unit_raw = str(step_unit_input or '').strip().lower()
 
-        now_utc = datetime.now(timezone.utc)
+        # Whole hours, so the default span lines up with the sampling grid of the stored day windows.
+        now_utc = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
         if start_time is None:
             start_time = now_utc - timedelta(days=7)
             start_raw = ''
@@ -2242,8 +2449,61 @@ class BhtomPallasEphemerisView(BhtomPallasBaseMixin, TemplateView):
             })
         return matches
 
+    @staticmethod
+    def _stored_ephemeris_window(epochs):
+        """The whole UTC days around ``epochs`` as Horizons epochs, or None when its grid does not fit them.
+
+        Spans whose sampling grid starts on the step grid of their first day are
+        stored as whole-day tables, so every span inside the same days (such as the
+        default span all day long) is sliced out of one stored query.
+        """
+        step = str(epochs.get('step') or '')
+        unit_seconds = {'m': 60, 'h': 3600, 'd': 86400}.get(step[-1:])
+        if unit_seconds is None or not step[:-1].isdigit() or int(step[:-1]) <= 0:
+            return None
+        try:
+            start = datetime.strptime(epochs['start'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            stop = datetime.strptime(epochs['stop'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        except (KeyError, TypeError, ValueError):
+            return None
+        day_start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        if (start - day_start).total_seconds() % (int(step[:-1]) * unit_seconds):
+            return None
+        day_stop = stop.replace(hour=0, minute=0, second=0, microsecond=0)
+        if day_stop < stop:
+            day_stop += timedelta(days=1)
+        return {
+            'start': day_start.strftime('%Y-%m-%d %H:%M:%S'),
+            'stop': day_stop.strftime('%Y-%m-%d %H:%M:%S'),
+            'step': step,
+        }, start, stop
+
     @classmethod
     def _query_horizons_ephemerides(cls, target_query, location, epochs, quantities, target_record=''):
+        target_record = str(target_record or '').strip()
+        window = cls._stored_ephemeris_window(epochs)
+        payload = solar_system_query(
+            SolarSystemQuery.KIND_HORIZONS_EPHEMERIDES,
+            {
+                'target': target_query,
+                'target_record': target_record,
+                'location': location,
+                'epochs': window[0] if window else epochs,
+                'quantities': quantities,
+            },
+            designation=target_record or target_query,
+        )
+        table = table_from_payload(payload)
+        if window and 'datetime_jd' in table.colnames:
+            start_jd, stop_jd = (Time(value).jd for value in window[1:])
+            epochs_jd = np.asarray(table['datetime_jd'], dtype=float)
+            # Half a second of slack for the rounding of the stored Julian dates.
+            slack = 0.5 / 86400.0
+            table = table[(epochs_jd >= start_jd - slack) & (epochs_jd <= stop_jd + slack)]
+        return table
+
+    @classmethod
+    def _fetch_horizons_ephemerides(cls, target_query, location, epochs, quantities, target_record=''):
         errors = []
         ambiguous_error = None
         target_record = str(target_record or '').strip()
@@ -3530,6 +3790,7 @@ class GeoTomTargetListView(ListView):
             for key, value in self.OBSERVER_PRESETS.items()
         ]
         context['geotom_live_update_url'] = reverse('geotom-live-data')
+        context['geotom_live_stream_url'] = reverse('geotom-live-stream')
         return context
 
 
@@ -3558,18 +3819,8 @@ class GeoTomLiveDataView(View):
         elif object_class == 'satellite':
             queryset = queryset.filter(is_debris=False)
 
-        payload = _build_geotom_payload(queryset[:500], observer, calculation_time_utc, visible_only=visible_only)
-        rows = []
-        for row in payload['rows']:
-            rows.append({
-                'target_id': row['target'].pk,
-                'alt_deg': row['alt_deg'],
-                'az_deg': row['az_deg'],
-                'hour_angle_sex': row['hour_angle_sex'],
-                'ra_icrf_sex': row['ra_icrf_sex'],
-                'dec_sex': row['dec_sex'],
-                'estimated_vmag': row['estimated_vmag'],
-            })
+        payload = _build_geotom_payload(queryset[:GEOTOM_LIVE_MAX_ROWS], observer, calculation_time_utc, visible_only=visible_only)
+        rows = [_geotom_live_row(row) for row in payload['rows']]
 
         return JsonResponse({
             'generated_utc': calculation_time_utc.strftime('%Y-%m-%dT%H:%M:%S'),
@@ -3585,6 +3836,49 @@ class GeoTomLiveDataView(View):
         })
 
 
+class GeoTomLiveStreamView(View):
+    OBSERVER_PRESETS = LIST_OBSERVER_PRESETS
+
+    def get(self, request, *args, **kwargs):
+        observer = _resolve_list_observer(request, observer_presets=self.OBSERVER_PRESETS)
+        tick_seconds = max(0.2, float(getattr(settings, 'GEOTOM_LIVE_TICK_SECONDS', 1)))
+        stream_seconds = max(0, int(getattr(settings, 'GEOTOM_LIVE_STREAM_SECONDS', 300)))
+        response = StreamingHttpResponse(
+            _geotom_live_events(observer, _geotom_live_filters(request), tick_seconds, stream_seconds),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class GeoTomSunExclusionView(View):
+    """
+    The sky too close to the Sun for the GeoTOM observer and time, as a grid
+    for overlay plots. Takes ``frame`` (altaz or hadec) and ``step`` in degrees.
+    """
+    OBSERVER_PRESETS = LIST_OBSERVER_PRESETS
+
+    def get(self, request, *args, **kwargs):
+        observer = _resolve_list_observer(request, observer_presets=self.OBSERVER_PRESETS)
+        calculation_time_utc, _, calculation_time_error = _resolve_list_calculation_time(request)
+        try:
+            grid = sun_exclusion_grid(
+                observer_lat_deg=observer['lat_deg'],
+                observer_lon_deg=observer['lon_deg'],
+                observer_elevation_m=observer['elevation_m'],
+                when_utc=calculation_time_utc,
+                frame=(request.GET.get('frame') or 'altaz').strip().lower(),
+                step_deg=float(request.GET.get('step') or 1.0),
+            )
+        except ValueError as exc:
+            return JsonResponse({'error': f'Invalid request: {exc}'}, status=400)
+        grid['computed_at_utc'] = calculation_time_utc.strftime('%Y-%m-%dT%H:%M:%S')
+        grid['time_error'] = calculation_time_error
+        grid['observer'] = observer['name']
+        return JsonResponse(grid)
+
+
 class GeoTomAddSatView(LoginRequiredMixin, FormView):
     template_name = 'tom_targets/geotom_add_sat.html'
     form_class = GeoTomAddSatForm
@@ -3626,21 +3920,32 @@ class GeoTomAddSatView(LoginRequiredMixin, FormView):
 
 
 class GeoTomRefreshTleView(LoginRequiredMixin, View):
+    """
+    Refresh every GeoTOM TLE from the mirrored TLE catalogue; only satellites
+    missing from the catalogue are fetched one by one (not with a local TLE directory).
+    """
+
     def post(self, request, *args, **kwargs):
-        service = GeoSatDataService()
-        updated = 0
+        summary = refresh_geotarget_tles()
+        updated = summary['updated']
         failed = 0
-        for target in GeoTarget.objects.all().iterator():
-            try:
-                _refresh_geotarget_from_service(target, service)
-                updated += 1
-            except Exception:
-                failed += 1
+        if tle_directory():
+            failed = len(summary['missing'])
+        else:
+            service = GeoSatDataService()
+            for target in GeoTarget.objects.filter(norad_id__in=summary['missing']).iterator():
+                try:
+                    _refresh_geotarget_from_service(target, service)
+                    updated += 1
+                except Exception:
+                    failed += 1
 
+        if summary['failed']:
+            messages.warning(request, f"Could not read {summary['failed']} TLE catalogue groups.")
         if failed:
-            messages.warning(request, f'Refreshed TLE for {updated} satellites, {failed} failed.')
+            messages.warning(request, f"Updated TLE for {updated} of {summary['checked']} satellites, {failed} failed.")
         else:
-            messages.success(request, f'Refreshed TLE for {updated} satellites.')
+            messages.success(request, f"Updated TLE for {updated} of {summary['checked']} satellites.")
         return HttpResponseRedirect(reverse_lazy('geotom-list'))
 
 
@@ -4099,16 +4404,14 @@ class BhtomObservationProcessView(LoginRequiredMixin, View):
             messages.warning(request, f'Force process failed: {exc}')
             return redirect(reverse('tom_observations:detail', kwargs={'pk': observation_record.id}))
 
-        messages.success(
-            request,
-            'Force process finished for observation {0}: frames={1}, created={2}, forwarded={3}, already_forwarded={4}.'.format(
-                observation_record.observation_id,
-                result.get('frames_seen', 0),
-                result.get('created', 0),
-                result.get('forwarded', 0),
-                result.get('already_forwarded', 0),
-            ),
-        )
+        if result.get('queued'):
+            messages.success(
+                request,
+                'Force process queued for observation {0}; its archive frames are downloaded and forwarded '
+                'to BHTOM2 in the background.'.format(observation_record.observation_id),
+            )
+        else:
+            messages.info(request, f'Processing of observation {observation_record.observation_id} is already queued.')
         return redirect(reverse('tom_observations:detail', kwargs={'pk': observation_record.id}))
 
 class UserProfileRedirectView(View):
@@ -4197,17 +4500,54 @@ class UserCreateWithFixedFormView(TomCommonUserCreateView):
         return super().form_invalid(form)
 
 
+def _configure_upload_form_groups(form, user):
+    if not settings.TARGET_PERMISSIONS_ONLY:
+        if user.is_superuser:
+            form.fields['groups'].queryset = Group.objects.all()
+        else:
+            form.fields['groups'].queryset = user.groups.all()
+    return form
+
+
+def _register_staged_uploads(form, user, files, resume_ids=None):
+    dp_type = form.cleaned_data['data_product_type']
+    bhtom2_options = {}
+    if dp_type == 'fits_file':
+        _save_bhtom2_upload_preference(
+            user,
+            form.cleaned_data.get('bhtom2_upload_token'),
+            form.cleaned_data.get('bhtom2_upload_oname'),
+            form.cleaned_data.get('bhtom2_upload_filter'),
+        )
+        bhtom2_options = {
+            'observatory': form.cleaned_data.get('bhtom2_upload_oname') or '',
+            'calibration_filter': form.cleaned_data.get('bhtom2_upload_filter') or 'GaiaSP/any',
+            'comment': _build_bhtom2_comment(user, 'Uploaded from BHTOM3 Manage Data'),
+        }
+    return create_staged_uploads(
+        user,
+        files,
+        target=form.cleaned_data['target'],
+        observation_record=form.cleaned_data['observation_record'],
+        data_product_type=dp_type,
+        groups=form.cleaned_data.get('groups') or [],
+        bhtom2_options=bhtom2_options,
+        resume_ids=resume_ids,
+    )
+
+
+def _staged_upload_payload(upload):
+    payload = staged_upload_status(upload)
+    payload['chunk_url'] = reverse('dataproduct-upload-chunk', kwargs={'upload_id': upload.upload_id})
+    return payload
+
+
 class BhtomDataProductUploadView(LoginRequiredMixin, FormView):
+    """Classic multipart upload; files are staged and processed by db_worker."""
     form_class = BhtomDataProductUploadForm
 
     def get_form(self, form_class=None):
-        form = super().get_form(form_class)
-        if not settings.TARGET_PERMISSIONS_ONLY:
-            if self.request.user.is_superuser:
-                form.fields['groups'].queryset = Group.objects.all()
-            else:
-                form.fields['groups'].queryset = self.request.user.groups.all()
-        return form
+        return _configure_upload_form_groups(super().get_form(form_class), self.request.user)
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -4215,86 +4555,20 @@ class BhtomDataProductUploadView(LoginRequiredMixin, FormView):
         return kwargs
 
     def form_valid(self, form):
-        target = form.cleaned_data['target']
-        if not target:
-            observation_record = form.cleaned_data['observation_record']
-            target = observation_record.target
-        else:
-            observation_record = None
-
-        dp_type = form.cleaned_data['data_product_type']
         data_product_files = self.request.FILES.getlist('files')
-        successful_uploads = []
-        bhtom2_successes = []
-        bhtom2_failures = []
-
-        if dp_type == 'fits_file':
-            _save_bhtom2_upload_preference(
-                self.request.user,
-                form.cleaned_data.get('bhtom2_upload_token'),
-                form.cleaned_data.get('bhtom2_upload_oname'),
-                form.cleaned_data.get('bhtom2_upload_filter'),
-            )
-
-        for uploaded_file in data_product_files:
-            dp = DataProduct(
-                target=target,
-                observation_record=observation_record,
-                data=uploaded_file,
-                product_id=None,
-                data_product_type=dp_type,
-            )
-            dp.save()
-            try:
-                run_hook('data_product_post_upload', dp)
-                reduced_data = run_data_processor(dp)
-                if not settings.TARGET_PERMISSIONS_ONLY:
-                    for group in form.cleaned_data['groups']:
-                        assign_perm('tom_dataproducts.view_dataproduct', group, dp)
-                        assign_perm('tom_dataproducts.delete_dataproduct', group, dp)
-                        assign_perm('tom_dataproducts.view_reduceddatum', group, reduced_data)
-                successful_uploads.append(str(dp))
-            except InvalidFileFormatException as exc:
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
-                messages.error(self.request, f'File format invalid for file {dp} -- error was {exc}')
-                continue
-            except Exception:
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
-                messages.error(self.request, f'There was a problem processing your file: {dp}')
-                continue
-
-            if dp_type != 'fits_file':
-                continue
-
-            try:
-                _upload_dataproduct_to_bhtom2(
-                    dp,
-                    user=self.request.user,
-                    token=form.cleaned_data.get('bhtom2_upload_token'),
-                    oname=form.cleaned_data.get('bhtom2_upload_oname'),
-                    calibration_filter=form.cleaned_data.get('bhtom2_upload_filter') or 'GaiaSP/any',
-                    comment=_build_bhtom2_comment(self.request.user, 'Uploaded from BHTOM3 Manage Data'),
-                )
-                bhtom2_successes.append(dp.get_file_name())
-            except Exception as exc:
-                logger.warning('BHTOM2 FITS upload failed for dataproduct %s: %s', dp.pk, exc)
-                bhtom2_failures.append(f'{dp.get_file_name()}: {exc}')
+        _batch_id, uploads = _register_staged_uploads(
+            form,
+            self.request.user,
+            [(uploaded_file.name, uploaded_file.size) for uploaded_file in data_product_files],
+        )
+        for upload, uploaded_file in zip(uploads, data_product_files):
+            stage_uploaded_file(upload, uploaded_file)
 
-        if successful_uploads:
-            messages.success(
-                self.request,
-                'Successfully uploaded: {0}'.format('\n'.join([p for p in successful_uploads]))
-            )
-        if bhtom2_successes:
-            messages.success(
+        if uploads:
+            messages.info(
                 self.request,
-                'Sent to BHTOM2: {0}'.format(', '.join(bhtom2_successes))
+                'Processing in the background: {0}'.format(', '.join(upload.file_name for upload in uploads))
             )
-        for failure in bhtom2_failures:
-            messages.warning(self.request, f'Local FITS upload succeeded but BHTOM2 forwarding failed: {failure}')
-
         return redirect(form.cleaned_data.get('referrer', '/'))
 
     def form_invalid(self, form):
@@ -4302,6 +4576,78 @@ class BhtomDataProductUploadView(LoginRequiredMixin, FormView):
         return redirect(self.request.POST.get('referrer', '/'))
 
 
+class BhtomDataProductUploadStartView(LoginRequiredMixin, View):
+    """Register the files of a chunked upload and return where to send their chunks."""
+
+    def post(self, request, *args, **kwargs):
+        file_names = [str(name or '').strip() for name in request.POST.getlist('file_name')]
+        try:
+            file_sizes = [max(0, int(size)) for size in request.POST.getlist('file_size')]
+        except (TypeError, ValueError):
+            return JsonResponse({'errors': {'files': ['Invalid file size.']}}, status=400)
+        if len(file_sizes) != len(file_names) or not all(file_names):
+            return JsonResponse({'errors': {'files': ['Every file needs a name and a size.']}}, status=400)
+
+        form = _configure_upload_form_groups(
+            BhtomDataProductUploadForm(request.POST, user=request.user, staged_file_names=file_names),
+            request.user,
+        )
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        batch_id, uploads = _register_staged_uploads(
+            form,
+            request.user,
+            list(zip(file_names, file_sizes)),
+            resume_ids=request.POST.getlist('resume_upload_id'),
+        )
+        return JsonResponse({
+            'batch_id': batch_id,
+            'chunk_size': upload_chunk_size(),
+            'status_url': reverse('dataproduct-upload-batch-status', kwargs={'batch_id': batch_id}),
+            'redirect_url': form.cleaned_data.get('referrer') or '/',
+            'uploads': [_staged_upload_payload(upload) for upload in uploads],
+        })
+
+
+class BhtomDataProductUploadChunkView(LoginRequiredMixin, View):
+    """Append one chunk, sent as the raw request body, at ``?offset=`` of a staged upload."""
+
+    def post(self, request, upload_id, *args, **kwargs):
+        upload = get_object_or_404(StagedDataProductUpload, upload_id=upload_id, user=request.user)
+        try:
+            offset = int(request.GET.get('offset', ''))
+        except ValueError:
+            return JsonResponse({'detail': 'Missing chunk offset.', **_staged_upload_payload(upload)}, status=400)
+        try:
+            upload = append_staged_chunk(upload, offset, request)
+        except StagedUploadOffsetError as exc:
+            upload.received_bytes = exc.received_bytes
+            return JsonResponse({'detail': str(exc), **_staged_upload_payload(upload)}, status=409)
+        except StagedUploadError as exc:
+            upload.refresh_from_db()
+            return JsonResponse({'detail': str(exc), **_staged_upload_payload(upload)}, status=400)
+        return JsonResponse(_staged_upload_payload(upload))
+
+
+class BhtomDataProductUploadBatchStatusView(LoginRequiredMixin, View):
+    """Per-file upload and processing progress of one upload form submission."""
+
+    def get(self, request, batch_id, *args, **kwargs):
+        uploads = list(
+            StagedDataProductUpload.objects
+            .filter(batch_id=batch_id, user=request.user)
+            .order_by('pk')
+        )
+        if not uploads:
+            return JsonResponse({'detail': 'Unknown upload batch.'}, status=404)
+        return JsonResponse({
+            'batch_id': batch_id,
+            'finished': all(upload.status in STAGED_UPLOAD_TERMINAL_STATUSES for upload in uploads),
+            'uploads': [_staged_upload_payload(upload) for upload in uploads],
+        })
+
+
 class BhtomDataProductSaveView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         service_class = get_service_class(request.POST['facility'])
@@ -4341,7 +4687,7 @@ class BhtomDataProductSaveView(LoginRequiredMixin, View):
             )
             return redirect(reverse('tom_observations:detail', kwargs={'pk': observation_record.id}))
 
-        uploaded_names = []
+        queued_names = []
         skipped_names = []
         failed_uploads = []
         for dataproduct in fits_candidates:
@@ -4349,10 +4695,9 @@ class BhtomDataProductSaveView(LoginRequiredMixin, View):
                 skipped_names.append(dataproduct.get_file_name())
                 continue
             try:
-                _upload_dataproduct_to_bhtom2(
+                queued = _queue_dataproduct_for_bhtom2(
                     dataproduct,
                     user=request.user,
-                    token=preference.token,
                     oname=preference.oname,
                     calibration_filter=preference.calibration_filter or 'GaiaSP/any',
                     comment=_build_bhtom2_comment(
@@ -4360,15 +4705,18 @@ class BhtomDataProductSaveView(LoginRequiredMixin, View):
                         f'Uploaded from BHTOM3 observation {observation_record.observation_id}',
                     ),
                 )
-                uploaded_names.append(dataproduct.get_file_name())
+                if queued:
+                    queued_names.append(dataproduct.get_file_name())
+                else:
+                    skipped_names.append(dataproduct.get_file_name())
             except Exception as exc:
-                logger.warning('BHTOM2 forwarding failed for dataproduct %s: %s', dataproduct.pk, exc)
+                logger.warning('BHTOM2 forwarding could not be queued for dataproduct %s: %s', dataproduct.pk, exc)
                 failed_uploads.append(f'{dataproduct.get_file_name()}: {exc}')
 
-        if uploaded_names:
-            messages.success(request, 'Forwarded FITS products to BHTOM2: {0}'.format(', '.join(uploaded_names)))
+        if queued_names:
+            messages.success(request, 'Queued FITS products for BHTOM2: {0}'.format(', '.join(queued_names)))
         if skipped_names:
-            messages.info(request, 'Already forwarded to BHTOM2: {0}'.format(', '.join(skipped_names)))
+            messages.info(request, 'Already forwarded or queued for BHTOM2: {0}'.format(', '.join(skipped_names)))
         for failure in failed_uploads:
             messages.warning(request, f'FITS product saved locally but BHTOM2 forwarding failed: {failure}')
 
@@ -4485,150 +4833,103 @@ class TargetPeriodicityView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         target = get_object_or_404(Target, pk=self.kwargs['pk'])
+        light_curve = load_light_curve(photometry_queryset(target, self.request.user))
 
-        try:
-            photometry_type = settings.DATA_PRODUCT_TYPES['photometry'][0]
-        except (AttributeError, KeyError):
-            photometry_type = 'photometry'
-
-        if settings.TARGET_PERMISSIONS_ONLY:
-            datums = ReducedDatum.objects.filter(target=target, data_type=photometry_type)
-        else:
-            from guardian.shortcuts import get_objects_for_user
-            datums = get_objects_for_user(
-                self.request.user,
-                'tom_dataproducts.view_reduceddatum',
-                klass=ReducedDatum.objects.filter(target=target, data_type=photometry_type),
-            )
-        datums = datums.order_by('timestamp')
-
-        # Build JSON structure: {filter_name: {telescope_name: [{mjd, mag, err, t}]}}
-        series = {}
-        for datum in datums:
-            mag = datum.value.get('magnitude')
-            if mag is None:
-                continue  # skip upper limits
-            err = datum.value.get('error') or datum.value.get('magnitude_error')
-            filter_name = str(datum.value.get('filter') or 'Unknown').strip() or 'Unknown'
-            telescope = str(
-                datum.value.get('telescope') or datum.value.get('facility') or datum.source_name or 'Unknown'
-            ).strip() or 'Unknown'
-            try:
-                mag = float(mag)
-                err = float(err) if err is not None else None
-                mjd = float(Time(datum.timestamp).mjd)
-            except (TypeError, ValueError):
-                continue
-
-            series.setdefault(filter_name, {})
-            series[filter_name].setdefault(telescope, [])
-            series[filter_name][telescope].append({
-                'mjd': round(mjd, 6),
-                'mag': round(mag, 4),
-                'err': round(err, 4) if err is not None else None,
-                't': datum.timestamp.strftime('%Y-%m-%d %H:%M'),
-            })
-
+        # {filter_name: {telescope_name: {mjd: [...], mag: [...], err: [...]}}}
         context['target'] = target
-        context['photometry_json'] = json.dumps(series)
+        context['photometry_json'] = json.dumps(light_curve_series(light_curve))
+        context['periodicity_methods'] = METHOD_CHOICES
         return context
 
 
 class TargetPeriodicityComputeView(LoginRequiredMixin, View):
-    def post(self, request, pk, *args, **kwargs):
-        from scipy.optimize import curve_fit
+    """Start (or return the stored) periodicity search over the selected photometry of a target.
 
+    Returns the periodogram when it is ready, or 202 with the search status
+    when it runs in db_worker; poll TargetPeriodicitySearchView until it is done.
+    """
+
+    def post(self, request, pk, *args, **kwargs):
+        target = get_object_or_404(Target, pk=pk)
         try:
-            body = json.loads(request.body)
-            times_mjd = np.array(body['times_mjd'], dtype=float)
-            magnitudes = np.array(body['magnitudes'], dtype=float)
-            raw_errors = body.get('errors') or []
-            errors = np.array(raw_errors, dtype=float) if raw_errors else np.zeros(len(times_mjd))
-            min_period = max(float(body.get('min_period', 0.1)), 1e-4)
-            max_period = float(body.get('max_period', 1000.0))
-        except (KeyError, ValueError, json.JSONDecodeError) as exc:
+            parameters = search_parameters(json.loads(request.body))
+            search = start_periodicity_search(target, parameters, user=request.user)
+        except (TypeError, ValueError) as exc:
             return JsonResponse({'error': f'Invalid request: {exc}'}, status=400)
+        return _periodicity_search_response(search)
 
-        n = len(times_mjd)
-        if n < 5:
-            return JsonResponse({'error': f'Need at least 5 data points (got {n})'}, status=400)
-        if min_period >= max_period:
-            return JsonResponse({'error': 'min_period must be less than max_period'}, status=400)
 
-        # Sort by time
-        sort_idx = np.argsort(times_mjd)
-        times_mjd = times_mjd[sort_idx]
-        magnitudes = magnitudes[sort_idx]
-        errors = errors[sort_idx]
+class TargetPeriodicitySearchView(LoginRequiredMixin, View):
+    def get(self, request, pk, search_id, *args, **kwargs):
+        search = get_object_or_404(PeriodicitySearch, pk=search_id, target_id=pk)
+        return _periodicity_search_response(search)
 
-        # Only use errors if all positive
-        use_errors = errors if (len(errors) == n and np.all(errors > 0)) else None
 
-        # Cap max_period to avoid unconstrained long periods
-        time_baseline = float(times_mjd[-1] - times_mjd[0])
-        if time_baseline > 0:
-            max_period = min(max_period, 2.0 * time_baseline)
-        max_period = max(max_period, min_period * 2)
+def _periodicity_search_response(search):
+    payload = search_payload(search)
+    payload['status_url'] = reverse(
+        'target-periodicity-search',
+        kwargs={'pk': search.target_id, 'search_id': search.pk},
+    )
+    if search.status == PeriodicitySearch.STATUS_FAILED:
+        return JsonResponse({'error': search.error or 'Periodicity search failed', **payload}, status=400)
+    return JsonResponse(payload, status=200 if search.status == PeriodicitySearch.STATUS_DONE else 202)
 
-        try:
-            ls = LombScargle(times_mjd, magnitudes, use_errors)
-            frequency, power = ls.autopower(
-                minimum_frequency=1.0 / max_period,
-                maximum_frequency=1.0 / min_period,
-                samples_per_peak=5,
-            )
-        except Exception as exc:
-            logger.error('LSP computation failed for target pk=%s: %s', pk, exc)
-            return JsonResponse({'error': f'LSP computation failed: {exc}'}, status=500)
 
-        periods = 1.0 / frequency
+TRANSIT_FILTER_FIELDS = ('start', 'days', 'facility', 'site', 'min_depth', 'min_duration', 'max_duration', 'max_mag')
 
-        # Find the best period on the full-resolution periodogram before downsampling
-        best_idx = int(np.argmax(power))
-        best_period = float(periods[best_idx])
 
-        # Downsample to keep response manageable
-        if len(periods) > 15000:
-            step = len(periods) // 15000
-            periods = periods[::step]
-            power = power[::step]
+class TransitCalendarView(ListView):
+    """Transits observable from the facility sites, listed from the precomputed transit calendar."""
 
-        fap_10 = fap_1 = fap_01 = None
-        try:
-            fap_levels = ls.false_alarm_level([0.1, 0.01, 0.001])
-            fap_10 = float(fap_levels[0])
-            fap_1 = float(fap_levels[1])
-            fap_01 = float(fap_levels[2])
-        except Exception:
-            pass
+    template_name = 'custom_code/transit_calendar.html'
+    context_object_name = 'transits'
+    paginate_by = 100
 
-        fit_result = None
+    def get_queryset(self):
+        self.filter_error = None
         try:
-            def sinusoid(t, amplitude, phase, offset):
-                return offset + amplitude * np.sin(2 * np.pi / best_period * t + phase)
+            filters = transit_filters(self.request.GET)
+        except ValueError as exc:
+            self.filter_error = str(exc)
+            return TransitEventVisibility.objects.none()
+        return observable_transits(self.request.user, **filters)
 
-            p0 = [float(np.std(magnitudes)), 0.0, float(np.mean(magnitudes))]
-            popt, _ = curve_fit(sinusoid, times_mjd, magnitudes, p0=p0, maxfev=10000)
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        sites = observing_sites()
+        context['filter_values'] = {field: (self.request.GET.get(field) or '').strip() for field in TRANSIT_FILTER_FIELDS}
+        context['filter_values']['partial'] = str(self.request.GET.get('partial', '')).lower() in ('1', 'true', 'yes', 'on')
+        context['filter_error'] = self.filter_error
+        context['transit_facilities'] = sorted({facility_name for facility_name, *_ in sites})
+        context['transit_sites'] = [{'facility': facility_name, 'site': site} for facility_name, site, *_ in sites]
+        context['transit_calendar_api_url'] = reverse('transit-calendar-api')
+        return context
 
-            t_fine = np.linspace(times_mjd[0], times_mjd[-1], 600)
-            mags_fine = sinusoid(t_fine, *popt)
 
-            fit_result = {
-                'times_fine': t_fine.tolist(),
-                'mags_fine': mags_fine.tolist(),
-                'amplitude': float(popt[0]),
-                'phase': float(popt[1]),
-                'offset': float(popt[2]),
-            }
-        except Exception as exc:
-            logger.warning('Sinusoidal fit failed for target pk=%s: %s', pk, exc)
+class TransitCalendarApiView(View):
+    """
+    Observable transits as JSON. Takes the filters of TransitCalendarView plus
+    ``limit``; API tokens are accepted as by the other API endpoints.
+    """
+
+    def get(self, request, *args, **kwargs):
+        user = _authenticate_api_token_user(request) or request.user
+        try:
+            filters = transit_filters(request.GET)
+        except ValueError as exc:
+            return JsonResponse({'error': f'Invalid request: {exc}'}, status=400)
+        try:
+            limit = int(request.GET.get('limit') or 500)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid request: limit must be an integer.'}, status=400)
+        limit = min(max(limit, 1), MAX_LISTED_TRANSITS)
 
+        rows = list(observable_transits(user, **filters)[:limit + 1])
         return JsonResponse({
-            'periods': periods.tolist(),
-            'powers': power.tolist(),
-            'best_period': best_period,
-            'fap_10': fap_10,
-            'fap_1': fap_1,
-            'fap_01': fap_01,
-            'fit': fit_result,
+            'start': filters['start'].isoformat(),
+            'end': filters['end'].isoformat(),
+            'count': min(len(rows), limit),
+            'truncated': len(rows) > limit,
+            'transits': [transit_payload(row) for row in rows[:limit]],
         })
@@ -1,7 +1,15 @@
 # gunicorn_config.py
 
+import os
+
 bind = '0.0.0.0:8000'  # Bind to localhost on port 8000
 workers = 3             # Number of worker processes
+# Threaded workers: each open GeoTOM live page holds one thread for up to GEOTOM_LIVE_STREAM_SECONDS,
+# so size the threads for the expected viewers plus ordinary requests.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+# Above GEOTOM_LIVE_STREAM_SECONDS (300 s by default) so a live stream is never killed as a stuck worker.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '360'))
 accesslog = '-'         # Log access to stdout
 errorlog = '-'          # Log errors to stdout
 loglevel = 'debug'       # Set log level